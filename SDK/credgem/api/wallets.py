@@ -39,10 +39,13 @@ class WalletsAPI(BaseAPI):
         page: int = 1,
         page_size: int = 50,
         context: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
     ) -> PaginatedWalletResponse:
         params: Dict[str, Any] = {"page": page, "page_size": page_size}
         if context is not None:
             params["context"] = get_context_filter(context)
+        if search is not None:
+            params["search"] = search
         response = await self._get("/wallets", params=params, response_model=None)
         return PaginatedWalletResponse(
             data=[
@@ -5,6 +5,7 @@ from typing import Any, Dict, List
 
 
 class TimeGranularity(str, Enum):
+    HOUR = "hour"
     DAY = "day"
     WEEK = "week"
     MONTH = "month"
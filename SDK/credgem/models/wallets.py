@@ -30,6 +30,9 @@ class Balance:
     available: float
     held: float
     spent: float
+    burn_rate: float = 0
+    estimated_depletion_at: Optional[str] = None
+    spend_zscore: Optional[float] = None
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Balance":
@@ -38,6 +41,9 @@ class Balance:
             available=float(data["available"]),
             held=float(data["held"]),
             spent=float(data["spent"]),
+            burn_rate=float(data.get("burn_rate", 0)),
+            estimated_depletion_at=data.get("estimated_depletion_at"),
+            spend_zscore=data.get("spend_zscore"),
         )
 
 
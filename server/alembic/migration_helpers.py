@@ -0,0 +1,48 @@
+"""Helpers shared by the migrations in versions/"""
+from typing import Optional
+
+from alembic import op
+
+# Partitions of the hash partitioned tables, see create_partitioned_table in
+# the init_schema migration
+NUM_PARTITIONS = 10
+
+
+def create_partitioned_index_concurrently(
+    index_name: str,
+    table_name: str,
+    columns: str,
+    where: Optional[str] = None,
+    num_partitions: int = NUM_PARTITIONS,
+):
+    """
+    Create an index on a hash partitioned table without blocking writes.
+
+    Postgres does not support CREATE INDEX CONCURRENTLY on a partitioned table,
+    so the parent index is created invalid with ON ONLY, every partition is
+    indexed concurrently, and the partition indexes are then attached, which
+    marks the parent index valid once all of them are in place.
+
+    Args:
+        index_name: Name of the index on the partitioned table
+        table_name: Name of the partitioned table
+        columns: Indexed columns, as they would appear in CREATE INDEX
+        where: Optional predicate for a partial index
+        num_partitions: Number of partitions of the table (default: 10)
+    """
+    predicate = f" WHERE {where}" if where else ""
+
+    op.execute(
+        f"CREATE INDEX IF NOT EXISTS {index_name} "
+        f"ON ONLY {table_name} ({columns}){predicate}"
+    )
+
+    with op.get_context().autocommit_block():
+        for i in range(num_partitions):
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name}_part_{i} "
+                f"ON {table_name}_part_{i} ({columns}){predicate}"
+            )
+
+    for i in range(num_partitions):
+        op.execute(f"ALTER INDEX {index_name} ATTACH PARTITION {index_name}_part_{i}")
@@ -0,0 +1,44 @@
+"""balance_checkpoints
+
+Revision ID: balance_checkpoints
+Revises: low_balance_thresholds
+Create Date: 2026-10-22 10:17:36.204518
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "balance_checkpoints"
+down_revision: Union[str, None] = "low_balance_thresholds"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The primary key serves the latest checkpoint of a balance until a time
+    op.create_table(
+        "balance_checkpoints",
+        sa.Column("wallet_id", sa.Uuid(), nullable=False),
+        sa.Column("credit_type_id", sa.Uuid(), nullable=False),
+        sa.Column("checkpoint_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("available", sa.Float(), nullable=False),
+        sa.Column("held", sa.Float(), nullable=False),
+        sa.Column("spent", sa.Float(), nullable=False),
+        sa.Column("overall_spent", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("wallet_id", "credit_type_id", "checkpoint_at"),
+    )
+    op.create_index(
+        "ix_balance_checkpoints_checkpoint_at",
+        "balance_checkpoints",
+        ["checkpoint_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_balance_checkpoints_checkpoint_at", table_name="balance_checkpoints"
+    )
+    op.drop_table("balance_checkpoints")
@@ -0,0 +1,81 @@
+"""balance_spend_stats
+
+Revision ID: balance_spend_stats
+Revises: insight_counters
+Create Date: 2026-10-19 23:02:17.409236
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from migration_helpers import create_partitioned_index_concurrently
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "balance_spend_stats"
+down_revision: Union[str, None] = "insight_counters"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Statistics start with the first debit after the upgrade, nothing is
+    # replayed from the ledger
+    op.add_column(
+        "balances",
+        sa.Column("burn_rate", sa.Float(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "balances",
+        sa.Column("spend_mean", sa.Float(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "balances",
+        sa.Column("spend_variance", sa.Float(), nullable=False, server_default="0"),
+    )
+    op.add_column("balances", sa.Column("spend_zscore", sa.Float(), nullable=True))
+    op.add_column(
+        "balances",
+        sa.Column("last_debit_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "balances",
+        sa.Column("estimated_depletion_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+    # When a balance with available credits runs out at its burn rate in
+    # credits per day, from now. Every statement changing a balance sets it.
+    op.execute(
+        """
+        CREATE FUNCTION balance_depletion_at(
+            available double precision, burn_rate double precision
+        ) RETURNS timestamptz
+        LANGUAGE sql STABLE AS $$
+            SELECT CASE WHEN available > 0 AND burn_rate > 0
+                THEN now() + available / burn_rate * interval '1 day'
+            END
+        $$
+        """
+    )
+
+    # "balances closest to depletion"
+    create_partitioned_index_concurrently(
+        index_name="ix_balances_estimated_depletion_at",
+        table_name="balances",
+        columns="estimated_depletion_at",
+        where="estimated_depletion_at IS NOT NULL",
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_balances_estimated_depletion_at")
+    op.execute("DROP FUNCTION IF EXISTS balance_depletion_at")
+    for column in (
+        "estimated_depletion_at",
+        "last_debit_at",
+        "spend_zscore",
+        "spend_variance",
+        "spend_mean",
+        "burn_rate",
+    ):
+        op.drop_column("balances", column)
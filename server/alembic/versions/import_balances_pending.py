@@ -0,0 +1,33 @@
+"""import_balances_pending
+
+Revision ID: import_balances_pending
+Revises: balance_checkpoints
+Create Date: 2026-10-23 09:12:48.371905
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "import_balances_pending"
+down_revision: Union[str, None] = "balance_checkpoints"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "transaction_imports",
+        sa.Column(
+            "balances_pending",
+            sa.Boolean(),
+            server_default=sa.text("false"),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("transaction_imports", "balances_pending")
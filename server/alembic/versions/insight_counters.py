@@ -0,0 +1,118 @@
+"""insight_counters
+
+Revision ID: insight_counters
+Revises: transaction_rollups
+Create Date: 2026-10-19 21:14:36.520871
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "insight_counters"
+down_revision: Union[str, None] = "transaction_rollups"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Concurrent writers increment different rows of a counter, by backend
+NUM_SHARDS = 16
+
+# Counted table and the counter name of each of its rows
+COUNTED_TABLES = {
+    "transactions": "'transactions.' || type",
+    "wallets": "'wallets'",
+    "credit_types": "'credit_types'",
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        "insight_counters",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("value", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("name", "shard"),
+    )
+
+    for table_name, counter_name in COUNTED_TABLES.items():
+        added = f"SELECT {counter_name} AS name, 1 AS delta FROM new_rows"
+        removed = f"SELECT {counter_name} AS name, -1 AS delta FROM old_rows"
+        # Statement triggers see every row written by the statement at once in
+        # the transition tables, a bulk insert is counted by a single upsert.
+        # Only the transition tables of the firing event exist.
+        op.execute(
+            f"""
+            CREATE FUNCTION count_{table_name}() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP = 'TRUNCATE' THEN
+                    DELETE FROM insight_counters
+                    WHERE split_part(name, '.', 1) = '{table_name}';
+                ELSIF TG_OP = 'INSERT' THEN
+                    {add_to_counters(added)};
+                ELSIF TG_OP = 'DELETE' THEN
+                    {add_to_counters(removed)};
+                ELSE
+                    {add_to_counters(f"{added} UNION ALL {removed}")};
+                END IF;
+                RETURN NULL;
+            END
+            $$
+            """
+        )
+        for event, transition_tables in (
+            ("INSERT", "NEW TABLE AS new_rows"),
+            ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+            ("DELETE", "OLD TABLE AS old_rows"),
+        ):
+            op.execute(
+                f"""
+                CREATE TRIGGER count_{table_name}_{event.lower()}
+                AFTER {event} ON {table_name}
+                REFERENCING {transition_tables}
+                FOR EACH STATEMENT EXECUTE FUNCTION count_{table_name}()
+                """
+            )
+        op.execute(
+            f"""
+            CREATE TRIGGER count_{table_name}_truncate
+            AFTER TRUNCATE ON {table_name}
+            FOR EACH STATEMENT EXECUTE FUNCTION count_{table_name}()
+            """
+        )
+
+        op.execute(
+            f"""
+            INSERT INTO insight_counters (name, shard, value)
+            SELECT {counter_name}, 0, count(*) FROM {table_name} GROUP BY 1
+            """
+        )
+
+
+def add_to_counters(changes: str) -> str:
+    """
+    Upsert the sums of the deltas of a query of (name, delta) rows into the
+    shard of the backend. Rows are upserted in name order so that writers
+    lock them in the same order.
+    """
+    return f"""
+        INSERT INTO insight_counters AS c (name, shard, value)
+        SELECT name, pg_backend_pid() % {NUM_SHARDS}, sum(delta)
+        FROM ({changes}) changes
+        GROUP BY name
+        HAVING sum(delta) != 0
+        ORDER BY name
+        ON CONFLICT (name, shard) DO UPDATE SET value = c.value + EXCLUDED.value
+    """
+
+
+def downgrade() -> None:
+    for table_name in COUNTED_TABLES:
+        for event in ("insert", "update", "delete", "truncate"):
+            op.execute(
+                f"DROP TRIGGER IF EXISTS count_{table_name}_{event} ON {table_name}"
+            )
+        op.execute(f"DROP FUNCTION IF EXISTS count_{table_name}()")
+    op.drop_table("insight_counters")
@@ -0,0 +1,121 @@
+"""liability_counters
+
+Revision ID: liability_counters
+Revises: balance_spend_stats
+Create Date: 2026-10-20 08:41:52.663018
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "liability_counters"
+down_revision: Union[str, None] = "balance_spend_stats"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Concurrent writers add to different rows of a credit type, by backend
+NUM_SHARDS = 16
+
+
+def upgrade() -> None:
+    op.create_table(
+        "liability_counters",
+        sa.Column("credit_type_id", sa.Uuid(), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("available", sa.Float(), nullable=False),
+        sa.Column("held", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("credit_type_id", "shard"),
+    )
+    op.create_table(
+        "liability_snapshots",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("credit_type_id", sa.Uuid(), nullable=False),
+        sa.Column("available", sa.Float(), nullable=False),
+        sa.Column("held", sa.Float(), nullable=False),
+        sa.Column("taken_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("day", "credit_type_id"),
+    )
+
+    added = "SELECT credit_type_id, available, held FROM new_rows"
+    removed = "SELECT credit_type_id, -available, -held FROM old_rows"
+    # Statement triggers on the partitioned balances table see every balance
+    # changed by the statement in the transition tables, only those of the
+    # firing event exist
+    op.execute(
+        f"""
+        CREATE FUNCTION count_liabilities() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                DELETE FROM liability_counters;
+            ELSIF TG_OP = 'INSERT' THEN
+                {add_to_liabilities(added)};
+            ELSIF TG_OP = 'DELETE' THEN
+                {add_to_liabilities(removed)};
+            ELSE
+                {add_to_liabilities(f"{added} UNION ALL {removed}")};
+            END IF;
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    for event, transition_tables in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+    ):
+        op.execute(
+            f"""
+            CREATE TRIGGER count_liabilities_{event.lower()}
+            AFTER {event} ON balances
+            REFERENCING {transition_tables}
+            FOR EACH STATEMENT EXECUTE FUNCTION count_liabilities()
+            """
+        )
+    op.execute(
+        """
+        CREATE TRIGGER count_liabilities_truncate
+        AFTER TRUNCATE ON balances
+        FOR EACH STATEMENT EXECUTE FUNCTION count_liabilities()
+        """
+    )
+
+    op.execute(
+        """
+        INSERT INTO liability_counters (credit_type_id, shard, available, held)
+        SELECT credit_type_id, 0, sum(available), sum(held)
+        FROM balances GROUP BY credit_type_id
+        """
+    )
+
+
+def add_to_liabilities(changes: str) -> str:
+    """
+    Upsert the sums of the changes of a query of (credit_type_id, available,
+    held) rows into the shard of the backend, in credit type order so that
+    writers lock the rows in the same order.
+    """
+    return f"""
+        INSERT INTO liability_counters AS c (credit_type_id, shard, available, held)
+        SELECT credit_type_id, pg_backend_pid() % {NUM_SHARDS}, sum(available),
+            sum(held)
+        FROM ({changes}) AS changes (credit_type_id, available, held)
+        GROUP BY credit_type_id
+        HAVING sum(available) != 0 OR sum(held) != 0
+        ORDER BY credit_type_id
+        ON CONFLICT (credit_type_id, shard) DO UPDATE SET
+            available = c.available + EXCLUDED.available,
+            held = c.held + EXCLUDED.held
+    """
+
+
+def downgrade() -> None:
+    for event in ("insert", "update", "delete", "truncate"):
+        op.execute(f"DROP TRIGGER IF EXISTS count_liabilities_{event} ON balances")
+    op.execute("DROP FUNCTION IF EXISTS count_liabilities()")
+    op.drop_table("liability_snapshots")
+    op.drop_table("liability_counters")
@@ -0,0 +1,54 @@
+"""low_balance_thresholds
+
+Revision ID: low_balance_thresholds
+Revises: wallets_updated_at_index
+Create Date: 2026-10-21 09:42:11.518230
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "low_balance_thresholds"
+down_revision: Union[str, None] = "wallets_updated_at_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Thresholds of the balances of a credit type, unless their own is set
+    op.add_column(
+        "credit_types",
+        sa.Column("low_balance_threshold", sa.Float(), nullable=True),
+    )
+    op.add_column(
+        "balances",
+        sa.Column("low_balance_threshold", sa.Float(), nullable=True),
+    )
+    # Read by every statement changing a balance, a function so that it can
+    # be read from the ON CONFLICT clause of an upsert
+    op.execute(
+        """
+        CREATE FUNCTION credit_type_low_balance_threshold(credit_type_id uuid)
+        RETURNS double precision
+        LANGUAGE sql STABLE AS $$
+            SELECT low_balance_threshold FROM credit_types WHERE id = credit_type_id
+        $$
+        """
+    )
+    # Set by the first change taking a balance below its threshold, kept
+    # while it stays below. Balances already low are left unset, they are
+    # notified when they next cross their threshold.
+    op.add_column(
+        "balances",
+        sa.Column("low_balance_since", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP FUNCTION IF EXISTS credit_type_low_balance_threshold")
+    op.drop_column("balances", "low_balance_since")
+    op.drop_column("balances", "low_balance_threshold")
+    op.drop_column("credit_types", "low_balance_threshold")
@@ -0,0 +1,62 @@
+"""promoted_context_keys
+
+Revision ID: promoted_context_keys
+Revises: wallet_context_index
+Create Date: 2026-10-19 17:02:37.519044
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from migration_helpers import create_partitioned_index_concurrently
+
+from alembic import op
+from src.core.settings import settings
+
+# revision identifiers, used by Alembic.
+revision: str = "promoted_context_keys"
+down_revision: Union[str, None] = "wallet_context_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Indexes for the promoted context keys configured in this deployment. They
+    # are partial, so rows whose context lacks the key cost nothing to index.
+    # Keys configured later are indexed the same way, the application routes
+    # filters to the indexes it finds at startup.
+    for key in settings.PROMOTED_CONTEXT_KEYS_LIST:
+        columns = f"(context ->> '{key}'), created_at"
+        where = f"(context ->> '{key}') IS NOT NULL"
+        create_partitioned_index_concurrently(
+            index_name=f"ix_transactions_ctx_{key}_created_at",
+            table_name="transactions",
+            columns=columns,
+            where=where,
+        )
+        with op.get_context().autocommit_block():
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+                f"ix_wallets_ctx_{key}_created_at ON wallets ({columns}) "
+                f"WHERE {where}"
+            )
+
+
+def downgrade() -> None:
+    # Drop the indexes of every key promoted so far, not only of the keys
+    # configured now
+    index_names = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT indexname FROM pg_indexes "
+                "WHERE schemaname = current_schema() "
+                "AND tablename IN ('transactions', 'wallets') "
+                "AND indexname LIKE 'ix\\_%\\_ctx\\_%\\_created\\_at'"
+            )
+        )
+        .scalars()
+        .all()
+    )
+    for index_name in index_names:
+        # Dropping the index of a partitioned table drops its partition indexes
+        op.execute(f"DROP INDEX IF EXISTS {index_name}")
@@ -0,0 +1,72 @@
+"""query_shape_indexes
+
+Revision ID: query_shape_indexes
+Revises: init_schema
+Create Date: 2026-10-19 09:12:41.118304
+"""
+from typing import Sequence, Union
+
+from migration_helpers import create_partitioned_index_concurrently
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "query_shape_indexes"
+down_revision: Union[str, None] = "init_schema"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # "transactions for wallet X in a date range ordered by created_at desc".
+    # Supersedes the single column wallet_id index, which is a prefix of it.
+    create_partitioned_index_concurrently(
+        index_name="ix_transactions_wallet_id_created_at",
+        table_name="transactions",
+        columns="wallet_id, created_at",
+    )
+    op.execute("DROP INDEX IF EXISTS transactions_wallet_id_idx")
+
+    # "DEBITs by credit type in a date range"
+    create_partitioned_index_concurrently(
+        index_name="ix_transactions_debit_created_at",
+        table_name="transactions",
+        columns="created_at, credit_type_id",
+        where="type = 'DEBIT'",
+    )
+
+    # Lookups of HELD holds by id when debiting or releasing them
+    create_partitioned_index_concurrently(
+        index_name="ix_transactions_held_id",
+        table_name="transactions",
+        columns="id, wallet_id",
+        where="hold_status = 'HELD'",
+    )
+
+    with op.get_context().autocommit_block():
+        # Default wallet listing order
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_wallets_created_at "
+            "ON wallets (created_at)"
+        )
+        # Subscriptions of a wallet
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+            "ix_product_subscriptions_wallet_id ON product_subscriptions (wallet_id)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(
+            "DROP INDEX CONCURRENTLY IF EXISTS ix_product_subscriptions_wallet_id"
+        )
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_wallets_created_at")
+
+    op.execute("DROP INDEX IF EXISTS ix_transactions_held_id")
+    op.execute("DROP INDEX IF EXISTS ix_transactions_debit_created_at")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS transactions_wallet_id_idx "
+        "ON transactions (wallet_id)"
+    )
+    op.execute("DROP INDEX IF EXISTS ix_transactions_wallet_id_created_at")
@@ -0,0 +1,47 @@
+"""transaction_completed_at
+
+Revision ID: transaction_completed_at
+Revises: import_balances_pending
+Create Date: 2026-10-24 11:03:27.519842
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from migration_helpers import create_partitioned_index_concurrently
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "transaction_completed_at"
+down_revision: Union[str, None] = "import_balances_pending"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "transactions",
+        sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    # Transactions are not updated after they complete, except holds when they
+    # are used or released, whose completion is approximated by their creation
+    op.execute(
+        """
+        UPDATE transactions SET completed_at = CASE
+            WHEN type = 'HOLD' AND hold_status <> 'HELD' THEN created_at
+            ELSE updated_at
+        END
+        WHERE snapshot_available IS NOT NULL
+        """
+    )
+    # "latest snapshot of a balance of wallet X until a time"
+    create_partitioned_index_concurrently(
+        index_name="ix_transactions_wallet_id_completed_at",
+        table_name="transactions",
+        columns="wallet_id, completed_at",
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_transactions_wallet_id_completed_at")
+    op.drop_column("transactions", "completed_at")
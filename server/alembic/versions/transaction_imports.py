@@ -0,0 +1,65 @@
+"""transaction_imports
+
+Revision ID: transaction_imports
+Revises: promoted_context_keys
+Create Date: 2026-10-19 18:11:52.640327
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "transaction_imports"
+down_revision: Union[str, None] = "promoted_context_keys"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "transaction_imports",
+        sa.Column("id", postgresql.UUID(), nullable=False),
+        sa.Column(
+            "format", sa.Enum("NDJSON", "CSV", name="importformat"), nullable=False
+        ),
+        sa.Column(
+            "status",
+            sa.Enum(
+                "STAGING",
+                "VALIDATING",
+                "IMPORTING",
+                "RECOMPUTING",
+                "COMPLETED",
+                "FAILED",
+                name="importstatus",
+            ),
+            nullable=False,
+        ),
+        sa.Column("rows_staged", sa.Integer(), nullable=False),
+        sa.Column("rows_invalid", sa.Integer(), nullable=False),
+        sa.Column("rows_imported", sa.Integer(), nullable=False),
+        sa.Column("balances_recomputed", sa.Integer(), nullable=False),
+        sa.Column("errors", postgresql.JSONB(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("transaction_imports")
+    op.execute("DROP TYPE IF EXISTS importstatus")
+    op.execute("DROP TYPE IF EXISTS importformat")
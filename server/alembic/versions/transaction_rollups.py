@@ -0,0 +1,47 @@
+"""transaction_rollups
+
+Revision ID: transaction_rollups
+Revises: transaction_imports
+Create Date: 2026-10-19 20:02:17.305118
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "transaction_rollups"
+down_revision: Union[str, None] = "transaction_imports"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by the rollup worker, starting from the oldest transaction
+    op.create_table(
+        "transaction_rollups",
+        sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("wallet_id", postgresql.UUID(), nullable=False),
+        sa.Column("credit_type_id", postgresql.UUID(), nullable=False),
+        sa.Column(
+            "type",
+            postgresql.ENUM(name="transactiontype", create_type=False),
+            nullable=False,
+        ),
+        sa.Column("transaction_count", sa.BigInteger(), nullable=False),
+        sa.Column("amount_sum", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("bucket", "wallet_id", "credit_type_id", "type"),
+    )
+    op.create_table(
+        "rollup_watermarks",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("watermark", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rollup_watermarks")
+    op.drop_table("transaction_rollups")
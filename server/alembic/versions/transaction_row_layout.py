@@ -0,0 +1,118 @@
+"""transaction_row_layout
+
+Revision ID: transaction_row_layout
+Revises: query_shape_indexes
+Create Date: 2026-10-19 11:02:17.530942
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "transaction_row_layout"
+down_revision: Union[str, None] = "query_shape_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NUM_PARTITIONS = 10
+
+SNAPSHOT_FIELDS = ["available", "held", "spent", "overall_spent"]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "transaction_labels",
+        sa.Column("id", sa.Integer(), sa.Identity(), nullable=False),
+        sa.Column("value", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("value"),
+    )
+
+    op.add_column("transactions", sa.Column("issuer_id", sa.Integer()))
+    op.add_column("transactions", sa.Column("description_id", sa.Integer()))
+    op.add_column("transactions", sa.Column("amount", sa.Float()))
+    for field in SNAPSHOT_FIELDS:
+        op.add_column("transactions", sa.Column(f"snapshot_{field}", sa.Float()))
+
+    op.execute(
+        """
+        INSERT INTO transaction_labels (value)
+        SELECT issuer FROM transactions
+        UNION
+        SELECT description FROM transactions
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+    snapshot_values = ", ".join(
+        f"snapshot_{field} = (t.balance_snapshot ->> '{field}')::float"
+        for field in SNAPSHOT_FIELDS
+    )
+    # One partition at a time keeps each statement's working set bounded
+    for i in range(NUM_PARTITIONS):
+        op.execute(
+            f"""
+            UPDATE transactions_part_{i} t
+            SET issuer_id = issuer_label.id,
+                description_id = description_label.id,
+                amount = (t.payload ->> 'amount')::float,
+                {snapshot_values}
+            FROM transaction_labels issuer_label, transaction_labels description_label
+            WHERE issuer_label.value = t.issuer
+            AND description_label.value = t.description
+            """
+        )
+
+    # Releases carry no amount in their payload, they release the whole hold
+    op.execute(
+        """
+        UPDATE transactions release
+        SET amount = hold.amount
+        FROM transactions hold
+        WHERE release.type = 'RELEASE'
+        AND hold.id = release.payload ->> 'hold_transaction_id'
+        AND hold.wallet_id = release.wallet_id
+        """
+    )
+
+    op.alter_column("transactions", "issuer_id", nullable=False)
+    op.alter_column("transactions", "description_id", nullable=False)
+    op.drop_column("transactions", "issuer")
+    op.drop_column("transactions", "description")
+    op.drop_column("transactions", "balance_snapshot")
+
+
+def downgrade() -> None:
+    op.add_column("transactions", sa.Column("issuer", sa.String()))
+    op.add_column("transactions", sa.Column("description", sa.String()))
+    op.add_column("transactions", sa.Column("balance_snapshot", sa.JSON()))
+
+    snapshot_object = ", ".join(
+        f"'{field}', t.snapshot_{field}" for field in SNAPSHOT_FIELDS
+    )
+    for i in range(NUM_PARTITIONS):
+        op.execute(
+            f"""
+            UPDATE transactions_part_{i} t
+            SET issuer = issuer_label.value,
+                description = description_label.value,
+                balance_snapshot = CASE
+                    WHEN t.snapshot_available IS NOT NULL
+                    THEN json_build_object({snapshot_object})
+                END
+            FROM transaction_labels issuer_label, transaction_labels description_label
+            WHERE issuer_label.id = t.issuer_id
+            AND description_label.id = t.description_id
+            """
+        )
+
+    op.alter_column("transactions", "issuer", nullable=False)
+    op.alter_column("transactions", "description", nullable=False)
+    for field in SNAPSHOT_FIELDS:
+        op.drop_column("transactions", f"snapshot_{field}")
+    op.drop_column("transactions", "amount")
+    op.drop_column("transactions", "description_id")
+    op.drop_column("transactions", "issuer_id")
+    op.drop_table("transaction_labels")
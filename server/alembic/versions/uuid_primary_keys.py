@@ -0,0 +1,187 @@
+"""uuid_primary_keys
+
+Revision ID: uuid_primary_keys
+Revises: transaction_row_layout
+Create Date: 2026-10-19 13:40:05.771214
+"""
+from typing import Dict, Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "uuid_primary_keys"
+down_revision: Union[str, None] = "transaction_row_layout"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NUM_PARTITIONS = 10
+
+ID_COLUMNS = {
+    "wallets": ["id"],
+    "credit_types": ["id"],
+    "products": ["id"],
+    "product_credit_settings": ["id", "product_id", "credit_type_id"],
+    "product_subscriptions": ["id", "product_id", "wallet_id"],
+}
+
+PARTITIONED_ID_COLUMNS = {
+    "transactions": ["id", "wallet_id", "credit_type_id", "subscription_id"],
+    "balances": ["id", "wallet_id", "credit_type_id"],
+}
+
+FOREIGN_KEYS = [
+    # name, source table, source column, referred table
+    (
+        "product_credit_settings_credit_type_id_fkey",
+        "product_credit_settings",
+        "credit_type_id",
+        "credit_types",
+    ),
+    (
+        "product_credit_settings_product_id_fkey",
+        "product_credit_settings",
+        "product_id",
+        "products",
+    ),
+    (
+        "product_subscriptions_product_id_fkey",
+        "product_subscriptions",
+        "product_id",
+        "products",
+    ),
+    (
+        "product_subscriptions_wallet_id_fkey",
+        "product_subscriptions",
+        "wallet_id",
+        "wallets",
+    ),
+]
+
+
+def upgrade() -> None:
+    convert_id_columns(postgresql.UUID(), "uuid")
+
+
+def downgrade() -> None:
+    convert_id_columns(sa.String(), "varchar")
+
+
+def convert_id_columns(column_type: sa.types.TypeEngine, sql_type: str):
+    for name, table_name, _, _ in FOREIGN_KEYS:
+        op.drop_constraint(name, table_name, type_="foreignkey")
+
+    for table_name, columns in ID_COLUMNS.items():
+        for column in columns:
+            op.alter_column(
+                table_name,
+                column,
+                type_=column_type,
+                postgresql_using=f"{column}::{sql_type}",
+            )
+
+    for name, table_name, column, referred_table in FOREIGN_KEYS:
+        op.create_foreign_key(name, table_name, referred_table, [column], ["id"])
+
+    for table_name, columns in PARTITIONED_ID_COLUMNS.items():
+        rebuild_partitioned_table(
+            table_name=table_name,
+            column_types={column: column_type for column in columns},
+            sql_type=sql_type,
+        )
+
+
+def rebuild_partitioned_table(
+    table_name: str,
+    column_types: Dict[str, sa.types.TypeEngine],
+    sql_type: str,
+    partition_column: str = "wallet_id",
+    num_partitions: int = NUM_PARTITIONS,
+):
+    """
+    Change column types of a hash partitioned table.
+
+    Postgres cannot change the type of a partition key column, and rows would
+    hash to different partitions with the new type anyway. The table is renamed
+    away, recreated with the same columns, indexes and partitions but the new
+    column types, and the rows are copied over.
+
+    Args:
+        table_name: Name of the partitioned table
+        column_types: New types of the converted columns
+        sql_type: SQL name of the new type, used to cast the copied values
+        partition_column: Column the table is partitioned by
+        num_partitions: Number of partitions of the table (default: 10)
+    """
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    old_table_name = f"{table_name}_old"
+
+    columns = inspector.get_columns(table_name)
+    primary_key = inspector.get_pk_constraint(table_name)
+    index_definitions = bind.execute(
+        sa.text(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = :table_name "
+            "AND indexname != :primary_key"
+        ),
+        {"table_name": table_name, "primary_key": primary_key["name"]},
+    ).all()
+
+    # Free the table, partition and index names for the new table
+    op.execute(f"ALTER TABLE {table_name} RENAME TO {old_table_name}")
+    for i in range(num_partitions):
+        op.execute(
+            f"ALTER TABLE {table_name}_part_{i} RENAME TO {old_table_name}_part_{i}"
+        )
+    op.execute(f"ALTER TABLE {old_table_name} DROP CONSTRAINT {primary_key['name']}")
+    for index_name, _ in index_definitions:
+        op.execute(f"DROP INDEX {index_name}")
+
+    new_columns = []
+    for column in columns:
+        column_type = column_types.get(column["name"], column["type"])
+        if isinstance(column_type, postgresql.ENUM):
+            column_type.create_type = False
+        new_columns.append(
+            sa.Column(
+                column["name"],
+                column_type,
+                nullable=column["nullable"],
+                server_default=(
+                    sa.text(column["default"]) if column["default"] else None
+                ),
+            )
+        )
+    op.create_table(
+        table_name,
+        *new_columns,
+        sa.PrimaryKeyConstraint(
+            *primary_key["constrained_columns"], name=primary_key["name"]
+        ),
+        postgresql_partition_by=f"HASH ({partition_column})",
+    )
+    # Indexes created on the parent before its partitions are created on every
+    # partition as it is attached
+    for _, index_definition in index_definitions:
+        op.execute(index_definition.replace(" ON ONLY ", " ON "))
+    for i in range(num_partitions):
+        op.execute(
+            f"CREATE TABLE {table_name}_part_{i} PARTITION OF {table_name} "
+            f"FOR VALUES WITH (modulus {num_partitions}, remainder {i})"
+        )
+
+    column_names = ", ".join(column["name"] for column in columns)
+    values = ", ".join(
+        f"{column['name']}::{sql_type}"
+        if column["name"] in column_types
+        else column["name"]
+        for column in columns
+    )
+    op.execute(
+        f"INSERT INTO {table_name} ({column_names}) "
+        f"SELECT {values} FROM {old_table_name}"
+    )
+    op.execute(f"DROP TABLE {old_table_name}")
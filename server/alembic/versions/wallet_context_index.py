@@ -0,0 +1,29 @@
+"""wallet_context_index
+
+Revision ID: wallet_context_index
+Revises: wallet_trigram_search
+Create Date: 2026-10-19 16:05:12.184530
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "wallet_context_index"
+down_revision: Union[str, None] = "wallet_trigram_search"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Context filters are compiled to a single context @> '{...}' predicate
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_wallets_context "
+            "ON wallets USING gin (context jsonb_path_ops)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_wallets_context")
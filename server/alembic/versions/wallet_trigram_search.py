@@ -0,0 +1,37 @@
+"""wallet_trigram_search
+
+Revision ID: wallet_trigram_search
+Revises: uuid_primary_keys
+Create Date: 2026-10-19 15:21:48.402856
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "wallet_trigram_search"
+down_revision: Union[str, None] = "uuid_primary_keys"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Fuzzy wallet search and name ILIKE filters
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_wallets_name_trgm "
+            "ON wallets USING gin (name gin_trgm_ops)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_wallets_external_id_trgm "
+            "ON wallets USING gin (external_id gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    # The extension is left installed, other objects may depend on it
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_wallets_external_id_trgm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_wallets_name_trgm")
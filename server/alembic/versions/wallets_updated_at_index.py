@@ -0,0 +1,29 @@
+"""wallets_updated_at_index
+
+Revision ID: wallets_updated_at_index
+Revises: liability_counters
+Create Date: 2026-10-20 11:17:38.204519
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "wallets_updated_at_index"
+down_revision: Union[str, None] = "liability_counters"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        # Wallets changed since the watermark of the analytics replica
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_wallets_updated_at_id "
+            "ON wallets (updated_at, id)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_wallets_updated_at_id")
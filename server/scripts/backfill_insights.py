@@ -0,0 +1,23 @@
+import asyncio
+
+from src.core.db_config import DBManager
+from src.core.redis_config import RedisManager
+from src.services import insights_service
+
+
+async def main():
+    await DBManager().init_db_connection()
+    await RedisManager().connect()
+    try:
+        await insights_service.backfill_trending_wallets()
+        await insights_service.backfill_active_wallets()
+        await insights_service.backfill_debit_sketches()
+    finally:
+        await DBManager().disconnect()
+        await RedisManager().disconnect()
+
+    print("Redis insights rebuilt from the transactions")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import gzip
+from pathlib import Path
+from typing import AsyncIterator
+
+from fastapi import HTTPException
+
+from src.core.db_config import DBManager
+from src.models.transaction_imports import (
+    ImportFormat,
+    ImportStatus,
+    TransactionImportResponse,
+)
+from src.services import transaction_imports_service
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def infer_format(path: Path) -> ImportFormat:
+    suffixes = [suffix for suffix in path.suffixes if suffix != ".gz"]
+    if suffixes and suffixes[-1] == ".csv":
+        return ImportFormat.CSV
+    return ImportFormat.NDJSON
+
+
+async def read_chunks(path: Path) -> AsyncIterator[bytes]:
+    """Read the file in chunks, decompressing .gz files on the fly"""
+    open_file = gzip.open if path.suffix == ".gz" else open
+    with open_file(path, "rb") as file:
+        while chunk := await asyncio.to_thread(file.read, CHUNK_SIZE):
+            yield chunk
+
+
+def print_progress(transaction_import: TransactionImportResponse):
+    print(
+        f"{transaction_import.status.value}: "
+        f"{transaction_import.rows_imported}/{transaction_import.rows_staged} "
+        f"rows imported, {transaction_import.balances_recomputed} balances "
+        f"recomputed"
+    )
+
+
+async def import_transactions(path: Path, import_format: ImportFormat) -> bool:
+    try:
+        transaction_import = await transaction_imports_service.stage_import(
+            source=read_chunks(path), import_format=import_format
+        )
+    except HTTPException as e:
+        print(f"Could not stage {path}: {e.detail}")
+        return False
+    print(f"Staged {transaction_import.rows_staged} rows")
+    transaction_import = await transaction_imports_service.process_import(
+        transaction_import.id, on_progress=print_progress
+    )
+    for error in transaction_import.errors:
+        print(f"Line {error.line}: {error.reason}" if error.line else error.reason)
+    if transaction_import.rows_invalid:
+        print(f"{transaction_import.rows_invalid} invalid rows, nothing imported")
+    return transaction_import.status == ImportStatus.COMPLETED
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk import transactions from an NDJSON or CSV file"
+    )
+    parser.add_argument("path", type=Path, help="File to import, optionally .gz")
+    parser.add_argument(
+        "--format",
+        choices=[import_format.value for import_format in ImportFormat],
+        help="Format of the file, inferred from its extension by default",
+    )
+    args = parser.parse_args()
+    import_format = (
+        ImportFormat(args.format) if args.format else infer_format(args.path)
+    )
+
+    await DBManager().init_db_connection()
+
+    try:
+        completed = await import_transactions(args.path, import_format)
+    finally:
+        await DBManager().disconnect()
+    if not completed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,15 +2,16 @@ import argparse
 import asyncio
 from datetime import datetime, timezone
 from typing import Dict, List
-from uuid import uuid4
 
 from sqlalchemy import text
 
 from scripts.seed_data import generate_seed_data
 from src.core.db_config import DBManager
+from src.db.transaction_labels import get_or_create_labels
 from src.models.balances import BalanceDBModel
 from src.models.transactions import TransactionDBModel, TransactionType
 from src.utils.ctx_managers import db_session
+from src.utils.ids import generate_id
 
 
 async def calculate_balances(
@@ -23,7 +24,7 @@ async def calculate_balances(
         key = f"{tx.wallet_id}_{tx.credit_type_id}"
         if key not in balances:
             balances[key] = BalanceDBModel(
-                id=str(uuid4()),
+                id=generate_id(),
                 wallet_id=tx.wallet_id,
                 credit_type_id=tx.credit_type_id,
                 available=0.0,
@@ -34,7 +35,7 @@ async def calculate_balances(
                 updated_at=datetime.now(timezone.utc),
             )
 
-        amount = tx.payload.get("amount", 0)
+        amount = tx.amount or 0
 
         if tx.type == TransactionType.DEPOSIT:
             balances[key].available += amount
@@ -65,7 +66,15 @@ async def load_seed_data(clear_existing: bool = False):
         session = session_ctx.session
         # Optionally clear existing data
         if clear_existing:
-            tables = ["credit_types", "wallets", "transactions", "balances"]
+            tables = [
+                "credit_types",
+                "wallets",
+                "transactions",
+                "balances",
+                "transaction_rollups",
+                "rollup_watermarks",
+                "liability_snapshots",
+            ]
             for table in tables:
                 await session.execute(text(f"TRUNCATE TABLE {table} CASCADE"))
             await session.commit()
@@ -86,6 +95,17 @@ async def load_seed_data(clear_existing: bool = False):
             await session.flush()
         # Insert transactions
         if seed_data.transactions:
+            label_ids = await get_or_create_labels(
+                session=session,
+                values={
+                    label
+                    for tx in seed_data.transactions
+                    for label in (tx.issuer, tx.description)
+                },
+            )
+            for tx in seed_data.transactions:
+                tx.issuer_id = label_ids[tx.issuer]
+                tx.description_id = label_ids[tx.description]
             session.add_all(seed_data.transactions)
             await session.flush()
         # Calculate and insert balances
@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+
+from src.core.db_config import DBManager
+from src.core.redis_config import RedisManager
+from src.services import reconciliation_service
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the balances with the transactions ledger"
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="Recompute the drifted balances from the ledger",
+    )
+    parser.add_argument(
+        "--wallets-per-chunk",
+        type=int,
+        default=reconciliation_service.WALLETS_PER_CHUNK,
+        help="Wallets reconciled by each query",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=reconciliation_service.CONCURRENCY,
+        help="Queries run at the same time",
+    )
+    args = parser.parse_args()
+
+    await DBManager().init_db_connection()
+    await RedisManager().connect()
+
+    try:
+        report = await reconciliation_service.reconcile_balances(
+            repair=args.repair,
+            wallets_per_chunk=args.wallets_per_chunk,
+            concurrency=args.concurrency,
+        )
+    finally:
+        await DBManager().disconnect()
+        await RedisManager().disconnect()
+
+    for drift in report.drifts:
+        print(
+            f"{drift.wallet_id} {drift.credit_type_id}: "
+            f"available {drift.available} (expected {drift.expected_available}), "
+            f"held {drift.held} (expected {drift.expected_held}), "
+            f"spent {drift.spent} (expected {drift.expected_spent}), "
+            f"overall_spent {drift.overall_spent} "
+            f"(expected {drift.expected_overall_spent})"
+            + (" - repaired" if drift.repaired else "")
+        )
+    print(
+        f"Checked {report.balances_checked} balances in {report.chunks} chunks "
+        f"in {report.duration_seconds:.1f}s: {report.balances_drifted} drifted, "
+        f"{report.balances_repaired} repaired"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+import asyncio
+
+from src.core.db_config import DBManager
+from src.services import rollups_service
+
+
+async def main():
+    await DBManager().init_db_connection()
+    try:
+        watermark = await rollups_service.refresh_rollups()
+    finally:
+        await DBManager().disconnect()
+
+    if watermark is None:
+        print("Another refresh is running")
+    else:
+        print(f"Transactions rolled up until {watermark.isoformat()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -143,6 +143,7 @@ class TransactionGenerator:
         payload: TransactionRequestPayload,
         hold_status: Optional[HoldStatus] = None,
         _id: Optional[str] = None,
+        amount: Optional[float] = None,
     ) -> TransactionDBModel:
         self.transaction_counter += 1
         return TransactionDBModel(
@@ -159,6 +160,7 @@ class TransactionGenerator:
             issuer="seed_script",
             context={"source": "seed_data"},
             payload=payload.model_dump(),
+            amount=amount if amount is not None else getattr(payload, "amount", None),
             hold_status=hold_status,
             status=TransactionStatus.COMPLETED,
             created_at=self.current_date,
@@ -201,6 +203,7 @@ class TransactionGenerator:
             type=TransactionType.RELEASE,
             description=description,
             payload=ReleaseTransactionRequestPayload(hold_transaction_id=hold_id),
+            amount=amount,
         )
 
         del self.active_holds[hold_id]
@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional, Sequence, TypeVar, Union
+from uuid import UUID
+
+from sqlalchemy import Select
+from sqlalchemy.dialects import postgresql
+
+from src.core.settings import settings
+from src.utils.singleton import SingletonMeta
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+# DuckDB runs the SQL of the Postgres dialect, with $1 style parameters
+DIALECT = postgresql.dialect(paramstyle="numeric_dollar")
+
+
+def to_replica(value: Any) -> Any:
+    """The replica keeps times as naive UTC timestamps"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def from_replica(value: Any) -> Any:
+    """Values read from the replica as they are read from Postgres"""
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class AnalyticsReplica(metaclass=SingletonMeta):
+    """
+    Connection to the embedded DuckDB database of the analytics replica.
+
+    DuckDB is synchronous, every statement runs in a thread on a cursor of its
+    own. The database file is locked by the process that opens it, the
+    processes that cannot open it read insights from Postgres only.
+    """
+
+    def __init__(self):
+        self._connection: Optional[Any] = None
+        # Transactions created before this time are all in the replica
+        self.synced_until: Optional[datetime] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None
+
+    def connect(self) -> None:
+        import duckdb
+
+        logger.info("Analytics replica -> opening %s", settings.ANALYTICS_REPLICA_PATH)
+        self._connection = duckdb.connect(settings.ANALYTICS_REPLICA_PATH)
+
+    def disconnect(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self.synced_until = None
+
+    async def run(self, work: Callable[[Any], T]) -> T:
+        """Run work on a cursor of the replica in a thread, in one transaction"""
+        if self._connection is None:
+            raise ValueError("Analytics replica not connected")
+        connection = self._connection
+
+        def in_transaction() -> T:
+            cursor = connection.cursor()
+            try:
+                cursor.begin()
+                result = work(cursor)
+                cursor.commit()
+                return result
+            except Exception:
+                cursor.rollback()
+                raise
+            finally:
+                cursor.close()
+
+        return await asyncio.to_thread(in_transaction)
+
+    async def fetch(
+        self, query: Union[Select, str], params: Sequence[Any] = ()
+    ) -> List[Dict[str, Any]]:
+        """Rows of a query as dicts, a Select is compiled to the Postgres dialect"""
+        if isinstance(query, Select):
+            compiled = query.compile(dialect=DIALECT)
+            sql = str(compiled)
+            params = [compiled.params[name] for name in compiled.positiontup or []]
+        else:
+            sql = query
+        params = [to_replica(value) for value in params]
+
+        def fetch_rows(cursor) -> List[Dict[str, Any]]:
+            cursor.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return [
+                {name: from_replica(value) for name, value in zip(names, row)}
+                for row in cursor.fetchall()
+            ]
+
+        return await self.run(fetch_rows)
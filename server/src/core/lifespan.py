@@ -1,10 +1,23 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 
+from src.core.analytics_replica import AnalyticsReplica
 from src.core.db_config import DBManager
 from src.core.logging_config import setup_logging
 from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.db.expressions import PromotedContextKeys
+from src.services.analytics_service import connect_replica, run_replica_worker
+from src.services.balance_checkpoints_service import run_balance_checkpoint_worker
+from src.services.insight_counters_service import run_recount_worker
+from src.services.insights_service import backfill_insights_if_missing
+from src.services.liabilities_service import run_liabilities_worker
+from src.services.low_balance_service import run_low_balance_worker
+from src.services.rollups_service import run_rollup_worker
+from src.utils.balance_events import BalanceEvents
+from src.utils.ctx_managers import db_session
 
 
 @asynccontextmanager
@@ -14,9 +27,31 @@ async def lifespan(app: FastAPI):
     # Startup
     await DBManager().init_db_connection()
     await RedisManager().connect()
+    async with db_session(read_only=True) as session_ctx:
+        await PromotedContextKeys().load(session_ctx.session)
+    workers = []
+    if settings.ROLLUP_WORKER_ENABLED:
+        workers.append(asyncio.create_task(run_rollup_worker()))
+    if settings.INSIGHT_COUNTERS_RECOUNT_ENABLED:
+        workers.append(asyncio.create_task(run_recount_worker()))
+    if settings.LIABILITIES_WORKER_ENABLED:
+        workers.append(asyncio.create_task(run_liabilities_worker()))
+    if settings.BALANCE_CHECKPOINT_WORKER_ENABLED:
+        workers.append(asyncio.create_task(run_balance_checkpoint_worker()))
+    if settings.ANALYTICS_REPLICA_ENABLED and await connect_replica():
+        workers.append(asyncio.create_task(run_replica_worker()))
+    if settings.LOW_BALANCE_WEBHOOK_URL:
+        workers.append(asyncio.create_task(run_low_balance_worker()))
+    workers.append(asyncio.create_task(backfill_insights_if_missing()))
 
     yield
 
     # Shutdown
+    for worker in workers:
+        worker.cancel()
+        with suppress(asyncio.CancelledError):
+            await worker
+    AnalyticsReplica().disconnect()
+    await BalanceEvents().close()
     await DBManager().disconnect()
     await RedisManager().disconnect()
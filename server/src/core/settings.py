@@ -1,5 +1,7 @@
-from typing import Literal
+import re
+from typing import Literal, Optional
 
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -34,6 +36,100 @@ class Settings(BaseSettings):
     # Logging Configuration
     LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = "INFO"
 
+    # Context keys that are filtered on far more than others. Transactions and
+    # wallets are indexed on (context ->> key, created_at) for each of them by
+    # the promoted_context_keys migration, for the keys configured when it runs.
+    # Filters on a key only use these indexes once they exist, which is checked
+    # at startup, before that they are applied like filters on any other key.
+    PROMOTED_CONTEXT_KEYS: str = "org_id,request_id"
+
+    # Insights rollups. Hours are rolled up once they ended longer than the
+    # lateness ago, the transactions after the watermark are read as they are.
+    ROLLUP_WORKER_ENABLED: bool = True
+    ROLLUP_REFRESH_INTERVAL_SECONDS: int = 60
+    ROLLUP_LATENESS_SECONDS: int = 300
+
+    # Exact recount of the insight counters, correcting any drift
+    INSIGHT_COUNTERS_RECOUNT_ENABLED: bool = True
+    INSIGHT_COUNTERS_RECOUNT_INTERVAL_SECONDS: int = 3600
+
+    # Daily snapshots of the outstanding credits per credit type, the snapshot
+    # of the current day is replaced at every interval
+    LIABILITIES_WORKER_ENABLED: bool = True
+    LIABILITIES_SNAPSHOT_INTERVAL_SECONDS: int = 3600
+
+    # Checkpoints of the balances changed since the previous one, balances as
+    # of a time are read from the checkpoint before it and the transactions
+    # completed in between
+    BALANCE_CHECKPOINT_WORKER_ENABLED: bool = True
+    BALANCE_CHECKPOINT_INTERVAL_SECONDS: int = 86400
+    # Buckets of balance history returned at most
+    BALANCE_HISTORY_MAX_POINTS: int = 1000
+
+    # Hours of transactions per wallet kept in Redis for trending wallets
+    TRENDING_WALLETS_RETENTION_DAYS: int = 30
+
+    # Days of distinct active wallets per credit type kept in Redis
+    ACTIVE_WALLETS_RETENTION_DAYS: int = 400
+
+    # Hours of debit amount sketches per credit type kept in Redis
+    DEBIT_SKETCHES_RETENTION_DAYS: int = 90
+
+    # Burn rates weigh the credits spent by exp(-age / window)
+    BURN_RATE_WINDOW_DAYS: float = 7
+    # Weight of each debit in the mean and variance of the amounts debited
+    SPEND_EWMA_ALPHA: float = 0.1
+
+    # Optional embedded DuckDB replica of transactions, wallets and credit types
+    # for long range insights, requires the duckdb package of the analytics
+    # extra (poetry install --extras analytics). Transactions are mirrored once
+    # older than ROLLUP_LATENESS_SECONDS, and insights over at least the minimum
+    # range are computed from the replica while it is at most the maximum lag
+    # behind. Only one process can open the replica file.
+    ANALYTICS_REPLICA_ENABLED: bool = False
+    ANALYTICS_REPLICA_PATH: str = "analytics.duckdb"
+    ANALYTICS_REPLICA_SYNC_INTERVAL_SECONDS: int = 60
+    ANALYTICS_REPLICA_BATCH_SIZE: int = 50000
+    ANALYTICS_REPLICA_MIN_RANGE_DAYS: int = 31
+    ANALYTICS_REPLICA_MAX_LAG_SECONDS: int = 900
+
+    # Approximate insights are estimated from a TABLESAMPLE SYSTEM sample of
+    # about this many of the transactions in the range
+    INSIGHTS_SAMPLE_ROWS: int = 100000
+
+    # Balance changes are pushed to the subscribers of /wallets/{id}/events.
+    # The last events of every wallet are kept for subscribers resuming from
+    # their Last-Event-ID, until the wallet has no event for the retention.
+    BALANCE_EVENTS_RETAINED: int = 100
+    BALANCE_EVENTS_RETENTION_SECONDS: int = 3600
+    # Events buffered per subscriber, a subscriber further behind is
+    # disconnected and resumes from the retained events when it reconnects
+    BALANCE_EVENTS_BUFFER_SIZE: int = 100
+    BALANCE_EVENTS_HEARTBEAT_SECONDS: int = 15
+
+    # Balances falling below their low balance threshold are queued in Redis
+    # and POSTed in batches to the webhook, when set. Failed deliveries are
+    # retried after the retry delay, up to the attempts.
+    LOW_BALANCE_WEBHOOK_URL: Optional[str] = None
+    LOW_BALANCE_WEBHOOK_INTERVAL_SECONDS: int = 10
+    LOW_BALANCE_WEBHOOK_BATCH_SIZE: int = 100
+    LOW_BALANCE_WEBHOOK_TIMEOUT_SECONDS: float = 10
+    LOW_BALANCE_WEBHOOK_RETRY_SECONDS: int = 60
+    LOW_BALANCE_WEBHOOK_MAX_ATTEMPTS: int = 10
+
+    # Insights results are served from Redis past their TTL for this long
+    # while they are computed again in the background
+    INSIGHTS_CACHE_STALE_SECONDS: int = 600
+
+    @field_validator("PROMOTED_CONTEXT_KEYS")
+    @classmethod
+    def validate_promoted_context_keys(cls, value: str) -> str:
+        # The keys end up in index names and inline in SQL
+        for key in to_list(value):
+            if not re.fullmatch(r"[A-Za-z0-9_]+", key):
+                raise ValueError(f"Invalid promoted context key: {key}")
+        return value
+
     @property
     def ASYNC_DATABASE_URL(self) -> str:
         db_name = self.DB_NAME if not self.ENV == "test" else self.TEST_DB_NAME
@@ -54,6 +150,10 @@ class Settings(BaseSettings):
     def CORS_ALLOWED_HEADERS_LIST(self) -> list[str]:
         return to_list(self.CORS_ALLOW_HEADERS)
 
+    @property
+    def PROMOTED_CONTEXT_KEYS_LIST(self) -> list[str]:
+        return to_list(self.PROMOTED_CONTEXT_KEYS)
+
     # Pydantic Configuration
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
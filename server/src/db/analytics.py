@@ -0,0 +1,314 @@
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple, Type, Union
+from uuid import UUID
+
+from sqlalchemy import Subquery, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.analytics_replica import AnalyticsReplica, to_replica
+from src.db import insights as insights_db
+from src.models import CreditType, TransactionDBModel, Wallet
+from src.models.Insights import (
+    CreditUsageAggregationResult,
+    TimeGranularity,
+    TimeSeriesOptions,
+    TrendingWalletAggregationResult,
+    WalletActivityBounds,
+)
+
+TRANSACTIONS = "transactions"
+WALLETS = "wallets"
+CREDIT_TYPES = "credit_types"
+
+# Only the columns read by the insights are mirrored, under the names of
+# Postgres so that the insights queries run unchanged on the replica
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS transactions (
+        id UUID NOT NULL,
+        wallet_id UUID NOT NULL,
+        credit_type_id UUID NOT NULL,
+        type VARCHAR NOT NULL,
+        amount DOUBLE,
+        created_at TIMESTAMP NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS wallets (
+        id UUID PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS credit_types (
+        id UUID PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS replica_watermarks (
+        name VARCHAR PRIMARY KEY,
+        time TIMESTAMP NOT NULL,
+        id UUID NOT NULL,
+        synced_until TIMESTAMP
+    )
+    """,
+]
+
+# Rows are mirrored in (time, id) order, the watermark is the last one mirrored
+Watermark = Tuple[datetime, str]
+
+
+async def create_schema(replica: AnalyticsReplica):
+    def create(cursor):
+        for sql in SCHEMA_SQL:
+            cursor.execute(sql)
+
+    await replica.run(create)
+
+
+async def get_watermark(replica: AnalyticsReplica, name: str) -> Optional[Watermark]:
+    rows = await replica.fetch(
+        "SELECT time, id FROM replica_watermarks WHERE name = $1", [name]
+    )
+    return (rows[0]["time"], rows[0]["id"]) if rows else None
+
+
+async def get_synced_until(replica: AnalyticsReplica) -> Optional[datetime]:
+    rows = await replica.fetch(
+        "SELECT synced_until FROM replica_watermarks WHERE name = $1", [TRANSACTIONS]
+    )
+    return rows[0]["synced_until"] if rows else None
+
+
+def _set_watermark(
+    cursor,
+    name: str,
+    watermark: Watermark,
+    synced_until: Optional[datetime] = None,
+):
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO replica_watermarks (name, time, id, synced_until)
+        VALUES ($1, $2, $3, $4)
+        """,
+        [name, to_replica(watermark[0]), watermark[1], to_replica(synced_until)],
+    )
+
+
+async def get_transactions_to_mirror(
+    session: AsyncSession,
+    after: Optional[Watermark],
+    until: datetime,
+    limit: int,
+) -> List[Tuple[Any, ...]]:
+    """
+    The transactions created after the watermark and before until, in
+    (created_at, id) order, read from Postgres.
+    """
+    query = (
+        select(
+            TransactionDBModel.id,
+            TransactionDBModel.wallet_id,
+            TransactionDBModel.credit_type_id,
+            TransactionDBModel.type,
+            TransactionDBModel.amount,
+            TransactionDBModel.created_at,
+        )
+        .where(TransactionDBModel.created_at < until)
+        .order_by(TransactionDBModel.created_at, TransactionDBModel.id)
+        .limit(limit)
+    )
+    if after is not None:
+        # The created_at bound alone is served by the index on created_at
+        query = query.where(
+            TransactionDBModel.created_at >= after[0],
+            tuple_(TransactionDBModel.created_at, TransactionDBModel.id) > after,
+        )
+    return [
+        (id, wallet_id, credit_type_id, type.name, amount, created_at)
+        for id, wallet_id, credit_type_id, type, amount, created_at in (
+            await session.execute(query)
+        ).all()
+    ]
+
+
+async def get_transactions_between(
+    session: AsyncSession, start_date: datetime, end_date: datetime
+) -> List[Tuple[Any, ...]]:
+    """The transactions created from start_date to before end_date, from Postgres"""
+    query = select(
+        TransactionDBModel.id,
+        TransactionDBModel.wallet_id,
+        TransactionDBModel.credit_type_id,
+        TransactionDBModel.type,
+        TransactionDBModel.amount,
+        TransactionDBModel.created_at,
+    ).where(
+        TransactionDBModel.created_at >= start_date,
+        TransactionDBModel.created_at < end_date,
+    )
+    return [
+        (id, wallet_id, credit_type_id, type.name, amount, created_at)
+        for id, wallet_id, credit_type_id, type, amount, created_at in (
+            await session.execute(query)
+        ).all()
+    ]
+
+
+async def get_named_rows_to_mirror(
+    session: AsyncSession,
+    model: Union[Type[Wallet], Type[CreditType]],
+    after: Optional[Watermark],
+    limit: int,
+) -> List[Tuple[Any, ...]]:
+    """
+    The (id, name, updated_at) of the wallets or credit types updated after
+    the watermark, in (updated_at, id) order, read from Postgres.
+    """
+    query = (
+        select(model.id, model.name, model.updated_at)
+        .order_by(model.updated_at, model.id)
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(
+            model.updated_at >= after[0],
+            tuple_(model.updated_at, model.id) > after,
+        )
+    return list((await session.execute(query)).tuples().all())
+
+
+def _insert_transactions(cursor, rows: Sequence[Tuple[Any, ...]]):
+    cursor.executemany(
+        "INSERT INTO transactions VALUES ($1, $2, $3, $4, $5, $6)",
+        [(*row[:5], to_replica(row[5])) for row in rows],
+    )
+
+
+async def append_transactions(
+    replica: AnalyticsReplica,
+    rows: Sequence[Tuple[Any, ...]],
+    synced_until: datetime,
+):
+    """
+    Append transactions read by get_transactions_to_mirror and move the
+    watermark past them, every transaction before synced_until is mirrored
+    once the last batch is appended.
+    """
+
+    def append(cursor):
+        if rows:
+            _insert_transactions(cursor, rows)
+            _set_watermark(
+                cursor, TRANSACTIONS, (rows[-1][5], rows[-1][0]), synced_until
+            )
+            return
+        # Nothing to mirror, the watermark starts at synced_until when unset
+        cursor.execute(
+            """
+            INSERT INTO replica_watermarks (name, time, id, synced_until)
+            VALUES ($1, $2, $3, $2)
+            ON CONFLICT (name) DO UPDATE SET synced_until = EXCLUDED.synced_until
+            """,
+            [TRANSACTIONS, to_replica(synced_until), str(UUID(int=0))],
+        )
+
+    await replica.run(append)
+
+
+async def replace_transactions(
+    replica: AnalyticsReplica,
+    start_date: datetime,
+    end_date: datetime,
+    rows: Sequence[Tuple[Any, ...]],
+):
+    """Replace the transactions created from start_date to before end_date"""
+
+    def replace(cursor):
+        cursor.execute(
+            "DELETE FROM transactions WHERE created_at >= $1 AND created_at < $2",
+            [to_replica(start_date), to_replica(end_date)],
+        )
+        if rows:
+            _insert_transactions(cursor, rows)
+
+    await replica.run(replace)
+
+
+async def upsert_named_rows(
+    replica: AnalyticsReplica, table: str, rows: Sequence[Tuple[Any, ...]]
+):
+    """Upsert wallets or credit types read by get_named_rows_to_mirror"""
+    if not rows:
+        return
+
+    def upsert(cursor):
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {table} (id, name, updated_at) "
+            "VALUES ($1, $2, $3)",
+            [(id, name, to_replica(updated_at)) for id, name, updated_at in rows],
+        )
+        _set_watermark(cursor, table, (rows[-1][2], rows[-1][0]))
+
+    await replica.run(upsert)
+
+
+def _hours(start_date: datetime, end_date: datetime) -> Subquery:
+    return insights_db.group_hourly_transactions(
+        TransactionDBModel.created_at.between(start_date, end_date)
+    ).subquery()
+
+
+async def get_wallet_activity_aggregation(
+    replica: AnalyticsReplica,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    options: TimeSeriesOptions,
+    bounds: Optional[WalletActivityBounds] = None,
+) -> Tuple[List[dict], Optional[int]]:
+    hours = _hours(start_date, end_date)
+    rows = await replica.fetch(
+        insights_db.wallet_activity_query(
+            hours, start_date, end_date, granularity, options, bounds=bounds
+        )
+    )
+    total_wallets = None
+    if bounds is not None and bounds.page is not None:
+        count = await replica.fetch(insights_db.wallet_count_query(hours))
+        total_wallets = next(iter(count[0].values()))
+    return rows, total_wallets
+
+
+async def get_trending_wallets(
+    replica: AnalyticsReplica, start_date: datetime, end_date: datetime, limit: int
+) -> List[TrendingWalletAggregationResult]:
+    hours = _hours(start_date, end_date)
+    rows = await replica.fetch(insights_db.trending_wallets_query(hours, limit))
+    return [TrendingWalletAggregationResult(**row) for row in rows]
+
+
+async def get_credit_usage_aggregation(
+    replica: AnalyticsReplica, start_date: datetime, end_date: datetime
+) -> List[CreditUsageAggregationResult]:
+    hours = _hours(start_date, end_date)
+    rows = await replica.fetch(insights_db.credit_usage_query(hours))
+    return [CreditUsageAggregationResult(**row) for row in rows]
+
+
+async def get_credit_usage_timeseries_aggregation(
+    replica: AnalyticsReplica,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    options: TimeSeriesOptions,
+) -> List[dict]:
+    hours = _hours(start_date, end_date)
+    return await replica.fetch(
+        insights_db.credit_usage_timeseries_query(
+            hours, start_date, end_date, granularity, options
+        )
+    )
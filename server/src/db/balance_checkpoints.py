@@ -0,0 +1,195 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import (
+    DateTime,
+    FromClause,
+    Select,
+    cast,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    true,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models import BalanceCheckpoint, BalanceDBModel, TransactionDBModel
+from src.models.balances import BalanceHistoryPoint
+from src.models.Insights import TimeGranularity
+
+# Balances changed this long before the last checkpoint are recorded again, for
+# the writes committed after it started
+CHECKPOINT_OVERLAP = timedelta(minutes=5)
+
+
+async def get_last_checkpoint_at(session: AsyncSession) -> Optional[datetime]:
+    return await session.scalar(select(func.max(BalanceCheckpoint.checkpoint_at)))
+
+
+async def checkpoint_balances(session: AsyncSession) -> int:
+    """
+    Record the balances changed since the last checkpoint, every balance at the
+    first one.
+
+    Returns:
+        The number of balances recorded
+    """
+    last_checkpoint_at = await get_last_checkpoint_at(session)
+    balances = select(
+        BalanceDBModel.wallet_id,
+        BalanceDBModel.credit_type_id,
+        func.now(),
+        BalanceDBModel.available,
+        BalanceDBModel.held,
+        BalanceDBModel.spent,
+        BalanceDBModel.overall_spent,
+    )
+    if last_checkpoint_at is not None:
+        balances = balances.where(
+            BalanceDBModel.updated_at >= last_checkpoint_at - CHECKPOINT_OVERLAP
+        )
+    stmt = (
+        insert(BalanceCheckpoint)
+        .from_select(
+            [
+                "wallet_id",
+                "credit_type_id",
+                "checkpoint_at",
+                "available",
+                "held",
+                "spent",
+                "overall_spent",
+            ],
+            balances,
+        )
+        .on_conflict_do_nothing()
+    )
+    result = await session.execute(stmt)
+    return result.rowcount
+
+
+def _balances_at(
+    wallet_id: str, times: FromClause, credit_type_id: Optional[str] = None
+) -> Select:
+    """
+    The balances of a wallet as of every times.c.at: the latest checkpoint of
+    the balance until then, replaced by the snapshot of the latest transaction
+    completed on it since if any. The transactions are scanned back on the
+    (wallet_id, completed_at) index down to the checkpoint at most. Balances
+    without checkpoint or transaction until then did not exist yet.
+    """
+    balances = select(BalanceDBModel.credit_type_id).where(
+        BalanceDBModel.wallet_id == wallet_id
+    )
+    if credit_type_id is not None:
+        balances = balances.where(BalanceDBModel.credit_type_id == credit_type_id)
+    balances = balances.subquery("balances")
+
+    checkpoint = (
+        select(BalanceCheckpoint)
+        .where(
+            BalanceCheckpoint.wallet_id == wallet_id,
+            BalanceCheckpoint.credit_type_id == balances.c.credit_type_id,
+            BalanceCheckpoint.checkpoint_at <= times.c.at,
+        )
+        .order_by(BalanceCheckpoint.checkpoint_at.desc())
+        .limit(1)
+        .lateral("checkpoint")
+    )
+    since = func.coalesce(
+        checkpoint.c.checkpoint_at, cast(literal("-infinity"), DateTime(timezone=True))
+    )
+    latest = (
+        select(
+            TransactionDBModel.completed_at,
+            TransactionDBModel.snapshot_available,
+            TransactionDBModel.snapshot_held,
+            TransactionDBModel.snapshot_spent,
+            TransactionDBModel.snapshot_overall_spent,
+        )
+        .where(
+            TransactionDBModel.wallet_id == wallet_id,
+            TransactionDBModel.completed_at <= times.c.at,
+            TransactionDBModel.completed_at > since,
+            TransactionDBModel.credit_type_id == balances.c.credit_type_id,
+            TransactionDBModel.snapshot_available.is_not(None),
+        )
+        .order_by(TransactionDBModel.completed_at.desc())
+        .limit(1)
+        .lateral("latest")
+    )
+    return (
+        select(
+            balances.c.credit_type_id,
+            func.coalesce(latest.c.snapshot_available, checkpoint.c.available).label(
+                "available"
+            ),
+            func.coalesce(latest.c.snapshot_held, checkpoint.c.held).label("held"),
+            func.coalesce(latest.c.snapshot_spent, checkpoint.c.spent).label("spent"),
+            func.coalesce(
+                latest.c.snapshot_overall_spent, checkpoint.c.overall_spent
+            ).label("overall_spent"),
+        )
+        .select_from(times)
+        .join(balances, true())
+        .outerjoin(checkpoint, true())
+        .outerjoin(latest, true())
+        .where(
+            or_(
+                checkpoint.c.checkpoint_at.is_not(None),
+                latest.c.completed_at.is_not(None),
+            )
+        )
+    )
+
+
+async def get_balances_at(
+    session: AsyncSession, wallet_id: str, as_of: datetime
+) -> List[BalanceHistoryPoint]:
+    """The balances of a wallet as of a time, those existing by then"""
+    times = select(literal(as_of, DateTime(timezone=True)).label("at")).subquery(
+        "times"
+    )
+    query = _balances_at(wallet_id, times).add_columns(times.c.at.label("timestamp"))
+    results = (await session.execute(query)).all()
+    return [BalanceHistoryPoint(**result._asdict()) for result in results]
+
+
+async def get_balance_history(
+    session: AsyncSession,
+    wallet_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    credit_type_id: Optional[str] = None,
+) -> List[BalanceHistoryPoint]:
+    """
+    The balances of a wallet as of the end of every bucket of granularity from
+    start_date to end_date, the last bucket ends at end_date.
+    """
+    step = literal_column(f"interval '1 {granularity.value}'")
+    grid = (
+        func.generate_series(
+            func.date_trunc(granularity.value, literal(start_date)),
+            func.date_trunc(
+                granularity.value, literal(end_date - timedelta(microseconds=1))
+            ),
+            step,
+        )
+        .table_valued("bucket")
+        .render_derived(name="grid")
+    )
+    times = select(
+        grid.c.bucket,
+        func.least(grid.c.bucket + step, literal(end_date)).label("at"),
+    ).subquery("times")
+    query = (
+        _balances_at(wallet_id, times, credit_type_id)
+        .add_columns(times.c.bucket.label("timestamp"))
+        .order_by(times.c.bucket, "credit_type_id")
+    )
+    results = (await session.execute(query)).all()
+    return [BalanceHistoryPoint(**result._asdict()) for result in results]
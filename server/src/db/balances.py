@@ -1,10 +1,148 @@
-from uuid import uuid4
-
-from sqlalchemy import select, update
+from sqlalchemy import (
+    ColumnElement,
+    case,
+    func,
+    literal,
+    literal_column,
+    select,
+    update,
+)
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.settings import settings
 from src.models.balances import BalanceDBModel
+from src.models.base import UUIDString
+from src.utils.ids import generate_id
+
+
+def depletion_at(available: ColumnElement, burn_rate: ColumnElement) -> ColumnElement:
+    """When available credits run out at a burn rate, from now, see the
+    balance_depletion_at function"""
+    return func.balance_depletion_at(available, burn_rate)
+
+
+def _credit_type_threshold(credit_type_id: ColumnElement | str) -> ColumnElement:
+    """The low balance threshold of a credit type, see the
+    credit_type_low_balance_threshold function"""
+    return func.credit_type_low_balance_threshold(
+        literal(credit_type_id, UUIDString)
+        if isinstance(credit_type_id, str)
+        else credit_type_id
+    )
+
+
+def low_balance_since(available: ColumnElement) -> ColumnElement:
+    """
+    What low_balance_since of a balance becomes with available credits: when
+    they first fell below the threshold of the balance, or else of its credit
+    type, while they stay below it, and null otherwise. Every statement
+    changing a balance sets it, the threshold is read by the same statement.
+
+    A balance crossed its threshold in the statement that returns it when
+    low_balance_since is its updated_at, both being the time of the
+    transaction, see crossed_low_balance.
+    """
+    threshold = func.coalesce(
+        BalanceDBModel.low_balance_threshold,
+        _credit_type_threshold(BalanceDBModel.credit_type_id),
+    )
+    return case(
+        (
+            available < threshold,
+            func.coalesce(BalanceDBModel.low_balance_since, func.now()),
+        ),
+        else_=None,
+    )
+
+
+def _new_low_balance_since(
+    credit_type_id: ColumnElement | str, available: ColumnElement | float
+) -> ColumnElement:
+    """low_balance_since of a balance created with available credits"""
+    if not isinstance(available, ColumnElement):
+        available = literal(available)
+    return case(
+        (
+            available < _credit_type_threshold(credit_type_id),
+            func.now(),
+        ),
+        else_=None,
+    )
+
+
+def _to_sql(expression: ColumnElement) -> str:
+    return str(expression.compile(dialect=postgresql.dialect()))
+
+
+def low_balance_since_sql(available: str) -> str:
+    """low_balance_since, in SQL for the balance upserts written in SQL, of the
+    balances row updated with the available credits of the SQL expression"""
+    return _to_sql(low_balance_since(literal_column(available)))
+
+
+def new_low_balance_since_sql(credit_type_id: str, available: str) -> str:
+    """low_balance_since, in SQL for the balance upserts written in SQL, of a
+    balance inserted with the credit type and available credits of the SQL
+    expressions"""
+    return _to_sql(
+        _new_low_balance_since(
+            literal_column(credit_type_id), literal_column(available)
+        )
+    )
+
+
+def crossed_low_balance(balance: BalanceDBModel) -> bool:
+    """Whether the statement that returned a balance took it below its threshold"""
+    return (
+        balance.low_balance_since is not None
+        and balance.low_balance_since == balance.updated_at
+    )
+
+
+def _spend_stats(spent: float) -> dict:
+    """
+    The spend statistics of a balance after a debit of spent credits, from
+    their current values, to update a balance with.
+
+    The burn rate is an exponentially decayed sum of the credits spent, with
+    a time constant of BURN_RATE_WINDOW_DAYS, divided by it, so that a steady
+    rate of spending converges to its credits per day. The mean and variance
+    of the amounts debited are exponentially weighted by SPEND_EWMA_ALPHA, and
+    the z-score compares the debit with them before it is added.
+    """
+    window = settings.BURN_RATE_WINDOW_DAYS
+    alpha = settings.SPEND_EWMA_ALPHA
+    now = func.now()
+    elapsed_days = (
+        func.extract("epoch", now - func.coalesce(BalanceDBModel.last_debit_at, now))
+        / 86400
+    )
+    burn_rate = BalanceDBModel.burn_rate * func.exp(-elapsed_days / window) + (
+        spent / window
+    )
+    deviation = literal(spent) - BalanceDBModel.spend_mean
+    first_debit = BalanceDBModel.last_debit_at.is_(None)
+    return dict(
+        burn_rate=burn_rate,
+        spend_zscore=case(
+            (
+                BalanceDBModel.spend_variance > 0,
+                deviation / func.sqrt(BalanceDBModel.spend_variance),
+            ),
+            else_=None,
+        ),
+        spend_mean=case(
+            (first_debit, spent), else_=BalanceDBModel.spend_mean + alpha * deviation
+        ),
+        spend_variance=case(
+            (first_debit, 0),
+            else_=(1 - alpha)
+            * (BalanceDBModel.spend_variance + alpha * deviation * deviation),
+        ),
+        last_debit_at=now,
+    )
 
 
 async def get_balance(
@@ -25,17 +163,26 @@ async def deposit_balance(
     stmt = (
         insert(BalanceDBModel)
         .values(
-            id=str(uuid4()),
+            id=generate_id(),
             wallet_id=wallet_id,
             credit_type_id=credit_type_id,
             available=amount,
             held=0,
             spent=0,
             overall_spent=0,
+            low_balance_since=_new_low_balance_since(credit_type_id, amount),
         )
         .on_conflict_do_update(
             index_elements=["wallet_id", "credit_type_id"],
-            set_=dict(available=BalanceDBModel.available + amount),
+            set_=dict(
+                available=BalanceDBModel.available + amount,
+                estimated_depletion_at=depletion_at(
+                    BalanceDBModel.available + amount, BalanceDBModel.burn_rate
+                ),
+                low_balance_since=low_balance_since(BalanceDBModel.available + amount),
+                # on_conflict_do_update leaves out the onupdate of updated_at
+                updated_at=func.now(),
+            ),
         )
         .returning(BalanceDBModel)
     )
@@ -52,6 +199,7 @@ async def debit_balance(
     held_amount: float,
     spent: float,
 ) -> BalanceDBModel | None:
+    spend_stats = _spend_stats(spent)
     stmt = (
         update(BalanceDBModel)
         .where(
@@ -63,6 +211,11 @@ async def debit_balance(
             held=BalanceDBModel.held - held_amount,
             spent=BalanceDBModel.spent + spent,
             overall_spent=BalanceDBModel.overall_spent + spent,
+            **spend_stats,
+            estimated_depletion_at=depletion_at(
+                BalanceDBModel.available - amount, spend_stats["burn_rate"]
+            ),
+            low_balance_since=low_balance_since(BalanceDBModel.available - amount),
         )
         .returning(BalanceDBModel)
     )
@@ -82,6 +235,10 @@ async def hold_balance(
         .values(
             held=BalanceDBModel.held + amount,
             available=BalanceDBModel.available - amount,
+            estimated_depletion_at=depletion_at(
+                BalanceDBModel.available - amount, BalanceDBModel.burn_rate
+            ),
+            low_balance_since=low_balance_since(BalanceDBModel.available - amount),
         )
         .returning(BalanceDBModel)
     )
@@ -95,7 +252,7 @@ async def release_balance(
     stmt = (
         insert(BalanceDBModel)
         .values(
-            id=str(uuid4()),
+            id=generate_id(),
             wallet_id=wallet_id,
             credit_type_id=credit_type_id,
         )
@@ -104,6 +261,12 @@ async def release_balance(
             set_=dict(
                 held=BalanceDBModel.held - amount,
                 available=BalanceDBModel.available + amount,
+                estimated_depletion_at=depletion_at(
+                    BalanceDBModel.available + amount, BalanceDBModel.burn_rate
+                ),
+                low_balance_since=low_balance_since(BalanceDBModel.available + amount),
+                # on_conflict_do_update leaves out the onupdate of updated_at
+                updated_at=func.now(),
             ),
         )
         .returning(BalanceDBModel)
@@ -129,8 +292,50 @@ async def adjust_balance(
             available=amount,
             held=0,
             spent=0 if reset_spent else BalanceDBModel.spent,
+            estimated_depletion_at=depletion_at(
+                literal(amount), BalanceDBModel.burn_rate
+            ),
+            low_balance_since=low_balance_since(literal(amount)),
         )
         .returning(BalanceDBModel)
     )
     result = await session.execute(stmt)
     return result.scalar_one_or_none()
+
+
+async def set_low_balance_threshold(
+    session: AsyncSession,
+    wallet_id: str,
+    credit_type_id: str,
+    threshold: float | None,
+) -> BalanceDBModel:
+    """
+    Set the threshold of a balance, creating the balance if needed. A balance
+    already below the new threshold is not notified until it crosses it again.
+    """
+    stmt = insert(BalanceDBModel).values(
+        id=generate_id(),
+        wallet_id=wallet_id,
+        credit_type_id=credit_type_id,
+        low_balance_threshold=threshold,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["wallet_id", "credit_type_id"],
+        set_=dict(
+            low_balance_threshold=stmt.excluded.low_balance_threshold,
+            low_balance_since=case(
+                (
+                    BalanceDBModel.available
+                    < func.coalesce(
+                        stmt.excluded.low_balance_threshold,
+                        _credit_type_threshold(BalanceDBModel.credit_type_id),
+                    ),
+                    BalanceDBModel.low_balance_since,
+                ),
+                else_=None,
+            ),
+            updated_at=func.now(),
+        ),
+    ).returning(BalanceDBModel)
+    result = await session.execute(stmt)
+    return result.scalar_one()
@@ -1,5 +1,4 @@
 from typing import List
-from uuid import uuid4
 
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -9,6 +8,7 @@ from src.models.credit_types import (
     CreditType,
     UpdateCreditTypeRequest,
 )
+from src.utils.ids import generate_id
 
 
 async def get_credit_types(db: AsyncSession) -> List[CreditType]:
@@ -21,9 +21,10 @@ async def create_credit_type(
     db: AsyncSession, credit_type_request: CreateCreditTypeRequest
 ) -> CreditType:
     credit_type = CreditType(
-        id=str(uuid4()),
+        id=generate_id(),
         name=credit_type_request.name,
         description=credit_type_request.description,
+        low_balance_threshold=credit_type_request.low_balance_threshold,
     )
     db.add(credit_type)
     return credit_type
@@ -45,6 +46,8 @@ async def update_credit_type(
         credit_type.name = credit_type_request.name
     if credit_type_request.description:
         credit_type.description = credit_type_request.description
+    if "low_balance_threshold" in credit_type_request.model_fields_set:
+        credit_type.low_balance_threshold = credit_type_request.low_balance_threshold
     db.add(credit_type)
     return credit_type
 
@@ -0,0 +1,106 @@
+from enum import Enum
+from typing import Dict, FrozenSet, List, Tuple
+
+from sqlalchemy import ColumnElement, String, literal_column, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.settings import settings
+from src.utils.singleton import SingletonMeta
+
+
+def promoted_context_index_name(table_name: str, key: str) -> str:
+    """The (context ->> key, created_at) index of the promoted_context_keys migration"""
+    return f"ix_{table_name}_ctx_{key}_created_at"
+
+
+class PromotedContextKeys(metaclass=SingletonMeta):
+    """
+    The configured promoted context keys whose indexes exist, per table. Until
+    they are loaded, and for keys whose indexes are missing or still being
+    built, filters are applied like filters on any other key.
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, FrozenSet[str]] = {}
+
+    async def load(self, session: AsyncSession):
+        result = await session.execute(
+            text(
+                """
+                SELECT indexes.relname
+                FROM pg_index
+                JOIN pg_class indexes ON indexes.oid = pg_index.indexrelid
+                WHERE indexes.relnamespace = current_schema()::regnamespace
+                AND pg_index.indisvalid
+                """
+            )
+        )
+        index_names = set(result.scalars())
+        self._keys = {
+            table_name: frozenset(
+                key
+                for key in settings.PROMOTED_CONTEXT_KEYS_LIST
+                if promoted_context_index_name(table_name, key) in index_names
+            )
+            for table_name in ("transactions", "wallets")
+        }
+
+    def get(self, table_name: str) -> FrozenSet[str]:
+        return self._keys.get(table_name, frozenset())
+
+
+def enum_literal(value: Enum):
+    """
+    Render an enum member inline as a SQL literal instead of a bound parameter.
+
+    Partial indexes are only considered when the planner can prove the query
+    predicate implies the index predicate, which it cannot do for a generic plan
+    of a prepared statement where the value is a parameter.
+    """
+    return literal_column(f"'{value.name}'")
+
+
+def context_value(column, key: str):
+    """
+    Extract a context key as text, with the key rendered inline.
+
+    The expression indexes on promoted context keys are only matched by a query
+    extracting the same literal key, never by one binding the key as a parameter.
+    Only use it with trusted keys, such as the validated promoted keys.
+    """
+    return column.op("->>", return_type=String)(literal_column(f"'{key}'"))
+
+
+def promoted_context_filters(
+    column, context: Dict[str, str]
+) -> Tuple[List[ColumnElement[bool]], Dict[str, str]]:
+    """
+    Split context filters into predicates on the promoted context keys, which
+    are served by their (context ->> key, created_at) indexes, and the remaining
+    filters which the caller applies as it otherwise would. Either way a filter
+    matches the context values whose text is the filtered value.
+    """
+    promoted_keys = PromotedContextKeys().get(column.table.name)
+    predicates = [
+        context_value(column, key) == str(value)
+        for key, value in context.items()
+        if key in promoted_keys
+    ]
+    remaining = {
+        key: value for key, value in context.items() if key not in promoted_keys
+    }
+    return predicates, remaining
+
+
+def uuid7_sql(timestamp: str) -> str:
+    """
+    SQL expression generating a UUIDv7 for the given SQL timestamp expression.
+
+    Used by set based inserts that cannot call generate_id() per row, so their
+    ids are time ordered like the ids generated by the application.
+    """
+    return (
+        "encode(set_bit(set_bit(overlay(uuid_send(gen_random_uuid()) placing "
+        f"substring(int8send(floor(extract(epoch FROM {timestamp}) * 1000)::bigint) "
+        "FROM 3) FROM 1 FOR 6), 52, 1), 53, 1), 'hex')::uuid"
+    )
@@ -0,0 +1,46 @@
+from typing import Dict
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.insight_counters import InsightCounter
+
+EXACT_COUNTS_SQL = """
+    SELECT 'transactions.' || type, count(*) FROM transactions GROUP BY 1
+    UNION ALL
+    SELECT 'wallets', count(*) FROM wallets
+    UNION ALL
+    SELECT 'credit_types', count(*) FROM credit_types
+"""
+
+
+async def get_counters(session: AsyncSession) -> Dict[str, int]:
+    """The value of every counter, summed over its shards"""
+    result = await session.execute(
+        select(InsightCounter.name, func.sum(InsightCounter.value)).group_by(
+            InsightCounter.name
+        )
+    )
+    return {name: int(value) for name, value in result.all()}
+
+
+async def get_exact_counts(session: AsyncSession) -> Dict[str, int]:
+    """What every counter should be, counted from the counted tables"""
+    result = await session.execute(text(EXACT_COUNTS_SQL))
+    return {name: count for name, count in result.all()}
+
+
+async def add_to_counters(session: AsyncSession, deltas: Dict[str, int]):
+    await session.execute(
+        text(
+            """
+            INSERT INTO insight_counters AS c (name, shard, value)
+            SELECT name, 0, delta
+            FROM unnest(CAST(:names AS text[]), CAST(:deltas AS bigint[]))
+                AS d(name, delta)
+            ORDER BY name
+            ON CONFLICT (name, shard) DO UPDATE SET value = c.value + EXCLUDED.value
+            """
+        ),
+        {"names": list(deltas), "deltas": list(deltas.values())},
+    )
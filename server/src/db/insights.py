@@ -1,145 +1,771 @@
-from datetime import datetime
-from typing import Dict, List, Optional
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from sqlalchemy import Float, String, and_, case, desc, func, select
+from sqlalchemy import (
+    BigInteger,
+    ColumnElement,
+    Double,
+    Integer,
+    RowMapping,
+    Select,
+    String,
+    Subquery,
+    and_,
+    case,
+    cast,
+    desc,
+    func,
+    literal,
+    literal_column,
+    select,
+    tablesample,
+    true,
+    union_all,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
-from src.models import CreditType, TransactionDBModel, Wallet
+from src.core.settings import settings
+from src.db import insight_counters as insight_counters_db
+from src.db import rollups as rollups_db
+from src.db.expressions import enum_literal, promoted_context_filters
+from src.models import (
+    BalanceDBModel,
+    CreditType,
+    TransactionDBModel,
+    TransactionRollup,
+    Wallet,
+)
 from src.models.Insights import (
+    OTHER_WALLETS_ID,
+    OTHER_WALLETS_NAME,
+    ActiveWalletsPoint,
+    ConfidenceInterval,
     CreditUsageAggregationResult,
-    CreditUsageTimeSeriesAggregationResult,
+    DepletingBalance,
     GeneralInsightsResponse,
     TimeGranularity,
+    TimeSeriesOptions,
     TrendingWalletAggregationResult,
-    WalletActivityAggregationResult,
+    WalletActivityBounds,
 )
+from src.models.transactions import TransactionType
+
+# Seed of the sample of approximate insights
+SAMPLE_SEED = 0
+# Standard normal quantile of 95% confidence intervals
+CONFIDENCE_Z = 1.96
 
 
 async def get_general_insights(
     session: AsyncSession,
 ) -> GeneralInsightsResponse:
     """
-    Get general insights including transaction counts, deposit counts etc.
+    Get general insights including transaction counts, deposit counts etc.,
+    read from the insight counters.
     """
-    # Query for transaction statistics
-    transaction_stats_query = select(
-        func.count().label("total_transactions"),
-        func.sum(
-            case(
-                (TransactionDBModel.type == "DEPOSIT", 1),
-                else_=0,
-            )
-        ).label("total_deposits"),
-        func.sum(
-            case(
-                (TransactionDBModel.type == "DEBIT", 1),
-                else_=0,
+    counters = await insight_counters_db.get_counters(session)
+
+    def transactions(transaction_type: TransactionType) -> int:
+        return counters.get(f"transactions.{transaction_type.name}", 0)
+
+    return GeneralInsightsResponse(
+        total_transactions=sum(map(transactions, TransactionType)),
+        total_deposits=transactions(TransactionType.DEPOSIT),
+        total_debits=transactions(TransactionType.DEBIT),
+        total_holds=transactions(TransactionType.HOLD),
+        total_adjustments=transactions(TransactionType.ADJUST),
+        total_releases=transactions(TransactionType.RELEASE),
+        total_wallets=counters.get("wallets", 0),
+        total_credit_types=counters.get("credit_types", 0),
+    )
+
+
+def group_hourly_transactions(*conditions: ColumnElement) -> Select:
+    """
+    Transaction counts and amounts per hour, wallet, credit type and type of
+    the transactions matching conditions, grouped from transactions.
+    """
+    bucket = func.date_trunc("hour", TransactionDBModel.created_at)
+    return (
+        select(
+            bucket.label("bucket"),
+            TransactionDBModel.wallet_id,
+            TransactionDBModel.credit_type_id,
+            TransactionDBModel.type,
+            func.count().label("transaction_count"),
+            func.coalesce(func.sum(TransactionDBModel.amount), 0).label("amount_sum"),
+        )
+        .where(*conditions)
+        .group_by(
+            bucket,
+            TransactionDBModel.wallet_id,
+            TransactionDBModel.credit_type_id,
+            TransactionDBModel.type,
+        )
+    )
+
+
+async def get_hourly_transactions(
+    session: AsyncSession,
+    start_date: datetime,
+    end_date: datetime,
+    context: Optional[Dict[str, str]] = None,
+) -> Subquery:
+    """
+    Transaction counts and amounts per hour, wallet, credit type and type for
+    the transactions created between start_date and end_date.
+
+    The hours entirely within the range and before the rollup watermark are
+    read from transaction_rollups. The partial hours at the edges of the range
+    and the hours after the watermark are grouped from transactions, as are all
+    hours when filtering by context, which the rollups do not keep.
+    """
+    promoted, remaining = promoted_context_filters(
+        TransactionDBModel.context, context or {}
+    )
+    context_filters = [
+        *promoted,
+        *(
+            TransactionDBModel.context[key].as_string() == value
+            for key, value in remaining.items()
+        ),
+    ]
+
+    def raw_hours(*conditions: ColumnElement) -> Select:
+        return group_hourly_transactions(*conditions, *context_filters)
+
+    watermark = None
+    if not context_filters:
+        watermark = await rollups_db.get_watermark(
+            session, rollups_db.TRANSACTION_ROLLUPS
+        )
+    rollup_start = rollups_db.bucket_start(start_date)
+    if rollup_start < start_date:
+        rollup_start += rollups_db.BUCKET_SIZE
+    rollup_end = min(rollups_db.bucket_start(end_date), watermark or rollup_start)
+    if rollup_end <= rollup_start:
+        return raw_hours(
+            TransactionDBModel.created_at.between(start_date, end_date)
+        ).subquery()
+
+    rollups = select(
+        TransactionRollup.bucket,
+        TransactionRollup.wallet_id,
+        TransactionRollup.credit_type_id,
+        TransactionRollup.type,
+        TransactionRollup.transaction_count,
+        TransactionRollup.amount_sum,
+    ).where(
+        TransactionRollup.bucket >= rollup_start,
+        TransactionRollup.bucket < rollup_end,
+    )
+    return union_all(
+        rollups,
+        raw_hours(
+            TransactionDBModel.created_at >= start_date,
+            TransactionDBModel.created_at < rollup_start,
+        ),
+        raw_hours(
+            TransactionDBModel.created_at >= rollup_end,
+            TransactionDBModel.created_at <= end_date,
+        ),
+    ).subquery()
+
+
+async def count_range_transactions(
+    session: AsyncSession, start_date: datetime, end_date: datetime
+) -> float:
+    """
+    About the number of transactions created between start_date and end_date.
+    The hours before the rollup watermark are summed from transaction_rollups,
+    the hours at the edges of the range in proportion of the time they share
+    with it, and the transactions after the watermark are counted.
+    """
+    watermark = await rollups_db.get_watermark(session, rollups_db.TRANSACTION_ROLLUPS)
+    rolled_up = 0.0
+    if watermark is not None and watermark > start_date:
+        rolled_up_end = min(end_date, watermark)
+        bucket_end = TransactionRollup.bucket + literal_column("interval '1 hour'")
+        overlap = (
+            func.extract(
+                "epoch",
+                func.least(bucket_end, literal(rolled_up_end))
+                - func.greatest(TransactionRollup.bucket, literal(start_date)),
             )
-        ).label("total_debits"),
-        func.sum(
-            case(
-                (TransactionDBModel.type == "HOLD", 1),
-                else_=0,
+            / rollups_db.BUCKET_SIZE.total_seconds()
+        )
+        rolled_up = await session.scalar(
+            select(
+                func.coalesce(
+                    func.sum(TransactionRollup.transaction_count * overlap), 0
+                )
+            ).where(
+                TransactionRollup.bucket >= rollups_db.bucket_start(start_date),
+                TransactionRollup.bucket < rolled_up_end,
             )
-        ).label("total_holds"),
-        func.sum(
-            case(
-                (TransactionDBModel.type == "ADJUST", 1),
-                else_=0,
+        )
+    recent_start = start_date if watermark is None else max(start_date, watermark)
+    recent = 0
+    if recent_start <= end_date:
+        recent = await session.scalar(
+            select(func.count()).where(
+                TransactionDBModel.created_at >= recent_start,
+                TransactionDBModel.created_at <= end_date,
             )
-        ).label("total_adjustments"),
-        func.sum(
-            case(
-                (TransactionDBModel.type == "RELEASE", 1),
-                else_=0,
+        )
+    return float(rolled_up) + recent
+
+
+async def get_sample_percent(
+    session: AsyncSession, start_date: datetime, end_date: datetime
+) -> Optional[float]:
+    """
+    The percentage of the blocks of transactions sampled for about
+    INSIGHTS_SAMPLE_ROWS of the transactions created between start_date and
+    end_date. None when the range holds fewer transactions than that, or when
+    the sample would read more transactions than the range holds, since the
+    exact query reading the range on its created_at index is then cheaper.
+    """
+    range_count = await count_range_transactions(session, start_date, end_date)
+    if range_count <= settings.INSIGHTS_SAMPLE_ROWS:
+        return None
+    counters = await insight_counters_db.get_counters(session)
+    total = sum(
+        counters.get(f"transactions.{transaction_type.name}", 0)
+        for transaction_type in TransactionType
+    )
+    sample_percent = 100 * settings.INSIGHTS_SAMPLE_ROWS / range_count
+    if total * sample_percent / 100 >= range_count:
+        return None
+    return sample_percent
+
+
+def sample_hourly_transactions(
+    start_date: datetime,
+    end_date: datetime,
+    sample_percent: float,
+    context: Optional[Dict[str, str]] = None,
+) -> Subquery:
+    """
+    Transaction counts and amounts per hour, wallet, credit type, type and
+    block of the transactions created between start_date and end_date, in a
+    TABLESAMPLE SYSTEM sample of sample_percent of the blocks of transactions.
+
+    Only the sampled blocks are read, whatever the range. The sample is the
+    same from one query to the next while the table is unchanged, so that
+    repeated estimates agree.
+    """
+    sampled = aliased(
+        TransactionDBModel,
+        tablesample(
+            TransactionDBModel.__table__,
+            func.system(sample_percent),
+            name="sampled",
+            seed=literal_column(str(SAMPLE_SEED)),
+        ),
+    )
+    # Blocks of different partitions have the same numbers
+    block = literal_column(
+        "(sampled.tableoid::bigint << 32) + (sampled.ctid::text::point)[0]::bigint"
+    )
+    bucket = func.date_trunc("hour", sampled.created_at)
+    return (
+        select(
+            bucket.label("bucket"),
+            sampled.wallet_id,
+            sampled.credit_type_id,
+            sampled.type,
+            block.label("block"),
+            func.count().label("transaction_count"),
+            func.coalesce(func.sum(sampled.amount), 0).label("amount_sum"),
+        )
+        .where(
+            sampled.created_at.between(start_date, end_date),
+            *(
+                sampled.context[key].as_string() == value
+                for key, value in (context or {}).items()
+            ),
+        )
+        .group_by(
+            bucket, sampled.wallet_id, sampled.credit_type_id, sampled.type, block
+        )
+        .subquery()
+    )
+
+
+def _estimate(
+    query: Select,
+    hours: Subquery,
+    keys: List[str],
+    metrics: List[str],
+    sample_percent: float,
+) -> Select:
+    """
+    Estimate the metrics of a query of (*keys, *metrics) rows grouped from a
+    sample of hourly transactions, along with their {metric}_variance.
+
+    Every block is in the sample with probability p, so a metric summing to
+    y_b over each sampled block is estimated by sum(y_b) / p, with a variance
+    of (1 - p) / p^2 * sum(y_b^2). Counts are rounded to whole transactions.
+    """
+    blocks = query.add_columns(hours.c.block).group_by(hours.c.block).subquery()
+    p = sample_percent / 100
+    columns: List[ColumnElement] = [blocks.c[key] for key in keys]
+    for metric in metrics:
+        value = blocks.c[metric]
+        estimate = func.sum(value) / p
+        if isinstance(value.type, BigInteger):
+            estimate = cast(func.round(estimate), BigInteger)
+        columns.append(estimate.label(metric))
+        columns.append(
+            cast(func.sum(value * value) * ((1 - p) / p**2), Double).label(
+                f"{metric}_variance"
             )
-        ).label("total_releases"),
-    ).select_from(TransactionDBModel)
+        )
+    return select(*columns).group_by(*(blocks.c[key] for key in keys))
+
+
+def pop_confidence_intervals(
+    values: Dict[str, Any]
+) -> Optional[Dict[str, ConfidenceInterval]]:
+    """
+    Replace the {metric}_variance values of an estimate by the confidence
+    intervals of their metrics, None when the values are exact.
+    """
+    intervals = {}
+    for name in [name for name in values if name.endswith("_variance")]:
+        metric = name.removesuffix("_variance")
+        margin = CONFIDENCE_Z * math.sqrt(max(values.pop(name), 0))
+        intervals[metric] = ConfidenceInterval(
+            low=max(values[metric] - margin, 0), high=values[metric] + margin
+        )
+    return intervals or None
 
-    # Get counts for wallets and credit types
-    total_wallets = (await session.execute(select(func.count(Wallet.id)))).scalar() or 0
-    total_credit_types = (
-        await session.execute(select(func.count(CreditType.id)))
-    ).scalar() or 0
 
-    # Execute transaction query and build response
-    results = (await session.execute(transaction_stats_query)).all()
+async def get_hourly_wallet_transaction_counts(
+    session: AsyncSession, start_date: datetime, end_date: datetime
+) -> List[Tuple[datetime, str, int]]:
+    """
+    Number of transactions per hour and wallet created in [start_date,
+    end_date), for hour aligned dates.
 
-    return GeneralInsightsResponse(
-        total_transactions=results[0][0],
-        total_deposits=results[0][1],
-        total_debits=results[0][2],
-        total_holds=results[0][3],
-        total_adjustments=results[0][4],
-        total_releases=results[0][5],
-        total_wallets=total_wallets,
-        total_credit_types=total_credit_types,
+    Returns:
+        list: (hour, wallet_id, transaction count) tuples
+    """
+    hours = await get_hourly_transactions(
+        session, start_date, end_date - timedelta(microseconds=1)
+    )
+    query = select(hours.c.bucket, hours.c.wallet_id, _sum_counts(hours)).group_by(
+        hours.c.bucket, hours.c.wallet_id
     )
+    return list((await session.execute(query)).tuples().all())
 
 
-async def get_wallet_activity_aggregation(
-    session: AsyncSession,  # Add session parameter
+async def get_daily_active_wallets(
+    session: AsyncSession, start_date: datetime, end_date: datetime
+) -> List[Tuple[datetime, str, str]]:
+    """
+    The wallets with transactions of each credit type on each UTC day in
+    [start_date, end_date), for day aligned dates.
+
+    Returns:
+        list: (day, credit_type_id, wallet_id) tuples
+    """
+    hours = await get_hourly_transactions(
+        session, start_date, end_date - timedelta(microseconds=1)
+    )
+    day = func.date_trunc("day", hours.c.bucket)
+    query = select(day, hours.c.credit_type_id, hours.c.wallet_id).distinct()
+    return list((await session.execute(query)).tuples().all())
+
+
+async def get_active_wallets_aggregation(
+    session: AsyncSession,
     start_date: datetime,
     end_date: datetime,
     granularity: TimeGranularity,
-    context: Optional[Dict[str, str]] = None,
-) -> List[WalletActivityAggregationResult]:
-    date_grouping = get_date_grouping_by_granularity(granularity)
-
+) -> List[ActiveWalletsPoint]:
+    """
+    Exact number of distinct wallets with transactions per period and credit
+    type in [start_date, end_date)
+    """
+    hours = await get_hourly_transactions(
+        session, start_date, end_date - timedelta(microseconds=1)
+    )
+    date_grouping = get_date_grouping_by_granularity(granularity, hours.c.bucket)
     query = (
         select(
             date_grouping.label("timestamp"),
-            TransactionDBModel.wallet_id,
-            Wallet.name.label("wallet_name"),
-            func.count().label("total_transactions"),
-            func.sum(
-                case(
-                    (TransactionDBModel.type == "DEPOSIT", 1),
-                    else_=0,
-                )
-            ).label("total_deposits"),
-            func.sum(
-                case(
-                    (TransactionDBModel.type == "DEBIT", 1),
-                    else_=0,
-                )
-            ).label("total_debits"),
-            func.sum(
-                case(
-                    (TransactionDBModel.type == "HOLD", 1),
-                    else_=0,
-                )
-            ).label("total_holds"),
-            func.sum(
-                case(
-                    (TransactionDBModel.type == "ADJUST", 1),
-                    else_=0,
-                )
-            ).label("total_adjustments"),
-            func.sum(
-                case(
-                    (TransactionDBModel.type == "RELEASE", 1),
-                    else_=0,
-                )
-            ).label("total_releases"),
+            hours.c.credit_type_id,
+            CreditType.name.label("credit_type_name"),
+            func.count(hours.c.wallet_id.distinct()).label("active_wallets"),
+        )
+        .select_from(hours)
+        .join(CreditType, CreditType.id == hours.c.credit_type_id)
+        .group_by(date_grouping, hours.c.credit_type_id, CreditType.name)
+        .order_by(date_grouping, hours.c.credit_type_id)
+    )
+
+    results = (await session.execute(query)).all()
+    return [ActiveWalletsPoint(**result._asdict()) for result in results]
+
+
+async def get_hourly_debit_amount_bins(
+    session: AsyncSession, start_date: datetime, end_date: datetime, gamma: float
+) -> List[Tuple[datetime, str, int, int]]:
+    """
+    Number of debits per hour, credit type and logarithmic bin of their amount
+    created in [start_date, end_date), where bin i holds the amounts in
+    (gamma^(i-1), gamma^i].
+
+    Returns:
+        list: (hour, credit_type_id, bin, debit count) tuples
+    """
+    bucket = func.date_trunc("hour", TransactionDBModel.created_at)
+    amount_bin = cast(
+        func.ceil(func.ln(TransactionDBModel.amount) / math.log(gamma)), Integer
+    )
+    query = (
+        select(
+            bucket,
+            TransactionDBModel.credit_type_id,
+            amount_bin,
+            func.count(),
         )
-        .select_from(TransactionDBModel)
-        .join(Wallet, Wallet.id == TransactionDBModel.wallet_id)
         .where(
+            TransactionDBModel.type == enum_literal(TransactionType.DEBIT),
+            TransactionDBModel.created_at >= start_date,
+            TransactionDBModel.created_at < end_date,
+            TransactionDBModel.amount > 0,
+        )
+        .group_by(bucket, TransactionDBModel.credit_type_id, amount_bin)
+    )
+    return list((await session.execute(query)).tuples().all())
+
+
+def _sum_counts(
+    hours: Subquery, transaction_type: Optional[TransactionType] = None
+) -> ColumnElement:
+    total = func.sum(hours.c.transaction_count)
+    if transaction_type is not None:
+        total = total.filter(hours.c.type == enum_literal(transaction_type))
+    return cast(func.coalesce(total, 0), BigInteger)
+
+
+def _sum_debits_amount(hours: Subquery) -> ColumnElement:
+    return func.coalesce(
+        func.sum(hours.c.amount_sum).filter(
+            hours.c.type == enum_literal(TransactionType.DEBIT)
+        ),
+        0,
+    )
+
+
+def _time_series(
+    query: Select,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    keys: List[str],
+    metrics: List[str],
+    options: TimeSeriesOptions,
+    extras: Sequence[str] = (),
+) -> Select:
+    """
+    Complete the series of a query of (timestamp, *keys, *metrics, *extras)
+    rows, one series per distinct keys, on the grid of the buckets of the
+    granularity between start_date and end_date, in a single statement.
+
+    Moving averages over the last options.moving_average buckets and the
+    differences from the previous bucket are computed by window functions
+    over the full grid, where the buckets without rows count as zeros. The
+    rows of those empty buckets are only returned with options.fill_gaps.
+    The extras are returned as they are, zero in empty buckets.
+
+    Returns:
+        (timestamp, *keys, *metrics, *extras) rows, followed by the
+        {metric}_moving_average and {metric}_delta columns requested, ordered
+        by timestamp and keys
+    """
+    series = query.subquery("series")
+    if not (options.fill_gaps or options.moving_average or options.deltas):
+        return select(series).order_by(
+            series.c.timestamp, *(series.c[key] for key in keys)
+        )
+
+    step = literal_column(f"interval '1 {granularity.value}'")
+    grid = (
+        func.generate_series(
+            func.date_trunc(granularity.value, literal(start_date)),
+            func.date_trunc(
+                granularity.value, literal(end_date - timedelta(microseconds=1))
+            ),
+            step,
+        )
+        .table_valued("bucket")
+        .render_derived(name="grid")
+    )
+    series_keys = select(*(series.c[key] for key in keys)).distinct().subquery("keys")
+    filled = (
+        select(
+            grid.c.bucket.label("timestamp"),
+            *series_keys.c,
+            *(
+                func.coalesce(series.c[name], 0).label(name)
+                for name in [*metrics, *extras]
+            ),
+            series.c.timestamp.is_not(None).label("present"),
+        )
+        .select_from(grid)
+        .join(series_keys, true())
+        .outerjoin(
+            series,
             and_(
-                TransactionDBModel.created_at.between(start_date, end_date),
-                *(
-                    TransactionDBModel.context[key].as_string() == value
-                    for key, value in (context or {}).items()
+                series.c.timestamp == grid.c.bucket,
+                *(series.c[key] == series_keys.c[key] for key in keys),
+            ),
+        )
+        .subquery("filled")
+    )
+
+    def over(function: ColumnElement, **kwargs) -> ColumnElement:
+        return function.over(
+            partition_by=[filled.c[key] for key in keys],
+            order_by=filled.c.timestamp,
+            **kwargs,
+        )
+
+    columns = [filled.c.timestamp, *(filled.c[key] for key in keys)]
+    columns += [filled.c[name] for name in [*metrics, *extras]]
+    if options.moving_average:
+        columns += [
+            cast(
+                over(
+                    func.avg(filled.c[metric]),
+                    rows=(-(options.moving_average - 1), 0),
                 ),
+                Double,
+            ).label(f"{metric}_moving_average")
+            for metric in metrics
+        ]
+    if options.deltas:
+        columns += [
+            cast(filled.c[metric] - over(func.lag(filled.c[metric])), Double).label(
+                f"{metric}_delta"
             )
+            for metric in metrics
+        ]
+    windowed = select(*columns, filled.c.present).subquery("windowed")
+    completed = select(*(column for column in windowed.c if column.name != "present"))
+    if not options.fill_gaps:
+        completed = completed.where(windowed.c.present)
+    return completed.order_by(windowed.c.timestamp, *(windowed.c[key] for key in keys))
+
+
+def _estimated_time_series(
+    query: Select,
+    hours: Subquery,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    keys: List[str],
+    metrics: List[str],
+    options: TimeSeriesOptions,
+    sample_percent: Optional[float],
+    top: Optional[int] = None,
+) -> Select:
+    """
+    The _time_series of a query, of its estimate from a sample of hourly
+    transactions when sample_percent is given, with the variances as extras,
+    and of its top wallets only when top is given, see _top_wallets.
+    """
+    extras: List[str] = []
+    if sample_percent is not None:
+        query = _estimate(query, hours, ["timestamp", *keys], metrics, sample_percent)
+        extras = [f"{metric}_variance" for metric in metrics]
+    if top is not None:
+        query = _top_wallets(query, top, [*metrics, *extras])
+    return _time_series(
+        query,
+        start_date,
+        end_date,
+        granularity,
+        keys=keys,
+        metrics=metrics,
+        options=options,
+        extras=extras,
+    )
+
+
+def _top_wallets(query: Select, top: int, values: List[str]) -> Select:
+    """
+    Keep the top wallets of every bucket of a query of (timestamp, wallet_id,
+    wallet_name, *values) rows by total_transactions, and sum the values of
+    the other wallets into one OTHER_WALLETS_ID row per bucket.
+
+    Variances of estimates are summed as if the estimates were independent.
+    """
+    rows = query.subquery("wallet_rows")
+    rank = func.row_number().over(
+        partition_by=rows.c.timestamp,
+        order_by=(rows.c.total_transactions.desc(), rows.c.wallet_id),
+    )
+    ranked = select(rows, rank.label("wallet_rank")).subquery("ranked")
+    in_top = ranked.c.wallet_rank <= top
+    wallet_id = case(
+        (in_top, cast(ranked.c.wallet_id, String)), else_=literal(OTHER_WALLETS_ID)
+    )
+    wallet_name = case(
+        (in_top, ranked.c.wallet_name), else_=literal(OTHER_WALLETS_NAME)
+    )
+    return select(
+        ranked.c.timestamp,
+        wallet_id.label("wallet_id"),
+        wallet_name.label("wallet_name"),
+        *(
+            cast(func.sum(ranked.c[name]), ranked.c[name].type).label(name)
+            for name in values
+        ),
+    ).group_by(ranked.c.timestamp, wallet_id, wallet_name)
+
+
+def _wallet_totals(hours: Subquery) -> Select:
+    """Transactions of every existing wallet of hourly transactions"""
+    return (
+        select(hours.c.wallet_id, _sum_counts(hours).label("total_transactions"))
+        .join(Wallet, Wallet.id == hours.c.wallet_id)
+        .group_by(hours.c.wallet_id)
+    )
+
+
+def wallet_count_query(hours: Subquery) -> Select:
+    """Number of wallets with hourly transactions, the wallets paginated"""
+    return select(func.count()).select_from(_wallet_totals(hours).subquery())
+
+
+def wallet_activity_query(
+    hours: Subquery,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    options: TimeSeriesOptions,
+    sample_percent: Optional[float] = None,
+    bounds: Optional[WalletActivityBounds] = None,
+) -> Select:
+    """
+    Number of transactions of every type per period and wallet of hourly
+    transactions, see _time_series for the options. With a sample_percent the
+    hours are a sample and the counts are estimated, see _estimate.
+
+    The bounds either keep the top wallets of every period, or the wallets of
+    a page of the wallets ranked by transactions over the whole range.
+    """
+    bounds = bounds or WalletActivityBounds()
+    date_grouping = get_date_grouping_by_granularity(granularity, hours.c.bucket)
+    query = (
+        select(
+            date_grouping.label("timestamp"),
+            hours.c.wallet_id,
+            Wallet.name.label("wallet_name"),
+            _sum_counts(hours).label("total_transactions"),
+            _sum_counts(hours, TransactionType.DEPOSIT).label("total_deposits"),
+            _sum_counts(hours, TransactionType.DEBIT).label("total_debits"),
+            _sum_counts(hours, TransactionType.HOLD).label("total_holds"),
+            _sum_counts(hours, TransactionType.ADJUST).label("total_adjustments"),
+            _sum_counts(hours, TransactionType.RELEASE).label("total_releases"),
         )
-        .group_by(date_grouping, TransactionDBModel.wallet_id, Wallet.name)
-        .order_by("timestamp", TransactionDBModel.wallet_id)
+        .select_from(hours)
+        .join(Wallet, Wallet.id == hours.c.wallet_id)
+        .group_by(date_grouping, hours.c.wallet_id, Wallet.name)
+    )
+    if bounds.page is not None:
+        totals = _wallet_totals(hours).subquery("wallet_totals")
+        page = (
+            select(totals.c.wallet_id)
+            .order_by(totals.c.total_transactions.desc(), totals.c.wallet_id)
+            .offset((bounds.page - 1) * bounds.page_size)
+            .limit(bounds.page_size)
+        )
+        query = query.where(hours.c.wallet_id.in_(page))
+    keys = ["wallet_id", "wallet_name"]
+    metrics = [
+        "total_transactions",
+        "total_deposits",
+        "total_debits",
+        "total_holds",
+        "total_adjustments",
+        "total_releases",
+    ]
+    return _estimated_time_series(
+        query,
+        hours,
+        start_date,
+        end_date,
+        granularity,
+        keys,
+        metrics,
+        options,
+        sample_percent,
+        bounds.top,
     )
 
-    results = (await session.execute(query)).all()
-    return [WalletActivityAggregationResult(**result._asdict()) for result in results]
+
+async def get_wallet_activity_aggregation(
+    session: AsyncSession,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    context: Optional[Dict[str, str]] = None,
+    options: Optional[TimeSeriesOptions] = None,
+    sample_percent: Optional[float] = None,
+    bounds: Optional[WalletActivityBounds] = None,
+) -> Tuple[Sequence[RowMapping], Optional[int]]:
+    """
+    Number of transactions of every type per period and wallet, see
+    _time_series for the options and wallet_activity_query for the bounds.
+    Estimated from a sample of sample_percent of the transactions when given,
+    see sample_hourly_transactions.
+
+    Returns:
+        The rows, and the number of wallets with transactions when paginated
+    """
+    if sample_percent is None:
+        hours = await get_hourly_transactions(session, start_date, end_date, context)
+    else:
+        hours = sample_hourly_transactions(
+            start_date, end_date, sample_percent, context
+        )
+    query = wallet_activity_query(
+        hours,
+        start_date,
+        end_date,
+        granularity,
+        options or TimeSeriesOptions(),
+        sample_percent,
+        bounds,
+    )
+    rows = (await session.execute(query)).mappings().all()
+    total_wallets = None
+    if bounds is not None and bounds.page is not None:
+        total_wallets = await session.scalar(wallet_count_query(hours))
+    return rows, total_wallets
+
+
+def trending_wallets_query(hours: Subquery, limit: int) -> Select:
+    return (
+        select(
+            hours.c.wallet_id,
+            Wallet.name.label("wallet_name"),
+            _sum_counts(hours).label("transaction_count"),
+        )
+        .select_from(hours)
+        .join(Wallet, Wallet.id == hours.c.wallet_id)
+        .group_by(hours.c.wallet_id, Wallet.name)
+        .order_by(desc("transaction_count"), hours.c.wallet_id)
+        .limit(limit)
+    )
 
 
 async def get_trending_wallets(
@@ -148,116 +774,166 @@ async def get_trending_wallets(
     end_date: datetime,
     limit: int,
 ) -> List[TrendingWalletAggregationResult]:
+    hours = await get_hourly_transactions(session, start_date, end_date)
+    results = (await session.execute(trending_wallets_query(hours, limit))).all()
+    return [TrendingWalletAggregationResult(**result._asdict()) for result in results]
+
+
+async def get_depleting_balances(
+    session: AsyncSession, limit: int
+) -> List[DepletingBalance]:
+    """
+    The balances estimated to run out first at their burn rate, read in order
+    from the estimated depletion index of balances.
+    """
     query = (
         select(
-            TransactionDBModel.wallet_id,
+            BalanceDBModel.wallet_id,
             Wallet.name.label("wallet_name"),
-            func.count().label("transaction_count"),
+            BalanceDBModel.credit_type_id,
+            CreditType.name.label("credit_type_name"),
+            BalanceDBModel.available,
+            BalanceDBModel.burn_rate,
+            BalanceDBModel.estimated_depletion_at,
         )
-        .select_from(TransactionDBModel)
-        .join(Wallet, Wallet.id == TransactionDBModel.wallet_id)
-        .where(and_(TransactionDBModel.created_at.between(start_date, end_date)))
-        .group_by(TransactionDBModel.wallet_id, Wallet.name)
-        .order_by(desc("transaction_count"), TransactionDBModel.wallet_id)
+        .join(Wallet, Wallet.id == BalanceDBModel.wallet_id)
+        .join(CreditType, CreditType.id == BalanceDBModel.credit_type_id)
+        .where(BalanceDBModel.estimated_depletion_at.is_not(None))
+        .order_by(BalanceDBModel.estimated_depletion_at)
         .limit(limit)
     )
 
     results = (await session.execute(query)).all()
-    return [TrendingWalletAggregationResult(**result._asdict()) for result in results]
+    return [DepletingBalance(**result._asdict()) for result in results]
 
 
-async def get_credit_usage_aggregation(
-    session: AsyncSession,
-    start_date: datetime,
-    end_date: datetime,
-) -> List[CreditUsageAggregationResult]:
+def credit_usage_query(
+    hours: Subquery, sample_percent: Optional[float] = None
+) -> Select:
     """
-    SQLAlchemy version of credit usage aggregation
+    Amount and number of DEBITs per credit type of hourly transactions. With a
+    sample_percent the hours are a sample and both are estimated, see
+    _estimate.
     """
     query = (
         select(
-            TransactionDBModel.credit_type_id,
+            hours.c.credit_type_id,
             CreditType.name.label("credit_type_name"),
-            func.sum(
-                case(
-                    (
-                        TransactionDBModel.type == "DEBIT",
-                        func.cast(
-                            func.cast(TransactionDBModel.payload["amount"], String),
-                            Float,
-                        ),
-                    ),
-                    else_=0,
-                )
-            ).label("debits_amount"),
-            func.count().label("transaction_count"),
+            _sum_debits_amount(hours).label("debits_amount"),
+            _sum_counts(hours).label("transaction_count"),
         )
-        .select_from(TransactionDBModel)
-        .outerjoin(CreditType, CreditType.id == TransactionDBModel.credit_type_id)
-        .where(
-            and_(
-                TransactionDBModel.type == "DEBIT",
-                TransactionDBModel.created_at.between(start_date, end_date),
-            )
-        )
-        .group_by(TransactionDBModel.credit_type_id, CreditType.name)
-        .order_by(desc("debits_amount"), TransactionDBModel.credit_type_id)
+        .select_from(hours)
+        .outerjoin(CreditType, CreditType.id == hours.c.credit_type_id)
+        .where(hours.c.type == enum_literal(TransactionType.DEBIT))
+        .group_by(hours.c.credit_type_id, CreditType.name)
     )
-
-    results = (await session.execute(query)).all()
-    return [CreditUsageAggregationResult(**result._asdict()) for result in results]
+    if sample_percent is not None:
+        query = _estimate(
+            query,
+            hours,
+            keys=["credit_type_id", "credit_type_name"],
+            metrics=["debits_amount", "transaction_count"],
+            sample_percent=sample_percent,
+        )
+    return query.order_by(desc("debits_amount"), query.selected_columns.credit_type_id)
 
 
-async def get_credit_usage_timeseries_aggregation(
+async def get_credit_usage_aggregation(
     session: AsyncSession,
     start_date: datetime,
     end_date: datetime,
-    granularity: TimeGranularity,
-) -> List[CreditUsageTimeSeriesAggregationResult]:
-    date_grouping = get_date_grouping_by_granularity(granularity)
+    sample_percent: Optional[float] = None,
+) -> List[CreditUsageAggregationResult]:
+    """
+    Amount and number of DEBITs per credit type, estimated from a sample of
+    sample_percent of the transactions when given.
+    """
+    if sample_percent is None:
+        hours = await get_hourly_transactions(session, start_date, end_date)
+    else:
+        hours = sample_hourly_transactions(start_date, end_date, sample_percent)
+    results = (await session.execute(credit_usage_query(hours, sample_percent))).all()
+    return [
+        CreditUsageAggregationResult(
+            **values, confidence_intervals=pop_confidence_intervals(values)
+        )
+        for values in (result._asdict() for result in results)
+    ]
 
+
+def credit_usage_timeseries_query(
+    hours: Subquery,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    options: TimeSeriesOptions,
+    sample_percent: Optional[float] = None,
+) -> Select:
+    """
+    Number of transactions and amount debited per period and credit type of
+    hourly transactions, see _time_series for the options. With a
+    sample_percent the hours are a sample and both are estimated, see
+    _estimate.
+    """
+    date_grouping = get_date_grouping_by_granularity(granularity, hours.c.bucket)
     query = (
         select(
             date_grouping.label("timestamp"),
-            TransactionDBModel.credit_type_id,
+            hours.c.credit_type_id,
             CreditType.name.label("credit_type_name"),
-            func.count().label("transaction_count"),
-            func.sum(
-                case(
-                    (
-                        TransactionDBModel.type == "DEBIT",
-                        func.cast(
-                            func.cast(TransactionDBModel.payload["amount"], String),
-                            Float,
-                        ),
-                    ),
-                    else_=0,
-                )
-            ).label("debits_amount"),
-        )
-        .select_from(TransactionDBModel)
-        .outerjoin(CreditType, CreditType.id == TransactionDBModel.credit_type_id)
-        .where(
-            TransactionDBModel.created_at.between(start_date, end_date),
+            _sum_counts(hours).label("transaction_count"),
+            _sum_debits_amount(hours).label("debits_amount"),
         )
-        .group_by(date_grouping, TransactionDBModel.credit_type_id, CreditType.name)
-        .order_by(date_grouping, TransactionDBModel.credit_type_id)
+        .select_from(hours)
+        .outerjoin(CreditType, CreditType.id == hours.c.credit_type_id)
+        .group_by(date_grouping, hours.c.credit_type_id, CreditType.name)
+    )
+    return _estimated_time_series(
+        query,
+        hours,
+        start_date,
+        end_date,
+        granularity,
+        keys=["credit_type_id", "credit_type_name"],
+        metrics=["transaction_count", "debits_amount"],
+        options=options,
+        sample_percent=sample_percent,
     )
 
-    results = (await session.execute(query)).all()
-    return [
-        CreditUsageTimeSeriesAggregationResult(**result._asdict()) for result in results
-    ]
+
+async def get_credit_usage_timeseries_aggregation(
+    session: AsyncSession,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    options: Optional[TimeSeriesOptions] = None,
+    sample_percent: Optional[float] = None,
+) -> Sequence[RowMapping]:
+    """
+    Number of transactions and amount debited per period and credit type, see
+    _time_series for the options. Estimated from a sample of sample_percent
+    of the transactions when given.
+    """
+    if sample_percent is None:
+        hours = await get_hourly_transactions(session, start_date, end_date)
+    else:
+        hours = sample_hourly_transactions(start_date, end_date, sample_percent)
+    query = credit_usage_timeseries_query(
+        hours,
+        start_date,
+        end_date,
+        granularity,
+        options or TimeSeriesOptions(),
+        sample_percent,
+    )
+    return (await session.execute(query)).mappings().all()
 
 
-def get_date_grouping_by_granularity(granularity: TimeGranularity):
+def get_date_grouping_by_granularity(
+    granularity: TimeGranularity, column: ColumnElement
+):
     """
     Returns the appropriate SQLAlchemy date extraction functions
     for the given granularity
     """
-    if granularity == TimeGranularity.DAY:
-        return func.date_trunc("day", TransactionDBModel.created_at)
-    elif granularity == TimeGranularity.WEEK:
-        return func.date_trunc("week", TransactionDBModel.created_at)
-    else:  # MONTH
-        return func.date_trunc("month", TransactionDBModel.created_at)
+    return func.date_trunc(granularity.value, column)
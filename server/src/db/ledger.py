@@ -0,0 +1,126 @@
+def ledger_balances_sql(condition: str) -> str:
+    """
+    SQL selecting the balances the ledger implies for the balances of the
+    transactions matching a condition.
+
+    Every COMPLETED transaction of a (wallet_id, credit_type_id) pair is folded
+    in a single aggregation, applying the same changes as the transaction
+    handlers:
+
+        DEPOSIT   available + amount
+        DEBIT     available - amount, spent + amount
+                  with a hold: available + (hold - amount), held - hold
+        HOLD      available - amount, held + amount
+        RELEASE   available + amount, held - amount
+        ADJUST    available = amount, held = 0, spent = 0 if reset_spent
+
+    An ADJUST overrides everything before it, so only the transactions after
+    the last ADJUST (and the last ADJUST resetting spent, for spent) count.
+    Transactions are ordered as their changes were applied, by completed_at,
+    then created_at and id. Transactions completed before completed_at was
+    recorded, like imports without snapshots, count as completed when created.
+
+    Args:
+        condition: SQL condition on the transactions, aliased t, selecting
+            whole balances, e.g. a set of wallet ids. Bind parameters of the
+            condition are left to the caller.
+
+    Returns:
+        SQL query selecting wallet_id, credit_type_id, available, held, spent
+        and overall_spent for every balance with matching transactions
+    """
+    return f"""
+        WITH ledger AS MATERIALIZED (
+            SELECT
+                t.wallet_id,
+                t.credit_type_id,
+                t.id,
+                coalesce(t.completed_at, t.created_at) AS completed_at,
+                t.created_at,
+                t.type,
+                coalesce(t.amount, 0) AS amount,
+                CASE
+                    WHEN t.type = 'DEBIT' AND pg_input_is_valid(
+                        t.payload ->> 'hold_transaction_id', 'uuid'
+                    )
+                    THEN (t.payload ->> 'hold_transaction_id')::uuid
+                END AS hold_id,
+                t.type = 'ADJUST'
+                    AND coalesce((t.payload ->> 'reset_spent')::boolean, false)
+                    AS reset_spent
+            FROM transactions t
+            WHERE t.status = 'COMPLETED' AND ({condition})
+        ),
+        -- Each of these is small next to the ledger, which is only aggregated
+        -- once
+        holds AS (
+            SELECT wallet_id, id, amount FROM ledger WHERE type = 'HOLD'
+        ),
+        last_adjust AS (
+            SELECT DISTINCT ON (wallet_id, credit_type_id)
+                wallet_id, credit_type_id, completed_at, created_at, id, amount
+            FROM ledger
+            WHERE type = 'ADJUST'
+            ORDER BY wallet_id, credit_type_id, completed_at DESC, created_at DESC,
+                id DESC
+        ),
+        last_spent_reset AS (
+            SELECT DISTINCT ON (wallet_id, credit_type_id)
+                wallet_id, credit_type_id, completed_at, created_at, id
+            FROM ledger
+            WHERE reset_spent
+            ORDER BY wallet_id, credit_type_id, completed_at DESC, created_at DESC,
+                id DESC
+        ),
+        -- Amounts of the holds used by debits since the last ADJUST. Holds
+        -- belong to the same balance as the debits using them.
+        used_holds AS (
+            SELECT d.wallet_id, d.credit_type_id, sum(h.amount) AS amount
+            FROM ledger d
+            JOIN holds h ON h.wallet_id = d.wallet_id AND h.id = d.hold_id
+            LEFT JOIN last_adjust a
+                ON a.wallet_id = d.wallet_id AND a.credit_type_id = d.credit_type_id
+            WHERE d.hold_id IS NOT NULL
+            AND (a.id IS NULL OR (d.completed_at, d.created_at, d.id)
+                    > (a.completed_at, a.created_at, a.id))
+            GROUP BY d.wallet_id, d.credit_type_id
+        )
+        SELECT
+            l.wallet_id,
+            l.credit_type_id,
+            coalesce(max(a.amount), 0) + coalesce(max(u.amount), 0) + coalesce(sum(
+                CASE l.type
+                    WHEN 'DEPOSIT' THEN l.amount
+                    WHEN 'DEBIT' THEN -l.amount
+                    WHEN 'HOLD' THEN -l.amount
+                    WHEN 'RELEASE' THEN l.amount
+                END
+            ) FILTER (
+                WHERE a.id IS NULL OR (l.completed_at, l.created_at, l.id)
+                    > (a.completed_at, a.created_at, a.id)
+            ), 0) AS available,
+            coalesce(sum(
+                CASE l.type
+                    WHEN 'HOLD' THEN l.amount
+                    WHEN 'RELEASE' THEN -l.amount
+                END
+            ) FILTER (
+                WHERE a.id IS NULL OR (l.completed_at, l.created_at, l.id)
+                    > (a.completed_at, a.created_at, a.id)
+            ), 0) - coalesce(max(u.amount), 0) AS held,
+            coalesce(sum(l.amount) FILTER (
+                WHERE l.type = 'DEBIT'
+                AND (r.id IS NULL OR (l.completed_at, l.created_at, l.id)
+                    > (r.completed_at, r.created_at, r.id))
+            ), 0) AS spent,
+            coalesce(sum(l.amount) FILTER (WHERE l.type = 'DEBIT'), 0)
+                AS overall_spent
+        FROM ledger l
+        LEFT JOIN last_adjust a
+            ON a.wallet_id = l.wallet_id AND a.credit_type_id = l.credit_type_id
+        LEFT JOIN last_spent_reset r
+            ON r.wallet_id = l.wallet_id AND r.credit_type_id = l.credit_type_id
+        LEFT JOIN used_holds u
+            ON u.wallet_id = l.wallet_id AND u.credit_type_id = l.credit_type_id
+        GROUP BY l.wallet_id, l.credit_type_id
+    """
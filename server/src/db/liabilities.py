@@ -0,0 +1,144 @@
+from datetime import date
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Date, cast, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models import CreditType, LiabilityCounter, LiabilitySnapshot
+from src.models.Insights import CreditTypeLiability, LiabilityHistoryPoint
+
+EXACT_LIABILITIES_SQL = """
+    SELECT credit_type_id, sum(available), sum(held)
+    FROM balances
+    GROUP BY credit_type_id
+"""
+
+
+async def get_liability_counters(
+    session: AsyncSession,
+) -> Dict[str, Tuple[float, float]]:
+    """The available and held credits of every credit type, summed over shards"""
+    result = await session.execute(
+        select(
+            LiabilityCounter.credit_type_id,
+            func.sum(LiabilityCounter.available),
+            func.sum(LiabilityCounter.held),
+        ).group_by(LiabilityCounter.credit_type_id)
+    )
+    return {
+        credit_type_id: (available, held)
+        for credit_type_id, available, held in result.all()
+    }
+
+
+async def get_exact_liabilities(
+    session: AsyncSession,
+) -> Dict[str, Tuple[float, float]]:
+    """What every liability counter should be, summed from the balances"""
+    result = await session.execute(text(EXACT_LIABILITIES_SQL))
+    return {
+        str(credit_type_id): (available, held)
+        for credit_type_id, available, held in result.all()
+    }
+
+
+async def add_to_liabilities(
+    session: AsyncSession, deltas: Dict[str, Tuple[float, float]]
+):
+    await session.execute(
+        text(
+            """
+            INSERT INTO liability_counters AS c (
+                credit_type_id, shard, available, held
+            )
+            SELECT credit_type_id, 0, available, held
+            FROM unnest(
+                CAST(:credit_type_ids AS uuid[]),
+                CAST(:available AS double precision[]),
+                CAST(:held AS double precision[])
+            ) AS d(credit_type_id, available, held)
+            ORDER BY credit_type_id
+            ON CONFLICT (credit_type_id, shard) DO UPDATE SET
+                available = c.available + EXCLUDED.available,
+                held = c.held + EXCLUDED.held
+            """
+        ),
+        {
+            "credit_type_ids": list(deltas),
+            "available": [available for available, _ in deltas.values()],
+            "held": [held for _, held in deltas.values()],
+        },
+    )
+
+
+async def get_liabilities(session: AsyncSession) -> List[CreditTypeLiability]:
+    """Outstanding credits per credit type, read from the liability counters"""
+    available = func.sum(LiabilityCounter.available)
+    held = func.sum(LiabilityCounter.held)
+    query = (
+        select(
+            LiabilityCounter.credit_type_id,
+            CreditType.name.label("credit_type_name"),
+            available.label("available"),
+            held.label("held"),
+            (available + held).label("outstanding"),
+        )
+        .join(CreditType, CreditType.id == LiabilityCounter.credit_type_id)
+        .group_by(LiabilityCounter.credit_type_id, CreditType.name)
+        .order_by(CreditType.name)
+    )
+    results = (await session.execute(query)).all()
+    return [CreditTypeLiability(**result._asdict()) for result in results]
+
+
+async def snapshot_liabilities(session: AsyncSession) -> int:
+    """
+    Record the liability counters as the snapshot of the current UTC day,
+    replacing the snapshot taken earlier that day if any.
+
+    Returns:
+        The number of credit types recorded
+    """
+    today = cast(func.timezone("UTC", func.now()), Date)
+    counters = select(
+        today,
+        LiabilityCounter.credit_type_id,
+        func.sum(LiabilityCounter.available),
+        func.sum(LiabilityCounter.held),
+        func.now(),
+    ).group_by(LiabilityCounter.credit_type_id)
+    stmt = insert(LiabilitySnapshot).from_select(
+        ["day", "credit_type_id", "available", "held", "taken_at"], counters
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "credit_type_id"],
+        set_=dict(
+            available=stmt.excluded.available,
+            held=stmt.excluded.held,
+            taken_at=stmt.excluded.taken_at,
+        ),
+    )
+    result = await session.execute(stmt)
+    return result.rowcount
+
+
+async def get_liability_history(
+    session: AsyncSession, start_day: date, end_day: date
+) -> List[LiabilityHistoryPoint]:
+    """The daily snapshots of the outstanding credits from start_day to end_day"""
+    query = (
+        select(
+            LiabilitySnapshot.day,
+            LiabilitySnapshot.credit_type_id,
+            CreditType.name.label("credit_type_name"),
+            LiabilitySnapshot.available,
+            LiabilitySnapshot.held,
+            (LiabilitySnapshot.available + LiabilitySnapshot.held).label("outstanding"),
+        )
+        .join(CreditType, CreditType.id == LiabilitySnapshot.credit_type_id)
+        .where(LiabilitySnapshot.day.between(start_day, end_day))
+        .order_by(LiabilitySnapshot.day, CreditType.name)
+    )
+    results = (await session.execute(query)).all()
+    return [LiabilityHistoryPoint(**result._asdict()) for result in results]
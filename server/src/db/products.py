@@ -1,6 +1,5 @@
 from asyncio import gather
 from typing import List, Tuple
-from uuid import uuid4
 
 from fastapi import HTTPException
 from sqlalchemy import func, select, update
@@ -20,13 +19,14 @@ from src.models.products import (
     SubscriptionStatus,
     UpdateProductRequest,
 )
+from src.utils.ids import generate_id
 
 
 async def create_product(
     db: AsyncSession, product_request: CreateProductRequest
 ) -> Product:
     product = Product(
-        id=str(uuid4()),
+        id=generate_id(),
         name=product_request.name,
         description=product_request.description,
         status=ProductStatus.ACTIVE,
@@ -40,7 +40,7 @@ async def create_product_settings(
 ) -> List[ProductSettings]:
     settings = [
         ProductSettings(
-            id=str(uuid4()),
+            id=generate_id(),
             product_id=product_id,
             credit_type_id=credit_settings.credit_type_id,
             credit_amount=credit_settings.credit_amount,
@@ -141,7 +141,7 @@ async def create_product_subscription(
     settings_snapshot: List[PydanticProductSettings],
 ) -> ProductSubscription:
     subscription = ProductSubscription(
-        id=str(uuid4()),
+        id=generate_id(),
         wallet_id=wallet_id,
         product_id=subscription_request.product_id,
         status=SubscriptionStatus.PENDING,
@@ -0,0 +1,153 @@
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.balances import low_balance_since_sql, new_low_balance_since_sql
+from src.db.expressions import uuid7_sql
+from src.db.ledger import ledger_balances_sql
+
+BALANCE_COLUMNS = ["available", "held", "spent", "overall_spent"]
+
+
+async def get_wallet_id_boundaries(
+    session: AsyncSession, wallets_per_chunk: int
+) -> List[str]:
+    """
+    Split the wallets with balances into ranges of about wallets_per_chunk
+    wallets, read from the (wallet_id, credit_type_id) index of balances.
+
+    Returns:
+        The lower bounds of every range but the first, in order
+    """
+    result = await session.execute(
+        text(
+            """
+            SELECT wallet_id FROM (
+                SELECT wallet_id, row_number() OVER (ORDER BY wallet_id) AS position
+                FROM (SELECT DISTINCT wallet_id FROM balances) wallets
+            ) wallets
+            WHERE position % :wallets_per_chunk = 1 AND position > 1
+            ORDER BY wallet_id
+            """
+        ),
+        {"wallets_per_chunk": wallets_per_chunk},
+    )
+    return [str(wallet_id) for wallet_id in result.scalars()]
+
+
+def _wallet_range_condition(
+    column: str, low: Optional[str], high: Optional[str]
+) -> str:
+    conditions = ["true"]
+    if low is not None:
+        conditions.append(f"{column} >= CAST(:low AS uuid)")
+    if high is not None:
+        conditions.append(f"{column} < CAST(:high AS uuid)")
+    return " AND ".join(conditions)
+
+
+async def find_balance_drift(
+    session: AsyncSession,
+    low: Optional[str],
+    high: Optional[str],
+    tolerance: float,
+) -> Tuple[int, List[dict]]:
+    """
+    Compare the balances of the wallets in [low, high) with the balances
+    their ledger implies, in a single statement.
+
+    A balance drifted when any amount differs by more than the tolerance, when
+    it has no transactions but is not zero, or when transactions exist without
+    a balance.
+
+    Returns:
+        tuple: (number of balances checked, the drifted balances)
+    """
+    drifted = " OR ".join(
+        f"abs(coalesce(b.{column}, 0) - coalesce(l.{column}, 0)) > :tolerance"
+        for column in BALANCE_COLUMNS
+    )
+    result = await session.execute(
+        text(
+            f"""
+            WITH ledger AS (
+                {ledger_balances_sql(_wallet_range_condition("t.wallet_id", low, high))}
+            ),
+            compared AS (
+                SELECT
+                    coalesce(b.wallet_id, l.wallet_id) AS wallet_id,
+                    coalesce(b.credit_type_id, l.credit_type_id) AS credit_type_id,
+                    b.available, b.held, b.spent, b.overall_spent,
+                    coalesce(l.available, 0) AS expected_available,
+                    coalesce(l.held, 0) AS expected_held,
+                    coalesce(l.spent, 0) AS expected_spent,
+                    coalesce(l.overall_spent, 0) AS expected_overall_spent,
+                    b.id IS NULL OR {drifted} AS drifted
+                FROM (
+                    SELECT * FROM balances b
+                    WHERE {_wallet_range_condition("b.wallet_id", low, high)}
+                ) b
+                FULL JOIN ledger l
+                    ON l.wallet_id = b.wallet_id
+                    AND l.credit_type_id = b.credit_type_id
+            )
+            SELECT
+                count(*),
+                coalesce(
+                    json_agg(compared ORDER BY wallet_id, credit_type_id)
+                        FILTER (WHERE drifted),
+                    '[]'
+                )
+            FROM compared
+            """
+        ),
+        {"low": low, "high": high, "tolerance": tolerance},
+    )
+    checked, drifts = result.one()
+    return checked, drifts
+
+
+async def repair_balance(session: AsyncSession, wallet_id: str, credit_type_id: str):
+    """
+    Overwrite a balance with the balance its ledger implies, or zero when it
+    has no completed transactions. Callers hold the balance lock.
+    """
+    ledger = ledger_balances_sql(
+        "t.wallet_id = CAST(:wallet_id AS uuid) "
+        "AND t.credit_type_id = CAST(:credit_type_id AS uuid)"
+    )
+    await session.execute(
+        text(
+            f"""
+            INSERT INTO balances (
+                id, wallet_id, credit_type_id, available, held, spent,
+                overall_spent, low_balance_since
+            )
+            SELECT
+                {uuid7_sql("now()")},
+                CAST(:wallet_id AS uuid),
+                CAST(:credit_type_id AS uuid),
+                coalesce(l.available, 0),
+                coalesce(l.held, 0),
+                coalesce(l.spent, 0),
+                coalesce(l.overall_spent, 0),
+                {new_low_balance_since_sql(
+                    "CAST(:credit_type_id AS uuid)", "coalesce(l.available, 0)"
+                )}
+            FROM (SELECT 1) balance
+            LEFT JOIN ({ledger}) l ON true
+            ON CONFLICT (wallet_id, credit_type_id) DO UPDATE SET
+                available = EXCLUDED.available,
+                held = EXCLUDED.held,
+                spent = EXCLUDED.spent,
+                overall_spent = EXCLUDED.overall_spent,
+                estimated_depletion_at = balance_depletion_at(
+                    EXCLUDED.available, balances.burn_rate
+                ),
+                low_balance_since = {low_balance_since_sql("EXCLUDED.available")},
+                updated_at = now()
+            """
+        ),
+        {"wallet_id": wallet_id, "credit_type_id": credit_type_id},
+    )
@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.rollups import RollupWatermark
+
+TRANSACTION_ROLLUPS = "transaction_rollups"
+BUCKET_SIZE = timedelta(hours=1)
+
+# Serializes the writers of transaction_rollups across processes
+ROLLUP_LOCK_SQL = "hashtext('transaction_rollups')"
+
+ROLLUP_COLUMNS = (
+    "bucket, wallet_id, credit_type_id, type, transaction_count, amount_sum"
+)
+
+
+def _rollup_select_sql(condition: str, from_sql: str = "transactions t") -> str:
+    """Hourly rollup rows of the transactions matching condition, on alias t"""
+    return f"""
+        SELECT date_trunc('hour', t.created_at), t.wallet_id, t.credit_type_id,
+               t.type, count(*), coalesce(sum(t.amount), 0)
+        FROM {from_sql}
+        WHERE {condition}
+        GROUP BY 1, 2, 3, 4
+    """
+
+
+def bucket_start(value: datetime) -> datetime:
+    """The start of the hour bucket holding value"""
+    return value.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+async def get_watermark(session: AsyncSession, name: str) -> Optional[datetime]:
+    return await session.scalar(
+        select(RollupWatermark.watermark).where(RollupWatermark.name == name)
+    )
+
+
+async def _set_watermark(session: AsyncSession, name: str, watermark: datetime):
+    await session.execute(
+        text(
+            """
+            INSERT INTO rollup_watermarks (name, watermark)
+            VALUES (:name, :watermark)
+            ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark
+            """
+        ),
+        {"name": name, "watermark": watermark},
+    )
+
+
+async def refresh_transaction_rollups(
+    session: AsyncSession, until: datetime, max_span: timedelta
+) -> Optional[datetime]:
+    """
+    Roll up the complete hours between the watermark and until, at most
+    max_span of them, and move the watermark past them.
+
+    Without a watermark the rollups start at the oldest transaction. The hours
+    are replaced rather than incremented, so rolling up an hour twice is
+    harmless. until must leave room for transactions still being written, as
+    rows created before the watermark but committed after it are never added.
+
+    Returns:
+        The new watermark, or None when another refresh is running
+    """
+    locked = await session.scalar(
+        text(f"SELECT pg_try_advisory_xact_lock({ROLLUP_LOCK_SQL})")
+    )
+    if not locked:
+        return None
+
+    watermark = await get_watermark(session, TRANSACTION_ROLLUPS)
+    if watermark is None:
+        oldest = await session.scalar(text("SELECT min(created_at) FROM transactions"))
+        watermark = bucket_start(oldest or until)
+    end = min(bucket_start(until), watermark + max_span)
+    if end <= watermark:
+        return watermark
+
+    params = {"start": watermark, "end": end}
+    await session.execute(
+        text(
+            "DELETE FROM transaction_rollups WHERE bucket >= :start AND bucket < :end"
+        ),
+        params,
+    )
+    await session.execute(
+        text(
+            f"""
+            INSERT INTO transaction_rollups ({ROLLUP_COLUMNS})
+            {_rollup_select_sql("t.created_at >= :start AND t.created_at < :end")}
+            """
+        ),
+        params,
+    )
+    await _set_watermark(session, TRANSACTION_ROLLUPS, end)
+    return end
+
+
+async def rebuild_transaction_rollups(
+    session: AsyncSession, buckets: List[datetime]
+) -> int:
+    """
+    Roll up again the given hours that are already rolled up, after
+    transactions were written into them after the fact, like by an import.
+
+    Returns:
+        Number of hours rolled up again
+    """
+    await session.execute(text(f"SELECT pg_advisory_xact_lock({ROLLUP_LOCK_SQL})"))
+    watermark = await get_watermark(session, TRANSACTION_ROLLUPS)
+    if watermark is None:
+        return 0
+    buckets = sorted({bucket_start(bucket) for bucket in buckets})
+    buckets = [bucket for bucket in buckets if bucket < watermark]
+    if not buckets:
+        return 0
+
+    params = {"buckets": buckets, "bucket_size": BUCKET_SIZE}
+    await session.execute(
+        text(
+            "DELETE FROM transaction_rollups "
+            "WHERE bucket = ANY(CAST(:buckets AS timestamptz[]))"
+        ),
+        params,
+    )
+    await session.execute(
+        text(
+            f"""
+            INSERT INTO transaction_rollups ({ROLLUP_COLUMNS})
+            {_rollup_select_sql(
+                condition="t.created_at >= b.bucket "
+                "AND t.created_at < b.bucket + CAST(:bucket_size AS interval)",
+                from_sql="unnest(CAST(:buckets AS timestamptz[])) AS b(bucket), "
+                "transactions t",
+            )}
+            """
+        ),
+        params,
+    )
+    return len(buckets)
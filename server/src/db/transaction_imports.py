@@ -0,0 +1,571 @@
+from datetime import datetime
+from typing import AsyncIterable, List, Tuple
+
+from asyncpg import PostgresError
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.balances import low_balance_since_sql, new_low_balance_since_sql
+from src.db.expressions import uuid7_sql
+from src.db.ledger import ledger_balances_sql
+from src.models.transaction_imports import (
+    ImportFormat,
+    ImportStatus,
+    TransactionImportDBModel,
+)
+from src.utils.ids import generate_id
+
+# Columns of the staging table, which are also the accepted input columns. All
+# of them are staged as text and only cast once the whole input is validated.
+STAGING_COLUMNS = [
+    "id",
+    "type",
+    "status",
+    "hold_status",
+    "wallet_id",
+    "credit_type_id",
+    "external_id",
+    "subscription_id",
+    "issuer",
+    "description",
+    "context",
+    "payload",
+    "balance_snapshot",
+    "created_at",
+    "updated_at",
+]
+
+# Staged as text, and converted to jsonb once they are validated
+JSONB_COLUMNS = ["context", "payload", "balance_snapshot"]
+
+DEFAULT_ISSUER = "import"
+
+TRANSACTION_TYPES = "('DEPOSIT', 'DEBIT', 'HOLD', 'RELEASE', 'ADJUST')"
+TRANSACTION_STATUSES = "('PENDING', 'COMPLETED', 'FAILED')"
+HOLD_STATUSES = "('HELD', 'USED', 'RELEASED', 'EXPIRED')"
+
+# (reason, condition) pairs checked for every staged row before anything is
+# cast. A NULL condition, from a missing optional value, passes.
+FORMAT_CHECKS = [
+    ("missing wallet_id", "s.wallet_id IS NULL"),
+    ("missing credit_type_id", "s.credit_type_id IS NULL"),
+    ("missing type", "s.type IS NULL"),
+    ("missing description", "s.description IS NULL"),
+    ("missing payload", "s.payload IS NULL"),
+    ("invalid id", "NOT pg_input_is_valid(s.id, 'uuid')"),
+    ("invalid wallet_id", "NOT pg_input_is_valid(s.wallet_id, 'uuid')"),
+    ("invalid credit_type_id", "NOT pg_input_is_valid(s.credit_type_id, 'uuid')"),
+    ("invalid subscription_id", "NOT pg_input_is_valid(s.subscription_id, 'uuid')"),
+    ("invalid type", f"upper(s.type) NOT IN {TRANSACTION_TYPES}"),
+    ("invalid status", f"upper(s.status) NOT IN {TRANSACTION_STATUSES}"),
+    ("invalid hold_status", f"upper(s.hold_status) NOT IN {HOLD_STATUSES}"),
+    ("invalid created_at", "NOT pg_input_is_valid(s.created_at, 'timestamptz')"),
+    ("invalid updated_at", "NOT pg_input_is_valid(s.updated_at, 'timestamptz')"),
+    ("invalid context", "NOT pg_input_is_valid(s.context, 'jsonb')"),
+    ("invalid payload", "NOT pg_input_is_valid(s.payload, 'jsonb')"),
+    ("invalid balance_snapshot", "NOT pg_input_is_valid(s.balance_snapshot, 'jsonb')"),
+]
+
+# Checks of the staged rows against each other and the existing data, run once
+# all rows passed FORMAT_CHECKS. The rows are matched with the existing data by
+# the joins of _consistency_joins rather than a subquery per row.
+CONSISTENCY_CHECKS = [
+    ("payload is not an object", "jsonb_typeof(s.payload) <> 'object'"),
+    ("unknown wallet", "wallet.id IS NULL"),
+    ("unknown credit type", "credit_type.id IS NULL"),
+    (
+        "invalid amount",
+        "upper(s.type) <> 'RELEASE' AND CASE "
+        "WHEN pg_input_is_valid(s.payload ->> 'amount', 'float8') "
+        "THEN (s.payload ->> 'amount')::float8 < 0 ELSE true END",
+    ),
+    (
+        "invalid reset_spent",
+        "NOT pg_input_is_valid(s.payload ->> 'reset_spent', 'boolean')",
+    ),
+    (
+        "missing hold_transaction_id",
+        "upper(s.type) = 'RELEASE' " "AND s.payload ->> 'hold_transaction_id' IS NULL",
+    ),
+    (
+        "unknown hold",
+        "s.payload ->> 'hold_transaction_id' IS NOT NULL " "AND hold.line IS NULL",
+    ),
+    ("duplicate id", "s.id_count > 1"),
+    ("duplicate external_id", "s.external_id_count > 1"),
+    (
+        "external_id used by another transaction",
+        "external_id_conflict.line IS NOT NULL",
+    ),
+    ("id used by a transaction of another wallet", "id_conflict.line IS NOT NULL"),
+]
+
+
+def staging_table_name(import_id: str) -> str:
+    return f"transaction_import_{import_id.replace('-', '')}"
+
+
+def _staged_holds(table_name: str) -> str:
+    """
+    Lines of the staged rows referring to a HOLD by their hold_transaction_id,
+    with the amount of the hold. Holds of the same wallet and credit type are
+    looked up among the staged rows first, then among the existing
+    transactions.
+    """
+    hold_id = "s.payload ->> 'hold_transaction_id'"
+    return f"""
+        SELECT DISTINCT ON (s.line) s.line, holds.amount
+        FROM {table_name} s
+        JOIN (
+            SELECT
+                1 AS priority, lower(h.id) AS id, h.wallet_id::uuid AS wallet_id,
+                h.credit_type_id::uuid AS credit_type_id,
+                (h.payload ->> 'amount')::float8 AS amount
+            FROM {table_name} h
+            WHERE upper(h.type) = 'HOLD'
+            UNION ALL
+            SELECT 2, t.id::text, t.wallet_id, t.credit_type_id, t.amount
+            FROM transactions t
+            WHERE t.type = 'HOLD'
+            AND t.id IN (
+                SELECT ({hold_id})::uuid FROM {table_name} s
+                WHERE pg_input_is_valid({hold_id}, 'uuid')
+            )
+        ) holds
+            ON holds.id = lower({hold_id})
+            AND holds.wallet_id = s.wallet_id::uuid
+            AND holds.credit_type_id = s.credit_type_id::uuid
+        ORDER BY s.line, holds.priority
+    """
+
+
+def _consistency_joins(table_name: str) -> str:
+    return f"""
+        LEFT JOIN wallets wallet ON wallet.id = s.wallet_id::uuid
+        LEFT JOIN credit_types credit_type
+            ON credit_type.id = s.credit_type_id::uuid
+        LEFT JOIN ({_staged_holds(table_name)}) hold ON hold.line = s.line
+        LEFT JOIN (
+            SELECT DISTINCT s.line FROM {table_name} s
+            JOIN transactions t
+                ON s.external_id IS NOT NULL
+                AND t.external_id = s.external_id
+                AND t.id IS DISTINCT FROM s.id::uuid
+        ) external_id_conflict ON external_id_conflict.line = s.line
+        LEFT JOIN (
+            SELECT DISTINCT s.line FROM {table_name} s
+            JOIN transactions t
+                ON s.id IS NOT NULL
+                AND t.id = s.id::uuid
+                AND t.wallet_id <> s.wallet_id::uuid
+        ) id_conflict ON id_conflict.line = s.line
+    """
+
+
+async def create_import(
+    session: AsyncSession, import_format: ImportFormat
+) -> TransactionImportDBModel:
+    transaction_import = TransactionImportDBModel(
+        id=generate_id(),
+        format=import_format,
+        status=ImportStatus.STAGING,
+        rows_staged=0,
+        rows_invalid=0,
+        rows_imported=0,
+        balances_recomputed=0,
+        errors=[],
+    )
+    session.add(transaction_import)
+    return transaction_import
+
+
+async def get_import(
+    session: AsyncSession, import_id: str
+) -> TransactionImportDBModel | None:
+    result = await session.execute(
+        select(TransactionImportDBModel).where(TransactionImportDBModel.id == import_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def update_import(session: AsyncSession, import_id: str, **values):
+    await session.execute(
+        update(TransactionImportDBModel)
+        .where(TransactionImportDBModel.id == import_id)
+        .values(**values)
+    )
+
+
+async def create_staging_table(session: AsyncSession, table_name: str):
+    # Unlogged: the staged rows are disposable, and skipping the WAL makes the
+    # COPY considerably faster. line numbers the rows in input order.
+    columns = ", ".join(f"{column} text" for column in STAGING_COLUMNS)
+    await session.execute(
+        text(
+            f"CREATE UNLOGGED TABLE {table_name} "
+            f"(line bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY, {columns})"
+        )
+    )
+
+
+async def drop_staging_table(session: AsyncSession, table_name: str):
+    await session.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+
+
+async def copy_into_staging_table(
+    session: AsyncSession,
+    table_name: str,
+    columns: List[str],
+    source: AsyncIterable[bytes],
+) -> int:
+    """
+    COPY CSV rows of the given columns into the staging table.
+
+    The source is streamed to the server as it is read, so inputs of any size
+    can be staged.
+
+    Raises:
+        ValueError: If the server rejects the input, e.g. a malformed CSV row
+    """
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    try:
+        result = await raw_connection.driver_connection.copy_to_table(
+            table_name, source=source, columns=columns, format="csv"
+        )
+    except PostgresError as e:
+        context = getattr(e, "context", None)
+        raise ValueError(f"{e}. {context}" if context else str(e)) from e
+    # The command tag is "COPY <rows>"
+    return int(result.split()[-1])
+
+
+async def validate_staged_rows(
+    session: AsyncSession, table_name: str, max_errors: int
+) -> Tuple[int, List[dict]]:
+    """
+    Validate all staged rows with set based checks.
+
+    Returns:
+        tuple: (number of invalid rows, up to max_errors errors by line)
+    """
+    invalid_rows, errors = await _find_invalid_rows(
+        session,
+        f"SELECT * FROM {table_name}",
+        "",
+        FORMAT_CHECKS,
+        max_errors,
+    )
+    if invalid_rows:
+        return invalid_rows, errors
+
+    # Every value is known to be valid now. The JSON columns are parsed once
+    # rather than by every check, and staged rows are looked up by id and by
+    # the hold they refer to.
+    await session.execute(
+        text(
+            f"ALTER TABLE {table_name} "
+            + ", ".join(
+                f"ALTER COLUMN {column} TYPE jsonb USING {column}::jsonb"
+                for column in JSONB_COLUMNS
+            )
+        )
+    )
+    await session.execute(text(f"CREATE INDEX ON {table_name} (lower(id))"))
+    await session.execute(
+        text(
+            f"CREATE INDEX ON {table_name} "
+            f"(lower(payload ->> 'hold_transaction_id'))"
+        )
+    )
+    await session.execute(text(f"ANALYZE {table_name}"))
+    return await _find_invalid_rows(
+        session,
+        f"""
+        SELECT *,
+            count(id) OVER (PARTITION BY lower(id)) AS id_count,
+            count(external_id) OVER (PARTITION BY external_id) AS external_id_count
+        FROM {table_name}
+        """,
+        _consistency_joins(table_name),
+        CONSISTENCY_CHECKS,
+        max_errors,
+    )
+
+
+async def _find_invalid_rows(
+    session: AsyncSession,
+    rows: str,
+    joins: str,
+    checks: List[Tuple[str, str]],
+    max_errors: int,
+) -> Tuple[int, List[dict]]:
+    # One array of failed checks per row, rather than a row per check
+    reasons = ", ".join(
+        f"CASE WHEN {condition} THEN '{reason}' END" for reason, condition in checks
+    )
+    result = await session.execute(
+        text(
+            f"""
+            WITH invalid_rows AS (
+                SELECT s.line, array_remove(ARRAY[{reasons}], NULL) AS reasons
+                FROM ({rows}) s
+                {joins}
+            ),
+            errors AS (
+                SELECT line, unnest(reasons) AS reason FROM invalid_rows
+                WHERE cardinality(reasons) > 0
+            )
+            SELECT
+                (SELECT count(DISTINCT line) FROM errors),
+                (
+                    SELECT coalesce(json_agg(e), '[]')
+                    FROM (
+                        SELECT line, reason FROM errors
+                        ORDER BY line, reason
+                        LIMIT :max_errors
+                    ) e
+                )
+            """
+        ),
+        {"max_errors": max_errors},
+    )
+    invalid_rows, errors = result.one()
+    return invalid_rows, errors
+
+
+async def insert_staged_labels(session: AsyncSession, table_name: str):
+    await session.execute(
+        text(
+            f"""
+            INSERT INTO transaction_labels (value)
+            SELECT DISTINCT coalesce(issuer, :default_issuer) FROM {table_name}
+            UNION
+            SELECT DISTINCT description FROM {table_name}
+            ON CONFLICT (value) DO NOTHING
+            """
+        ),
+        {"default_issuer": DEFAULT_ISSUER},
+    )
+
+
+async def get_staged_hours(session: AsyncSession, table_name: str) -> List[datetime]:
+    """
+    The hours the staged rows are created in, and the hours of the existing
+    transactions they replace, which all change once the rows are imported.
+    Rows without a created_at are created now and left out.
+    """
+    result = await session.execute(
+        text(
+            f"""
+            SELECT date_trunc('hour', s.created_at::timestamptz)
+            FROM {table_name} s
+            WHERE s.created_at IS NOT NULL
+            UNION
+            SELECT date_trunc('hour', t.created_at)
+            FROM {table_name} s
+            JOIN transactions t
+                ON t.id = s.id::uuid AND t.wallet_id = s.wallet_id::uuid
+            """
+        )
+    )
+    return list(result.scalars())
+
+
+async def upsert_staged_transactions(
+    session: AsyncSession, table_name: str, first_line: int, last_line: int
+) -> int:
+    """
+    Insert the staged rows with line numbers in [first_line, last_line] into
+    transactions, replacing transactions with the same id.
+
+    Rows without an id get a UUIDv7 derived from their created_at. RELEASE
+    amounts are the amount of the released hold, like for released holds
+    created through the API, and holds default to HELD, or to RELEASED or USED
+    when a staged RELEASE or DEBIT refers to them. Rows with a balance snapshot
+    are completed at their created_at.
+    """
+    created_at = "coalesce(s.created_at::timestamptz, now())"
+    snapshot = "s.balance_snapshot"
+    result = await session.execute(
+        text(
+            f"""
+            INSERT INTO transactions (
+                id, type, external_id, wallet_id, credit_type_id, issuer_id,
+                description_id, amount, context, payload, hold_status, status,
+                snapshot_available, snapshot_held, snapshot_spent,
+                snapshot_overall_spent, subscription_id, created_at, updated_at,
+                completed_at
+            )
+            SELECT
+                coalesce(s.id::uuid, {uuid7_sql(created_at)}),
+                upper(s.type)::transactiontype,
+                s.external_id,
+                s.wallet_id::uuid,
+                s.credit_type_id::uuid,
+                issuer.id,
+                description.id,
+                CASE
+                    WHEN upper(s.type) = 'RELEASE' THEN hold.amount
+                    ELSE (s.payload ->> 'amount')::float8
+                END,
+                coalesce(s.context, '{{}}')::json,
+                s.payload::json,
+                coalesce(
+                    upper(s.hold_status),
+                    CASE WHEN upper(s.type) = 'HOLD' THEN coalesce(
+                        (
+                            SELECT CASE upper(r.type)
+                                WHEN 'RELEASE' THEN 'RELEASED' ELSE 'USED'
+                            END
+                            FROM {table_name} r
+                            WHERE lower(r.payload ->> 'hold_transaction_id')
+                                = lower(s.id)
+                            AND r.wallet_id = s.wallet_id
+                            AND upper(r.type) IN ('RELEASE', 'DEBIT')
+                            ORDER BY r.line DESC
+                            LIMIT 1
+                        ),
+                        'HELD'
+                    ) END
+                )::holdstatus,
+                coalesce(upper(s.status), 'COMPLETED')::transactionstatus,
+                ({snapshot} ->> 'available')::float8,
+                ({snapshot} ->> 'held')::float8,
+                ({snapshot} ->> 'spent')::float8,
+                ({snapshot} ->> 'overall_spent')::float8,
+                s.subscription_id::uuid,
+                {created_at},
+                coalesce(s.updated_at::timestamptz, {created_at}),
+                CASE WHEN {snapshot} ->> 'available' IS NOT NULL THEN {created_at} END
+            FROM {table_name} s
+            JOIN transaction_labels issuer
+                ON issuer.value = coalesce(s.issuer, :default_issuer)
+            JOIN transaction_labels description ON description.value = s.description
+            LEFT JOIN ({_staged_holds(table_name)}) hold ON hold.line = s.line
+            WHERE s.line BETWEEN :first_line AND :last_line
+            ON CONFLICT (id, wallet_id) DO UPDATE SET
+                type = EXCLUDED.type,
+                external_id = EXCLUDED.external_id,
+                credit_type_id = EXCLUDED.credit_type_id,
+                issuer_id = EXCLUDED.issuer_id,
+                description_id = EXCLUDED.description_id,
+                amount = EXCLUDED.amount,
+                context = EXCLUDED.context,
+                payload = EXCLUDED.payload,
+                hold_status = EXCLUDED.hold_status,
+                status = EXCLUDED.status,
+                snapshot_available = EXCLUDED.snapshot_available,
+                snapshot_held = EXCLUDED.snapshot_held,
+                snapshot_spent = EXCLUDED.snapshot_spent,
+                snapshot_overall_spent = EXCLUDED.snapshot_overall_spent,
+                subscription_id = EXCLUDED.subscription_id,
+                created_at = EXCLUDED.created_at,
+                updated_at = EXCLUDED.updated_at,
+                completed_at = EXCLUDED.completed_at
+            """
+        ),
+        {
+            "default_issuer": DEFAULT_ISSUER,
+            "first_line": first_line,
+            "last_line": last_line,
+        },
+    )
+    return result.rowcount
+
+
+async def update_existing_holds(session: AsyncSession, table_name: str):
+    """Mark the existing holds used or released by staged transactions"""
+    await session.execute(
+        text(
+            f"""
+            UPDATE transactions t
+            SET hold_status = CASE upper(s.type)
+                WHEN 'RELEASE' THEN 'RELEASED' ELSE 'USED'
+            END::holdstatus
+            FROM {table_name} s
+            WHERE upper(s.type) IN ('RELEASE', 'DEBIT')
+            AND upper(coalesce(s.status, 'COMPLETED')) = 'COMPLETED'
+            AND t.id = (s.payload ->> 'hold_transaction_id')::uuid
+            AND t.wallet_id = s.wallet_id::uuid
+            AND t.type = 'HOLD'
+            AND t.hold_status = 'HELD'
+            AND NOT EXISTS (
+                SELECT 1 FROM {table_name} h WHERE lower(h.id) = t.id::text
+            )
+            """
+        )
+    )
+
+
+async def staging_table_exists(session: AsyncSession, table_name: str) -> bool:
+    return await session.scalar(
+        text("SELECT to_regclass(:table_name) IS NOT NULL"),
+        {"table_name": table_name},
+    )
+
+
+async def get_staged_balance_keys(
+    session: AsyncSession, table_name: str
+) -> List[Tuple[str, str]]:
+    """
+    The (wallet_id, credit_type_id) of every balance with staged rows, in the
+    order their balance locks are taken.
+    """
+    result = await session.execute(
+        text(
+            f"""
+            SELECT DISTINCT wallet_id::uuid::text, credit_type_id::uuid::text
+            FROM {table_name}
+            ORDER BY 1, 2
+            """
+        )
+    )
+    return list(result.tuples().all())
+
+
+async def recompute_balances(
+    session: AsyncSession, balance_keys: List[Tuple[str, str]]
+) -> int:
+    """
+    Recompute the balances of the given (wallet_id, credit_type_id) from
+    their full ledger, in a single statement. Callers hold the balance locks,
+    so that no transaction changes them between reading the ledger and
+    writing them, whether or not the balance rows exist yet.
+    """
+    keys = (
+        "SELECT wallet_id, credit_type_id FROM unnest("
+        "CAST(:wallet_ids AS uuid[]), CAST(:credit_type_ids AS uuid[])"
+        ") AS k(wallet_id, credit_type_id)"
+    )
+    balance_condition = f"(t.wallet_id, t.credit_type_id) IN ({keys})"
+    result = await session.execute(
+        text(
+            f"""
+            INSERT INTO balances (
+                id, wallet_id, credit_type_id, available, held, spent,
+                overall_spent, low_balance_since
+            )
+            SELECT
+                {uuid7_sql("now()")}, wallet_id, credit_type_id, available, held,
+                spent, overall_spent,
+                {new_low_balance_since_sql("credit_type_id", "available")}
+            FROM ({ledger_balances_sql(balance_condition)}) ledger
+            ON CONFLICT (wallet_id, credit_type_id) DO UPDATE SET
+                available = EXCLUDED.available,
+                held = EXCLUDED.held,
+                spent = EXCLUDED.spent,
+                overall_spent = EXCLUDED.overall_spent,
+                estimated_depletion_at = balance_depletion_at(
+                    EXCLUDED.available, balances.burn_rate
+                ),
+                low_balance_since = {low_balance_since_sql("EXCLUDED.available")},
+                updated_at = now()
+            """
+        ),
+        {
+            "wallet_ids": [wallet_id for wallet_id, _ in balance_keys],
+            "credit_type_ids": [credit_type_id for _, credit_type_id in balance_keys],
+        },
+    )
+    return result.rowcount
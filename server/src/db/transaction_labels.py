@@ -0,0 +1,30 @@
+from typing import Dict, Iterable
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.transactions import TransactionLabel
+
+
+async def get_or_create_labels(
+    session: AsyncSession, values: Iterable[str]
+) -> Dict[str, int]:
+    values = set(values)
+    result = await session.execute(
+        insert(TransactionLabel)
+        .values([{"value": value} for value in values])
+        .on_conflict_do_nothing(index_elements=["value"])
+        .returning(TransactionLabel.value, TransactionLabel.id)
+    )
+    label_ids = dict(result.tuples().all())
+
+    existing = values - label_ids.keys()
+    if existing:
+        result = await session.execute(
+            select(TransactionLabel.value, TransactionLabel.id).where(
+                TransactionLabel.value.in_(existing)
+            )
+        )
+        label_ids.update(result.tuples().all())
+    return label_ids
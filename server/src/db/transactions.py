@@ -1,11 +1,13 @@
-from typing import Dict, Optional
-from uuid import uuid4
+from typing import AsyncIterator, Dict, Optional, Sequence, Tuple
 
-from sqlalchemy import func, select, update
+from sqlalchemy import Select, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
+from src.db.expressions import enum_literal, promoted_context_filters
 from src.models.base import OrderBy, PaginationRequest
 from src.models.transactions import (
+    BalanceSnapshot,
     HoldStatus,
     PaginatedTransactionDBModel,
     SubscriptionDepositRequest,
@@ -15,12 +17,15 @@ from src.models.transactions import (
     TransactionType,
 )
 from src.utils.dependencies import DateTimeRange
+from src.utils.ids import generate_id
 
 
 async def create_transaction(
     db: AsyncSession,
     wallet_id: str,
     transaction_request: TransactionRequestBase,
+    issuer_id: int,
+    description_id: int,
 ) -> TransactionDBModel:
     subscription_id = None
     if isinstance(transaction_request, SubscriptionDepositRequest):
@@ -31,14 +36,16 @@ async def create_transaction(
         hold_status = HoldStatus.HELD
 
     transaction = TransactionDBModel(
-        id=str(uuid4()),
+        id=generate_id(),
         type=transaction_request.type,
         external_id=transaction_request.external_id,
         wallet_id=wallet_id,
         credit_type_id=transaction_request.credit_type_id,
-        issuer=transaction_request.issuer,
-        description=transaction_request.description,
+        issuer_id=issuer_id,
+        description_id=description_id,
+        amount=getattr(transaction_request.payload, "amount", None),
         payload=transaction_request.payload.model_dump(),
+        context=transaction_request.context or {},
         hold_status=hold_status,
         status=TransactionStatus.PENDING,
         subscription_id=subscription_id,
@@ -52,6 +59,8 @@ async def get_transaction(
     transaction_id: str,
     transaction_type: Optional[TransactionType] = None,
     credit_type_id: Optional[str] = None,
+    wallet_id: Optional[str] = None,
+    hold_status: Optional[HoldStatus] = None,
 ) -> TransactionDBModel | None:
     query = select(TransactionDBModel).where(
         TransactionDBModel.id == transaction_id,
@@ -60,6 +69,12 @@ async def get_transaction(
         query = query.where(TransactionDBModel.type == transaction_type)
     if credit_type_id:
         query = query.where(TransactionDBModel.credit_type_id == credit_type_id)
+    if wallet_id:
+        # transactions are partitioned by wallet_id, this prunes the lookup
+        # to a single partition
+        query = query.where(TransactionDBModel.wallet_id == wallet_id)
+    if hold_status:
+        query = query.where(TransactionDBModel.hold_status == enum_literal(hold_status))
     result = await session.execute(query)
     return result.scalar_one_or_none()
 
@@ -69,7 +84,8 @@ async def update_transaction(
     transaction_id: str,
     status: TransactionStatus | None = None,
     hold_status: HoldStatus | None = None,
-    balance_snapshot: dict | None = None,
+    balance_snapshot: BalanceSnapshot | None = None,
+    amount: float | None = None,
 ) -> TransactionDBModel | None:
     update_values = {}
     if status is not None:
@@ -77,28 +93,44 @@ async def update_transaction(
     if hold_status is not None:
         update_values["hold_status"] = hold_status.value
     if balance_snapshot is not None:
-        update_values["balance_snapshot"] = balance_snapshot
+        update_values["snapshot_available"] = balance_snapshot.available
+        update_values["snapshot_held"] = balance_snapshot.held
+        update_values["snapshot_spent"] = balance_snapshot.spent
+        update_values["snapshot_overall_spent"] = balance_snapshot.overall_spent
+        update_values["completed_at"] = func.now()
+    if amount is not None:
+        update_values["amount"] = amount
 
     result = await session.execute(
         update(TransactionDBModel)
         .where(TransactionDBModel.id == transaction_id)
         .values(**update_values)
-        .returning(TransactionDBModel)
+        .returning(
+            TransactionDBModel,
+            TransactionDBModel.issuer,
+            TransactionDBModel.description,
+        )
     )
-    return result.scalar_one_or_none()
+    row = result.one_or_none()
+    if row is None:
+        return None
+
+    # RETURNING only populates the table columns of the returned entity, the
+    # dictionary encoded labels are returned alongside it
+    transaction, issuer, description = row
+    set_committed_value(transaction, "issuer", issuer)
+    set_committed_value(transaction, "description", description)
+    return transaction
 
 
-async def list_transactions(
-    session: AsyncSession,
+def _transactions_query(
     wallet_id: Optional[str],
     credit_type_id: Optional[str],
     external_id: Optional[str],
-    pagination: PaginationRequest,
     context: Dict[str, str],
     date_range: DateTimeRange,
     order_by: OrderBy,
-) -> PaginatedTransactionDBModel:
-    # Base query for both total count and paginated results
+) -> Select[Tuple[TransactionDBModel]]:
     query = select(TransactionDBModel)
     if wallet_id:
         query = query.where(TransactionDBModel.wallet_id == wallet_id)
@@ -107,7 +139,11 @@ async def list_transactions(
     if external_id:
         query = query.where(TransactionDBModel.external_id == external_id)
     if context:
-        for key, value in context.items():
+        promoted, remaining = promoted_context_filters(
+            TransactionDBModel.context, context
+        )
+        query = query.where(*promoted)
+        for key, value in remaining.items():
             query = query.where(TransactionDBModel.context[key].as_string() == value)
     if date_range:
         query = query.where(TransactionDBModel.created_at >= date_range.start_date)
@@ -117,6 +153,28 @@ async def list_transactions(
         query = query.order_by(TransactionDBModel.created_at.desc())
     elif order_by == OrderBy.ASC:
         query = query.order_by(TransactionDBModel.created_at.asc())
+    return query
+
+
+async def list_transactions(
+    session: AsyncSession,
+    wallet_id: Optional[str],
+    credit_type_id: Optional[str],
+    external_id: Optional[str],
+    pagination: PaginationRequest,
+    context: Dict[str, str],
+    date_range: DateTimeRange,
+    order_by: OrderBy,
+) -> PaginatedTransactionDBModel:
+    # Base query for both total count and paginated results
+    query = _transactions_query(
+        wallet_id=wallet_id,
+        credit_type_id=credit_type_id,
+        external_id=external_id,
+        context=context,
+        date_range=date_range,
+        order_by=order_by,
+    )
 
     # Get total count
     count_query = select(func.count()).select_from(query.subquery())
@@ -138,6 +196,36 @@ async def list_transactions(
     )
 
 
+async def stream_transactions(
+    session: AsyncSession,
+    wallet_id: Optional[str],
+    credit_type_id: Optional[str],
+    external_id: Optional[str],
+    context: Dict[str, str],
+    date_range: DateTimeRange,
+    order_by: OrderBy,
+    batch_size: int = 1000,
+) -> AsyncIterator[Sequence[TransactionDBModel]]:
+    """
+    Stream all transactions matching the filters in batches.
+
+    Rows are fetched from a server side cursor batch_size at a time, so memory
+    use does not depend on the number of matching transactions. The cursor only
+    lives as long as the session's transaction.
+    """
+    query = _transactions_query(
+        wallet_id=wallet_id,
+        credit_type_id=credit_type_id,
+        external_id=external_id,
+        context=context,
+        date_range=date_range,
+        order_by=order_by,
+    )
+    result = await session.stream_scalars(query.execution_options(yield_per=batch_size))
+    async for batch in result.partitions():
+        yield batch
+
+
 async def get_transaction_by_external_id(
     session: AsyncSession,
     external_id: str,
@@ -1,12 +1,41 @@
-from typing import Optional
-from uuid import uuid4
+import json
+from typing import Any, Dict, List, Optional
 
-from sqlalchemy import delete, func, select
+from sqlalchemy import ColumnElement, and_, delete, desc, func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from src.db.expressions import promoted_context_filters
 from src.models.base import PaginationRequest
 from src.models.wallets import CreateWalletRequest, UpdateWalletRequest, Wallet
+from src.utils.ids import generate_id
+
+
+def _reject_constant(constant: str) -> Any:
+    raise ValueError(f"Not a JSON value: {constant}")
+
+
+def _context_value_filter(key: str, value: str) -> ColumnElement[bool]:
+    """
+    Match the wallets whose context value of key has the text value, as
+    context ->> key = value does: the JSON string value, or the JSON number,
+    boolean or null it spells. Every form is a containment predicate served
+    by the GIN index on context, the number is checked against the text too
+    since containment compares numbers by value, not by how they are written.
+    """
+    try:
+        typed = json.loads(value, parse_constant=_reject_constant)
+    except ValueError:
+        typed = value
+    if isinstance(typed, (str, list, dict)):
+        return Wallet.context.contains({key: value})
+    return and_(
+        or_(
+            Wallet.context.contains({key: value}),
+            Wallet.context.contains({key: typed}),
+        ),
+        Wallet.context[key].as_string() == value,
+    )
 
 
 async def get_wallet(session: AsyncSession, wallet_id: str) -> Wallet | None:
@@ -14,6 +43,16 @@ async def get_wallet(session: AsyncSession, wallet_id: str) -> Wallet | None:
     return await session.get(Wallet, wallet_id)
 
 
+async def get_wallet_names(
+    session: AsyncSession, wallet_ids: List[str]
+) -> Dict[str, str]:
+    """Get the names of the wallets by ID, for the wallets that exist"""
+    result = await session.execute(
+        select(Wallet.id, Wallet.name).where(Wallet.id.in_(wallet_ids))
+    )
+    return dict(result.tuples().all())
+
+
 async def get_wallet_with_balances(
     session: AsyncSession, wallet_id: str
 ) -> Wallet | None:
@@ -32,9 +71,14 @@ async def get_wallets(
     pagination_request: PaginationRequest,
     name: Optional[str] = None,
     context: Optional[dict] = None,
+    search: Optional[str] = None,
 ) -> tuple[list[Wallet], int]:
     """Get all wallets with pagination
 
+    When search is given, only wallets whose name or external id contain a word
+    similar to it are returned, most similar first. Both the filter and the name
+    filter are served by the trigram indexes on wallets.
+
     Returns:
         tuple: (list of wallets, total count)
     """
@@ -42,9 +86,19 @@ async def get_wallets(
     def apply_filters(query):
         if name:
             query = query.where(Wallet.name.ilike(f"%{name}%"))
+        if search:
+            query = query.where(
+                or_(
+                    Wallet.name.op("%>")(search),
+                    Wallet.external_id.op("%>")(search),
+                )
+            )
         if context:
-            for key, value in context.items():
-                query = query.where(Wallet.context[key].as_string() == str(value))
+            promoted, remaining = promoted_context_filters(Wallet.context, context)
+            query = query.where(*promoted)
+            query = query.where(
+                *(_context_value_filter(key, value) for key, value in remaining.items())
+            )
         return query
 
     # Build base query
@@ -59,12 +113,19 @@ async def get_wallets(
     if total_count == 0:
         return [], 0
 
+    if search:
+        rank = func.greatest(
+            func.word_similarity(search, Wallet.name),
+            func.word_similarity(search, Wallet.external_id),
+        )
+        query = query.order_by(desc(rank), Wallet.created_at.desc())
+    else:
+        query = query.order_by(Wallet.created_at.desc())
+
     # Apply pagination
-    query = (
-        query.order_by(Wallet.created_at.desc())
-        .offset((pagination_request.page - 1) * pagination_request.page_size)
-        .limit(pagination_request.page_size)
-    )
+    query = query.offset(
+        (pagination_request.page - 1) * pagination_request.page_size
+    ).limit(pagination_request.page_size)
 
     result = await session.execute(query)
     return list(result.scalars().all()), total_count or 0
@@ -75,7 +136,7 @@ async def create_wallet(
 ) -> Wallet:
     """Create a new wallet"""
     wallet = Wallet(
-        id=str(uuid4()),
+        id=generate_id(),
         name=wallet_request.name,
         context=wallet_request.context,
         external_id=wallet_request.external_id,
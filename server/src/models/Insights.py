@@ -1,11 +1,12 @@
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
-from typing import List
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
 
 class TimeGranularity(str, Enum):
+    HOUR = "hour"
     DAY = "day"
     WEEK = "week"
     MONTH = "month"
@@ -29,20 +30,45 @@ class InsightTimeSeriesBaseResponse(BaseModel):
     points: List[BaseModel]
 
 
-class WalletActivityAggregationResult(BaseModel):
-    timestamp: datetime
-    wallet_id: str
-    wallet_name: str
-    total_transactions: int
-    total_deposits: float = 0
-    total_debits: float = 0
-    total_holds: float = 0
-    total_releases: float = 0
-    total_adjustments: float = 0
+class TimeSeriesOptions(BaseModel):
+    # Return zero points for the buckets without transactions
+    fill_gaps: bool = False
+    # Number of buckets averaged into the moving average of every metric
+    moving_average: Optional[int] = None
+    # Return the difference of every metric from the previous bucket
+    deltas: bool = False
+
 
+class ConfidenceInterval(BaseModel):
+    low: float
+    high: float
 
-class WalletActivityPoint(BaseModel):
+
+class TimeSeriesPoint(BaseModel):
     timestamp: datetime
+    # Per metric, when requested by the TimeSeriesOptions
+    moving_averages: Optional[Dict[str, float]] = None
+    deltas: Optional[Dict[str, float]] = None
+    # Per metric, the 95% confidence interval of an approximate metric
+    confidence_intervals: Optional[Dict[str, ConfidenceInterval]] = None
+
+
+class WalletActivityBounds(BaseModel):
+    # Keep the top wallets of every bucket by transactions, the others are
+    # summed into a single point of wallet_id OTHER_WALLETS_ID per bucket
+    top: Optional[int] = None
+    # Only return the points of a page of the wallets, ranked by their
+    # transactions over the whole range
+    page: Optional[int] = None
+    page_size: int = 10
+
+
+# wallet_id and wallet_name of the point of the wallets outside the top
+OTHER_WALLETS_ID = "other"
+OTHER_WALLETS_NAME = "Other"
+
+
+class WalletActivityPoint(TimeSeriesPoint):
     wallet_id: str
     wallet_name: str
     total_transactions: int
@@ -55,6 +81,15 @@ class WalletActivityPoint(BaseModel):
 
 class WalletActivityResponse(InsightTimeSeriesBaseResponse):
     points: List[WalletActivityPoint]
+    # The page, and the number of wallets with transactions in the range,
+    # when paginated
+    page: Optional[int] = None
+    page_size: Optional[int] = None
+    total_wallets: Optional[int] = None
+    # Metrics are estimated from sample_percent of the transactions when
+    # approximate
+    approximate: bool = False
+    sample_percent: Optional[float] = None
 
 
 class CreditUsagePoint(BaseModel):
@@ -72,6 +107,7 @@ class CreditUsageAggregationResult(BaseModel):
     credit_type_name: str
     transaction_count: int
     debits_amount: float = 0
+    confidence_intervals: Optional[Dict[str, ConfidenceInterval]] = None
 
 
 class CreditTypesUsage(BaseModel):
@@ -81,34 +117,100 @@ class CreditTypesUsage(BaseModel):
     total_amount: float = 0
 
 
-class CreditUsageTimeSeriesAggregationResult(BaseModel):
-    timestamp: datetime
+class CreditUsageResponse(BaseModel):
     credit_type_id: str
     credit_type_name: str
     transaction_count: int
     debits_amount: float = 0
+    # Per metric, the 95% confidence interval of an approximate metric
+    confidence_intervals: Optional[Dict[str, ConfidenceInterval]] = None
 
 
-class CreditUsageResponse(BaseModel):
+class CreditUsageTimeSeriesPoint(TimeSeriesPoint):
     credit_type_id: str
     credit_type_name: str
     transaction_count: int
     debits_amount: float = 0
 
 
-class CreditUsageTimeSeriesPoint(BaseModel):
+class CreditUsageTimeSeriesResponse(InsightTimeSeriesBaseResponse):
+    points: List[CreditUsageTimeSeriesPoint]
+    # Metrics are estimated from sample_percent of the transactions when
+    # approximate
+    approximate: bool = False
+    sample_percent: Optional[float] = None
+
+
+class ActiveWalletsPoint(BaseModel):
     timestamp: datetime
     credit_type_id: str
     credit_type_name: str
-    transaction_count: int
-    debits_amount: float = 0
+    active_wallets: int
 
 
-class CreditUsageTimeSeriesResponse(InsightTimeSeriesBaseResponse):
-    points: List[CreditUsageTimeSeriesPoint]
+class ActiveWalletsResponse(InsightTimeSeriesBaseResponse):
+    points: List[ActiveWalletsPoint]
+    # Counts are HyperLogLog estimates when approximate, within about
+    # standard_error of the exact count (relative, one standard deviation)
+    approximate: bool
+    standard_error: float = 0
+
+
+class DebitDistributionPoint(BaseModel):
+    timestamp: datetime
+    credit_type_id: str
+    credit_type_name: str
+    debit_count: int
+    p50: float
+    p90: float
+    p99: float
+
+
+class DebitDistributionResponse(InsightTimeSeriesBaseResponse):
+    points: List[DebitDistributionPoint]
+    # Percentiles are within relative_accuracy of a debited amount of that rank
+    relative_accuracy: float
+
+
+class DepletingBalance(BaseModel):
+    wallet_id: str
+    wallet_name: str
+    credit_type_id: str
+    credit_type_name: str
+    available: float
+    burn_rate: float
+    estimated_depletion_at: datetime
+
+
+class CreditTypeLiability(BaseModel):
+    credit_type_id: str
+    credit_type_name: str
+    available: float
+    held: float
+    # Available and held credits owed to the wallets
+    outstanding: float
+
+
+class LiabilityHistoryPoint(CreditTypeLiability):
+    day: date
 
 
 class TrendingWalletAggregationResult(BaseModel):
     wallet_id: str
     transaction_count: int
     wallet_name: str
+
+
+class DashboardResponse(BaseModel):
+    general: GeneralInsightsResponse
+    trending_wallets: List[TrendingWalletAggregationResult]
+    credit_usage: List[CreditUsageResponse]
+    # Activity of the trending wallets of every period, the others summed
+    wallet_activity: WalletActivityResponse
+
+
+class InsightsCacheMetrics(BaseModel):
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    bypasses: int = 0
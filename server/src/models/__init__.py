@@ -1,7 +1,11 @@
 # flake8: noqa
 
-from src.models.balances import BalanceDBModel
+from src.models.balances import BalanceCheckpoint, BalanceDBModel
 from src.models.credit_types import CreditType
+from src.models.insight_counters import InsightCounter
+from src.models.liabilities import LiabilityCounter, LiabilitySnapshot
 from src.models.products import Product, ProductSettings, ProductSubscription
-from src.models.transactions import TransactionDBModel
+from src.models.rollups import RollupWatermark, TransactionRollup
+from src.models.transaction_imports import TransactionImportDBModel
+from src.models.transactions import TransactionDBModel, TransactionLabel
 from src.models.wallets import Wallet
@@ -1,7 +1,11 @@
-from sqlalchemy import Float, ForeignKey, String
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+from sqlalchemy import DateTime, Float, ForeignKey, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from src.models.base import DBModel, DBModelResponse
+from src.models.base import Base, DBModel, DBModelResponse, UUIDString
 
 
 class BalanceResponse(DBModelResponse):
@@ -11,17 +15,62 @@ class BalanceResponse(DBModelResponse):
     held: float
     spent: float
     overall_spent: float
+    # Exponentially weighted credits spent per day
+    burn_rate: float
+    # When the available credits run out at the burn rate
+    estimated_depletion_at: Optional[datetime]
+    # Standard deviations of the last debit from the weighted mean debit
+    spend_zscore: Optional[float]
+    # Threshold of this balance, overriding the threshold of its credit type
+    low_balance_threshold: Optional[float] = None
+    # Since when the available credits are below the threshold
+    low_balance_since: Optional[datetime] = None
+    # Time the amounts are as of when requested, the other fields are current
+    as_of: Optional[datetime] = None
+
+
+class BalanceHistoryPoint(BaseModel):
+    # Start of the bucket, the amounts are as of its end
+    timestamp: datetime
+    credit_type_id: str
+    available: float
+    held: float
+    spent: float
+    overall_spent: float
 
 
 class BalanceDBModel(DBModel):
     __tablename__ = "balances"
+    __table_args__ = (
+        Index(
+            "ix_balances_estimated_depletion_at",
+            "estimated_depletion_at",
+            postgresql_where=text("estimated_depletion_at IS NOT NULL"),
+        ),
+    )
 
-    wallet_id: Mapped[str] = mapped_column(String, ForeignKey("wallets.id"), index=True)
-    credit_type_id: Mapped[str] = mapped_column(String, index=True)
+    wallet_id: Mapped[str] = mapped_column(
+        UUIDString, ForeignKey("wallets.id"), index=True
+    )
+    credit_type_id: Mapped[str] = mapped_column(UUIDString, index=True)
     available: Mapped[float] = mapped_column(Float, default=0)
     held: Mapped[float] = mapped_column(Float, default=0)
     spent: Mapped[float] = mapped_column(Float, default=0)
     overall_spent: Mapped[float] = mapped_column(Float, default=0)
+    burn_rate: Mapped[float] = mapped_column(Float, default=0, server_default="0")
+    spend_mean: Mapped[float] = mapped_column(Float, default=0, server_default="0")
+    spend_variance: Mapped[float] = mapped_column(Float, default=0, server_default="0")
+    spend_zscore: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    last_debit_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    estimated_depletion_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    low_balance_threshold: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    low_balance_since: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
 
     wallet = relationship("Wallet", back_populates="_balances")
 
@@ -36,4 +85,47 @@ class BalanceDBModel(DBModel):
             held=self.held,
             spent=self.spent,
             overall_spent=self.overall_spent,
+            burn_rate=self.burn_rate,
+            estimated_depletion_at=self.estimated_depletion_at,
+            spend_zscore=self.spend_zscore,
+            low_balance_threshold=self.low_balance_threshold,
+            low_balance_since=self.low_balance_since,
         )
+
+
+class BalanceCheckpoint(Base):
+    """
+    A balance as of a checkpoint. Every checkpoint records the balances changed
+    since the previous one, the balance at any time is its latest checkpoint
+    until then updated by the transactions completed since.
+    """
+
+    __tablename__ = "balance_checkpoints"
+    __table_args__ = (Index("ix_balance_checkpoints_checkpoint_at", "checkpoint_at"),)
+
+    wallet_id: Mapped[str] = mapped_column(UUIDString, primary_key=True)
+    credit_type_id: Mapped[str] = mapped_column(UUIDString, primary_key=True)
+    checkpoint_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), primary_key=True
+    )
+    available: Mapped[float] = mapped_column(Float)
+    held: Mapped[float] = mapped_column(Float)
+    spent: Mapped[float] = mapped_column(Float)
+    overall_spent: Mapped[float] = mapped_column(Float)
+
+
+class LowBalanceThresholdRequest(BaseModel):
+    # None falls back to the threshold of the credit type
+    low_balance_threshold: Optional[float] = None
+
+
+class LowBalanceNotification(BaseModel):
+    """A balance whose available credits fell below its threshold"""
+
+    # Same for every delivery of a notification, to deduplicate them
+    id: str
+    wallet_id: str
+    credit_type_id: str
+    available: float
+    held: float
+    low_balance_since: datetime
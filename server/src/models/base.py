@@ -1,15 +1,44 @@
 from datetime import datetime
 from enum import Enum
-from typing import Any
+from typing import Any, Optional
+from uuid import UUID
 
 from pydantic import BaseModel, ConfigDict
-from sqlalchemy import DateTime, String
+from sqlalchemy import DateTime, TypeDecorator, Uuid
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column
 from sqlalchemy.sql import func
 
+from src.utils.ids import generate_id
+
 Base = declarative_base()
 
 
+class UUIDString(TypeDecorator):
+    """
+    Native uuid column exposed as a string.
+
+    Ids stay plain strings on the models and in the API, while the database
+    stores them in 16 bytes. A string that is not a valid uuid binds as NULL, so
+    looking up a malformed id finds nothing instead of failing the query.
+    """
+
+    impl = Uuid(as_uuid=True)
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect) -> Optional[UUID]:
+        if value is None or isinstance(value, UUID):
+            return value
+        try:
+            return UUID(str(value))
+        except ValueError:
+            return None
+
+    def process_result_value(self, value: Any, dialect) -> Optional[str]:
+        if value is None:
+            return None
+        return str(value)
+
+
 class OrderBy(str, Enum):
     ASC = "asc"
     DESC = "desc"
@@ -18,7 +47,9 @@ class OrderBy(str, Enum):
 class DBModel(Base):
     __abstract__ = True
 
-    id: Mapped[str] = mapped_column(String, primary_key=True)  # type hint for id
+    id: Mapped[str] = mapped_column(
+        UUIDString, primary_key=True, default=generate_id
+    )  # type hint for id
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -1,5 +1,7 @@
+from typing import Optional
+
 from pydantic import BaseModel
-from sqlalchemy import String
+from sqlalchemy import Float, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.models.base import DBModel, DBModelResponse
@@ -8,6 +10,7 @@ from src.models.base import DBModel, DBModelResponse
 class CreditTypeResponse(DBModelResponse):
     name: str
     description: str
+    low_balance_threshold: Optional[float] = None
 
 
 class CreditType(DBModel):
@@ -15,6 +18,8 @@ class CreditType(DBModel):
 
     name: Mapped[str] = mapped_column(String, nullable=False)
     description: Mapped[str] = mapped_column(String, nullable=False)
+    # Balances whose available credits fall below it are notified
+    low_balance_threshold: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
     def to_response(self) -> CreditTypeResponse:
         return CreditTypeResponse(
@@ -23,14 +28,18 @@ class CreditType(DBModel):
             updated_at=self.updated_at,
             name=self.name,
             description=self.description,
+            low_balance_threshold=self.low_balance_threshold,
         )
 
 
 class CreateCreditTypeRequest(BaseModel):
     name: str
     description: str
+    low_balance_threshold: Optional[float] = None
 
 
 class UpdateCreditTypeRequest(BaseModel):
     name: str
     description: str
+    # Left unchanged when not given, removed when null
+    low_balance_threshold: Optional[float] = None
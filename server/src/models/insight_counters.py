@@ -0,0 +1,20 @@
+from sqlalchemy import BigInteger, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.models.base import Base
+
+
+class InsightCounter(Base):
+    """
+    Row counts of transactions per type, wallets and credit types.
+
+    Kept up to date in the writing transaction by the statement triggers of the
+    insight_counters migration. A counter is the sum of its shards, concurrent
+    writers add to the shard of their backend.
+    """
+
+    __tablename__ = "insight_counters"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger)
@@ -0,0 +1,36 @@
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime, Float, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.models.base import Base, UUIDString
+
+
+class LiabilityCounter(Base):
+    """
+    Outstanding available and held credits per credit type, over all balances.
+
+    Kept up to date in the writing transaction by the statement triggers of the
+    liability_counters migration, with the same changes as the balances. A
+    credit type is the sum of its shards, concurrent writers add to the shard
+    of their backend.
+    """
+
+    __tablename__ = "liability_counters"
+
+    credit_type_id: Mapped[str] = mapped_column(UUIDString, primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    available: Mapped[float] = mapped_column(Float)
+    held: Mapped[float] = mapped_column(Float)
+
+
+class LiabilitySnapshot(Base):
+    """Outstanding credits per credit type as of the last snapshot of a UTC day"""
+
+    __tablename__ = "liability_snapshots"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    credit_type_id: Mapped[str] = mapped_column(UUIDString, primary_key=True)
+    available: Mapped[float] = mapped_column(Float)
+    held: Mapped[float] = mapped_column(Float)
+    taken_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
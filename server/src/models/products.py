@@ -7,7 +7,12 @@ from sqlalchemy import Float, ForeignKey, String, UniqueConstraint
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from src.models.base import DBModel, DBModelResponse, PaginatedResponse
+from src.models.base import (
+    DBModel,
+    DBModelResponse,
+    PaginatedResponse,
+    UUIDString,
+)
 from src.models.credit_types import CreditType
 from src.models.wallets import Wallet
 
@@ -119,10 +124,10 @@ class ProductSettings(DBModel):
     )
 
     product_id: Mapped[str] = mapped_column(
-        String, ForeignKey("products.id", ondelete="CASCADE"), nullable=False
+        UUIDString, ForeignKey("products.id", ondelete="CASCADE"), nullable=False
     )
     credit_type_id: Mapped[str] = mapped_column(
-        String, ForeignKey("credit_types.id"), nullable=False
+        UUIDString, ForeignKey("credit_types.id"), nullable=False
     )
     credit_amount: Mapped[float] = mapped_column(Float, nullable=False)
 
@@ -147,10 +152,10 @@ class ProductSubscription(DBModel):
     __tablename__ = "product_subscriptions"
 
     product_id: Mapped[str] = mapped_column(
-        String, ForeignKey("products.id"), nullable=False
+        UUIDString, ForeignKey("products.id"), nullable=False
     )
     wallet_id: Mapped[str] = mapped_column(
-        String, ForeignKey("wallets.id"), nullable=False
+        UUIDString, ForeignKey("wallets.id"), nullable=False, index=True
     )
     settings_snapshot: Mapped[List[dict]] = mapped_column(JSONB, nullable=False)
     status: Mapped[SubscriptionStatus] = mapped_column(
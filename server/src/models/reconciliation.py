@@ -0,0 +1,28 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class BalanceDrift(BaseModel):
+    wallet_id: str
+    credit_type_id: str
+    # Stored balance, None when the ledger has transactions but no balance
+    available: Optional[float] = None
+    held: Optional[float] = None
+    spent: Optional[float] = None
+    overall_spent: Optional[float] = None
+    # Balance implied by the completed transactions
+    expected_available: float
+    expected_held: float
+    expected_spent: float
+    expected_overall_spent: float
+    repaired: bool = False
+
+
+class ReconciliationReport(BaseModel):
+    chunks: int
+    balances_checked: int
+    balances_drifted: int
+    balances_repaired: int
+    drifts: List[BalanceDrift]  # Up to MAX_REPORTED_DRIFTS of them
+    duration_seconds: float
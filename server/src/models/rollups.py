@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime
+from sqlalchemy import Enum as SQLEnum
+from sqlalchemy import Float, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.models.base import Base, UUIDString
+from src.models.transactions import TransactionType
+
+
+class TransactionRollup(Base):
+    """
+    Transaction counts and amounts per hour, wallet, credit type and type.
+
+    Every hour before the transaction_rollups watermark is complete, insights
+    read those hours from here and only the hours after it from transactions.
+    """
+
+    __tablename__ = "transaction_rollups"
+
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    wallet_id: Mapped[str] = mapped_column(UUIDString, primary_key=True)
+    credit_type_id: Mapped[str] = mapped_column(UUIDString, primary_key=True)
+    type: Mapped[TransactionType] = mapped_column(
+        SQLEnum(TransactionType), primary_key=True
+    )
+    transaction_count: Mapped[int] = mapped_column(BigInteger)
+    amount_sum: Mapped[float] = mapped_column(Float)
+
+
+class RollupWatermark(Base):
+    """How far a rollup is complete, rows created before it are all included"""
+
+    __tablename__ = "rollup_watermarks"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    watermark: Mapped[datetime] = mapped_column(DateTime(timezone=True))
@@ -0,0 +1,76 @@
+from enum import Enum
+from typing import List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import Boolean
+from sqlalchemy import Enum as SQLAlchemyEnum
+from sqlalchemy import Integer
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.models.base import DBModel, DBModelResponse
+
+
+class ImportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class ImportStatus(str, Enum):
+    STAGING = "staging"  # Input is being copied into the staging table
+    VALIDATING = "validating"
+    IMPORTING = "importing"  # Upserting staged rows into transactions
+    RECOMPUTING = "recomputing"  # Recomputing the affected balances
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class ImportRowError(BaseModel):
+    line: Optional[int] = None  # Row of the input, starting at 1
+    reason: str
+
+
+class TransactionImportResponse(DBModelResponse):
+    format: ImportFormat
+    status: ImportStatus
+    rows_staged: int
+    rows_invalid: int
+    rows_imported: int
+    balances_recomputed: int
+    # Transactions were imported and their balances are not recomputed yet
+    balances_pending: bool
+    errors: List[ImportRowError]
+
+
+class TransactionImportDBModel(DBModel):
+    """Progress and outcome of a bulk import of transactions"""
+
+    __tablename__ = "transaction_imports"
+
+    format: Mapped[ImportFormat] = mapped_column(SQLAlchemyEnum(ImportFormat))
+    status: Mapped[ImportStatus] = mapped_column(
+        SQLAlchemyEnum(ImportStatus), default=ImportStatus.STAGING
+    )
+    rows_staged: Mapped[int] = mapped_column(Integer, default=0)
+    rows_invalid: Mapped[int] = mapped_column(Integer, default=0)
+    rows_imported: Mapped[int] = mapped_column(Integer, default=0)
+    balances_recomputed: Mapped[int] = mapped_column(Integer, default=0)
+    balances_pending: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default="false"
+    )
+    errors: Mapped[List[dict]] = mapped_column(JSONB, default=list)
+
+    def to_response(self) -> TransactionImportResponse:
+        return TransactionImportResponse(
+            id=self.id,
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+            format=self.format,
+            status=self.status,
+            rows_staged=self.rows_staged,
+            rows_invalid=self.rows_invalid,
+            rows_imported=self.rows_imported,
+            balances_recomputed=self.balances_recomputed,
+            balances_pending=self.balances_pending,
+            errors=[ImportRowError(**error) for error in self.errors],
+        )
@@ -1,13 +1,20 @@
+from datetime import datetime
 from enum import Enum
 from typing import Annotated, Any, Dict, List, Literal, Optional, Union
 
 from pydantic import BaseModel, Field
-from sqlalchemy import JSON
+from sqlalchemy import JSON, DateTime
 from sqlalchemy import Enum as SQLEnum
-from sqlalchemy import String
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Float, Identity, Index, Integer, String, select, text
+from sqlalchemy.orm import Mapped, column_property, mapped_column
 
-from src.models.base import DBModel, DBModelResponse, PaginatedResponse
+from src.models.base import (
+    Base,
+    DBModel,
+    DBModelResponse,
+    PaginatedResponse,
+    UUIDString,
+)
 
 
 class TransactionType(str, Enum):
@@ -31,6 +38,11 @@ class TransactionStatus(str, Enum):
     FAILED = "failed"
 
 
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
 class BalanceSnapshot(BaseModel):
     available: float
     held: float
@@ -38,6 +50,17 @@ class BalanceSnapshot(BaseModel):
     overall_spent: float
 
 
+class BalanceEvent(BaseModel):
+    """The balance of a credit type of a wallet after a completed transaction"""
+
+    wallet_id: str
+    credit_type_id: str
+    transaction_id: str
+    transaction_type: TransactionType
+    balance: BalanceSnapshot
+    updated_at: datetime
+
+
 class TransactionRequestBase(BaseModel):
     type: TransactionType
     credit_type_id: str
@@ -140,19 +163,58 @@ class TransactionResponse(DBModelResponse):
     hold_status: Optional[HoldStatus] = None
     wallet_id: str
     status: TransactionStatus
+    completed_at: Optional[datetime] = None
+
+
+class TransactionLabel(Base):
+    """
+    Dictionary of the issuer and description strings of transactions, which
+    repeat the same few values across millions of rows
+    """
+
+    __tablename__ = "transaction_labels"
+
+    id: Mapped[int] = mapped_column(Integer, Identity(), primary_key=True)
+    value: Mapped[str] = mapped_column(String, unique=True)
+
+
+def _label_value(label_id_column):
+    return (
+        select(TransactionLabel.value)
+        .where(TransactionLabel.id == label_id_column)
+        .correlate_except(TransactionLabel)
+        .scalar_subquery()
+    )
 
 
 class TransactionDBModel(DBModel):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_wallet_id_created_at", "wallet_id", "created_at"),
+        Index("ix_transactions_wallet_id_completed_at", "wallet_id", "completed_at"),
+        Index(
+            "ix_transactions_debit_created_at",
+            "created_at",
+            "credit_type_id",
+            postgresql_where=text("type = 'DEBIT'"),
+        ),
+        Index(
+            "ix_transactions_held_id",
+            "id",
+            "wallet_id",
+            postgresql_where=text("hold_status = 'HELD'"),
+        ),
+    )
 
     type: Mapped[TransactionType] = mapped_column(SQLEnum(TransactionType))
     external_id: Mapped[Optional[str]] = mapped_column(
         String, index=True, unique=True, nullable=True
     )
-    wallet_id: Mapped[str] = mapped_column(String, index=True)
-    credit_type_id: Mapped[str] = mapped_column(String, index=True)
-    issuer: Mapped[str] = mapped_column(String)
-    description: Mapped[str] = mapped_column(String)
+    wallet_id: Mapped[str] = mapped_column(UUIDString)
+    credit_type_id: Mapped[str] = mapped_column(UUIDString, index=True)
+    issuer_id: Mapped[int] = mapped_column(Integer)
+    description_id: Mapped[int] = mapped_column(Integer)
+    amount: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     context: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON, default={})
     payload: Mapped[Dict[str, Any]] = mapped_column(
         JSON
@@ -161,10 +223,32 @@ class TransactionDBModel(DBModel):
         SQLEnum(HoldStatus), nullable=True
     )
     status: Mapped[TransactionStatus] = mapped_column(SQLEnum(TransactionStatus))
-    balance_snapshot: Mapped[Optional[Dict[str, float]]] = mapped_column(
-        JSON, nullable=True
-    )  # BalanceSnapshot as JSON
-    subscription_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    snapshot_available: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    snapshot_held: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    snapshot_spent: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    snapshot_overall_spent: Mapped[Optional[float]] = mapped_column(
+        Float, nullable=True
+    )
+    subscription_id: Mapped[Optional[str]] = mapped_column(UUIDString, nullable=True)
+    # When the balance snapshot was taken, unlike updated_at it does not move
+    # when the hold status changes
+    completed_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+
+    issuer: Mapped[str] = column_property(_label_value(issuer_id))
+    description: Mapped[str] = column_property(_label_value(description_id))
+
+    @property
+    def balance_snapshot(self) -> Optional[Dict[str, float]]:
+        if self.snapshot_available is None:
+            return None
+        return BalanceSnapshot(
+            available=self.snapshot_available,
+            held=self.snapshot_held,
+            spent=self.snapshot_spent,
+            overall_spent=self.snapshot_overall_spent,
+        ).model_dump()
 
     def to_response(self) -> TransactionResponse:
         return TransactionResponse(
@@ -182,6 +266,7 @@ class TransactionDBModel(DBModel):
             hold_status=self.hold_status,
             wallet_id=self.wallet_id,
             status=self.status,
+            completed_at=self.completed_at,
         )
 
 
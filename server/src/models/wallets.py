@@ -3,7 +3,7 @@ from typing import List, Optional
 
 from pydantic import BaseModel
 from sqlalchemy import Enum as SQLAlchemyEnum
-from sqlalchemy import String, inspect
+from sqlalchemy import Index, String, inspect
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -26,6 +26,28 @@ class WalletResponse(DBModelResponse):
 
 class Wallet(DBModel):
     __tablename__ = "wallets"
+    __table_args__ = (
+        Index("ix_wallets_created_at", "created_at"),
+        Index("ix_wallets_updated_at_id", "updated_at", "id"),
+        Index(
+            "ix_wallets_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_wallets_external_id_trgm",
+            "external_id",
+            postgresql_using="gin",
+            postgresql_ops={"external_id": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_wallets_context",
+            "context",
+            postgresql_using="gin",
+            postgresql_ops={"context": "jsonb_path_ops"},
+        ),
+    )
 
     name: Mapped[str] = mapped_column(String, nullable=False)  # type hint for name
     context: Mapped[dict] = mapped_column(
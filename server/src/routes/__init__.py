@@ -1,6 +1,8 @@
 from src.routes.credit_types import router as credit_types_router
+from src.routes.imports import router as imports_router
 from src.routes.insights import router as insights_router
 from src.routes.products import router as products_router
+from src.routes.reconciliation import router as reconciliation_router
 from src.routes.transactions import router as transactions_router
 from src.routes.wallets import router as wallets_router
 from src.utils.router import APIRouter
@@ -12,3 +14,5 @@ router.include_router(credit_types_router)
 router.include_router(insights_router)
 router.include_router(transactions_router)
 router.include_router(products_router)
+router.include_router(imports_router)
+router.include_router(reconciliation_router)
@@ -0,0 +1,54 @@
+from fastapi import BackgroundTasks, Query, Request, status
+
+from src.models.transaction_imports import ImportFormat, TransactionImportResponse
+from src.services import transaction_imports_service
+from src.utils.router import APIRouter
+
+router = APIRouter(
+    prefix="/admin/imports",
+    tags=["admin"],
+)
+
+
+@router.post(
+    "/",
+    description=(
+        "Bulk import transactions from an NDJSON or CSV request body. The body "
+        "is staged right away, then validated and applied in the background."
+    ),
+    response_model=TransactionImportResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def create_import(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    import_format: ImportFormat = Query(default=ImportFormat.NDJSON, alias="format"),
+) -> TransactionImportResponse:
+    transaction_import = await transaction_imports_service.stage_import(
+        source=request.stream(), import_format=import_format
+    )
+    background_tasks.add_task(
+        transaction_imports_service.process_import, transaction_import.id
+    )
+    return transaction_import
+
+
+@router.get(
+    "/{import_id}",
+    description="Get the progress of an import",
+    response_model=TransactionImportResponse,
+)
+async def get_import(import_id: str) -> TransactionImportResponse:
+    return await transaction_imports_service.get_import(import_id)
+
+
+@router.post(
+    "/{import_id}/recompute-balances",
+    description=(
+        "Recompute the balances left pending by an import that failed or whose "
+        "process stopped"
+    ),
+    response_model=TransactionImportResponse,
+)
+async def recompute_pending_balances(import_id: str) -> TransactionImportResponse:
+    return await transaction_imports_service.recompute_pending_balances(import_id)
@@ -3,25 +3,65 @@ from typing import Dict, List
 from fastapi import APIRouter, Depends, Query
 
 from src.models.Insights import (
+    ActiveWalletsResponse,
+    CreditTypeLiability,
     CreditUsageResponse,
     CreditUsageTimeSeriesResponse,
+    DashboardResponse,
+    DebitDistributionResponse,
+    DepletingBalance,
     GeneralInsightsResponse,
+    InsightsCacheMetrics,
+    LiabilityHistoryPoint,
     TimeGranularity,
+    TimeSeriesOptions,
     TrendingWalletAggregationResult,
+    WalletActivityBounds,
     WalletActivityResponse,
 )
 from src.services import insights_service
-from src.utils.dependencies import DateTimeRange, dict_parser, get_datetime_range
+from src.utils.dependencies import (
+    DateTimeRange,
+    dict_parser,
+    get_cache_bypass,
+    get_datetime_range,
+    get_time_series_options,
+    get_wallet_activity_bounds,
+)
 
 router = APIRouter(prefix="/insights")
 
 
 @router.get("/general", response_model=GeneralInsightsResponse)
-async def get_general_insights() -> GeneralInsightsResponse:
+async def get_general_insights(
+    bypass_cache: bool = Depends(get_cache_bypass),
+) -> GeneralInsightsResponse:
     """
     Get general insights including transaction counts, deposit counts etc.
     """
-    return await insights_service.get_general_insights()
+    return await insights_service.get_general_insights(bypass_cache=bypass_cache)
+
+
+@router.get("/dashboard", response_model=DashboardResponse)
+async def get_dashboard(
+    date_range: DateTimeRange = Depends(get_datetime_range),
+    granularity: TimeGranularity = TimeGranularity.DAY,
+    limit: int = Query(
+        default=5,
+        description="Number of trending wallets, and of wallets of every period "
+        "of the activity besides the others summed",
+        ge=1,
+        le=100,
+    ),
+    bypass_cache: bool = Depends(get_cache_bypass),
+) -> DashboardResponse:
+    return await insights_service.get_dashboard(
+        start_date=date_range.start_date,
+        end_date=date_range.end_date,
+        granularity=granularity,
+        limit=limit,
+        bypass_cache=bypass_cache,
+    )
 
 
 @router.get("/wallets/activity", response_model=WalletActivityResponse)
@@ -29,12 +69,24 @@ async def get_wallet_activity(
     date_range: DateTimeRange = Depends(get_datetime_range),
     granularity: TimeGranularity = TimeGranularity.DAY,
     context: Dict[str, str] = Depends(dict_parser("context")),
+    options: TimeSeriesOptions = Depends(get_time_series_options),
+    approximate: bool = Query(
+        default=False,
+        description="Estimate from a sample of the transactions, with 95% "
+        "confidence intervals",
+    ),
+    bounds: WalletActivityBounds = Depends(get_wallet_activity_bounds),
+    bypass_cache: bool = Depends(get_cache_bypass),
 ) -> WalletActivityResponse:
     return await insights_service.get_wallet_activity(
         start_date=date_range.start_date,
         end_date=date_range.end_date,
         granularity=granularity,
         context=context,
+        options=options,
+        approximate=approximate,
+        bounds=bounds,
+        bypass_cache=bypass_cache,
     )
 
 
@@ -44,21 +96,46 @@ async def get_trending_wallets(
     limit: int = Query(
         default=5, description="Number of trending wallets to return", ge=1, le=100
     ),
+    bypass_cache: bool = Depends(get_cache_bypass),
 ) -> List[TrendingWalletAggregationResult]:
     return await insights_service.get_trending_wallets(
         start_date=date_range.start_date,
         end_date=date_range.end_date,
         limit=limit,
+        bypass_cache=bypass_cache,
+    )
+
+
+@router.get("/wallets/depletion", response_model=List[DepletingBalance])
+async def get_depleting_balances(
+    limit: int = Query(
+        default=10, description="Number of balances to return", ge=1, le=100
+    ),
+    bypass_cache: bool = Depends(get_cache_bypass),
+) -> List[DepletingBalance]:
+    """
+    Balances closest to running out of available credits at their burn rate
+    """
+    return await insights_service.get_depleting_balances(
+        limit=limit, bypass_cache=bypass_cache
     )
 
 
 @router.get("/credits/usage-summary", response_model=List[CreditUsageResponse])
 async def get_credit_usage(
     date_range: DateTimeRange = Depends(get_datetime_range),
+    approximate: bool = Query(
+        default=False,
+        description="Estimate from a sample of the transactions, with 95% "
+        "confidence intervals",
+    ),
+    bypass_cache: bool = Depends(get_cache_bypass),
 ) -> List[CreditUsageResponse]:
     return await insights_service.get_credit_usage(
         start_date=date_range.start_date,
         end_date=date_range.end_date,
+        approximate=approximate,
+        bypass_cache=bypass_cache,
     )
 
 
@@ -66,9 +143,90 @@ async def get_credit_usage(
 async def get_credit_usage_timeseries(
     date_range: DateTimeRange = Depends(get_datetime_range),
     granularity: TimeGranularity = TimeGranularity.DAY,
+    options: TimeSeriesOptions = Depends(get_time_series_options),
+    approximate: bool = Query(
+        default=False,
+        description="Estimate from a sample of the transactions, with 95% "
+        "confidence intervals",
+    ),
+    bypass_cache: bool = Depends(get_cache_bypass),
 ) -> CreditUsageTimeSeriesResponse:
     return await insights_service.get_credit_usage_timeseries(
         start_date=date_range.start_date,
         end_date=date_range.end_date,
         granularity=granularity,
+        options=options,
+        approximate=approximate,
+        bypass_cache=bypass_cache,
+    )
+
+
+@router.get("/credits/active-wallets", response_model=ActiveWalletsResponse)
+async def get_active_wallets(
+    date_range: DateTimeRange = Depends(get_datetime_range),
+    granularity: TimeGranularity = TimeGranularity.DAY,
+    bypass_cache: bool = Depends(get_cache_bypass),
+) -> ActiveWalletsResponse:
+    """
+    Distinct wallets with transactions per period and credit type, over whole
+    UTC days. Counts are HyperLogLog estimates when approximate is set, with a
+    relative standard error of standard_error.
+    """
+    return await insights_service.get_active_wallets(
+        start_date=date_range.start_date,
+        end_date=date_range.end_date,
+        granularity=granularity,
+        bypass_cache=bypass_cache,
     )
+
+
+@router.get("/credit-types/distribution", response_model=DebitDistributionResponse)
+async def get_debit_distribution(
+    date_range: DateTimeRange = Depends(get_datetime_range),
+    granularity: TimeGranularity = TimeGranularity.DAY,
+    bypass_cache: bool = Depends(get_cache_bypass),
+) -> DebitDistributionResponse:
+    """
+    p50, p90 and p99 of the amounts debited per period and credit type, within
+    relative_accuracy of an amount debited
+    """
+    return await insights_service.get_debit_distribution(
+        start_date=date_range.start_date,
+        end_date=date_range.end_date,
+        granularity=granularity,
+        bypass_cache=bypass_cache,
+    )
+
+
+@router.get("/credits/liabilities", response_model=List[CreditTypeLiability])
+async def get_liabilities(
+    bypass_cache: bool = Depends(get_cache_bypass),
+) -> List[CreditTypeLiability]:
+    """
+    Outstanding available and held credits per credit type, at this moment
+    """
+    return await insights_service.get_liabilities(bypass_cache=bypass_cache)
+
+
+@router.get("/credits/liabilities/history", response_model=List[LiabilityHistoryPoint])
+async def get_liability_history(
+    date_range: DateTimeRange = Depends(get_datetime_range),
+    bypass_cache: bool = Depends(get_cache_bypass),
+) -> List[LiabilityHistoryPoint]:
+    """
+    Outstanding credits per credit type as of the last snapshot of every UTC
+    day in the range
+    """
+    return await insights_service.get_liability_history(
+        start_date=date_range.start_date,
+        end_date=date_range.end_date,
+        bypass_cache=bypass_cache,
+    )
+
+
+@router.get("/cache/metrics", response_model=Dict[str, InsightsCacheMetrics])
+async def get_cache_metrics() -> Dict[str, InsightsCacheMetrics]:
+    """
+    Hits, stale hits, misses and bypasses of the insights cache per endpoint
+    """
+    return await insights_service.get_cache_metrics()
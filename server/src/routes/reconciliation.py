@@ -0,0 +1,24 @@
+from fastapi import Query
+
+from src.models.reconciliation import ReconciliationReport
+from src.services import reconciliation_service
+from src.utils.router import APIRouter
+
+router = APIRouter(
+    prefix="/admin/reconciliation",
+    tags=["admin"],
+)
+
+
+@router.post(
+    "/",
+    description=(
+        "Compare every balance with the balance implied by its completed "
+        "transactions, and optionally repair the drifted ones"
+    ),
+    response_model=ReconciliationReport,
+)
+async def reconcile_balances(
+    repair: bool = Query(default=False),
+) -> ReconciliationReport:
+    return await reconciliation_service.reconcile_balances(repair=repair)
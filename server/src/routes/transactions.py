@@ -1,9 +1,14 @@
 from typing import Dict, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 
 from src.models.base import OrderBy, PaginationRequest
-from src.models.transactions import PaginatedTransactionResponse, TransactionResponse
+from src.models.transactions import (
+    ExportFormat,
+    PaginatedTransactionResponse,
+    TransactionResponse,
+)
 from src.services import transactions_service
 from src.utils.dependencies import (
     DateTimeRange,
@@ -11,6 +16,7 @@ from src.utils.dependencies import (
     get_datetime_range,
     get_pagination,
 )
+from src.utils.streaming import accepts_gzip, gzip_stream
 
 router = APIRouter(
     prefix="/transactions",
@@ -43,6 +49,49 @@ async def list_transactions(
     )
 
 
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    description=(
+        "Export all transactions matching the filters as NDJSON or CSV. "
+        "The response is streamed, and gzip encoded if the client accepts it"
+    ),
+)
+async def export_transactions(
+    request: Request,
+    credit_type_id: Optional[str] = Query(None),
+    wallet_id: Optional[str] = Query(None),
+    external_id: Optional[str] = Query(None),
+    context: Dict[str, str] = Depends(dict_parser("context")),
+    date_range: DateTimeRange = Depends(get_datetime_range),
+    order_by: OrderBy = Query(OrderBy.DESC),
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+) -> StreamingResponse:
+    content = transactions_service.export_transactions(
+        credit_type_id=credit_type_id,
+        wallet_id=wallet_id,
+        external_id=external_id,
+        context=context,
+        date_range=date_range,
+        order_by=order_by,
+        export_format=export_format,
+    )
+    headers = {
+        "Content-Disposition": (
+            f'attachment; filename="transactions.{export_format.value}"'
+        ),
+        "Vary": "Accept-Encoding",
+    }
+    if accepts_gzip(request):
+        content = gzip_stream(content)
+        headers["Content-Encoding"] = "gzip"
+
+    media_type = (
+        "text/csv" if export_format == ExportFormat.CSV else "application/x-ndjson"
+    )
+    return StreamingResponse(content, media_type=media_type, headers=headers)
+
+
 @router.get(
     "/{transaction_id}",
     response_model=TransactionResponse,
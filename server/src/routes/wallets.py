@@ -1,8 +1,16 @@
-from typing import Dict, Optional
+from datetime import datetime
+from typing import Dict, List, Optional
 
-from fastapi import Depends, Query, status
+from fastapi import Depends, Header, Query, status
+from fastapi.responses import StreamingResponse
 
+from src.models.balances import (
+    BalanceHistoryPoint,
+    BalanceResponse,
+    LowBalanceThresholdRequest,
+)
 from src.models.base import PaginationRequest
+from src.models.Insights import TimeGranularity
 from src.models.products import (
     PaginatedProductSubscriptionResponse,
     ProductSubscriptionRequest,
@@ -23,7 +31,12 @@ from src.models.wallets import (
     WalletResponse,
 )
 from src.services import wallets_service
-from src.utils.dependencies import dict_parser, get_pagination
+from src.utils.dependencies import (
+    DateTimeRange,
+    dict_parser,
+    get_datetime_range,
+    get_pagination,
+)
 from src.utils.dependencies.transactions import TransactionContext, transaction_ctx
 from src.utils.router import APIRouter
 
@@ -50,12 +63,46 @@ async def create_wallet(wallet_data: CreateWalletRequest) -> WalletResponse:
     response_model=WalletResponse,
     status_code=status.HTTP_200_OK,
 )
-async def get_wallet(wallet_id: str) -> WalletResponse:
+async def get_wallet(
+    wallet_id: str,
+    as_of: Optional[datetime] = Query(
+        default=None,
+        description=(
+            "Time to read the balances as of, in ISO format "
+            "(e.g. 2024-01-01T00:00:00Z)"
+        ),
+    ),
+) -> WalletResponse:
     """Get a wallet by ID"""
-    response = await wallets_service.get_wallet_with_balances(wallet_id=wallet_id)
+    response = await wallets_service.get_wallet_with_balances(
+        wallet_id=wallet_id, as_of=as_of
+    )
     return response
 
 
+@router.get(
+    "/{wallet_id}/balance-history",
+    description=(
+        "Balances of a wallet as of the end of every period of the date range"
+    ),
+    response_model=List[BalanceHistoryPoint],
+    status_code=status.HTTP_200_OK,
+)
+async def get_balance_history(
+    wallet_id: str,
+    date_range: DateTimeRange = Depends(get_datetime_range),
+    granularity: TimeGranularity = TimeGranularity.DAY,
+    credit_type_id: Optional[str] = Query(default=None),
+) -> List[BalanceHistoryPoint]:
+    return await wallets_service.get_balance_history(
+        wallet_id=wallet_id,
+        start_date=date_range.start_date,
+        end_date=date_range.end_date,
+        granularity=granularity,
+        credit_type_id=credit_type_id,
+    )
+
+
 @router.get(
     "/",
     description="Get wallets",
@@ -66,12 +113,60 @@ async def get_wallets(
     pagination_request: PaginationRequest = Depends(get_pagination),
     name: Optional[str] = Query(default=None, description="Name of the wallet"),
     context: Dict[str, str] = Depends(dict_parser("context")),
+    search: Optional[str] = Query(
+        default=None,
+        min_length=1,
+        description=(
+            "Fuzzy search over wallet names and external ids, "
+            "results are ranked by similarity"
+        ),
+    ),
 ) -> PaginatedWalletResponse:
     """Get all wallets"""
     return await wallets_service.get_wallets(
         pagination_request=pagination_request,
         name=name,
         context=context,
+        search=search,
+    )
+
+
+@router.put(
+    "/{wallet_id}/balances/{credit_type_id}/low-balance-threshold",
+    description=(
+        "Set the low balance threshold of a balance, overriding the threshold of "
+        "its credit type, or remove it with null"
+    ),
+    response_model=BalanceResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def set_low_balance_threshold(
+    wallet_id: str, credit_type_id: str, request: LowBalanceThresholdRequest
+) -> BalanceResponse:
+    return await wallets_service.set_low_balance_threshold(
+        wallet_id=wallet_id, credit_type_id=credit_type_id, request=request
+    )
+
+
+@router.get(
+    "/{wallet_id}/events",
+    response_class=StreamingResponse,
+    description=(
+        "Stream the balance changes of a wallet as Server-Sent Events, resuming "
+        "after the Last-Event-ID of a reconnecting client"
+    ),
+)
+async def stream_balance_events(
+    wallet_id: str,
+    last_event_id: Optional[str] = Header(default=None),
+) -> StreamingResponse:
+    content = await wallets_service.stream_balance_events(
+        wallet_id=wallet_id, last_event_id=last_event_id
+    )
+    return StreamingResponse(
+        content,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
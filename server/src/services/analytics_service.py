@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from typing import List, Optional, Type, Union
+
+from src.core.analytics_replica import AnalyticsReplica
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.db import analytics as analytics_db
+from src.db import rollups as rollups_db
+from src.models import CreditType, Wallet
+from src.utils.ctx_managers import db_session
+from src.utils.workers import run_periodically
+
+logger = getLogger(__name__)
+
+NAMESPACE = "analytics_replica"
+
+
+def _resync_key() -> str:
+    return RedisManager().create_key(NAMESPACE, "resync_hours")
+
+
+async def connect_replica() -> bool:
+    """
+    Open the analytics replica and create its tables. The replica is left
+    disabled in this process when duckdb is not installed or another process
+    holds the replica file.
+
+    Returns:
+        Whether the replica is connected
+    """
+    replica = AnalyticsReplica()
+    try:
+        replica.connect()
+        await analytics_db.create_schema(replica)
+        replica.synced_until = await analytics_db.get_synced_until(replica)
+    except Exception:
+        logger.warning(
+            "Analytics replica unavailable, insights are read from Postgres",
+            exc_info=True,
+        )
+        replica.disconnect()
+        return False
+    return True
+
+
+def serves(start_date: datetime, end_date: datetime) -> bool:
+    """
+    Whether insights from start_date to end_date are computed from the
+    analytics replica: the range is long enough and the replica is recent.
+    """
+    replica = AnalyticsReplica()
+    if (
+        not replica.connected
+        or replica.synced_until is None
+        or end_date - start_date
+        < timedelta(days=settings.ANALYTICS_REPLICA_MIN_RANGE_DAYS)
+    ):
+        return False
+    return replica.synced_until >= datetime.now(timezone.utc) - timedelta(
+        seconds=settings.ANALYTICS_REPLICA_MAX_LAG_SECONDS
+    )
+
+
+async def resync_hours(hours: List[datetime]):
+    """
+    Have the hours mirrored again by the replica, for transactions written
+    into hours already past its watermark, such as those of an import.
+    """
+    if not settings.ANALYTICS_REPLICA_ENABLED or not hours:
+        return
+    await RedisManager().client.sadd(
+        _resync_key(), *(int(hour.timestamp()) for hour in hours)
+    )
+
+
+async def _mirror_named_rows(
+    replica: AnalyticsReplica, table: str, model: Union[Type[Wallet], Type[CreditType]]
+):
+    while True:
+        after = await analytics_db.get_watermark(replica, table)
+        async with db_session(read_only=True) as session_ctx:
+            rows = await analytics_db.get_named_rows_to_mirror(
+                session=session_ctx.session,
+                model=model,
+                after=after,
+                limit=settings.ANALYTICS_REPLICA_BATCH_SIZE,
+            )
+        await analytics_db.upsert_named_rows(replica, table, rows)
+        if len(rows) < settings.ANALYTICS_REPLICA_BATCH_SIZE:
+            return
+
+
+async def _mirror_transactions(replica: AnalyticsReplica, until: datetime):
+    while True:
+        after = await analytics_db.get_watermark(replica, analytics_db.TRANSACTIONS)
+        async with db_session(read_only=True) as session_ctx:
+            rows = await analytics_db.get_transactions_to_mirror(
+                session=session_ctx.session,
+                after=after,
+                until=until,
+                limit=settings.ANALYTICS_REPLICA_BATCH_SIZE,
+            )
+        caught_up = len(rows) < settings.ANALYTICS_REPLICA_BATCH_SIZE
+        synced_until = until if caught_up else rows[-1][5]
+        await analytics_db.append_transactions(replica, rows, synced_until)
+        replica.synced_until = synced_until
+        if caught_up:
+            return
+        logger.info("Mirrored transactions until %s", synced_until)
+
+
+async def _resync_hours(replica: AnalyticsReplica):
+    hours = await RedisManager().client.smembers(_resync_key())
+    for hour in sorted(int(hour) for hour in hours):
+        start = datetime.fromtimestamp(hour, timezone.utc)
+        end = start + rollups_db.BUCKET_SIZE
+        if replica.synced_until is None or end > replica.synced_until:
+            # Hours are mirrored again once entirely before the watermark
+            break
+        async with db_session(read_only=True) as session_ctx:
+            rows = await analytics_db.get_transactions_between(
+                session=session_ctx.session, start_date=start, end_date=end
+            )
+        await analytics_db.replace_transactions(replica, start, end, rows)
+        await RedisManager().client.srem(_resync_key(), hour)
+
+
+async def sync_replica(now: Optional[datetime] = None):
+    """
+    Mirror the credit types, wallets and transactions written since the last
+    sync into the analytics replica, ANALYTICS_REPLICA_BATCH_SIZE rows at a
+    time, then mirror again the hours queued by resync_hours. Wallets deleted
+    from Postgres are kept by the replica.
+    """
+    replica = AnalyticsReplica()
+    until = (now or datetime.now(timezone.utc)) - timedelta(
+        seconds=settings.ROLLUP_LATENESS_SECONDS
+    )
+    await _mirror_named_rows(replica, analytics_db.CREDIT_TYPES, CreditType)
+    await _mirror_named_rows(replica, analytics_db.WALLETS, Wallet)
+    await _mirror_transactions(replica, until)
+    await _resync_hours(replica)
+
+
+async def run_replica_worker():
+    await run_periodically(
+        "analytics replica sync",
+        sync_replica,
+        settings.ANALYTICS_REPLICA_SYNC_INTERVAL_SECONDS,
+    )
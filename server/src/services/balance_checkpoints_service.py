@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.db import balance_checkpoints as balance_checkpoints_db
+from src.utils.ctx_managers import db_session
+from src.utils.workers import run_periodically
+
+# Longest a checkpoint may take before another process can take one
+CHECKPOINT_LOCK_SECONDS = 600
+# How often the workers check whether a checkpoint is due
+CHECKPOINT_POLL_SECONDS = 300
+
+
+async def checkpoint_balances() -> int:
+    """
+    Checkpoint the balances changed since the last checkpoint, once it is
+    BALANCE_CHECKPOINT_INTERVAL_SECONDS old, which only one process does.
+
+    Returns:
+        The number of balances checkpointed
+    """
+    redis_manager = RedisManager()
+    lock = redis_manager.client.lock(
+        redis_manager.create_key(namespace="balance_checkpoints", key="checkpoint"),
+        timeout=CHECKPOINT_LOCK_SECONDS,
+    )
+    if not await lock.acquire(blocking=False):
+        return 0
+    try:
+        async with db_session() as session_ctx:
+            session = session_ctx.session
+            last_checkpoint_at = await balance_checkpoints_db.get_last_checkpoint_at(
+                session
+            )
+            due_at = datetime.now(timezone.utc) - timedelta(
+                seconds=settings.BALANCE_CHECKPOINT_INTERVAL_SECONDS
+            )
+            if last_checkpoint_at is not None and last_checkpoint_at > due_at:
+                return 0
+            return await balance_checkpoints_db.checkpoint_balances(session)
+    finally:
+        await lock.release()
+
+
+async def run_balance_checkpoint_worker():
+    await run_periodically(
+        "balance checkpoints",
+        checkpoint_balances,
+        min(CHECKPOINT_POLL_SECONDS, settings.BALANCE_CHECKPOINT_INTERVAL_SECONDS),
+    )
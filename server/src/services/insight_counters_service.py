@@ -0,0 +1,65 @@
+from logging import getLogger
+from typing import Dict
+
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.db import insight_counters as insight_counters_db
+from src.utils.ctx_managers import db_session
+from src.utils.workers import run_periodically
+
+logger = getLogger(__name__)
+
+# Longest a recount may take before another process can start one
+RECOUNT_LOCK_SECONDS = 600
+
+
+async def recount_insight_counters() -> Dict[str, int]:
+    """
+    Correct the drift of the insight counters from an exact count of the
+    counted tables, which only one process does at a time.
+
+    The counters and the tables are read in one snapshot, in which the
+    triggers keep them equal, and the difference is added to the counters
+    rather than overwriting them, so writes committed since are kept.
+
+    Returns:
+        The corrections added to the drifted counters
+    """
+    redis_manager = RedisManager()
+    lock = redis_manager.client.lock(
+        redis_manager.create_key(namespace="insight_counters", key="recount"),
+        timeout=RECOUNT_LOCK_SECONDS,
+    )
+    if not await lock.acquire(blocking=False):
+        return {}
+    try:
+        async with db_session(read_only=True) as session_ctx:
+            session = session_ctx.session
+            await session.connection(
+                execution_options={"isolation_level": "REPEATABLE READ"}
+            )
+            exact_counts = await insight_counters_db.get_exact_counts(session)
+            counters = await insight_counters_db.get_counters(session)
+
+        corrections = {
+            name: exact_counts.get(name, 0) - counters.get(name, 0)
+            for name in exact_counts.keys() | counters.keys()
+            if exact_counts.get(name, 0) != counters.get(name, 0)
+        }
+        if corrections:
+            logger.warning("Correcting drifted insight counters: %s", corrections)
+            async with db_session() as session_ctx:
+                await insight_counters_db.add_to_counters(
+                    session=session_ctx.session, deltas=corrections
+                )
+        return corrections
+    finally:
+        await lock.release()
+
+
+async def run_recount_worker():
+    await run_periodically(
+        "insight counters recount",
+        recount_insight_counters,
+        settings.INSIGHT_COUNTERS_RECOUNT_INTERVAL_SECONDS,
+    )
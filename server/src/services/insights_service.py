@@ -1,27 +1,212 @@
-from datetime import datetime
-from typing import Dict, List, Optional
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Type, TypeVar
 
+from fastapi import HTTPException, status
+from sqlalchemy import RowMapping
+
+from src.core.analytics_replica import AnalyticsReplica
+from src.db import analytics as analytics_db
+from src.db import credit_types as credit_types_db
 from src.db import insights as insights_db
+from src.db import liabilities as liabilities_db
+from src.db import rollups as rollups_db
+from src.db import wallets as wallets_db
 from src.models.Insights import (
+    ActiveWalletsPoint,
+    ActiveWalletsResponse,
+    CreditTypeLiability,
+    CreditUsageAggregationResult,
     CreditUsageResponse,
     CreditUsageTimeSeriesPoint,
     CreditUsageTimeSeriesResponse,
+    DashboardResponse,
+    DebitDistributionPoint,
+    DebitDistributionResponse,
+    DepletingBalance,
     GeneralInsightsResponse,
+    InsightsCacheMetrics,
+    LiabilityHistoryPoint,
     TimeGranularity,
+    TimeSeriesOptions,
+    TimeSeriesPoint,
     TrendingWalletAggregationResult,
+    WalletActivityBounds,
     WalletActivityPoint,
     WalletActivityResponse,
 )
-from src.utils.ctx_managers import db_session
+from src.services import analytics_service
+from src.utils.active_wallets import DAY, STANDARD_ERROR, ActiveWallets, day_start
+from src.utils.ctx_managers import db_session, snapshot_sessions
+from src.utils.debit_sketches import (
+    GAMMA,
+    RELATIVE_ACCURACY,
+    DebitSketches,
+    quantiles,
+)
+from src.utils.insights_cache import InsightsCache
+from src.utils.trending_wallets import TrendingWallets
+
+logger = getLogger(__name__)
+
+TimeSeriesPointType = TypeVar("TimeSeriesPointType", bound=TimeSeriesPoint)
+
+# Seconds a cached result of each endpoint is served as fresh
+CACHE_TTLS = {
+    "general": 30,
+    "wallet_activity": 60,
+    "trending_wallets": 60,
+    "credit_usage": 120,
+    "credit_usage_timeseries": 120,
+    "active_wallets": 300,
+    "debit_distribution": 300,
+    "depleting_balances": 30,
+    "liabilities": 30,
+    "liability_history": 300,
+    "dashboard": 60,
+}
+
+# Transactions read by each query while backfilling the insights kept in Redis
+BACKFILL_SPAN = timedelta(days=7)
+
+
+def snap_date_range(
+    start_date: datetime, end_date: datetime
+) -> Tuple[datetime, datetime]:
+    """
+    Widen a date range to the hour boundaries around it, the buckets of the
+    rollups and of the hourly insights in Redis, so that the snapped range
+    contains the requested one.
+
+    Insights read from the hourly sets in Redis, which only answer for whole
+    hours, are computed over the snapped range, cached under it and report it.
+    Insights computed from the transactions are computed over and cached under
+    the requested range.
+    """
+    snapped_end = rollups_db.bucket_start(end_date)
+    if snapped_end < end_date:
+        snapped_end += rollups_db.BUCKET_SIZE
+    return rollups_db.bucket_start(start_date), snapped_end
 
 
-async def get_general_insights() -> GeneralInsightsResponse:
+async def get_general_insights(bypass_cache: bool = False) -> GeneralInsightsResponse:
     """
     Get general insights including transaction counts, deposit counts etc.
     """
-    async with db_session() as session_ctx:
-        session = session_ctx.session
-        return await insights_db.get_general_insights(session=session)
+
+    async def compute() -> GeneralInsightsResponse:
+        async with db_session() as session_ctx:
+            session = session_ctx.session
+            return await insights_db.get_general_insights(session=session)
+
+    return await InsightsCache().get(
+        endpoint="general",
+        params={},
+        ttl=CACHE_TTLS["general"],
+        compute=compute,
+        result_type=GeneralInsightsResponse,
+        bypass=bypass_cache,
+    )
+
+
+async def get_dashboard(
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    limit: int,
+    bypass_cache: bool = False,
+) -> DashboardResponse:
+    """
+    General insights, the limit trending wallets, credit usage and the
+    activity of the limit top wallets of every period, in one response. The
+    queries run concurrently on connections of their own that all read one
+    snapshot, so that the figures agree with each other, and are therefore
+    all read from Postgres rather than Redis or the analytics replica.
+    """
+    options = TimeSeriesOptions()
+
+    async def compute() -> DashboardResponse:
+        async with snapshot_sessions(4) as sessions:
+            general, trending_wallets, credit_usage, (rows, _) = await asyncio.gather(
+                insights_db.get_general_insights(session=sessions[0]),
+                insights_db.get_trending_wallets(
+                    session=sessions[1],
+                    start_date=start_date,
+                    end_date=end_date,
+                    limit=limit,
+                ),
+                insights_db.get_credit_usage_aggregation(
+                    session=sessions[2], start_date=start_date, end_date=end_date
+                ),
+                insights_db.get_wallet_activity_aggregation(
+                    session=sessions[3],
+                    start_date=start_date,
+                    end_date=end_date,
+                    granularity=granularity,
+                    options=options,
+                    bounds=WalletActivityBounds(top=limit),
+                ),
+            )
+
+        return DashboardResponse.model_construct(
+            general=general,
+            trending_wallets=trending_wallets,
+            credit_usage=_credit_usage_responses(credit_usage),
+            wallet_activity=WalletActivityResponse.model_construct(
+                granularity=granularity,
+                start_date=start_date,
+                end_date=end_date,
+                points=_time_series_points(rows, WalletActivityPoint, options),
+                approximate=False,
+            ),
+        )
+
+    return await InsightsCache().get(
+        endpoint="dashboard",
+        params={
+            "start_date": start_date,
+            "end_date": end_date,
+            "granularity": granularity,
+            "limit": limit,
+        },
+        ttl=CACHE_TTLS["dashboard"],
+        compute=compute,
+        result_type=DashboardResponse,
+        bypass=bypass_cache,
+    )
+
+
+def _time_series_points(
+    rows: Sequence[RowMapping],
+    point_type: Type[TimeSeriesPointType],
+    options: TimeSeriesOptions,
+) -> List[TimeSeriesPointType]:
+    """
+    Points of the rows of a time series aggregation, with their moving
+    averages, deltas and confidence intervals grouped by metric. The rows are
+    typed by the query, the points are constructed from them without
+    validating every field again.
+    """
+    points = []
+    for row in rows:
+        values = dict(row)
+        values["confidence_intervals"] = insights_db.pop_confidence_intervals(values)
+        if options.moving_average:
+            values["moving_averages"] = {
+                name.removesuffix("_moving_average"): values.pop(name)
+                for name in list(values)
+                if name.endswith("_moving_average")
+            }
+        if options.deltas:
+            values["deltas"] = {
+                name.removesuffix("_delta"): values.pop(name)
+                for name in list(values)
+                if name.endswith("_delta")
+            }
+        points.append(point_type.model_construct(**values))
+    return points
 
 
 async def get_wallet_activity(
@@ -29,109 +214,649 @@ async def get_wallet_activity(
     end_date: datetime,
     granularity: TimeGranularity,
     context: Optional[Dict[str, str]] = None,
+    options: Optional[TimeSeriesOptions] = None,
+    approximate: bool = False,
+    bounds: Optional[WalletActivityBounds] = None,
+    bypass_cache: bool = False,
 ) -> WalletActivityResponse:
-    async with db_session() as session_ctx:
-        session = session_ctx.session
-        results = await insights_db.get_wallet_activity_aggregation(
-            session=session,
-            start_date=start_date,
-            end_date=end_date,
-            granularity=granularity,
-            context=context,
-        )
+    """
+    Transactions per period and wallet, estimated from a sample of the
+    transactions when approximate and the transactions outnumber the sample.
+    The bounds keep the top wallets of every period, the others summed into
+    one "other" wallet, or a page of the wallets.
+    """
+    options = options or TimeSeriesOptions()
+    bounds = bounds or WalletActivityBounds()
 
-    activity_points = []
-    for result in results:
-        activity_points.append(
-            WalletActivityPoint(
-                timestamp=result.timestamp,
-                wallet_id=result.wallet_id,
-                wallet_name=result.wallet_name,
-                total_transactions=result.total_transactions,
-                total_deposits=result.total_deposits,
-                total_debits=result.total_debits,
-                total_holds=result.total_holds,
-                total_releases=result.total_releases,
-                total_adjustments=result.total_adjustments,
+    async def compute() -> WalletActivityResponse:
+        sample_percent = None
+        if (
+            not approximate
+            and not context
+            and analytics_service.serves(start_date, end_date)
+        ):
+            rows, total_wallets = await analytics_db.get_wallet_activity_aggregation(
+                replica=AnalyticsReplica(),
+                start_date=start_date,
+                end_date=end_date,
+                granularity=granularity,
+                options=options,
+                bounds=bounds,
             )
+        else:
+            async with db_session() as session_ctx:
+                session = session_ctx.session
+                if approximate:
+                    sample_percent = await insights_db.get_sample_percent(
+                        session, start_date, end_date
+                    )
+                rows, total_wallets = await insights_db.get_wallet_activity_aggregation(
+                    session=session,
+                    start_date=start_date,
+                    end_date=end_date,
+                    granularity=granularity,
+                    context=context,
+                    options=options,
+                    sample_percent=sample_percent,
+                    bounds=bounds,
+                )
+
+        paginated = bounds.page is not None
+        return WalletActivityResponse.model_construct(
+            granularity=granularity,
+            start_date=start_date,
+            end_date=end_date,
+            points=_time_series_points(rows, WalletActivityPoint, options),
+            approximate=sample_percent is not None,
+            sample_percent=sample_percent,
+            page=bounds.page,
+            page_size=bounds.page_size if paginated else None,
+            total_wallets=total_wallets,
         )
 
-    return WalletActivityResponse(
-        granularity=granularity,
-        start_date=start_date,
-        end_date=end_date,
-        points=activity_points,
+    return await InsightsCache().get(
+        endpoint="wallet_activity",
+        params={
+            "start_date": start_date,
+            "end_date": end_date,
+            "granularity": granularity,
+            "context": context or {},
+            "options": options.model_dump(),
+            "approximate": approximate,
+            "bounds": bounds.model_dump(),
+        },
+        ttl=CACHE_TTLS["wallet_activity"],
+        compute=compute,
+        result_type=WalletActivityResponse,
+        bypass=bypass_cache,
     )
 
 
+async def _get_wallet_names(wallet_ids: List[str]) -> Dict[str, str]:
+    names = await TrendingWallets().get_cached_names(wallet_ids)
+    missing = [wallet_id for wallet_id in wallet_ids if wallet_id not in names]
+    if missing:
+        async with db_session(read_only=True) as session_ctx:
+            found = await wallets_db.get_wallet_names(
+                session=session_ctx.session, wallet_ids=missing
+            )
+        await TrendingWallets().cache_names(found)
+        names.update(found)
+    return names
+
+
 async def get_trending_wallets(
     start_date: datetime,
     end_date: datetime,
     limit: int,
+    bypass_cache: bool = False,
 ) -> List[TrendingWalletAggregationResult]:
-    async with db_session() as session_ctx:
-        session = session_ctx.session
-        results = await insights_db.get_trending_wallets(
-            session=session,
-            start_date=start_date,
-            end_date=end_date,
-            limit=limit,
-        )
+    """
+    Wallets with the most transactions in the date range, from the hourly
+    sorted sets of trending wallets in Redis when they cover the range.
+    """
+    start_date, end_date = snap_date_range(start_date, end_date)
 
-    return results
+    async def compute() -> List[TrendingWalletAggregationResult]:
+        top = await TrendingWallets().get_top(start_date, end_date, limit)
+        if top is None and analytics_service.serves(start_date, end_date):
+            return await analytics_db.get_trending_wallets(
+                replica=AnalyticsReplica(),
+                start_date=start_date,
+                end_date=end_date,
+                limit=limit,
+            )
+        if top is None:
+            async with db_session() as session_ctx:
+                session = session_ctx.session
+                return await insights_db.get_trending_wallets(
+                    session=session,
+                    start_date=start_date,
+                    end_date=end_date,
+                    limit=limit,
+                )
 
+        names = await _get_wallet_names([wallet_id for wallet_id, _ in top])
+        return [
+            TrendingWalletAggregationResult(
+                wallet_id=wallet_id,
+                wallet_name=names[wallet_id],
+                transaction_count=transaction_count,
+            )
+            for wallet_id, transaction_count in sorted(
+                top, key=lambda wallet: (-wallet[1], wallet[0])
+            )
+            if wallet_id in names
+        ]
 
-async def get_credit_usage(
-    start_date: datetime,
-    end_date: datetime,
-) -> List[CreditUsageResponse]:
-    async with db_session() as session_ctx:
-        session = session_ctx.session
-        results = await insights_db.get_credit_usage_aggregation(
-            session=session,
-            start_date=start_date,
-            end_date=end_date,
-        )
+    return await InsightsCache().get(
+        endpoint="trending_wallets",
+        params={"start_date": start_date, "end_date": end_date, "limit": limit},
+        ttl=CACHE_TTLS["trending_wallets"],
+        compute=compute,
+        result_type=List[TrendingWalletAggregationResult],
+        bypass=bypass_cache,
+    )
 
+
+async def get_depleting_balances(
+    limit: int, bypass_cache: bool = False
+) -> List[DepletingBalance]:
+    """
+    Balances estimated to run out first at their exponentially weighted burn
+    rate, kept up to date by every balance change.
+    """
+
+    async def compute() -> List[DepletingBalance]:
+        async with db_session(read_only=True) as session_ctx:
+            return await insights_db.get_depleting_balances(
+                session=session_ctx.session, limit=limit
+            )
+
+    return await InsightsCache().get(
+        endpoint="depleting_balances",
+        params={"limit": limit},
+        ttl=CACHE_TTLS["depleting_balances"],
+        compute=compute,
+        result_type=List[DepletingBalance],
+        bypass=bypass_cache,
+    )
+
+
+async def get_liabilities(bypass_cache: bool = False) -> List[CreditTypeLiability]:
+    """
+    Outstanding available and held credits per credit type, read from the
+    liability counters the balance changes keep up to date.
+    """
+
+    async def compute() -> List[CreditTypeLiability]:
+        async with db_session(read_only=True) as session_ctx:
+            return await liabilities_db.get_liabilities(session_ctx.session)
+
+    return await InsightsCache().get(
+        endpoint="liabilities",
+        params={},
+        ttl=CACHE_TTLS["liabilities"],
+        compute=compute,
+        result_type=List[CreditTypeLiability],
+        bypass=bypass_cache,
+    )
+
+
+async def get_liability_history(
+    start_date: datetime, end_date: datetime, bypass_cache: bool = False
+) -> List[LiabilityHistoryPoint]:
+    """The daily snapshots of the liabilities of the UTC days in the range"""
+    start_day = day_start(start_date).date()
+    end_day = day_start(end_date).date()
+
+    async def compute() -> List[LiabilityHistoryPoint]:
+        async with db_session(read_only=True) as session_ctx:
+            return await liabilities_db.get_liability_history(
+                session=session_ctx.session, start_day=start_day, end_day=end_day
+            )
+
+    return await InsightsCache().get(
+        endpoint="liability_history",
+        params={"start_day": start_day, "end_day": end_day},
+        ttl=CACHE_TTLS["liability_history"],
+        compute=compute,
+        result_type=List[LiabilityHistoryPoint],
+        bypass=bypass_cache,
+    )
+
+
+def _credit_usage_responses(
+    results: Sequence[CreditUsageAggregationResult],
+) -> List[CreditUsageResponse]:
     return [
         CreditUsageResponse(
             credit_type_id=result.credit_type_id,
             credit_type_name=result.credit_type_name,
             transaction_count=result.transaction_count,
             debits_amount=result.debits_amount,
+            confidence_intervals=result.confidence_intervals,
         )
         for result in results
     ]
 
 
+async def get_credit_usage(
+    start_date: datetime,
+    end_date: datetime,
+    approximate: bool = False,
+    bypass_cache: bool = False,
+) -> List[CreditUsageResponse]:
+    async def compute() -> List[CreditUsageResponse]:
+        if not approximate and analytics_service.serves(start_date, end_date):
+            results = await analytics_db.get_credit_usage_aggregation(
+                replica=AnalyticsReplica(), start_date=start_date, end_date=end_date
+            )
+        else:
+            async with db_session() as session_ctx:
+                session = session_ctx.session
+                sample_percent = None
+                if approximate:
+                    sample_percent = await insights_db.get_sample_percent(
+                        session, start_date, end_date
+                    )
+                results = await insights_db.get_credit_usage_aggregation(
+                    session=session,
+                    start_date=start_date,
+                    end_date=end_date,
+                    sample_percent=sample_percent,
+                )
+
+        return _credit_usage_responses(results)
+
+    return await InsightsCache().get(
+        endpoint="credit_usage",
+        params={
+            "start_date": start_date,
+            "end_date": end_date,
+            "approximate": approximate,
+        },
+        ttl=CACHE_TTLS["credit_usage"],
+        compute=compute,
+        result_type=List[CreditUsageResponse],
+        bypass=bypass_cache,
+    )
+
+
 async def get_credit_usage_timeseries(
     start_date: datetime,
     end_date: datetime,
     granularity: TimeGranularity,
+    options: Optional[TimeSeriesOptions] = None,
+    approximate: bool = False,
+    bypass_cache: bool = False,
 ) -> CreditUsageTimeSeriesResponse:
-    async with db_session() as session_ctx:
-        session = session_ctx.session
-        results = await insights_db.get_credit_usage_timeseries_aggregation(
-            session=session,
+    options = options or TimeSeriesOptions()
+
+    async def compute() -> CreditUsageTimeSeriesResponse:
+        sample_percent = None
+        if not approximate and analytics_service.serves(start_date, end_date):
+            rows = await analytics_db.get_credit_usage_timeseries_aggregation(
+                replica=AnalyticsReplica(),
+                start_date=start_date,
+                end_date=end_date,
+                granularity=granularity,
+                options=options,
+            )
+        else:
+            async with db_session() as session_ctx:
+                session = session_ctx.session
+                if approximate:
+                    sample_percent = await insights_db.get_sample_percent(
+                        session, start_date, end_date
+                    )
+                rows = await insights_db.get_credit_usage_timeseries_aggregation(
+                    session=session,
+                    start_date=start_date,
+                    end_date=end_date,
+                    granularity=granularity,
+                    options=options,
+                    sample_percent=sample_percent,
+                )
+
+        return CreditUsageTimeSeriesResponse.model_construct(
+            granularity=granularity,
             start_date=start_date,
             end_date=end_date,
+            points=_time_series_points(rows, CreditUsageTimeSeriesPoint, options),
+            approximate=sample_percent is not None,
+            sample_percent=sample_percent,
+        )
+
+    return await InsightsCache().get(
+        endpoint="credit_usage_timeseries",
+        params={
+            "start_date": start_date,
+            "end_date": end_date,
+            "granularity": granularity,
+            "options": options.model_dump(),
+            "approximate": approximate,
+        },
+        ttl=CACHE_TTLS["credit_usage_timeseries"],
+        compute=compute,
+        result_type=CreditUsageTimeSeriesResponse,
+        bypass=bypass_cache,
+    )
+
+
+def _chunks(times: List[datetime], span: timedelta) -> List[List[datetime]]:
+    """Split ascending times into chunks spanning less than span each"""
+    chunks: List[List[datetime]] = []
+    for time in times:
+        if chunks and time - chunks[-1][0] < span:
+            chunks[-1].append(time)
+        else:
+            chunks.append([time])
+    return chunks
+
+
+def _periods(
+    start_date: datetime,
+    end_date: datetime,
+    step: timedelta,
+    granularity: TimeGranularity,
+) -> List[Tuple[datetime, List[datetime]]]:
+    """
+    The UTC periods of the granularity within [start_date, end_date), each
+    with its times from start_date on by step.
+    """
+    periods: Dict[datetime, List[datetime]] = defaultdict(list)
+    time = start_date
+    while time < end_date:
+        if granularity == TimeGranularity.HOUR:
+            period = rollups_db.bucket_start(time)
+        else:
+            period = day_start(time)
+            if granularity == TimeGranularity.WEEK:
+                period -= timedelta(days=period.weekday())
+            elif granularity == TimeGranularity.MONTH:
+                period = period.replace(day=1)
+        periods[period].append(time)
+        time += step
+    return list(periods.items())
+
+
+async def _get_credit_type_names() -> Dict[str, str]:
+    async with db_session(read_only=True) as session_ctx:
+        credit_types = await credit_types_db.get_credit_types(session_ctx.session)
+    return {credit_type.id: credit_type.name for credit_type in credit_types}
+
+
+async def get_active_wallets(
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    bypass_cache: bool = False,
+) -> ActiveWalletsResponse:
+    """
+    Distinct wallets with transactions per period and credit type, over the
+    whole UTC days the date range overlaps. Estimated from the daily
+    HyperLogLogs of active wallets in Redis when they cover the range, and
+    counted exactly from the transactions otherwise.
+    """
+    if granularity == TimeGranularity.HOUR:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Active wallets are counted per day at the finest",
+        )
+    start_date = day_start(start_date)
+    if day_start(end_date) < end_date:
+        end_date = day_start(end_date) + DAY
+
+    async def compute() -> ActiveWalletsResponse:
+        active_wallets = ActiveWallets()
+        if not await active_wallets.covers(start_date):
+            async with db_session(read_only=True) as session_ctx:
+                points = await insights_db.get_active_wallets_aggregation(
+                    session=session_ctx.session,
+                    start_date=start_date,
+                    end_date=end_date,
+                    granularity=granularity,
+                )
+            return ActiveWalletsResponse(
+                granularity=granularity,
+                start_date=start_date,
+                end_date=end_date,
+                points=points,
+                approximate=False,
+            )
+
+        names = await _get_credit_type_names()
+        counts = await active_wallets.count(
+            list(names), _periods(start_date, end_date, DAY, granularity)
+        )
+        return ActiveWalletsResponse(
             granularity=granularity,
+            start_date=start_date,
+            end_date=end_date,
+            points=[
+                ActiveWalletsPoint(
+                    timestamp=period,
+                    credit_type_id=credit_type_id,
+                    credit_type_name=names[credit_type_id],
+                    active_wallets=count,
+                )
+                for (period, credit_type_id), count in sorted(counts.items())
+            ],
+            approximate=True,
+            standard_error=STANDARD_ERROR,
         )
 
-    points = [
-        CreditUsageTimeSeriesPoint(
-            timestamp=result.timestamp,
-            credit_type_id=result.credit_type_id,
-            credit_type_name=result.credit_type_name,
-            transaction_count=result.transaction_count,
-            debits_amount=result.debits_amount,
+    return await InsightsCache().get(
+        endpoint="active_wallets",
+        params={
+            "start_date": start_date,
+            "end_date": end_date,
+            "granularity": granularity,
+        },
+        ttl=CACHE_TTLS["active_wallets"],
+        compute=compute,
+        result_type=ActiveWalletsResponse,
+        bypass=bypass_cache,
+    )
+
+
+async def get_debit_distribution(
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    bypass_cache: bool = False,
+) -> DebitDistributionResponse:
+    """
+    Percentiles of the amounts debited per period and credit type, by merging
+    the hourly debit amount sketches in Redis when they cover the range, and
+    sketches of the hours grouped from the transactions otherwise.
+    """
+    start_date, end_date = snap_date_range(start_date, end_date)
+
+    async def compute() -> DebitDistributionResponse:
+        names = await _get_credit_type_names()
+        periods = _periods(start_date, end_date, rollups_db.BUCKET_SIZE, granularity)
+        debit_sketches = DebitSketches()
+        if await debit_sketches.covers(start_date):
+            sketches = await debit_sketches.merge(list(names), periods)
+        else:
+            async with db_session(read_only=True) as session_ctx:
+                rows = await insights_db.get_hourly_debit_amount_bins(
+                    session=session_ctx.session,
+                    start_date=start_date,
+                    end_date=end_date,
+                    gamma=GAMMA,
+                )
+            period_of_hour = {
+                hour: period for period, hours in periods for hour in hours
+            }
+            sketches = defaultdict(lambda: defaultdict(int))
+            for bucket, credit_type_id, amount_bin, debit_count in rows:
+                period = period_of_hour[bucket]
+                sketches[(period, credit_type_id)][amount_bin] += debit_count
+
+        points = []
+        for (period, credit_type_id), bins in sorted(sketches.items()):
+            if credit_type_id not in names:
+                continue
+            p50, p90, p99 = quantiles(bins, [0.5, 0.9, 0.99])
+            points.append(
+                DebitDistributionPoint(
+                    timestamp=period,
+                    credit_type_id=credit_type_id,
+                    credit_type_name=names[credit_type_id],
+                    debit_count=sum(bins.values()),
+                    p50=p50,
+                    p90=p90,
+                    p99=p99,
+                )
+            )
+        return DebitDistributionResponse(
+            granularity=granularity,
+            start_date=start_date,
+            end_date=end_date,
+            points=points,
+            relative_accuracy=RELATIVE_ACCURACY,
         )
-        for result in results
-    ]
 
-    return CreditUsageTimeSeriesResponse(
-        granularity=granularity,
-        start_date=start_date,
-        end_date=end_date,
-        points=points,
+    return await InsightsCache().get(
+        endpoint="debit_distribution",
+        params={
+            "start_date": start_date,
+            "end_date": end_date,
+            "granularity": granularity,
+        },
+        ttl=CACHE_TTLS["debit_distribution"],
+        compute=compute,
+        result_type=DebitDistributionResponse,
+        bypass=bypass_cache,
     )
+
+
+async def backfill_trending_wallets(hours: Optional[List[datetime]] = None):
+    """
+    Rebuild the trending wallets sets from the transactions, of every retained
+    hour, after which the sets cover the whole retention, or of the given hours
+    only, like the hours an import wrote into.
+    """
+    trending_wallets = TrendingWallets()
+    buckets = trending_wallets.retained_buckets()
+    coverage_start = buckets[0]
+    if hours is not None:
+        requested = {rollups_db.bucket_start(hour) for hour in hours}
+        buckets = [bucket for bucket in buckets if bucket in requested]
+    if not buckets:
+        return
+
+    async with db_session(read_only=True) as session_ctx:
+        counts = await insights_db.get_hourly_wallet_transaction_counts(
+            session=session_ctx.session,
+            start_date=buckets[0],
+            end_date=buckets[-1] + rollups_db.BUCKET_SIZE,
+        )
+    wallet_counts: Dict[datetime, Dict[str, int]] = {bucket: {} for bucket in buckets}
+    for bucket, wallet_id, transaction_count in counts:
+        if bucket in wallet_counts:
+            wallet_counts[bucket][wallet_id] = transaction_count
+    await trending_wallets.rebuild(
+        wallet_counts, coverage_start=coverage_start if hours is None else None
+    )
+
+
+async def backfill_active_wallets(days: Optional[List[datetime]] = None):
+    """
+    Rebuild the active wallets HyperLogLogs from the transactions, of every
+    retained day, after which they cover the whole retention, or of the days
+    holding the given times only, like the hours an import wrote into.
+    """
+    active_wallets = ActiveWallets()
+    retained_days = active_wallets.retained_days()
+    coverage_start = retained_days[0]
+    if days is not None:
+        requested = {day_start(day) for day in days}
+        retained_days = [day for day in retained_days if day in requested]
+    if not retained_days:
+        return
+
+    async with db_session(read_only=True) as session_ctx:
+        credit_types = await credit_types_db.get_credit_types(session_ctx.session)
+    credit_type_ids = [credit_type.id for credit_type in credit_types]
+
+    chunks = _chunks(retained_days, BACKFILL_SPAN)
+    for index, chunk in enumerate(chunks):
+        async with db_session(read_only=True) as session_ctx:
+            rows = await insights_db.get_daily_active_wallets(
+                session=session_ctx.session,
+                start_date=chunk[0],
+                end_date=chunk[-1] + DAY,
+            )
+        wallets: Dict[Tuple[datetime, str], Set[str]] = defaultdict(set)
+        for wallet_day, credit_type_id, wallet_id in rows:
+            wallets[(wallet_day, credit_type_id)].add(wallet_id)
+        # Coverage is only set once the last chunk is in, older days first
+        is_last = index == len(chunks) - 1
+        await active_wallets.rebuild(
+            wallets,
+            days=chunk,
+            credit_type_ids=credit_type_ids,
+            coverage_start=coverage_start if days is None and is_last else None,
+        )
+
+
+async def backfill_debit_sketches(hours: Optional[List[datetime]] = None):
+    """
+    Rebuild the debit amount sketches from the transactions, of every retained
+    hour, after which they cover the whole retention, or of the given hours
+    only, like the hours an import wrote into.
+    """
+    debit_sketches = DebitSketches()
+    buckets = debit_sketches.retained_buckets()
+    coverage_start = buckets[0]
+    if hours is not None:
+        requested = {rollups_db.bucket_start(hour) for hour in hours}
+        buckets = [bucket for bucket in buckets if bucket in requested]
+    if not buckets:
+        return
+
+    async with db_session(read_only=True) as session_ctx:
+        credit_types = await credit_types_db.get_credit_types(session_ctx.session)
+    credit_type_ids = [credit_type.id for credit_type in credit_types]
+
+    chunks = _chunks(buckets, BACKFILL_SPAN)
+    for index, chunk in enumerate(chunks):
+        async with db_session(read_only=True) as session_ctx:
+            rows = await insights_db.get_hourly_debit_amount_bins(
+                session=session_ctx.session,
+                start_date=chunk[0],
+                end_date=chunk[-1] + rollups_db.BUCKET_SIZE,
+                gamma=GAMMA,
+            )
+        bins: Dict[Tuple[datetime, str], Dict[int, int]] = defaultdict(dict)
+        for bucket, credit_type_id, amount_bin, debit_count in rows:
+            bins[(bucket, credit_type_id)][amount_bin] = debit_count
+        is_last = index == len(chunks) - 1
+        await debit_sketches.rebuild(
+            bins,
+            buckets=chunk,
+            credit_type_ids=credit_type_ids,
+            coverage_start=coverage_start if hours is None and is_last else None,
+        )
+
+
+async def backfill_insights_if_missing():
+    """Backfill the insights kept in Redis that have never been built"""
+    for name, has_coverage, backfill in (
+        ("trending wallets", TrendingWallets().has_coverage, backfill_trending_wallets),
+        ("active wallets", ActiveWallets().has_coverage, backfill_active_wallets),
+        ("debit sketches", DebitSketches().has_coverage, backfill_debit_sketches),
+    ):
+        try:
+            if not await has_coverage():
+                await backfill()
+        except Exception:
+            logger.error("Backfilling the %s failed", name, exc_info=True)
+
+
+async def get_cache_metrics() -> Dict[str, InsightsCacheMetrics]:
+    return await InsightsCache().get_metrics()
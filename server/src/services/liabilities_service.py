@@ -0,0 +1,76 @@
+from logging import getLogger
+from typing import Dict, Tuple
+
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.db import liabilities as liabilities_db
+from src.utils.ctx_managers import db_session
+from src.utils.workers import run_periodically
+
+logger = getLogger(__name__)
+
+# Longest a recount may take before another process can start one
+RECOUNT_LOCK_SECONDS = 600
+# Differences from the exact sums below this are floating point noise
+RECOUNT_TOLERANCE = 1e-6
+
+
+async def recount_liabilities() -> Dict[str, Tuple[float, float]]:
+    """
+    Correct the drift of the liability counters from the exact sums of the
+    balances, which only one process does at a time.
+
+    The counters and the balances are read in one snapshot, in which the
+    triggers keep them equal, and the difference is added to the counters
+    rather than overwriting them, so writes committed since are kept.
+
+    Returns:
+        The (available, held) corrections added to the drifted credit types
+    """
+    redis_manager = RedisManager()
+    lock = redis_manager.client.lock(
+        redis_manager.create_key(namespace="liability_counters", key="recount"),
+        timeout=RECOUNT_LOCK_SECONDS,
+    )
+    if not await lock.acquire(blocking=False):
+        return {}
+    try:
+        async with db_session(read_only=True) as session_ctx:
+            session = session_ctx.session
+            await session.connection(
+                execution_options={"isolation_level": "REPEATABLE READ"}
+            )
+            exact = await liabilities_db.get_exact_liabilities(session)
+            counters = await liabilities_db.get_liability_counters(session)
+
+        corrections = {}
+        for credit_type_id in exact.keys() | counters.keys():
+            exact_available, exact_held = exact.get(credit_type_id, (0, 0))
+            available, held = counters.get(credit_type_id, (0, 0))
+            correction = (exact_available - available, exact_held - held)
+            if any(abs(delta) > RECOUNT_TOLERANCE for delta in correction):
+                corrections[credit_type_id] = correction
+        if corrections:
+            logger.warning("Correcting drifted liability counters: %s", corrections)
+            async with db_session() as session_ctx:
+                await liabilities_db.add_to_liabilities(
+                    session=session_ctx.session, deltas=corrections
+                )
+        return corrections
+    finally:
+        await lock.release()
+
+
+async def snapshot_liabilities() -> int:
+    """Correct the liability counters, then record them as today's snapshot"""
+    await recount_liabilities()
+    async with db_session() as session_ctx:
+        return await liabilities_db.snapshot_liabilities(session_ctx.session)
+
+
+async def run_liabilities_worker():
+    await run_periodically(
+        "liabilities snapshot",
+        snapshot_liabilities,
+        settings.LIABILITIES_SNAPSHOT_INTERVAL_SECONDS,
+    )
@@ -0,0 +1,73 @@
+import os
+import socket
+from logging import getLogger
+
+import httpx
+
+from src.core.settings import settings
+from src.utils.low_balance import LowBalanceNotifications
+from src.utils.workers import run_periodically
+
+logger = getLogger(__name__)
+
+# Name of this process among the readers of the notifications
+CONSUMER = f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def deliver_low_balance_notifications() -> int:
+    """
+    POST the queued low balance notifications to LOW_BALANCE_WEBHOOK_URL, as
+    {"notifications": [...]} batches of up to LOW_BALANCE_WEBHOOK_BATCH_SIZE,
+    until none is left or a delivery fails. A failed batch is retried after
+    LOW_BALANCE_WEBHOOK_RETRY_SECONDS, its notifications are dropped once
+    attempted LOW_BALANCE_WEBHOOK_MAX_ATTEMPTS times. A notification can be
+    delivered more than once, the webhook deduplicates them by id.
+
+    Returns:
+        The number of notifications delivered
+    """
+    queue = LowBalanceNotifications()
+    delivered = 0
+    async with httpx.AsyncClient(
+        timeout=settings.LOW_BALANCE_WEBHOOK_TIMEOUT_SECONDS
+    ) as client:
+        while True:
+            batch = await queue.read(CONSUMER, settings.LOW_BALANCE_WEBHOOK_BATCH_SIZE)
+            if not batch:
+                return delivered
+            entry_ids = [entry_id for entry_id, _ in batch]
+            try:
+                response = await client.post(
+                    settings.LOW_BALANCE_WEBHOOK_URL,
+                    json={
+                        "notifications": [
+                            notification.model_dump(mode="json")
+                            for _, notification in batch
+                        ]
+                    },
+                )
+                response.raise_for_status()
+            except httpx.HTTPError:
+                logger.warning(
+                    "Failed to deliver %d low balance notifications",
+                    len(batch),
+                    exc_info=True,
+                )
+                dropped = await queue.drop_exhausted(
+                    entry_ids, settings.LOW_BALANCE_WEBHOOK_MAX_ATTEMPTS
+                )
+                if dropped:
+                    logger.error("Dropped %d low balance notifications", dropped)
+                return delivered
+            await queue.acknowledge(entry_ids)
+            delivered += len(batch)
+            if len(batch) < settings.LOW_BALANCE_WEBHOOK_BATCH_SIZE:
+                return delivered
+
+
+async def run_low_balance_worker():
+    await run_periodically(
+        "low balance webhook",
+        deliver_low_balance_notifications,
+        settings.LOW_BALANCE_WEBHOOK_INTERVAL_SECONDS,
+    )
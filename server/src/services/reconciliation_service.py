@@ -0,0 +1,88 @@
+import asyncio
+import time
+from logging import getLogger
+from typing import List, Optional, Tuple
+
+from src.db import reconciliation as reconciliation_db
+from src.models.reconciliation import BalanceDrift, ReconciliationReport
+from src.utils.ctx_managers import db_session
+from src.utils.transactions import balance_lock
+
+logger = getLogger(__name__)
+
+WALLETS_PER_CHUNK = 2000
+CONCURRENCY = 4
+# Amounts are floats, sums over a long ledger differ by rounding
+TOLERANCE = 1e-6
+MAX_REPORTED_DRIFTS = 1000
+
+
+async def _repair_balance(wallet_id: str, credit_type_id: str):
+    # Recomputed under the same lock as transactions, so the balance cannot
+    # change between reading its ledger and writing it
+    async with balance_lock(wallet_id, credit_type_id):
+        async with db_session() as session_ctx:
+            await reconciliation_db.repair_balance(
+                session=session_ctx.session,
+                wallet_id=wallet_id,
+                credit_type_id=credit_type_id,
+            )
+
+
+async def _reconcile_chunk(
+    semaphore: asyncio.Semaphore,
+    low: Optional[str],
+    high: Optional[str],
+    repair: bool,
+) -> Tuple[int, List[BalanceDrift]]:
+    async with semaphore:
+        async with db_session(read_only=True) as session_ctx:
+            checked, rows = await reconciliation_db.find_balance_drift(
+                session=session_ctx.session,
+                low=low,
+                high=high,
+                tolerance=TOLERANCE,
+            )
+        drifts = [BalanceDrift(**row) for row in rows]
+        if repair:
+            for drift in drifts:
+                await _repair_balance(drift.wallet_id, drift.credit_type_id)
+                drift.repaired = True
+    return checked, drifts
+
+
+async def reconcile_balances(
+    repair: bool = False,
+    wallets_per_chunk: int = WALLETS_PER_CHUNK,
+    concurrency: int = CONCURRENCY,
+) -> ReconciliationReport:
+    """
+    Compare every balance with the balance its completed transactions imply.
+
+    The wallets are split into ranges of wallet ids, which are reconciled
+    concurrently, each with a single aggregation over its transactions. With
+    repair, drifted balances are recomputed under the balance lock, in case a
+    transaction changed them since they were compared.
+    """
+    started = time.monotonic()
+    async with db_session(read_only=True) as session_ctx:
+        boundaries = await reconciliation_db.get_wallet_id_boundaries(
+            session=session_ctx.session, wallets_per_chunk=wallets_per_chunk
+        )
+    ranges = list(zip([None, *boundaries], [*boundaries, None]))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(
+        *(_reconcile_chunk(semaphore, low, high, repair) for low, high in ranges)
+    )
+    drifts = [drift for _, chunk_drifts in results for drift in chunk_drifts]
+    if drifts:
+        logger.warning("Found %d balances drifted from the ledger", len(drifts))
+    return ReconciliationReport(
+        chunks=len(ranges),
+        balances_checked=sum(checked for checked, _ in results),
+        balances_drifted=len(drifts),
+        balances_repaired=sum(drift.repaired for drift in drifts),
+        drifts=drifts[:MAX_REPORTED_DRIFTS],
+        duration_seconds=time.monotonic() - started,
+    )
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from typing import Optional
+
+from src.core.settings import settings
+from src.db import rollups as rollups_db
+from src.utils.ctx_managers import db_session
+from src.utils.workers import run_periodically
+
+logger = getLogger(__name__)
+
+# Hours rolled up by each transaction while catching up
+REFRESH_SPAN = timedelta(days=7)
+
+
+async def refresh_rollups(now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Roll up every hour that ended more than ROLLUP_LATENESS_SECONDS ago,
+    REFRESH_SPAN at a time.
+
+    Returns:
+        The watermark reached, or None when another refresh is running
+    """
+    until = (now or datetime.now(timezone.utc)) - timedelta(
+        seconds=settings.ROLLUP_LATENESS_SECONDS
+    )
+    while True:
+        async with db_session() as session_ctx:
+            watermark = await rollups_db.refresh_transaction_rollups(
+                session=session_ctx.session, until=until, max_span=REFRESH_SPAN
+            )
+        if watermark is None or watermark >= rollups_db.bucket_start(until):
+            return watermark
+        logger.info("Rolled up transactions until %s", watermark)
+
+
+async def run_rollup_worker():
+    await run_periodically(
+        "rollups refresh", refresh_rollups, settings.ROLLUP_REFRESH_INTERVAL_SECONDS
+    )
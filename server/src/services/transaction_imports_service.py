@@ -0,0 +1,385 @@
+import csv
+import io
+import json
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from typing import AsyncIterable, AsyncIterator, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from src.db import rollups as rollups_db
+from src.db import transaction_imports as imports_db
+from src.models.transaction_imports import (
+    ImportFormat,
+    ImportStatus,
+    TransactionImportResponse,
+)
+from src.services import analytics_service, insights_service, reconciliation_service
+from src.utils.ctx_managers import db_session
+from src.utils.transactions import balance_lock
+
+logger = getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 50_000
+IMPORT_MAX_ERRORS = 100
+# Balances recomputed per database transaction, under their balance locks
+RECOMPUTE_BATCH_SIZE = 500
+# An import in progress without progress for this long is no longer running
+IMPORT_STALE_AFTER = timedelta(minutes=10)
+# Rows converted from NDJSON per chunk sent to COPY
+NDJSON_CHUNK_ROWS = 1000
+
+ProgressCallback = Callable[[TransactionImportResponse], None]
+
+
+async def _lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split a stream of chunks into lines, without the line breaks"""
+    rest = b""
+    async for chunk in chunks:
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if rest.strip():
+        yield rest
+
+
+def _csv_value(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (dict, list, bool)):
+        return json.dumps(value)
+    return str(value)
+
+
+async def ndjson_to_csv(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """
+    Convert NDJSON transactions into CSV rows of all STAGING_COLUMNS.
+
+    Raises:
+        ValueError: If a line is not a JSON object of known fields
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows = 0
+    line_number = 0
+    async for line in _lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number}: invalid JSON: {e}") from e
+        if not isinstance(row, dict):
+            raise ValueError(f"Line {line_number}: expected a JSON object")
+        unknown = set(row) - set(imports_db.STAGING_COLUMNS)
+        if unknown:
+            raise ValueError(
+                f"Line {line_number}: unknown fields {', '.join(sorted(unknown))}"
+            )
+        # None is written as an unquoted empty value, which COPY reads as NULL
+        writer.writerow(
+            [_csv_value(row.get(column)) for column in imports_db.STAGING_COLUMNS]
+        )
+        rows += 1
+        if rows % NDJSON_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def split_csv_header(
+    chunks: AsyncIterable[bytes],
+) -> Tuple[List[str], AsyncIterator[bytes]]:
+    """
+    Read the header row of a CSV input.
+
+    Returns:
+        tuple: (columns of the header, the rows after the header)
+
+    Raises:
+        ValueError: If the header is missing or has unknown columns
+    """
+    iterator = chunks.__aiter__()
+    head = b""
+    while b"\n" not in head:
+        try:
+            head += await iterator.__anext__()
+        except StopAsyncIteration:
+            break
+    header, _, rest = head.partition(b"\n")
+    columns = next(csv.reader([header.decode("utf-8-sig").strip()]), [])
+    columns = [column.strip() for column in columns]
+    if not columns or not all(columns):
+        raise ValueError("Missing CSV header")
+    unknown = set(columns) - set(imports_db.STAGING_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown CSV columns {', '.join(sorted(unknown))}")
+
+    async def rows() -> AsyncIterator[bytes]:
+        if rest:
+            yield rest
+        async for chunk in iterator:
+            yield chunk
+
+    return columns, rows()
+
+
+async def get_import(import_id: str) -> TransactionImportResponse:
+    async with db_session(read_only=True) as session_ctx:
+        transaction_import = await imports_db.get_import(
+            session=session_ctx.session, import_id=import_id
+        )
+        if not transaction_import:
+            raise HTTPException(status_code=404, detail="Import not found")
+        return transaction_import.to_response()
+
+
+async def _update_import(
+    import_id: str, on_progress: Optional[ProgressCallback] = None, **values
+):
+    async with db_session() as session_ctx:
+        await imports_db.update_import(
+            session=session_ctx.session, import_id=import_id, **values
+        )
+    if on_progress:
+        on_progress(await get_import(import_id))
+
+
+async def _drop_staging_table(import_id: str):
+    async with db_session() as session_ctx:
+        await imports_db.drop_staging_table(
+            session=session_ctx.session,
+            table_name=imports_db.staging_table_name(import_id),
+        )
+
+
+async def stage_import(
+    source: AsyncIterable[bytes], import_format: ImportFormat
+) -> TransactionImportResponse:
+    """
+    Copy an NDJSON or CSV input into a new staging table.
+
+    The input is streamed into the table with COPY and nothing is validated
+    yet beyond its format, see process_import.
+    """
+    async with db_session() as session_ctx:
+        transaction_import = await imports_db.create_import(
+            session=session_ctx.session, import_format=import_format
+        )
+        import_id = transaction_import.id
+        await imports_db.create_staging_table(
+            session=session_ctx.session,
+            table_name=imports_db.staging_table_name(import_id),
+        )
+
+    try:
+        if import_format == ImportFormat.CSV:
+            columns, rows = await split_csv_header(source)
+        else:
+            columns, rows = imports_db.STAGING_COLUMNS, ndjson_to_csv(source)
+        async with db_session() as session_ctx:
+            rows_staged = await imports_db.copy_into_staging_table(
+                session=session_ctx.session,
+                table_name=imports_db.staging_table_name(import_id),
+                columns=columns,
+                source=rows,
+            )
+    except ValueError as e:
+        await _drop_staging_table(import_id)
+        await _update_import(
+            import_id,
+            status=ImportStatus.FAILED,
+            errors=[{"line": None, "reason": str(e)}],
+        )
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await _update_import(
+        import_id, status=ImportStatus.VALIDATING, rows_staged=rows_staged
+    )
+    return await get_import(import_id)
+
+
+async def _recompute_staged_balances(
+    import_id: str, on_progress: Optional[ProgressCallback] = None
+) -> int:
+    """
+    Recompute the balances with staged rows from their ledger, in batches of
+    RECOMPUTE_BATCH_SIZE each holding the balance locks of its balances, the
+    locks the transactions take to change a balance.
+    """
+    async with db_session(read_only=True) as session_ctx:
+        balance_keys = await imports_db.get_staged_balance_keys(
+            session=session_ctx.session,
+            table_name=imports_db.staging_table_name(import_id),
+        )
+    recomputed = 0
+    for start in range(0, len(balance_keys), RECOMPUTE_BATCH_SIZE):
+        batch = balance_keys[start : start + RECOMPUTE_BATCH_SIZE]
+        async with AsyncExitStack() as locks:
+            # Taken in the same order by every import, transactions take one
+            for wallet_id, credit_type_id in batch:
+                await locks.enter_async_context(balance_lock(wallet_id, credit_type_id))
+            async with db_session() as session_ctx:
+                recomputed += await imports_db.recompute_balances(
+                    session=session_ctx.session, balance_keys=batch
+                )
+        await _update_import(import_id, on_progress, balances_recomputed=recomputed)
+    return recomputed
+
+
+async def process_import(
+    import_id: str, on_progress: Optional[ProgressCallback] = None
+) -> TransactionImportResponse:
+    """
+    Validate the staged rows of an import and apply them.
+
+    Nothing is imported unless every staged row is valid. Valid rows are
+    upserted into transactions by id in batches of IMPORT_BATCH_SIZE lines,
+    each committed on its own, and finally the balances of every affected
+    wallet and credit type are recomputed from their ledger and the insights
+    rollups and trending wallets of the hours the import wrote into are rebuilt
+    and queued to be mirrored again by the analytics replica.
+
+    The import is marked balances_pending from the first batch until its
+    balances are recomputed. When the import fails midway, the balances of the
+    batches committed so far are still recomputed. If that fails too, or the
+    process stops, the staging table is kept for recompute_pending_balances.
+    """
+    table_name = imports_db.staging_table_name(import_id)
+    try:
+        async with db_session() as session_ctx:
+            invalid_rows, errors = await imports_db.validate_staged_rows(
+                session=session_ctx.session,
+                table_name=table_name,
+                max_errors=IMPORT_MAX_ERRORS,
+            )
+        if invalid_rows:
+            await _update_import(
+                import_id,
+                on_progress,
+                status=ImportStatus.FAILED,
+                rows_invalid=invalid_rows,
+                errors=errors,
+            )
+            return await get_import(import_id)
+
+        await _update_import(
+            import_id,
+            on_progress,
+            status=ImportStatus.IMPORTING,
+            balances_pending=True,
+        )
+        async with db_session() as session_ctx:
+            await imports_db.insert_staged_labels(
+                session=session_ctx.session, table_name=table_name
+            )
+            staged_hours = await imports_db.get_staged_hours(
+                session=session_ctx.session, table_name=table_name
+            )
+
+        transaction_import = await get_import(import_id)
+        rows_imported = 0
+        for first_line in range(
+            1, transaction_import.rows_staged + 1, IMPORT_BATCH_SIZE
+        ):
+            async with db_session() as session_ctx:
+                rows_imported += await imports_db.upsert_staged_transactions(
+                    session=session_ctx.session,
+                    table_name=table_name,
+                    first_line=first_line,
+                    last_line=first_line + IMPORT_BATCH_SIZE - 1,
+                )
+            await _update_import(import_id, on_progress, rows_imported=rows_imported)
+
+        await _update_import(import_id, on_progress, status=ImportStatus.RECOMPUTING)
+        async with db_session() as session_ctx:
+            await imports_db.update_existing_holds(
+                session=session_ctx.session, table_name=table_name
+            )
+        balances_recomputed = await _recompute_staged_balances(import_id, on_progress)
+        await _update_import(import_id, on_progress, balances_pending=False)
+        async with db_session() as session_ctx:
+            await rollups_db.rebuild_transaction_rollups(
+                session=session_ctx.session, buckets=staged_hours
+            )
+        await insights_service.backfill_trending_wallets(hours=staged_hours)
+        await insights_service.backfill_active_wallets(days=staged_hours)
+        await insights_service.backfill_debit_sketches(hours=staged_hours)
+        await analytics_service.resync_hours(staged_hours)
+        await _update_import(
+            import_id,
+            on_progress,
+            status=ImportStatus.COMPLETED,
+            balances_recomputed=balances_recomputed,
+        )
+    except Exception as e:
+        logger.error("Import %s failed", import_id, exc_info=True)
+        await _update_import(
+            import_id,
+            on_progress,
+            status=ImportStatus.FAILED,
+            errors=[{"line": None, "reason": str(e)}],
+        )
+        if (await get_import(import_id)).balances_pending:
+            try:
+                await _recompute_staged_balances(import_id, on_progress)
+                await _update_import(import_id, on_progress, balances_pending=False)
+            except Exception:
+                logger.error(
+                    "Balances of the failed import %s are left pending",
+                    import_id,
+                    exc_info=True,
+                )
+    finally:
+        if not (await get_import(import_id)).balances_pending:
+            await _drop_staging_table(import_id)
+    return await get_import(import_id)
+
+
+async def recompute_pending_balances(import_id: str) -> TransactionImportResponse:
+    """
+    Recompute the balances an import left pending, when it failed or its
+    process stopped before they were recomputed. They are recomputed from the
+    balance keys of its staging table, or when the table is lost (it is
+    unlogged, and emptied by a database crash) every balance drifted from its
+    ledger is repaired.
+    """
+    transaction_import = await get_import(import_id)
+    if not transaction_import.balances_pending:
+        return transaction_import
+    stale_since = datetime.now(timezone.utc) - IMPORT_STALE_AFTER
+    if (
+        transaction_import.status != ImportStatus.FAILED
+        and transaction_import.updated_at > stale_since
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Import is still running"
+        )
+    table_name = imports_db.staging_table_name(import_id)
+    async with db_session(read_only=True) as session_ctx:
+        staged = await imports_db.staging_table_exists(
+            session=session_ctx.session, table_name=table_name
+        )
+        if staged:
+            staged = bool(
+                await imports_db.get_staged_balance_keys(
+                    session=session_ctx.session, table_name=table_name
+                )
+            )
+    if staged:
+        balances_recomputed = await _recompute_staged_balances(import_id)
+    else:
+        report = await reconciliation_service.reconcile_balances(repair=True)
+        balances_recomputed = report.balances_repaired
+    await _update_import(
+        import_id,
+        balances_pending=False,
+        balances_recomputed=balances_recomputed,
+    )
+    await _drop_staging_table(import_id)
+    return await get_import(import_id)
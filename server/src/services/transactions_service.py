@@ -1,10 +1,18 @@
-from typing import Dict, Optional
+import asyncio
+import csv
+import io
+import json
+from typing import AsyncIterator, Callable, Dict, List, Optional
 
 from fastapi import HTTPException
 
 from src.db import transactions as transactions_db
 from src.models.base import OrderBy, PaginationRequest
-from src.models.transactions import PaginatedTransactionResponse, TransactionResponse
+from src.models.transactions import (
+    ExportFormat,
+    PaginatedTransactionResponse,
+    TransactionResponse,
+)
 from src.utils.ctx_managers import db_session
 from src.utils.dependencies import DateTimeRange
 
@@ -59,3 +67,114 @@ async def list_transactions(
         page_size=transactions.page_size,
         total_count=transactions.total_count,
     )
+
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_BUFFERED_BATCHES = 4
+
+EXPORT_CSV_COLUMNS = [
+    "id",
+    "created_at",
+    "updated_at",
+    "type",
+    "status",
+    "hold_status",
+    "wallet_id",
+    "credit_type_id",
+    "external_id",
+    "subscription_id",
+    "description",
+    "context",
+    "payload",
+    "balance_snapshot",
+]
+
+
+def encode_ndjson(transactions: List[TransactionResponse]) -> bytes:
+    return "".join(
+        transaction.model_dump_json() + "\n" for transaction in transactions
+    ).encode()
+
+
+def encode_csv(transactions: List[TransactionResponse]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for transaction in transactions:
+        row = transaction.model_dump(mode="json")
+        writer.writerow(
+            [
+                json.dumps(value) if isinstance(value, dict) else value
+                for value in (row[column] for column in EXPORT_CSV_COLUMNS)
+            ]
+        )
+    return buffer.getvalue().encode()
+
+
+async def _produce_export(
+    queue: asyncio.Queue,
+    encode: Callable[[List[TransactionResponse]], bytes],
+    **filters,
+):
+    try:
+        async with db_session(read_only=True) as session_ctx:
+            async for batch in transactions_db.stream_transactions(
+                session=session_ctx.session,
+                batch_size=EXPORT_BATCH_SIZE,
+                **filters,
+            ):
+                await queue.put(
+                    encode([transaction.to_response() for transaction in batch])
+                )
+        await queue.put(None)
+    except Exception as e:
+        await queue.put(e)
+
+
+async def export_transactions(
+    wallet_id: Optional[str],
+    credit_type_id: Optional[str],
+    external_id: Optional[str],
+    context: Dict[str, str],
+    date_range: DateTimeRange,
+    order_by: OrderBy,
+    export_format: ExportFormat,
+) -> AsyncIterator[bytes]:
+    """
+    Export all transactions matching the filters, encoded one batch at a time.
+
+    The rows are read from a server side cursor while the output is sent, and
+    at most EXPORT_BUFFERED_BATCHES encoded batches wait for a slow client, so
+    an export of any size uses constant memory.
+
+    The cursor is read by a separate task. When the client disconnects the
+    request is cancelled, and the task is cancelled with it, which cancels the
+    running query and returns the connection to the pool. Cancelling the query
+    directly from the request's cancel scope would also cancel the clean up of
+    the connection.
+    """
+    encode = encode_csv if export_format == ExportFormat.CSV else encode_ndjson
+    if export_format == ExportFormat.CSV:
+        header = io.StringIO()
+        csv.writer(header).writerow(EXPORT_CSV_COLUMNS)
+        yield header.getvalue().encode()
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=EXPORT_BUFFERED_BATCHES)
+    producer = asyncio.create_task(
+        _produce_export(
+            queue,
+            encode,
+            wallet_id=wallet_id,
+            credit_type_id=credit_type_id,
+            external_id=external_id,
+            context=context,
+            date_range=date_range,
+            order_by=order_by,
+        )
+    )
+    try:
+        while (chunk := await queue.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        producer.cancel()
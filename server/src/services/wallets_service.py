@@ -1,16 +1,27 @@
 import asyncio
+from datetime import datetime, timedelta
 from logging import getLogger
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
 from fastapi import HTTPException, status
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.settings import settings
+from src.db import balance_checkpoints as balance_checkpoints_db
 from src.db import balances as balances_db
 from src.db import products as products_db
 from src.db import transactions as transactions_db
 from src.db import wallets
+from src.models.balances import (
+    BalanceDBModel,
+    BalanceHistoryPoint,
+    BalanceResponse,
+    LowBalanceNotification,
+    LowBalanceThresholdRequest,
+)
 from src.models.base import PaginationRequest
+from src.models.Insights import TimeGranularity
 from src.models.products import (
     PaginatedProductSubscriptionResponse,
     ProductSettings,
@@ -45,6 +56,7 @@ from src.models.wallets import (
     UpdateWalletRequest,
     WalletResponse,
 )
+from src.utils.balance_events import RESET, BalanceEvents
 from src.utils.constants import (
     BALANCE_NOT_FOUND_ERROR,
     DUPLICATE_TRANSACTION_ERROR,
@@ -56,7 +68,9 @@ from src.utils.constants import (
     WALLET_NOT_FOUND_ERROR,
 )
 from src.utils.ctx_managers import DBSessionCtx, db_session
+from src.utils.low_balance import LowBalanceNotifications
 from src.utils.transactions import run_managed_transaction
+from src.utils.trending_wallets import TrendingWallets
 
 logger = getLogger(__name__)
 
@@ -75,8 +89,13 @@ async def get_wallet_by_id(wallet_id: str) -> WalletResponse:
     return wallet.to_response()
 
 
-async def get_wallet_with_balances(wallet_id: str) -> WalletResponse:
-    """Get a wallet by ID and join its balances"""
+async def get_wallet_with_balances(
+    wallet_id: str, as_of: Optional[datetime] = None
+) -> WalletResponse:
+    """
+    Get a wallet by ID and join its balances, with their amounts as of a time
+    when given. Balances created since are left out.
+    """
     async with db_session(read_only=True) as session_ctx:
         wallet = await wallets.get_wallet_with_balances(
             session=session_ctx.session, wallet_id=wallet_id
@@ -86,13 +105,75 @@ async def get_wallet_with_balances(wallet_id: str) -> WalletResponse:
                 status_code=status.HTTP_404_NOT_FOUND, detail=WALLET_NOT_FOUND_ERROR
             )
         session_ctx.add_to_refresh([wallet])
-    return wallet.to_response()
+        past_balances = None
+        if as_of is not None:
+            past_balances = await balance_checkpoints_db.get_balances_at(
+                session=session_ctx.session, wallet_id=wallet_id, as_of=as_of
+            )
+    response = wallet.to_response()
+    if past_balances is not None:
+        amounts = {
+            past.credit_type_id: past.model_dump(
+                include={"available", "held", "spent", "overall_spent"}
+            )
+            for past in past_balances
+        }
+        response.balances = [
+            balance.model_copy(
+                update=dict(**amounts[balance.credit_type_id], as_of=as_of)
+            )
+            for balance in response.balances
+            if balance.credit_type_id in amounts
+        ]
+    return response
+
+
+# Shortest length of the buckets of each granularity
+GRANULARITY_LENGTHS = {
+    TimeGranularity.HOUR: timedelta(hours=1),
+    TimeGranularity.DAY: timedelta(days=1),
+    TimeGranularity.WEEK: timedelta(weeks=1),
+    TimeGranularity.MONTH: timedelta(days=28),
+}
+
+
+async def get_balance_history(
+    wallet_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: TimeGranularity,
+    credit_type_id: Optional[str] = None,
+) -> List[BalanceHistoryPoint]:
+    """
+    The balances of a wallet as of the end of every bucket of granularity in
+    the date range, up to BALANCE_HISTORY_MAX_POINTS buckets.
+    """
+    buckets = (end_date - start_date) / GRANULARITY_LENGTHS[granularity] + 1
+    if buckets > settings.BALANCE_HISTORY_MAX_POINTS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=(
+                f"The date range spans more than "
+                f"{settings.BALANCE_HISTORY_MAX_POINTS} {granularity.value}s"
+            ),
+        )
+    await get_wallet_by_id(wallet_id)
+    async with db_session(read_only=True) as session_ctx:
+        return await balance_checkpoints_db.get_balance_history(
+            session=session_ctx.session,
+            wallet_id=wallet_id,
+            start_date=start_date,
+            end_date=end_date,
+            granularity=granularity,
+            credit_type_id=credit_type_id,
+        )
 
 
 async def get_wallets(
     pagination_request: PaginationRequest,
     name: Optional[str] = None,
     context: Optional[dict] = None,
+    search: Optional[str] = None,
 ) -> PaginatedWalletResponse:
     """Get all wallets"""
     async with db_session(read_only=True) as session_ctx:
@@ -101,6 +182,7 @@ async def get_wallets(
             pagination_request=pagination_request,
             name=name,
             context=context,
+            search=search,
         )
     return PaginatedWalletResponse(
         page=pagination_request.page,
@@ -148,9 +230,62 @@ async def update_wallet(
                 status_code=status.HTTP_404_NOT_FOUND, detail=WALLET_NOT_FOUND_ERROR
             )
         session_ctx.add_to_refresh([wallet])
+    await TrendingWallets().forget_wallet(wallet_id)
     return wallet.to_response()
 
 
+async def set_low_balance_threshold(
+    wallet_id: str, credit_type_id: str, request: LowBalanceThresholdRequest
+) -> BalanceResponse:
+    """
+    Set the low balance threshold of a balance of a wallet, overriding the
+    threshold of its credit type, or remove it with None.
+    """
+    await get_wallet_by_id(wallet_id)
+    async with db_session() as session_ctx:
+        balance = await balances_db.set_low_balance_threshold(
+            session=session_ctx.session,
+            wallet_id=wallet_id,
+            credit_type_id=credit_type_id,
+            threshold=request.low_balance_threshold,
+        )
+    return balance.to_response()
+
+
+# Milliseconds clients wait before reconnecting to a balance event stream
+BALANCE_EVENTS_RETRY_MS = 1000
+
+
+async def _encode_balance_events(
+    wallet_id: str, last_event_id: Optional[str]
+) -> AsyncIterator[bytes]:
+    yield f"retry: {BALANCE_EVENTS_RETRY_MS}\n\n".encode()
+    async for event in BalanceEvents().listen(wallet_id, last_event_id):
+        if event is None:
+            # Keeps the connection open through proxies, and notices clients
+            # that went away
+            yield b": keepalive\n\n"
+        elif event is RESET:
+            yield b"event: reset\ndata: {}\n\n"
+        else:
+            event_id, data = event
+            yield f"id: {event_id}\nevent: balance\ndata: {data}\n\n".encode()
+
+
+async def stream_balance_events(
+    wallet_id: str, last_event_id: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """
+    Server-Sent Events of the balance changes of a wallet, a balance event per
+    completed transaction. A client reconnecting with the id of its last event
+    first receives the events it missed, or a reset event when they are no
+    longer retained, after which it should read the wallet again. A client
+    too slow to keep up is disconnected, and resumes once it reconnects.
+    """
+    await get_wallet_by_id(wallet_id)
+    return _encode_balance_events(wallet_id, last_event_id)
+
+
 async def delete_wallet(wallet_id: str) -> None:
     """Delete a wallet"""
     async with db_session() as session_ctx:
@@ -162,6 +297,35 @@ async def delete_wallet(wallet_id: str) -> None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail=WALLET_NOT_FOUND_ERROR
             )
+    await TrendingWallets().forget_wallet(wallet_id, deleted=True)
+
+
+def _balance_snapshot(
+    balance: BalanceDBModel, session_ctx: DBSessionCtx
+) -> BalanceSnapshot:
+    """
+    The snapshot of a balance returned by the statement changing it, queueing
+    a low balance notification once committed when the change took it below
+    its threshold.
+    """
+    if balances_db.crossed_low_balance(balance):
+        notification = LowBalanceNotification(
+            id=f"{balance.id}:{balance.low_balance_since.isoformat()}",
+            wallet_id=balance.wallet_id,
+            credit_type_id=balance.credit_type_id,
+            available=balance.available,
+            held=balance.held,
+            low_balance_since=balance.low_balance_since,
+        )
+        session_ctx.add_after_commit(
+            lambda: LowBalanceNotifications().enqueue(notification)
+        )
+    return BalanceSnapshot(
+        available=balance.available,
+        held=balance.held,
+        spent=balance.spent,
+        overall_spent=balance.overall_spent,
+    )
 
 
 async def _deposit_transaction_handler(
@@ -175,16 +339,11 @@ async def _deposit_transaction_handler(
         credit_type_id=pending_transaction.credit_type_id,
         amount=pending_transaction.payload["amount"],
     )
-    balance_snapshot = BalanceSnapshot(
-        available=updated_balance.available,
-        held=updated_balance.held,
-        spent=updated_balance.spent,
-        overall_spent=updated_balance.overall_spent,
-    )
+    balance_snapshot = _balance_snapshot(updated_balance, session_ctx)
     updated_transaction = await transactions_db.update_transaction(
         session=session,
         transaction_id=pending_transaction.id,
-        balance_snapshot=balance_snapshot.model_dump(),
+        balance_snapshot=balance_snapshot,
         status=TransactionStatus.COMPLETED,
     )
     return updated_transaction
@@ -244,12 +403,7 @@ async def _debit_transaction_handler(
             detail=INSUFFICIENT_BALANCE_ERROR,
         )
 
-    balance_snapshot = BalanceSnapshot(
-        available=updated_balance.available,
-        held=updated_balance.held,
-        spent=updated_balance.spent,
-        overall_spent=updated_balance.overall_spent,
-    )
+    balance_snapshot = _balance_snapshot(updated_balance, session_ctx)
 
     if hold_transaction_payload:
         await transactions_db.update_transaction(
@@ -261,21 +415,35 @@ async def _debit_transaction_handler(
     updated_transaction = await transactions_db.update_transaction(
         session=session,
         transaction_id=pending_transaction.id,
-        balance_snapshot=balance_snapshot.model_dump(),
+        balance_snapshot=balance_snapshot,
         status=TransactionStatus.COMPLETED,
     )
     return updated_transaction
 
 
-async def _get_and_validate_hold(
+async def _get_held_transaction(
     transaction_request: TransactionDBModel, session: AsyncSession
-) -> HoldTransactionRequestPayload:
-    assert transaction_request.payload["hold_transaction_id"]
+) -> TransactionDBModel:
+    hold_transaction_id = transaction_request.payload["hold_transaction_id"]
+    assert hold_transaction_id
+
+    hold_transaction = await transactions_db.get_transaction(
+        transaction_id=hold_transaction_id,
+        transaction_type=TransactionType.HOLD,
+        credit_type_id=transaction_request.credit_type_id,
+        wallet_id=transaction_request.wallet_id,
+        hold_status=HoldStatus.HELD,
+        session=session,
+    )
+    if hold_transaction:
+        return hold_transaction
 
+    # Slow path, only taken on errors: tell a missing hold from a used one
     hold_transaction = await transactions_db.get_transaction(
-        transaction_id=transaction_request.payload["hold_transaction_id"],
+        transaction_id=hold_transaction_id,
         transaction_type=TransactionType.HOLD,
         credit_type_id=transaction_request.credit_type_id,
+        wallet_id=transaction_request.wallet_id,
         session=session,
     )
     if not hold_transaction:
@@ -283,13 +451,18 @@ async def _get_and_validate_hold(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=HOLD_TRANSACTION_NOT_FOUND_ERROR,
         )
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=HOLD_TRANSACTION_NOT_HELD_ERROR,
+    )
 
-    if hold_transaction.hold_status != HoldStatus.HELD.value:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=HOLD_TRANSACTION_NOT_HELD_ERROR,
-        )
 
+async def _get_and_validate_hold(
+    transaction_request: TransactionDBModel, session: AsyncSession
+) -> HoldTransactionRequestPayload:
+    hold_transaction = await _get_held_transaction(
+        transaction_request=transaction_request, session=session
+    )
     hold_transaction_payload = HoldTransactionRequestPayload(**hold_transaction.payload)
 
     if hold_transaction_payload.amount < transaction_request.payload["amount"]:
@@ -332,18 +505,13 @@ async def _hold_transaction_handler(
             detail=INSUFFICIENT_BALANCE_ERROR,
         )
 
-    balance_snapshot = BalanceSnapshot(
-        available=updated_balance.available,
-        held=updated_balance.held,
-        spent=updated_balance.spent,
-        overall_spent=updated_balance.overall_spent,
-    )
+    balance_snapshot = _balance_snapshot(updated_balance, session_ctx)
 
     updated_transaction = await transactions_db.update_transaction(
         session=session,
         transaction_id=pending_transaction.id,
         status=TransactionStatus.COMPLETED,
-        balance_snapshot=balance_snapshot.model_dump(),
+        balance_snapshot=balance_snapshot,
         hold_status=HoldStatus.HELD,
     )
     assert updated_transaction is not None
@@ -366,24 +534,9 @@ async def _release_transaction_handler(
     session_ctx: DBSessionCtx,
 ) -> TransactionDBModel:
     session = session_ctx.session
-    hold_transaction = await transactions_db.get_transaction(
-        transaction_id=pending_transaction.payload["hold_transaction_id"],
-        credit_type_id=pending_transaction.credit_type_id,
-        transaction_type=TransactionType.HOLD,
-        session=session,
+    hold_transaction = await _get_held_transaction(
+        transaction_request=pending_transaction, session=session
     )
-    if not hold_transaction:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=HOLD_TRANSACTION_NOT_FOUND_ERROR,
-        )
-
-    if hold_transaction.hold_status != HoldStatus.HELD.value:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=HOLD_TRANSACTION_NOT_HELD_ERROR,
-        )
-
     hold_transaction_payload = HoldTransactionRequestPayload(**hold_transaction.payload)
     updated_balance = await balances_db.release_balance(
         session=session,
@@ -401,23 +554,19 @@ async def _release_transaction_handler(
             detail=INSUFFICIENT_BALANCE_ERROR,
         )
 
-    balance_snapshot = BalanceSnapshot(
-        available=updated_balance.available,
-        held=updated_balance.held,
-        spent=updated_balance.spent,
-        overall_spent=updated_balance.overall_spent,
-    )
+    balance_snapshot = _balance_snapshot(updated_balance, session_ctx)
 
     update_hold_status = transactions_db.update_transaction(
         session=session,
         transaction_id=hold_transaction.id,
         hold_status=HoldStatus.RELEASED,
-        balance_snapshot=balance_snapshot.model_dump(),
     )
     update_hold_transaction = transactions_db.update_transaction(
         session=session,
         transaction_id=pending_transaction.id,
         status=TransactionStatus.COMPLETED,
+        amount=hold_transaction_payload.amount,
+        balance_snapshot=balance_snapshot,
     )
 
     [_, updated_transaction] = await asyncio.gather(
@@ -461,18 +610,13 @@ async def _adjust_transaction_handler(
             detail=INSUFFICIENT_BALANCE_ERROR,
         )
 
-    balance_snapshot = BalanceSnapshot(
-        available=updated_balance.available,
-        held=updated_balance.held,
-        spent=updated_balance.spent,
-        overall_spent=updated_balance.overall_spent,
-    )
+    balance_snapshot = _balance_snapshot(updated_balance, session_ctx)
 
     updated_transaction = await transactions_db.update_transaction(
         session=session,
         transaction_id=pending_transaction.id,
         status=TransactionStatus.COMPLETED,
-        balance_snapshot=balance_snapshot.model_dump(),
+        balance_snapshot=balance_snapshot,
     )
     assert updated_transaction is not None
     return updated_transaction
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.utils.singleton import SingletonMeta
+
+NAMESPACE = "active_wallets"
+DAY = timedelta(days=1)
+# Relative standard error of the Redis HyperLogLog cardinality estimate
+STANDARD_ERROR = 0.0081
+
+
+def day_start(value: datetime) -> datetime:
+    """The start of the UTC day holding value"""
+    return value.astimezone(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+class ActiveWallets(metaclass=SingletonMeta):
+    """
+    Distinct wallets with transactions per UTC day and credit type, in Redis
+    HyperLogLogs of about 12KB at most each.
+
+    Every transaction written adds its wallet to the HyperLogLog of its day and
+    credit type. HyperLogLogs expire ACTIVE_WALLETS_RETENTION_DAYS after their
+    day ends, and are only complete from the coverage start, the first day
+    rebuilt by a backfill.
+    """
+
+    @property
+    def retention(self) -> timedelta:
+        return timedelta(days=settings.ACTIVE_WALLETS_RETENTION_DAYS)
+
+    @staticmethod
+    def _day_key(credit_type_id: str, day: datetime) -> str:
+        return RedisManager().create_key(
+            NAMESPACE, f"{credit_type_id}:{int(day.timestamp())}"
+        )
+
+    @staticmethod
+    def _coverage_key() -> str:
+        return RedisManager().create_key(NAMESPACE, "coverage_start")
+
+    def _expires_at(self, day: datetime) -> datetime:
+        return day + DAY + self.retention
+
+    def retained_days(self) -> List[datetime]:
+        """The days whose HyperLogLogs have not expired yet, oldest first"""
+        now = datetime.now(timezone.utc)
+        day = day_start(now - self.retention)
+        days = []
+        while day <= now:
+            days.append(day)
+            day += DAY
+        return days
+
+    async def has_coverage(self) -> bool:
+        return bool(await RedisManager().client.exists(self._coverage_key()))
+
+    async def covers(self, start_date: datetime) -> bool:
+        """Whether the HyperLogLogs are complete from start_date on"""
+        coverage_start = await RedisManager().client.get(self._coverage_key())
+        return (
+            coverage_start is not None
+            and start_date.timestamp() >= int(coverage_start)
+            and start_date >= day_start(datetime.now(timezone.utc) - self.retention)
+        )
+
+    async def record(self, wallet_id: str, credit_type_id: str, created_at: datetime):
+        day = day_start(created_at)
+        key = self._day_key(credit_type_id, day)
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            pipeline.pfadd(key, wallet_id)
+            pipeline.expireat(key, self._expires_at(day))
+            await pipeline.execute()
+
+    async def count(
+        self, credit_type_ids: List[str], periods: List[Tuple[datetime, List[datetime]]]
+    ) -> Dict[Tuple[datetime, str], int]:
+        """
+        Estimate the distinct wallets of every credit type in every period, by
+        counting the union of the HyperLogLogs of the days of the period.
+
+        Args:
+            credit_type_ids: Credit types to count the wallets of
+            periods: (period start, days of the period) pairs
+
+        Returns:
+            Distinct wallets by (period start, credit type id), when not zero
+        """
+        keys = [
+            (period, credit_type_id)
+            for period, _ in periods
+            for credit_type_id in credit_type_ids
+        ]
+        days_of_period = dict(periods)
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            for period, credit_type_id in keys:
+                pipeline.pfcount(
+                    *(
+                        self._day_key(credit_type_id, day)
+                        for day in days_of_period[period]
+                    )
+                )
+            counts = await pipeline.execute()
+        return {key: count for key, count in zip(keys, counts) if count}
+
+    async def rebuild(
+        self,
+        wallets: Dict[Tuple[datetime, str], Set[str]],
+        days: List[datetime],
+        credit_type_ids: List[str],
+        coverage_start: Optional[datetime] = None,
+    ):
+        """
+        Replace the HyperLogLogs of the given days and credit types by the
+        given wallets.
+
+        Args:
+            wallets: Wallets with transactions by (day, credit type id)
+            days: Days to replace
+            credit_type_ids: Credit types to replace the days of
+            coverage_start: The HyperLogLogs are complete from this day on
+        """
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            for day in days:
+                for credit_type_id in credit_type_ids:
+                    key = self._day_key(credit_type_id, day)
+                    pipeline.delete(key)
+                    day_wallets = wallets.get((day, credit_type_id))
+                    if day_wallets:
+                        pipeline.pfadd(key, *day_wallets)
+                        pipeline.expireat(key, self._expires_at(day))
+            if coverage_start is not None:
+                pipeline.set(self._coverage_key(), int(coverage_start.timestamp()))
+            await pipeline.execute()
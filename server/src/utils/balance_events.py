@@ -0,0 +1,217 @@
+import asyncio
+import time
+from logging import getLogger
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError
+
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.models.transactions import BalanceEvent
+from src.utils.singleton import SingletonMeta
+
+logger = getLogger(__name__)
+
+NAMESPACE = "balance_events"
+# Seconds the dispatcher waits for a message before checking it is still needed
+POLL_SECONDS = 1.0
+
+# (event id, event data), the id is the id of the event in the wallet's stream
+Event = Tuple[str, str]
+# Yielded instead of the events lost by a subscriber resuming too late
+RESET: Event = ("", "")
+
+
+def _stream_id(event_id: str) -> Tuple[int, int]:
+    """Redis stream ids are <milliseconds>-<sequence>"""
+    milliseconds, _, sequence = event_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(
+            maxsize=settings.BALANCE_EVENTS_BUFFER_SIZE
+        )
+        # Set once events were dropped, the subscriber has to resume
+        self.overflowed = False
+
+    def put(self, event: Event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class BalanceEvents(metaclass=SingletonMeta):
+    """
+    Balance changes of every wallet, pushed to the subscribers of the wallet.
+
+    Every change is added to a Redis stream per wallet, which keeps the last
+    BALANCE_EVENTS_RETAINED events for subscribers resuming after a
+    disconnection, and published on a channel of the wallet. Each process
+    subscribes once to the channels of the wallets it has subscribers for and
+    dispatches the events to their bounded buffers. A subscriber whose buffer
+    is full is dropped rather than buffering without bound or holding back
+    the others, it resumes from its last event when it reconnects.
+    """
+
+    def __init__(self):
+        self._pubsub: Optional[PubSub] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, Set[_Subscriber]] = {}
+
+    @staticmethod
+    def _key(wallet_id: str) -> str:
+        # The stream key also names the channel, channels are not keys
+        return RedisManager().create_key(NAMESPACE, wallet_id)
+
+    async def publish(self, event: BalanceEvent):
+        """
+        Add a balance change to the wallet's stream and push it to its
+        subscribers. Balance changes are committed before they are published,
+        a change that cannot be published is logged and only missed by the
+        subscribers, who still read it from the wallet.
+        """
+        key = self._key(event.wallet_id)
+        data = event.model_dump_json()
+        client = RedisManager().client
+        try:
+            async with client.pipeline(transaction=True) as pipeline:
+                # Trimmed exactly, a full stream tells events were dropped
+                pipeline.xadd(
+                    key,
+                    {"data": data},
+                    maxlen=settings.BALANCE_EVENTS_RETAINED,
+                    approximate=False,
+                )
+                pipeline.expire(key, settings.BALANCE_EVENTS_RETENTION_SECONDS)
+                event_id, _ = await pipeline.execute()
+            await client.publish(key, f"{event_id.decode()} {data}")
+        except RedisError:
+            logger.warning(
+                "Failed to publish the balance event of transaction %s",
+                event.transaction_id,
+                exc_info=True,
+            )
+
+    async def _backlog(
+        self, wallet_id: str, last_event_id: str
+    ) -> AsyncIterator[Event]:
+        """
+        The retained events after last_event_id, preceded by RESET when events
+        after it may no longer be retained: it is older than the retention, or
+        older than the oldest retained event of a full stream.
+        """
+        key = self._key(wallet_id)
+        client = RedisManager().client
+        async with client.pipeline(transaction=True) as pipeline:
+            pipeline.xlen(key)
+            pipeline.xrange(key, count=1)
+            pipeline.xrange(key, min=f"({last_event_id}")
+            length, first, events = await pipeline.execute()
+        retained_since = (
+            time.time() - settings.BALANCE_EVENTS_RETENTION_SECONDS
+        ) * 1000
+        if _stream_id(last_event_id)[0] < retained_since or (
+            length >= settings.BALANCE_EVENTS_RETAINED
+            and first
+            and _stream_id(first[0][0].decode()) > _stream_id(last_event_id)
+        ):
+            yield RESET
+        for event_id, fields in events:
+            yield event_id.decode(), fields[b"data"].decode()
+
+    async def _subscribe(self, wallet_id: str) -> _Subscriber:
+        if self._pubsub is None:
+            self._pubsub = RedisManager().client.pubsub()
+        subscriber = _Subscriber()
+        subscribers = self._subscribers.setdefault(wallet_id, set())
+        subscribers.add(subscriber)
+        if len(subscribers) == 1:
+            await self._pubsub.subscribe(self._key(wallet_id))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        return subscriber
+
+    async def _unsubscribe(self, wallet_id: str, subscriber: _Subscriber):
+        subscribers = self._subscribers.get(wallet_id, set())
+        subscribers.discard(subscriber)
+        if not subscribers:
+            self._subscribers.pop(wallet_id, None)
+            if self._pubsub is not None:
+                await self._pubsub.unsubscribe(self._key(wallet_id))
+
+    async def _dispatch(self):
+        prefix = self._key("")
+        while self._pubsub is not None:
+            try:
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=POLL_SECONDS
+                )
+            except RedisError:
+                logger.warning("Balance events subscription lost", exc_info=True)
+                # Events may have been missed, every subscriber has to resume
+                for subscribers in self._subscribers.values():
+                    for subscriber in subscribers:
+                        subscriber.overflowed = True
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            wallet_id = message["channel"].decode().removeprefix(prefix)
+            event_id, _, data = message["data"].decode().partition(" ")
+            for subscriber in self._subscribers.get(wallet_id, ()):
+                subscriber.put((event_id, data))
+
+    async def listen(
+        self, wallet_id: str, last_event_id: Optional[str] = None
+    ) -> AsyncIterator[Optional[Event]]:
+        """
+        The balance events of a wallet as they are published, after the
+        retained events following last_event_id when given. RESET is yielded
+        when events after last_event_id are no longer retained, and None after
+        every BALANCE_EVENTS_HEARTBEAT_SECONDS without events. Stops once the
+        subscriber fell behind by more than BALANCE_EVENTS_BUFFER_SIZE events.
+        """
+        subscriber = await self._subscribe(wallet_id)
+        try:
+            # Subscribed first so that no event falls between the backlog
+            # and the live events, the events in both are skipped
+            last = (0, 0)
+            if last_event_id:
+                try:
+                    last = _stream_id(last_event_id)
+                except ValueError:
+                    # Not an id of ours, nothing can be resumed from it
+                    yield RESET
+                    last_event_id = None
+            if last_event_id:
+                async for event in self._backlog(wallet_id, last_event_id):
+                    if event is not RESET:
+                        last = _stream_id(event[0])
+                    yield event
+            while not subscriber.overflowed:
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(),
+                        settings.BALANCE_EVENTS_HEARTBEAT_SECONDS,
+                    )
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if _stream_id(event[0]) > last:
+                    last = _stream_id(event[0])
+                    yield event
+        finally:
+            await self._unsubscribe(wallet_id, subscriber)
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        if self._pubsub is not None:
+            pubsub, self._pubsub = self._pubsub, None
+            await pubsub.aclose()
+        self._subscribers.clear()
@@ -1,7 +1,9 @@
 import asyncio
-from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+import weakref
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncGenerator, Awaitable, Callable, List
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.db_config import DBManager
@@ -19,10 +21,18 @@ class DBSessionCtx:
         self.commit_on_success = commit_on_success
         self.rollback_on_error = rollback_on_error
         self.objects_to_refresh = []
+        self.after_commit: List[Callable[[], Awaitable[None]]] = []
 
     def add_to_refresh(self, objects: list[DBModel]):
         self.objects_to_refresh.extend(objects)
 
+    def add_after_commit(self, callback: Callable[[], Awaitable[None]]):
+        """
+        Run callback once the session is committed, never if it is not. The
+        changes are committed by then, callbacks handle their own errors.
+        """
+        self.after_commit.append(callback)
+
 
 @asynccontextmanager
 async def db_session(
@@ -40,9 +50,59 @@ async def db_session(
                 await asyncio.gather(
                     *(session.refresh(obj) for obj in ctx.objects_to_refresh)
                 )
+            if commit_on_success and not read_only:
+                for callback in ctx.after_commit:
+                    await callback()
         except Exception as e:
             if rollback_on_error and not read_only:
                 await session.rollback()
             raise e
         finally:
             await session.close()
+
+
+# Sets of snapshot sessions open at once per process. Each set holds its
+# connections of the pool (5 + 10 overflow) until its queries end, sets taking
+# connections concurrently could hold them all and wait on each other.
+SNAPSHOT_SESSIONS_CONCURRENCY = 2
+# Semaphore per event loop, a semaphore cannot be shared between loops
+_snapshot_slots = weakref.WeakKeyDictionary()
+
+
+def _snapshot_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _snapshot_slots:
+        _snapshot_slots[loop] = asyncio.Semaphore(SNAPSHOT_SESSIONS_CONCURRENCY)
+    return _snapshot_slots[loop]
+
+
+@asynccontextmanager
+async def snapshot_sessions(count: int) -> AsyncGenerator[List[AsyncSession], None]:
+    """
+    count read only sessions on connections of their own, so that their
+    queries run concurrently, in REPEATABLE READ transactions that all see the
+    same snapshot of the database. The first session exports its snapshot and
+    the others import it, the transactions are rolled back on exit. At most
+    SNAPSHOT_SESSIONS_CONCURRENCY sets are open at once, the others wait for
+    one to close before taking any connection.
+    """
+    async with _snapshot_semaphore(), AsyncExitStack() as stack:
+        sessions: List[AsyncSession] = []
+        for _ in range(count):
+            session = await stack.enter_async_context(DBManager().AsyncSessionMaker())
+            await session.connection(
+                execution_options={
+                    "isolation_level": "REPEATABLE READ",
+                    "postgresql_readonly": True,
+                }
+            )
+            sessions.append(session)
+        snapshot = await sessions[0].scalar(text("SELECT pg_export_snapshot()"))
+        # SET TRANSACTION SNAPSHOT takes no parameters, the id is from Postgres
+        await asyncio.gather(
+            *(
+                session.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+                for session in sessions[1:]
+            )
+        )
+        yield sessions
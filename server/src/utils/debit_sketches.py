@@ -0,0 +1,177 @@
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.db.rollups import BUCKET_SIZE, bucket_start
+from src.utils.singleton import SingletonMeta
+
+NAMESPACE = "debit_sketches"
+# Quantiles are estimated within this relative error of an amount debited
+RELATIVE_ACCURACY = 0.01
+# Ratio between the bounds of a bin, amounts in (GAMMA^(i-1), GAMMA^i] are in
+# bin i
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+
+
+def amount_bin(amount: float) -> int:
+    return math.ceil(math.log(amount, GAMMA))
+
+
+def bin_amount(index: int) -> float:
+    """The amount of bin index closest in relative terms to all of its amounts"""
+    return 2 * GAMMA**index / (GAMMA + 1)
+
+
+def quantiles(bins: Dict[int, int], qs: List[float]) -> List[Optional[float]]:
+    """
+    Estimate the quantiles of the amounts counted in bins, within
+    RELATIVE_ACCURACY of an amount of rank q * (count - 1).
+
+    Returns:
+        The estimate of each quantile, None when bins is empty
+    """
+    total = sum(bins.values())
+    if not total:
+        return [None for _ in qs]
+
+    estimates = []
+    for q in qs:
+        rank = q * (total - 1)
+        seen = 0
+        for index in sorted(bins):
+            seen += bins[index]
+            if seen > rank:
+                estimates.append(bin_amount(index))
+                break
+    return estimates
+
+
+class DebitSketches(metaclass=SingletonMeta):
+    """
+    Mergeable sketches of the amounts debited per hour and credit type, in the
+    style of DDSketch: Redis hashes of counts per logarithmic bin of amounts.
+
+    Every debit written adds one to the bin of its amount in the hash of its
+    hour and credit type, and any range of hours is merged by summing their
+    bins. Hashes expire DEBIT_SKETCHES_RETENTION_DAYS after their hour ends,
+    and are only complete from the coverage start, the first hour rebuilt by
+    a backfill.
+    """
+
+    @property
+    def retention(self) -> timedelta:
+        return timedelta(days=settings.DEBIT_SKETCHES_RETENTION_DAYS)
+
+    @staticmethod
+    def _bucket_key(credit_type_id: str, bucket: datetime) -> str:
+        return RedisManager().create_key(
+            NAMESPACE, f"{credit_type_id}:{int(bucket.timestamp())}"
+        )
+
+    @staticmethod
+    def _coverage_key() -> str:
+        return RedisManager().create_key(NAMESPACE, "coverage_start")
+
+    def _expires_at(self, bucket: datetime) -> datetime:
+        return bucket + BUCKET_SIZE + self.retention
+
+    def retained_buckets(self) -> List[datetime]:
+        """The hours whose sketches have not expired yet, oldest first"""
+        now = datetime.now(timezone.utc)
+        bucket = bucket_start(now - self.retention)
+        buckets = []
+        while bucket <= now:
+            buckets.append(bucket)
+            bucket += BUCKET_SIZE
+        return buckets
+
+    async def has_coverage(self) -> bool:
+        return bool(await RedisManager().client.exists(self._coverage_key()))
+
+    async def covers(self, start_date: datetime) -> bool:
+        """Whether the sketches are complete from start_date on"""
+        coverage_start = await RedisManager().client.get(self._coverage_key())
+        return (
+            coverage_start is not None
+            and start_date.timestamp() >= int(coverage_start)
+            and start_date >= bucket_start(datetime.now(timezone.utc) - self.retention)
+        )
+
+    async def record(self, credit_type_id: str, amount: float, created_at: datetime):
+        bucket = bucket_start(created_at)
+        key = self._bucket_key(credit_type_id, bucket)
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            pipeline.hincrby(key, str(amount_bin(amount)), 1)
+            pipeline.expireat(key, self._expires_at(bucket))
+            await pipeline.execute()
+
+    async def merge(
+        self, credit_type_ids: List[str], periods: List[Tuple[datetime, List[datetime]]]
+    ) -> Dict[Tuple[datetime, str], Dict[int, int]]:
+        """
+        Merge the sketches of the hours of every period, per credit type.
+
+        Args:
+            credit_type_ids: Credit types to merge the sketches of
+            periods: (period start, hours of the period) pairs
+
+        Returns:
+            Counts per bin by (period start, credit type id), when not empty
+        """
+        keys = [
+            (period, credit_type_id, bucket)
+            for period, buckets in periods
+            for credit_type_id in credit_type_ids
+            for bucket in buckets
+        ]
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            for _, credit_type_id, bucket in keys:
+                pipeline.hgetall(self._bucket_key(credit_type_id, bucket))
+            sketches = await pipeline.execute()
+
+        merged: Dict[Tuple[datetime, str], Dict[int, int]] = {}
+        for (period, credit_type_id, _), sketch in zip(keys, sketches):
+            if not sketch:
+                continue
+            bins = merged.setdefault((period, credit_type_id), {})
+            for index, count in sketch.items():
+                bins[int(index)] = bins.get(int(index), 0) + int(count)
+        return merged
+
+    async def rebuild(
+        self,
+        bins: Dict[Tuple[datetime, str], Dict[int, int]],
+        buckets: List[datetime],
+        credit_type_ids: List[str],
+        coverage_start: Optional[datetime] = None,
+    ):
+        """
+        Replace the sketches of the given hours and credit types by the given
+        counts per bin.
+
+        Args:
+            bins: Counts per bin by (hour, credit type id)
+            buckets: Hours to replace
+            credit_type_ids: Credit types to replace the hours of
+            coverage_start: The sketches are complete from this hour on
+        """
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            for bucket in buckets:
+                for credit_type_id in credit_type_ids:
+                    key = self._bucket_key(credit_type_id, bucket)
+                    pipeline.delete(key)
+                    bucket_bins = bins.get((bucket, credit_type_id))
+                    if bucket_bins:
+                        pipeline.hset(
+                            key,
+                            mapping={
+                                str(index): count
+                                for index, count in bucket_bins.items()
+                            },
+                        )
+                        pipeline.expireat(key, self._expires_at(bucket))
+            if coverage_start is not None:
+                pipeline.set(self._coverage_key(), int(coverage_start.timestamp()))
+            await pipeline.execute()
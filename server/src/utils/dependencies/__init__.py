@@ -1,10 +1,11 @@
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Optional
 
-from fastapi import HTTPException, Query, Request
+from fastapi import Header, HTTPException, Query, Request
 from pydantic import BaseModel
 
 from src.models.base import PaginationRequest
+from src.models.Insights import TimeSeriesOptions, WalletActivityBounds
 
 
 async def get_pagination(
@@ -91,6 +92,60 @@ def parse_iso_date(param_name: str = "date"):
     return parser
 
 
+def get_cache_bypass(
+    cache_control: Optional[str] = Header(
+        default=None,
+        description="no-cache to compute a fresh result instead of a cached one",
+    ),
+) -> bool:
+    directives = (cache_control or "").lower().split(",")
+    return "no-cache" in (directive.strip() for directive in directives)
+
+
+def get_time_series_options(
+    fill_gaps: bool = Query(
+        default=False, description="Return zero points for the empty buckets"
+    ),
+    moving_average: Optional[int] = Query(
+        default=None,
+        ge=2,
+        le=366,
+        description="Number of buckets in the moving average of every metric",
+    ),
+    deltas: bool = Query(
+        default=False,
+        description="Return the change of every metric from the previous bucket",
+    ),
+) -> TimeSeriesOptions:
+    return TimeSeriesOptions(
+        fill_gaps=fill_gaps, moving_average=moving_average, deltas=deltas
+    )
+
+
+def get_wallet_activity_bounds(
+    top: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=100,
+        description="Number of wallets kept per bucket, the others are summed "
+        "into one other point",
+    ),
+    page: Optional[int] = Query(
+        default=None,
+        ge=1,
+        description="Page of the wallets ranked by transactions over the range",
+    ),
+    page_size: int = Query(
+        default=10, ge=1, le=100, description="Number of wallets per page"
+    ),
+) -> WalletActivityBounds:
+    if top is not None and page is not None:
+        raise HTTPException(
+            status_code=422, detail="top and page cannot be requested together"
+        )
+    return WalletActivityBounds(top=top, page=page, page_size=page_size)
+
+
 class DateTimeRange(BaseModel):
     start_date: datetime
     end_date: datetime
@@ -0,0 +1,22 @@
+import os
+import time
+from uuid import UUID
+
+
+def generate_id() -> str:
+    """
+    Generate a UUIDv7 (RFC 9562) id.
+
+    The first 48 bits are the unix timestamp in milliseconds, so ids sort by
+    creation time and new rows are appended to the right edge of B-tree
+    indexes instead of being scattered across them.
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    random_bits = int.from_bytes(os.urandom(10), "big")
+
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76  # version
+    value |= ((random_bits >> 62) & 0xFFF) << 64  # rand_a, 12 bits
+    value |= 0b10 << 62  # variant
+    value |= random_bits & 0x3FFF_FFFF_FFFF_FFFF  # rand_b, 62 bits
+    return str(UUID(int=value))
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import json
+import time
+from enum import Enum
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Dict, Set, Tuple, Type, TypeVar
+
+from pydantic import TypeAdapter
+
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.models.Insights import InsightsCacheMetrics
+from src.utils.singleton import SingletonMeta
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+CACHE_NAMESPACE = "insights_cache"
+METRICS_KEY = "insights_cache_metrics"
+# Longest a background refresh may take before another one can start
+REFRESH_LOCK_SECONDS = 60
+
+
+class CacheOutcome(str, Enum):
+    HIT = "hits"  # Fresh result served
+    STALE = "stale_hits"  # Stale result served while it is refreshed
+    MISS = "misses"  # Nothing cached, computed while the caller waits
+    BYPASS = "bypasses"  # Caller asked for a fresh result
+
+
+class InsightsCache(metaclass=SingletonMeta):
+    """
+    Redis cache of insights results shared by every API process.
+
+    A result is fresh for the TTL of its endpoint, then served stale for up to
+    INSIGHTS_CACHE_STALE_SECONDS more while a single background task, across
+    all processes, computes it again. Results older than that are evicted and
+    computed while the caller waits.
+    """
+
+    def __init__(self):
+        # Keeps the background refreshes referenced until they are done
+        self._refreshes: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _key(endpoint: str, params: Dict[str, Any]) -> str:
+        digest = hashlib.sha1(
+            json.dumps(params, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return RedisManager().create_key(CACHE_NAMESPACE, f"{endpoint}:{digest}")
+
+    async def get(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        ttl: int,
+        compute: Callable[[], Awaitable[T]],
+        result_type: Type[T],
+        bypass: bool = False,
+    ) -> T:
+        """
+        Get the result of compute for the endpoint and params from the cache,
+        computing and caching it when missing, stale or bypassed.
+        """
+        adapter = TypeAdapter(result_type)
+        key = self._key(endpoint, params)
+
+        if not bypass:
+            cached = await RedisManager().client.get(key)
+            if cached is not None:
+                computed_at, result = self._load(cached, adapter)
+                if time.time() - computed_at < ttl:
+                    await self._count(endpoint, CacheOutcome.HIT)
+                    return result
+                await self._count(endpoint, CacheOutcome.STALE)
+                await self._refresh_in_background(key, ttl, compute, adapter)
+                return result
+
+        await self._count(
+            endpoint, CacheOutcome.BYPASS if bypass else CacheOutcome.MISS
+        )
+        result = await compute()
+        await self._store(key, ttl, result, adapter)
+        return result
+
+    async def get_metrics(self) -> Dict[str, InsightsCacheMetrics]:
+        counters = await RedisManager().client.hgetall(METRICS_KEY)
+        metrics: Dict[str, Dict[str, int]] = {}
+        for field, count in counters.items():
+            endpoint, outcome = field.decode().rsplit(":", 1)
+            metrics.setdefault(endpoint, {})[outcome] = int(count)
+        return {
+            endpoint: InsightsCacheMetrics(**counts)
+            for endpoint, counts in sorted(metrics.items())
+        }
+
+    @staticmethod
+    def _load(cached: bytes, adapter: TypeAdapter) -> Tuple[float, Any]:
+        entry = json.loads(cached)
+        return entry["computed_at"], adapter.validate_python(entry["result"])
+
+    @staticmethod
+    async def _store(key: str, ttl: int, result: Any, adapter: TypeAdapter):
+        entry = {
+            "computed_at": time.time(),
+            "result": adapter.dump_python(result, mode="json"),
+        }
+        await RedisManager().client.set(
+            key, json.dumps(entry), ex=ttl + settings.INSIGHTS_CACHE_STALE_SECONDS
+        )
+
+    @staticmethod
+    async def _count(endpoint: str, outcome: CacheOutcome):
+        await RedisManager().client.hincrby(
+            METRICS_KEY, f"{endpoint}:{outcome.value}", 1
+        )
+
+    async def _refresh_in_background(
+        self,
+        key: str,
+        ttl: int,
+        compute: Callable[[], Awaitable[Any]],
+        adapter: TypeAdapter,
+    ):
+        lock_key = f"{key}:refreshing"
+        if not await RedisManager().client.set(
+            lock_key, 1, nx=True, ex=REFRESH_LOCK_SECONDS
+        ):
+            return  # Already being refreshed
+
+        async def refresh():
+            try:
+                await self._store(key, ttl, await compute(), adapter)
+            except Exception:
+                logger.error("Refreshing cached insights failed", exc_info=True)
+            finally:
+                await RedisManager().client.delete(lock_key)
+
+        task = asyncio.create_task(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
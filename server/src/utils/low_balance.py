@@ -0,0 +1,125 @@
+from logging import getLogger
+from typing import List, Tuple
+
+from redis.exceptions import RedisError, ResponseError
+
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.models.balances import LowBalanceNotification
+from src.utils.singleton import SingletonMeta
+
+logger = getLogger(__name__)
+
+NAMESPACE = "low_balance"
+GROUP = "webhook"
+# Notifications kept at most, the oldest are trimmed past it
+MAX_QUEUED = 100_000
+
+# (stream entry id, notification)
+QueuedNotification = Tuple[str, LowBalanceNotification]
+
+
+class LowBalanceNotifications(metaclass=SingletonMeta):
+    """
+    Queue of the low balance notifications, a Redis stream read by the webhook
+    workers as a consumer group. A notification stays pending until its
+    delivery is acknowledged, the notifications left pending for
+    LOW_BALANCE_WEBHOOK_RETRY_SECONDS, failed or read by a worker that
+    stopped, are claimed again by the next worker to read.
+    """
+
+    @staticmethod
+    def _key() -> str:
+        return RedisManager().create_key(NAMESPACE, "notifications")
+
+    async def enqueue(self, notification: LowBalanceNotification):
+        """Queue a notification, which is logged and lost if Redis fails"""
+        try:
+            await RedisManager().client.xadd(
+                self._key(),
+                {"data": notification.model_dump_json()},
+                maxlen=MAX_QUEUED,
+            )
+        except RedisError:
+            logger.warning(
+                "Failed to queue the low balance notification %s",
+                notification.id,
+                exc_info=True,
+            )
+
+    async def _create_group(self):
+        try:
+            await RedisManager().client.xgroup_create(
+                self._key(), GROUP, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    @staticmethod
+    def _parse(entries) -> List[QueuedNotification]:
+        return [
+            (
+                entry_id.decode(),
+                LowBalanceNotification.model_validate_json(fields[b"data"]),
+            )
+            for entry_id, fields in entries
+            # Entries trimmed while pending are claimed without their fields
+            if fields
+        ]
+
+    async def read(self, consumer: str, count: int) -> List[QueuedNotification]:
+        """
+        Up to count notifications to deliver, those to retry first, then
+        those never read. They stay pending until acknowledged.
+        """
+        await self._create_group()
+        client = RedisManager().client
+        claimed = await client.xautoclaim(
+            self._key(),
+            GROUP,
+            consumer,
+            min_idle_time=settings.LOW_BALANCE_WEBHOOK_RETRY_SECONDS * 1000,
+            count=count,
+        )
+        notifications = self._parse(claimed[1])
+        if len(notifications) < count:
+            streams = await client.xreadgroup(
+                GROUP,
+                consumer,
+                {self._key(): ">"},
+                count=count - len(notifications),
+            )
+            for _, entries in streams or []:
+                notifications.extend(self._parse(entries))
+        return notifications
+
+    async def acknowledge(self, entry_ids: List[str]):
+        """Remove delivered notifications from the queue"""
+        async with RedisManager().client.pipeline(transaction=True) as pipeline:
+            pipeline.xack(self._key(), GROUP, *entry_ids)
+            pipeline.xdel(self._key(), *entry_ids)
+            await pipeline.execute()
+
+    async def drop_exhausted(self, entry_ids: List[str], max_attempts: int) -> int:
+        """
+        Remove the notifications among entry_ids delivered max_attempts times.
+
+        Returns:
+            The number of notifications removed
+        """
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            for entry_id in entry_ids:
+                pipeline.xpending_range(
+                    self._key(), GROUP, min=entry_id, max=entry_id, count=1
+                )
+            pending = await pipeline.execute()
+        exhausted = [
+            entry["message_id"].decode()
+            for entries in pending
+            for entry in entries
+            if entry["times_delivered"] >= max_attempts
+        ]
+        if exhausted:
+            await self.acknowledge(exhausted)
+        return len(exhausted)
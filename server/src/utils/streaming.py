@@ -0,0 +1,31 @@
+import zlib
+from typing import AsyncIterator
+
+from fastapi import Request
+
+
+def accepts_gzip(request: Request) -> bool:
+    """Whether the client accepts a gzip encoded response"""
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, *params = [part.strip() for part in coding.split(";")]
+        if name.lower() != "gzip":
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compress a stream of chunks into a single gzip stream as it is produced"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+from src.db import transaction_labels as transaction_labels_db
+from src.utils.ctx_managers import db_session
+from src.utils.singleton import SingletonMeta
+
+MAX_CACHED_LABELS = 10_000
+
+
+class TransactionLabelCache(metaclass=SingletonMeta):
+    """
+    Maps issuer and description strings to their transaction_labels ids.
+
+    Labels are never updated or deleted, so ids can be cached for the lifetime of
+    the process. Missing labels are created in their own committed session, a
+    cached id can therefore never point at a label that was rolled back.
+    """
+
+    def __init__(self, max_size: int = MAX_CACHED_LABELS):
+        self.max_size = max_size
+        self._label_ids: OrderedDict[str, int] = OrderedDict()
+
+    async def get_ids(self, values: Iterable[str]) -> Dict[str, int]:
+        values = list(values)
+        missing = {value for value in values if value not in self._label_ids}
+        if missing:
+            async with db_session() as session_ctx:
+                created = await transaction_labels_db.get_or_create_labels(
+                    session=session_ctx.session, values=missing
+                )
+            self._label_ids.update(created)
+
+        label_ids = {}
+        for value in values:
+            label_ids[value] = self._label_ids[value]
+            self._label_ids.move_to_end(value)
+        while len(self._label_ids) > self.max_size:
+            self._label_ids.popitem(last=False)
+        return label_ids
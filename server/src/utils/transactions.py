@@ -1,17 +1,78 @@
+from logging import getLogger
 from typing import Awaitable, Callable
 
 from fastapi import HTTPException, status
+from redis.asyncio.lock import Lock
+from redis.exceptions import RedisError
 from sqlalchemy.exc import IntegrityError
 
 from src.core.redis_config import RedisManager
 from src.db import transactions as transactions_db
 from src.models.transactions import (
+    BalanceEvent,
     TransactionDBModel,
     TransactionRequestBase,
     TransactionStatus,
+    TransactionType,
 )
+from src.utils.active_wallets import ActiveWallets
+from src.utils.balance_events import BalanceEvents
 from src.utils.constants import DUPLICATE_TRANSACTION_ERROR, PG_UNIQUE_VIOLATION_ERROR
 from src.utils.ctx_managers import DBSessionCtx, db_session
+from src.utils.debit_sketches import DebitSketches
+from src.utils.transaction_labels import TransactionLabelCache
+from src.utils.trending_wallets import TrendingWallets
+
+logger = getLogger(__name__)
+
+
+def balance_lock(wallet_id: str, credit_type_id: str, timeout: int = 20) -> Lock:
+    """Redis lock serializing the changes to the balance of a credit type"""
+    redis_manager = RedisManager()
+    key = redis_manager.create_key(
+        namespace="balance_write_lock", key=f"{wallet_id}_{credit_type_id}"
+    )
+    return redis_manager.client.lock(key, timeout=timeout)
+
+
+async def record_transaction_insights(transaction: TransactionDBModel):
+    """
+    Count a completed transaction in the insights kept in Redis, once its
+    changes are committed, so failed transactions are never counted. They are
+    best effort: a transaction Redis fails to record is logged and only missed by
+    the insights, until they are backfilled from the transactions.
+    """
+    try:
+        await TrendingWallets().record(transaction.wallet_id, transaction.created_at)
+        await ActiveWallets().record(
+            transaction.wallet_id, transaction.credit_type_id, transaction.created_at
+        )
+        if transaction.type == TransactionType.DEBIT and transaction.amount:
+            await DebitSketches().record(
+                transaction.credit_type_id, transaction.amount, transaction.created_at
+            )
+    except RedisError:
+        logger.warning(
+            "Failed to record transaction %s in the insights",
+            transaction.id,
+            exc_info=True,
+        )
+
+
+async def publish_balance_event(transaction: TransactionDBModel):
+    """Push the balance after a completed transaction to its subscribers"""
+    if transaction.snapshot_available is None:
+        return
+    await BalanceEvents().publish(
+        BalanceEvent(
+            wallet_id=transaction.wallet_id,
+            credit_type_id=transaction.credit_type_id,
+            transaction_id=transaction.id,
+            transaction_type=transaction.type,
+            balance=transaction.balance_snapshot,
+            updated_at=transaction.updated_at,
+        )
+    )
 
 
 async def run_managed_transaction(
@@ -36,12 +97,17 @@ async def run_managed_transaction(
         HTTPException: If transaction creation fails due to duplicate
         Exception: If transaction processing fails, marks transaction as failed
     """
+    label_ids = await TransactionLabelCache().get_ids(
+        [transaction_request.issuer, transaction_request.description]
+    )
     try:
         async with db_session() as session_ctx:
             transaction = await transactions_db.create_transaction(
                 db=session_ctx.session,
                 wallet_id=wallet_id,
                 transaction_request=transaction_request,
+                issuer_id=label_ids[transaction_request.issuer],
+                description_id=label_ids[transaction_request.description],
             )
             session_ctx.add_to_refresh([transaction])
 
@@ -59,14 +125,16 @@ async def run_managed_transaction(
         raise
 
     try:
-        redis_manager = RedisManager()
-        key = redis_manager.create_key(
-            namespace="balance_write_lock",
-            key=f"{wallet_id}_{transaction_request.credit_type_id}",
-        )
-        async with redis_manager.client.lock(key, timeout=20):
+        async with balance_lock(wallet_id, transaction_request.credit_type_id):
             async with db_session() as session_ctx:
-                return await transaction_handler(transaction, session_ctx)
+                completed = await transaction_handler(transaction, session_ctx)
+                session_ctx.add_after_commit(
+                    lambda: record_transaction_insights(completed)
+                )
+            # Published under the lock so that the events of a balance are
+            # published in the order of its changes
+            await publish_balance_event(completed)
+            return completed
 
     except Exception as e:
         async with db_session() as session_ctx:
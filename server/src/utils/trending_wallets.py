@@ -0,0 +1,158 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from src.core.redis_config import RedisManager
+from src.core.settings import settings
+from src.db.rollups import BUCKET_SIZE, bucket_start
+from src.utils.singleton import SingletonMeta
+
+NAMESPACE = "trending_wallets"
+# Seconds the union of the buckets of a query is kept, it is deleted right away
+UNION_TTL_SECONDS = 10
+
+
+class TrendingWallets(metaclass=SingletonMeta):
+    """
+    Number of transactions per wallet in Redis sorted sets, one per hour.
+
+    Every completed transaction adds one to its wallet in the set of the hour
+    it was created in, once it is committed. Backfills rebuild the sets from
+    the database, whose counts include the failed transactions. Sets expire
+    TRENDING_WALLETS_RETENTION_DAYS after their hour ends. They are only
+    complete from the coverage start, the first hour rebuilt by a backfill,
+    before which ranges are left to the database.
+    """
+
+    @property
+    def retention(self) -> timedelta:
+        return timedelta(days=settings.TRENDING_WALLETS_RETENTION_DAYS)
+
+    @staticmethod
+    def _bucket_key(bucket: datetime) -> str:
+        return RedisManager().create_key(NAMESPACE, str(int(bucket.timestamp())))
+
+    @staticmethod
+    def _coverage_key() -> str:
+        return RedisManager().create_key(NAMESPACE, "coverage_start")
+
+    @staticmethod
+    def _names_key() -> str:
+        return RedisManager().create_key(NAMESPACE, "names")
+
+    def _expires_at(self, bucket: datetime) -> datetime:
+        return bucket + BUCKET_SIZE + self.retention
+
+    def retained_buckets(self) -> List[datetime]:
+        """The hours whose sets have not expired yet, oldest first"""
+        now = datetime.now(timezone.utc)
+        bucket = bucket_start(now - self.retention)
+        buckets = []
+        while bucket <= now:
+            buckets.append(bucket)
+            bucket += BUCKET_SIZE
+        return buckets
+
+    async def has_coverage(self) -> bool:
+        return bool(await RedisManager().client.exists(self._coverage_key()))
+
+    async def record(self, wallet_id: str, created_at: datetime):
+        bucket = bucket_start(created_at)
+        key = self._bucket_key(bucket)
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            pipeline.zincrby(key, 1, wallet_id)
+            pipeline.expireat(key, self._expires_at(bucket))
+            await pipeline.execute()
+
+    async def get_top(
+        self, start_date: datetime, end_date: datetime, limit: int
+    ) -> Optional[List[Tuple[str, int]]]:
+        """
+        Wallets with the most transactions created in [start_date, end_date),
+        by the union of the sets of the hours in between. ZUNIONSTORE is
+        linear in the total size of the merged sets, plus M log(M) for the M
+        wallets of the union, so wide ranges cost more than narrow ones.
+
+        Returns:
+            (wallet_id, transaction count) pairs by descending count, or None
+            when the range does not start and end on hours of complete sets
+        """
+        client = RedisManager().client
+        if bucket_start(start_date) != start_date or bucket_start(end_date) != end_date:
+            return None
+        coverage_start = await client.get(self._coverage_key())
+        oldest_bucket = bucket_start(datetime.now(timezone.utc) - self.retention)
+        if (
+            coverage_start is None
+            or start_date.timestamp() < int(coverage_start)
+            or start_date < oldest_bucket
+        ):
+            return None
+
+        keys = []
+        bucket = start_date
+        while bucket < end_date:
+            keys.append(self._bucket_key(bucket))
+            bucket += BUCKET_SIZE
+        if not keys:
+            return []
+
+        union_key = RedisManager().create_key(NAMESPACE, f"union:{uuid.uuid4()}")
+        async with client.pipeline(transaction=True) as pipeline:
+            pipeline.zunionstore(union_key, keys)
+            pipeline.expire(union_key, UNION_TTL_SECONDS)
+            pipeline.zrevrange(union_key, 0, limit - 1, withscores=True)
+            pipeline.delete(union_key)
+            *_, top, _ = await pipeline.execute()
+        return [(wallet_id.decode(), int(count)) for wallet_id, count in top]
+
+    async def rebuild(
+        self,
+        counts: Dict[datetime, Dict[str, int]],
+        coverage_start: Optional[datetime] = None,
+    ):
+        """
+        Replace the sets of the given hours by the given counts per wallet.
+
+        Transactions recorded while the counts were read from the database can
+        be counted twice or not at all in the hours they are replaced in.
+
+        Args:
+            counts: Transaction counts per wallet of every hour to replace
+            coverage_start: The sets are complete from this hour on
+        """
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            for bucket, wallet_counts in counts.items():
+                if self._expires_at(bucket) <= datetime.now(timezone.utc):
+                    continue
+                key = self._bucket_key(bucket)
+                pipeline.delete(key)
+                if wallet_counts:
+                    pipeline.zadd(key, wallet_counts)
+                    pipeline.expireat(key, self._expires_at(bucket))
+            if coverage_start is not None:
+                pipeline.set(self._coverage_key(), int(coverage_start.timestamp()))
+            await pipeline.execute()
+
+    async def get_cached_names(self, wallet_ids: List[str]) -> Dict[str, str]:
+        if not wallet_ids:
+            return {}
+        names = await RedisManager().client.hmget(self._names_key(), wallet_ids)
+        return {
+            wallet_id: name.decode()
+            for wallet_id, name in zip(wallet_ids, names)
+            if name is not None
+        }
+
+    async def cache_names(self, names: Dict[str, str]):
+        if names:
+            await RedisManager().client.hset(self._names_key(), mapping=names)
+
+    async def forget_wallet(self, wallet_id: str, deleted: bool = False):
+        """Drop the cached name of a wallet, and its counts once it is deleted"""
+        async with RedisManager().client.pipeline(transaction=False) as pipeline:
+            pipeline.hdel(self._names_key(), wallet_id)
+            if deleted:
+                for bucket in self.retained_buckets():
+                    pipeline.zrem(self._bucket_key(bucket), wallet_id)
+            await pipeline.execute()
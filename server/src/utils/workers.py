@@ -0,0 +1,17 @@
+import asyncio
+from logging import getLogger
+from typing import Awaitable, Callable
+
+logger = getLogger(__name__)
+
+
+async def run_periodically(
+    name: str, task: Callable[[], Awaitable], interval_seconds: int
+):
+    """Run task every interval_seconds until cancelled, logging its failures"""
+    while True:
+        try:
+            await task()
+        except Exception:
+            logger.error("Background task %s failed", name, exc_info=True)
+        await asyncio.sleep(interval_seconds)
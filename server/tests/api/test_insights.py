@@ -1,11 +1,32 @@
+import asyncio
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 
 import httpx
 import pytest
+from sqlalchemy import select, text, update
 
 from scripts.load_seed_data import load_seed_data
+from src.core.analytics_replica import AnalyticsReplica
 from src.core.settings import settings
-from src.models.Insights import TimeGranularity
+from src.db import insight_counters as insight_counters_db
+from src.db import insights as insights_db
+from src.db import liabilities as liabilities_db
+from src.models import TransactionDBModel
+from src.models.Insights import OTHER_WALLETS_ID, TimeGranularity
+from src.models.transactions import TransactionType
+from src.services import (
+    analytics_service,
+    insight_counters_service,
+    insights_service,
+    liabilities_service,
+    rollups_service,
+)
+from src.utils.active_wallets import STANDARD_ERROR, day_start
+from src.utils.ctx_managers import db_session, snapshot_sessions
+from src.utils.debit_sketches import RELATIVE_ACCURACY
+from src.utils.trending_wallets import TrendingWallets
+from tests.utils import create_credit_type, create_wallet
 
 pytestmark = pytest.mark.anyio
 
@@ -21,6 +42,7 @@ class TestInsightsEndpoints:
     @pytest.mark.parametrize(
         "granularity",
         [
+            TimeGranularity.HOUR.value,
             TimeGranularity.DAY.value,
             TimeGranularity.WEEK.value,
             TimeGranularity.MONTH.value,
@@ -120,6 +142,66 @@ class TestInsightsEndpoints:
         )
         assert response.status_code == 200
 
+    async def test_credit_usage_timeseries_options(self, client: httpx.AsyncClient):
+        end_date = datetime.now(tz=timezone.utc)
+        params = {
+            "start_date": (end_date - timedelta(days=30)).isoformat(),
+            "end_date": end_date.isoformat(),
+            "granularity": TimeGranularity.DAY.value,
+        }
+
+        async def get_points(**options):
+            response = await client.get(
+                f"{self.base_url}/insights/credits/usage-timeseries",
+                params={**params, **options},
+                headers={"Cache-Control": "no-cache"},
+            )
+            assert response.status_code == 200
+            return response.json()["points"]
+
+        sparse = await get_points()
+        filled = await get_points(fill_gaps=True, moving_average=3, deltas=True)
+        credit_types = {point["credit_type_id"] for point in sparse}
+        timestamps = sorted({point["timestamp"] for point in filled})
+        assert len(timestamps) == 31
+        assert len(filled) == len(timestamps) * len(credit_types)
+
+        metrics = ["transaction_count", "debits_amount"]
+        by_key = {
+            (point["timestamp"], point["credit_type_id"]): point for point in sparse
+        }
+        for credit_type_id in credit_types:
+            series = [
+                point for point in filled if point["credit_type_id"] == credit_type_id
+            ]
+            for index, point in enumerate(series):
+                sparse_point = by_key.get((point["timestamp"], credit_type_id))
+                for metric in metrics:
+                    value = sparse_point[metric] if sparse_point else 0
+                    assert point[metric] == pytest.approx(value)
+                    window = [p[metric] for p in series[max(index - 2, 0) : index + 1]]
+                    assert point["moving_averages"][metric] == pytest.approx(
+                        sum(window) / len(window)
+                    )
+                    if index == 0:
+                        assert point["deltas"][metric] is None
+                    else:
+                        assert point["deltas"][metric] == pytest.approx(
+                            point[metric] - series[index - 1][metric]
+                        )
+
+        # Without fill_gaps only the buckets with transactions are returned
+        smoothed = await get_points(moving_average=3)
+        assert [
+            {key: point[key] for key in ("timestamp", "credit_type_id", *metrics)}
+            for point in smoothed
+        ] == _approx_points(
+            [
+                {key: point[key] for key in ("timestamp", "credit_type_id", *metrics)}
+                for point in sparse
+            ]
+        )
+
     async def test_invalid_granularity(self, client: httpx.AsyncClient):
         # Test with invalid granularity
         end_date = datetime.now(tz=timezone.utc)
@@ -169,3 +251,653 @@ class TestInsightsEndpoints:
             f"{self.base_url}/insights/wallets/activity", params=params
         )
         assert response.status_code == 422  # Should return validation error
+
+    async def test_rollups_match_transactions(self, client: httpx.AsyncClient):
+        # Insights read from the rollups once they are refreshed must match the
+        # insights read from the transactions
+        end_date = datetime.now(tz=timezone.utc)
+        start_date = end_date - timedelta(days=365, minutes=30)
+        dates = {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+        requests = [
+            ("/insights/wallets/activity", {"granularity": "hour"}),
+            ("/insights/wallets/activity", {"granularity": "week"}),
+            ("/insights/wallets/trending", {"limit": 100}),
+            ("/insights/credits/usage-summary", {}),
+            ("/insights/credits/usage-timeseries", {"granularity": "day"}),
+        ]
+
+        async def get_insights():
+            responses = []
+            for path, params in requests:
+                response = await client.get(
+                    f"{self.base_url}{path}",
+                    params={**dates, **params},
+                    headers={"Cache-Control": "no-cache"},
+                )
+                assert response.status_code == 200
+                responses.append(response.json())
+            return responses
+
+        before = await get_insights()
+        watermark = await rollups_service.refresh_rollups()
+        assert watermark is not None and start_date < watermark < end_date
+        after = await get_insights()
+
+        for rolled_up, raw in zip(after, before):
+            assert _points(raw)
+            assert _points(rolled_up) == _approx_points(raw)
+
+    async def test_analytics_replica_matches_postgres(
+        self, client: httpx.AsyncClient, monkeypatch, tmp_path
+    ):
+        pytest.importorskip("duckdb")
+        end_date = datetime.now(tz=timezone.utc)
+        dates = {
+            "start_date": (end_date - timedelta(days=365)).isoformat(),
+            "end_date": end_date.isoformat(),
+        }
+        requests = [
+            ("/insights/wallets/activity", {"granularity": "week"}),
+            (
+                "/insights/wallets/activity",
+                {"granularity": "month", "fill_gaps": True, "deltas": True},
+            ),
+            ("/insights/credits/usage-summary", {}),
+            (
+                "/insights/credits/usage-timeseries",
+                {"granularity": "day", "moving_average": 7},
+            ),
+        ]
+
+        async def get_insights():
+            responses = []
+            for path, params in requests:
+                response = await client.get(
+                    f"{self.base_url}{path}",
+                    params={**dates, **params},
+                    headers={"Cache-Control": "no-cache"},
+                )
+                assert response.status_code == 200
+                responses.append(response.json())
+            return responses
+
+        from_postgres = await get_insights()
+        monkeypatch.setattr(settings, "ANALYTICS_REPLICA_ENABLED", True)
+        monkeypatch.setattr(
+            settings, "ANALYTICS_REPLICA_PATH", str(tmp_path / "analytics.duckdb")
+        )
+        assert await analytics_service.connect_replica()
+        try:
+            assert not analytics_service.serves(
+                end_date - timedelta(days=365), end_date
+            )
+            await analytics_service.sync_replica(
+                now=end_date + timedelta(seconds=settings.ROLLUP_LATENESS_SECONDS)
+            )
+            assert analytics_service.serves(end_date - timedelta(days=365), end_date)
+            assert not analytics_service.serves(end_date - timedelta(days=1), end_date)
+            from_replica = await get_insights()
+        finally:
+            AnalyticsReplica().disconnect()
+
+        for replica, postgres in zip(from_replica, from_postgres):
+            assert _points(postgres)
+            assert _points(replica) == _approx_points(postgres)
+
+    async def test_approximate_insights(self, client: httpx.AsyncClient, monkeypatch):
+        end_date = datetime.now(tz=timezone.utc)
+        params = {
+            "start_date": (end_date - timedelta(days=365)).isoformat(),
+            "end_date": end_date.isoformat(),
+        }
+        headers = {"Cache-Control": "no-cache"}
+
+        async def get_insights(path, approximate):
+            response = await client.get(
+                f"{self.base_url}{path}",
+                params={**params, "approximate": approximate},
+                headers=headers,
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        exact = await get_insights("/insights/credits/usage-summary", False)
+        # All transactions fit in the sample, nothing is estimated
+        assert await get_insights("/insights/credits/usage-summary", True) == exact
+
+        monkeypatch.setattr(settings, "INSIGHTS_SAMPLE_ROWS", 5000)
+        estimated = await get_insights("/insights/credits/usage-summary", True)
+        exact_by_id = {usage["credit_type_id"]: usage for usage in exact}
+        for usage in estimated:
+            for metric in ("transaction_count", "debits_amount"):
+                interval = usage["confidence_intervals"][metric]
+                assert interval["low"] <= usage[metric] <= interval["high"]
+                # Within 5 standard errors of the exact value
+                standard_error = (interval["high"] - interval["low"]) / 2 / 1.96
+                assert abs(
+                    usage[metric] - exact_by_id[usage["credit_type_id"]][metric]
+                ) <= 5 * max(standard_error, 1)
+
+        timeseries = await get_insights("/insights/credits/usage-timeseries", True)
+        assert timeseries["approximate"]
+        assert 0 < timeseries["sample_percent"] < 100
+        assert timeseries["points"]
+        for point in timeseries["points"]:
+            assert set(point["confidence_intervals"]) == {
+                "transaction_count",
+                "debits_amount",
+            }
+
+        activity = await get_insights("/insights/wallets/activity", True)
+        assert activity["approximate"]
+        assert all(
+            point["confidence_intervals"]["total_transactions"]["high"]
+            >= point["total_transactions"]
+            for point in activity["points"]
+        )
+
+    async def test_approximate_narrow_range(
+        self, client: httpx.AsyncClient, monkeypatch
+    ):
+        await rollups_service.refresh_rollups()
+        wallet = await create_wallet(client, self.base_url)
+        credit_type = await create_credit_type(client, self.base_url)
+        created_at = []
+        for kind, amount in [("deposit", 100)] + [("debit", n) for n in range(1, 11)]:
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet['id']}/{kind}",
+                json={
+                    "type": kind,
+                    "credit_type_id": credit_type["id"],
+                    "description": "narrow range",
+                    "issuer": "test",
+                    "payload": {"amount": amount},
+                },
+            )
+            assert response.status_code == 200
+            created_at.append(datetime.fromisoformat(response.json()["created_at"]))
+        params = {
+            "start_date": created_at[0].isoformat(),
+            "end_date": created_at[-1].isoformat(),
+        }
+        async with db_session(read_only=True) as session_ctx:
+            assert await insights_db.count_range_transactions(
+                session_ctx.session, created_at[0], created_at[-1]
+            ) == len(created_at)
+
+        async def get_usage(approximate):
+            response = await client.get(
+                f"{self.base_url}/insights/credits/usage-summary",
+                params={**params, "approximate": approximate},
+                headers={"Cache-Control": "no-cache"},
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        # A sample of a few transactions of the whole table would hold none of
+        # the range, which is read exactly instead
+        monkeypatch.setattr(settings, "INSIGHTS_SAMPLE_ROWS", 5)
+        usage = await get_usage(True)
+        assert usage == await get_usage(False)
+        usage = {row["credit_type_id"]: row for row in usage}
+        assert usage[credit_type["id"]]["debits_amount"] == 55
+
+    async def test_bounded_wallet_activity(self, client: httpx.AsyncClient):
+        end_date = datetime.now(tz=timezone.utc)
+        params = {
+            "start_date": (end_date - timedelta(days=365)).isoformat(),
+            "end_date": end_date.isoformat(),
+            "granularity": TimeGranularity.DAY.value,
+        }
+
+        async def get_activity(**bounds):
+            return await client.get(
+                f"{self.base_url}/insights/wallets/activity",
+                params={**params, **bounds},
+                headers={"Cache-Control": "no-cache"},
+            )
+
+        def totals_by_day(points):
+            totals = defaultdict(int)
+            for point in points:
+                totals[point["timestamp"]] += point["total_transactions"]
+            return totals
+
+        response = await get_activity()
+        assert response.status_code == 200
+        points = response.json()["points"]
+        wallet_ids = {point["wallet_id"] for point in points}
+
+        response = await get_activity(top=1)
+        assert response.status_code == 200
+        top_points = response.json()["points"]
+        for day in totals_by_day(top_points):
+            day_wallets = [p["wallet_id"] for p in top_points if p["timestamp"] == day]
+            assert len(day_wallets) <= 2
+            assert set(day_wallets) - {OTHER_WALLETS_ID} <= wallet_ids
+        # The other wallets are summed, not dropped
+        assert totals_by_day(top_points) == totals_by_day(points)
+
+        response = await get_activity(page=1, page_size=1)
+        assert response.status_code == 200
+        page = response.json()
+        assert page["total_wallets"] == len(wallet_ids)
+        assert (page["page"], page["page_size"]) == (1, 1)
+        assert len({point["wallet_id"] for point in page["points"]}) == 1
+
+        response = await get_activity(page=len(wallet_ids) + 1, page_size=1)
+        assert response.status_code == 200
+        assert response.json()["points"] == []
+
+        response = await get_activity(top=1, page=1)
+        assert response.status_code == 422
+
+    async def test_dashboard(self, client: httpx.AsyncClient):
+        end_date = datetime.now(tz=timezone.utc)
+        params = {
+            "start_date": (end_date - timedelta(days=365)).isoformat(),
+            "end_date": end_date.isoformat(),
+        }
+        headers = {"Cache-Control": "no-cache"}
+
+        async def get_insights(path, **extra):
+            response = await client.get(
+                f"{self.base_url}{path}", params={**params, **extra}, headers=headers
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        dashboard = await get_insights("/insights/dashboard", limit=2)
+        assert dashboard["general"] == await get_insights("/insights/general")
+        assert dashboard["credit_usage"] == await get_insights(
+            "/insights/credits/usage-summary"
+        )
+        assert len(dashboard["trending_wallets"]) <= 2
+        assert dashboard["wallet_activity"] == await get_insights(
+            "/insights/wallets/activity", top=2
+        )
+
+    async def test_concurrent_snapshot_sessions(self, client: httpx.AsyncClient):
+        # More sets than the pool has connections for at once, each holding
+        # its connections for a while
+        async def read_snapshot():
+            async with snapshot_sessions(4) as sessions:
+                results = await asyncio.gather(
+                    *(session.scalar(text("SELECT 1")) for session in sessions)
+                )
+                await asyncio.sleep(0.1)
+                return results
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*(read_snapshot() for _ in range(8))), 20
+        )
+        assert results == [[1] * 4] * 8
+
+    async def test_cached_insights(self, client: httpx.AsyncClient, monkeypatch):
+        async def get_metrics():
+            response = await client.get(f"{self.base_url}/insights/cache/metrics")
+            assert response.status_code == 200
+            return response.json().get("credit_usage", {})
+
+        end_date = datetime.now(tz=timezone.utc)
+        params = {
+            "start_date": (end_date - timedelta(days=365)).isoformat(),
+            "end_date": end_date.isoformat(),
+        }
+        path = f"{self.base_url}/insights/credits/usage-summary"
+
+        bypassed = await client.get(
+            path, params=params, headers={"Cache-Control": "no-cache"}
+        )
+        before = await get_metrics()
+        cached = await client.get(path, params=params)
+        assert cached.json() == bypassed.json()
+        after = await get_metrics()
+        assert after["hits"] == before.get("hits", 0) + 1
+        assert after["bypasses"] == before["bypasses"]
+
+        # Past its TTL the stale result is still served while it is refreshed
+        monkeypatch.setitem(insights_service.CACHE_TTLS, "credit_usage", 0)
+        stale = await client.get(path, params=params)
+        assert stale.json() == bypassed.json()
+        assert (await get_metrics())["stale_hits"] == after.get("stale_hits", 0) + 1
+
+    async def test_general_insights_counters(self, client: httpx.AsyncClient):
+        async def get_general_insights():
+            response = await client.get(
+                f"{self.base_url}/insights/general",
+                headers={"Cache-Control": "no-cache"},
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        async with db_session(read_only=True) as session_ctx:
+            exact_counts = await insight_counters_db.get_exact_counts(
+                session_ctx.session
+            )
+        insights = await get_general_insights()
+        assert insights["total_transactions"] == sum(
+            count
+            for name, count in exact_counts.items()
+            if name.startswith("transactions.")
+        )
+        assert insights["total_debits"] == exact_counts["transactions.DEBIT"]
+        assert insights["total_wallets"] == exact_counts["wallets"]
+        assert await insight_counters_service.recount_insight_counters() == {}
+
+        # Drifted counters are corrected by the recount
+        async with db_session() as session_ctx:
+            await insight_counters_db.add_to_counters(
+                session_ctx.session, {"transactions.DEBIT": 5, "wallets": -1}
+            )
+        assert (await get_general_insights())["total_debits"] == insights[
+            "total_debits"
+        ] + 5
+        assert await insight_counters_service.recount_insight_counters() == {
+            "transactions.DEBIT": -5,
+            "wallets": 1,
+        }
+        assert await get_general_insights() == insights
+
+    async def test_liabilities_counters(self, client: httpx.AsyncClient):
+        async def get_liabilities():
+            response = await client.get(
+                f"{self.base_url}/insights/credits/liabilities",
+                headers={"Cache-Control": "no-cache"},
+            )
+            assert response.status_code == 200
+            return {
+                liability["credit_type_id"]: liability for liability in response.json()
+            }
+
+        async with db_session(read_only=True) as session_ctx:
+            exact = await liabilities_db.get_exact_liabilities(session_ctx.session)
+        liabilities = await get_liabilities()
+        assert exact
+        for credit_type_id, (available, held) in exact.items():
+            liability = liabilities[credit_type_id]
+            assert liability["available"] == pytest.approx(available)
+            assert liability["held"] == pytest.approx(held)
+            assert liability["outstanding"] == pytest.approx(available + held)
+        assert await liabilities_service.recount_liabilities() == {}
+
+        # Balance changes move the counters by the same amounts
+        wallet = await create_wallet(client, self.base_url)
+        credit_type = await create_credit_type(client, self.base_url)
+        for transaction_type, amount in (("deposit", 100), ("hold", 30)):
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet['id']}/{transaction_type}",
+                json={
+                    "type": transaction_type,
+                    "credit_type_id": credit_type["id"],
+                    "description": "liabilities",
+                    "issuer": "test",
+                    "payload": {"amount": amount},
+                },
+            )
+            assert response.status_code == 200
+        liability = (await get_liabilities())[credit_type["id"]]
+        assert liability["available"] == 70
+        assert liability["held"] == 30
+
+        await liabilities_service.snapshot_liabilities()
+        end_date = datetime.now(tz=timezone.utc)
+        response = await client.get(
+            f"{self.base_url}/insights/credits/liabilities/history",
+            params={
+                "start_date": (end_date - timedelta(days=1)).isoformat(),
+                "end_date": end_date.isoformat(),
+            },
+            headers={"Cache-Control": "no-cache"},
+        )
+        assert response.status_code == 200
+        assert {
+            **liability,
+            "day": end_date.date().isoformat(),
+        } in response.json()
+
+    async def test_trending_wallets_from_redis(self, client: httpx.AsyncClient):
+        await insights_service.backfill_trending_wallets()
+        end_date = datetime.now(tz=timezone.utc)
+        params = {
+            "start_date": (end_date - timedelta(days=7)).isoformat(),
+            "end_date": end_date.isoformat(),
+            "limit": 100,
+        }
+        start_date, end_date = insights_service.snap_date_range(
+            end_date - timedelta(days=7), end_date
+        )
+
+        async def get_trending_wallets():
+            response = await client.get(
+                f"{self.base_url}/insights/wallets/trending",
+                params=params,
+                headers={"Cache-Control": "no-cache"},
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        assert await TrendingWallets().get_top(start_date, end_date, 100) is not None
+        async with db_session(read_only=True) as session_ctx:
+            expected = await insights_db.get_trending_wallets(
+                session_ctx.session, start_date, end_date, limit=100
+            )
+        assert expected
+        assert await get_trending_wallets() == [
+            wallet.model_dump() for wallet in expected
+        ]
+
+        # Transactions count as soon as they are written
+        wallet = await create_wallet(client, self.base_url)
+        credit_type = await create_credit_type(client, self.base_url)
+        response = await client.post(
+            f"{self.base_url}/wallets/{wallet['id']}/deposit",
+            json={
+                "type": "deposit",
+                "credit_type_id": credit_type["id"],
+                "description": "trending",
+                "issuer": "test",
+                "payload": {"amount": 1},
+            },
+        )
+        assert response.status_code == 200
+        assert {
+            "wallet_id": wallet["id"],
+            "wallet_name": wallet["name"],
+            "transaction_count": 1,
+        } in await get_trending_wallets()
+
+    @pytest.mark.parametrize(
+        "granularity", [TimeGranularity.DAY.value, TimeGranularity.WEEK.value]
+    )
+    async def test_active_wallets_from_redis(
+        self, client: httpx.AsyncClient, granularity: str
+    ):
+        await insights_service.backfill_active_wallets()
+        end_date = datetime.now(tz=timezone.utc)
+        start_date = end_date - timedelta(days=30)
+        response = await client.get(
+            f"{self.base_url}/insights/credits/active-wallets",
+            params={
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+                "granularity": granularity,
+            },
+            headers={"Cache-Control": "no-cache"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["approximate"] is True
+        assert data["standard_error"] == STANDARD_ERROR
+
+        async with db_session(read_only=True) as session_ctx:
+            expected = await insights_db.get_active_wallets_aggregation(
+                session_ctx.session,
+                datetime.fromisoformat(data["start_date"]),
+                datetime.fromisoformat(data["end_date"]),
+                TimeGranularity(granularity),
+            )
+        assert expected
+        assert [
+            {
+                **point,
+                "active_wallets": pytest.approx(point["active_wallets"], rel=0.05),
+            }
+            for point in data["points"]
+        ] == [point.model_dump(mode="json") for point in expected]
+
+    async def test_debit_distribution_from_redis(self, client: httpx.AsyncClient):
+        await insights_service.backfill_debit_sketches()
+        end_date = datetime.now(tz=timezone.utc)
+        start_date = end_date - timedelta(days=30)
+        response = await client.get(
+            f"{self.base_url}/insights/credit-types/distribution",
+            params={
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+                "granularity": TimeGranularity.DAY.value,
+            },
+            headers={"Cache-Control": "no-cache"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["relative_accuracy"] == RELATIVE_ACCURACY
+        assert data["points"]
+
+        async with db_session(read_only=True) as session_ctx:
+            debits = await session_ctx.session.execute(
+                select(
+                    TransactionDBModel.created_at,
+                    TransactionDBModel.credit_type_id,
+                    TransactionDBModel.amount,
+                ).where(
+                    TransactionDBModel.type == TransactionType.DEBIT,
+                    TransactionDBModel.created_at
+                    >= datetime.fromisoformat(data["start_date"]),
+                    TransactionDBModel.created_at
+                    < datetime.fromisoformat(data["end_date"]),
+                )
+            )
+        amounts = defaultdict(list)
+        for created_at, credit_type_id, amount in debits:
+            amounts[(day_start(created_at), credit_type_id)].append(amount)
+        assert len(data["points"]) == len(amounts)
+
+        for point in data["points"]:
+            day = datetime.fromisoformat(point["timestamp"])
+            day_amounts = sorted(amounts[(day, point["credit_type_id"])])
+            assert point["debit_count"] == len(day_amounts)
+            for key, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                exact = day_amounts[int(q * (len(day_amounts) - 1))]
+                assert point[key] == pytest.approx(exact, rel=RELATIVE_ACCURACY)
+
+    async def test_sub_hour_date_range(self, client: httpx.AsyncClient):
+        start_date, end_date = insights_service.snap_date_range(
+            datetime(2024, 1, 1, 10, 15, tzinfo=timezone.utc),
+            datetime(2024, 1, 1, 10, 45, tzinfo=timezone.utc),
+        )
+        assert start_date == datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+        assert end_date == datetime(2024, 1, 1, 11, tzinfo=timezone.utc)
+
+        wallet = await create_wallet(client, self.base_url)
+        credit_type = await create_credit_type(client, self.base_url)
+        for transaction_type, amount in [("deposit", 10), ("debit", 3)]:
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet['id']}/{transaction_type}",
+                json={
+                    "type": transaction_type,
+                    "credit_type_id": credit_type["id"],
+                    "description": "sub hour",
+                    "issuer": "test",
+                    "payload": {"amount": amount},
+                },
+            )
+            assert response.status_code == 200
+        debited_at = datetime.fromisoformat(response.json()["created_at"])
+
+        # A range within an hour still covers its transactions
+        response = await client.get(
+            f"{self.base_url}/insights/credits/usage-summary",
+            params={
+                "start_date": (debited_at - timedelta(seconds=1)).isoformat(),
+                "end_date": (debited_at + timedelta(seconds=1)).isoformat(),
+            },
+            headers={"Cache-Control": "no-cache"},
+        )
+        assert response.status_code == 200
+        usage = {row["credit_type_id"]: row for row in response.json()}
+        assert usage[credit_type["id"]]["debits_amount"] == 3
+
+    async def test_cached_sub_hour_date_ranges(self, client: httpx.AsyncClient):
+        wallet = await create_wallet(client, self.base_url)
+        credit_type = await create_credit_type(client, self.base_url)
+        now = datetime.now(tz=timezone.utc)
+        hour = insights_service.snap_date_range(now, now)[0] - timedelta(days=1)
+        for minutes, amount in [(0, 10), (10, 3), (40, 5)]:
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet['id']}/"
+                + ("deposit" if minutes == 0 else "debit"),
+                json={
+                    "type": "deposit" if minutes == 0 else "debit",
+                    "credit_type_id": credit_type["id"],
+                    "description": "sub hour cache",
+                    "issuer": "test",
+                    "payload": {"amount": amount},
+                },
+            )
+            assert response.status_code == 200
+            async with db_session() as session_ctx:
+                await session_ctx.session.execute(
+                    update(TransactionDBModel)
+                    .where(TransactionDBModel.id == response.json()["id"])
+                    .values(created_at=hour + timedelta(minutes=minutes))
+                )
+
+        async def debits_amount(end_minutes: int, headers=None) -> float:
+            # Unique to the run, not served from the cache of a previous one
+            end_date = hour + timedelta(
+                minutes=end_minutes, microseconds=now.microsecond
+            )
+            response = await client.get(
+                f"{self.base_url}/insights/credits/usage-summary",
+                params={
+                    "start_date": (hour + timedelta(minutes=5)).isoformat(),
+                    "end_date": end_date.isoformat(),
+                },
+                headers=headers,
+            )
+            assert response.status_code == 200
+            usage = {row["credit_type_id"]: row for row in response.json()}
+            return usage[credit_type["id"]]["debits_amount"]
+
+        # Both ranges snap to the same hour, each is cached on its own
+        assert await debits_amount(20, {"Cache-Control": "no-cache"}) == 3
+        assert await debits_amount(50) == 8
+        assert await debits_amount(20) == 3
+
+    async def test_active_wallets_hourly_rejected(self, client: httpx.AsyncClient):
+        end_date = datetime.now(tz=timezone.utc)
+        response = await client.get(
+            f"{self.base_url}/insights/credits/active-wallets",
+            params={
+                "start_date": (end_date - timedelta(days=1)).isoformat(),
+                "end_date": end_date.isoformat(),
+                "granularity": TimeGranularity.HOUR.value,
+            },
+        )
+        assert response.status_code == 422
+
+
+def _points(response):
+    return response["points"] if isinstance(response, dict) else response
+
+
+def _approx_points(response):
+    """The points of an insights response, with amounts compared approximately"""
+
+    def approx(value):
+        if isinstance(value, dict):
+            return {key: approx(item) for key, item in value.items()}
+        return pytest.approx(value) if isinstance(value, float) else value
+
+    return [approx(point) for point in _points(response)]
@@ -0,0 +1,196 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import func, update
+
+from src.core.settings import settings
+from src.models.balances import BalanceDBModel
+from src.models.transactions import TransactionDBModel
+from src.models.wallets import CreateWalletRequest
+from src.utils.ctx_managers import db_session
+
+pytestmark = pytest.mark.anyio
+
+
+class TestReconciliation:
+    base_url = settings.API_V1_STR
+
+    async def setup_wallet_and_credit_type(self, client: AsyncClient):
+        wallet_request = CreateWalletRequest(
+            name="test_reconciliation_wallet", context={"user_id": str(uuid4())}
+        )
+        wallet_response = await client.post(
+            f"{self.base_url}/wallets/", json=wallet_request.model_dump()
+        )
+        credit_type_response = await client.post(
+            f"{self.base_url}/credit-types",
+            json={
+                "name": f"test_reconciliation_credit_type_{uuid4()}",
+                "description": "Test credit type for reconciliation tests",
+            },
+        )
+        return wallet_response.json()["id"], credit_type_response.json()["id"]
+
+    async def create_transaction(
+        self,
+        client: AsyncClient,
+        wallet_id: str,
+        credit_type_id: str,
+        transaction_type: str,
+        payload: dict,
+    ) -> dict:
+        response = await client.post(
+            f"{self.base_url}/wallets/{wallet_id}/{transaction_type}",
+            json={
+                "credit_type_id": credit_type_id,
+                "description": "reconciliation",
+                "issuer": "test_user",
+                "payload": {"type": transaction_type, **payload},
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()
+
+    def find_drift(self, report: dict, wallet_id: str) -> dict | None:
+        return next(
+            (drift for drift in report["drifts"] if drift["wallet_id"] == wallet_id),
+            None,
+        )
+
+    async def test_reconcile_balances(self, client: AsyncClient):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        args = (client, wallet_id, credit_type_id)
+        await self.create_transaction(*args, "deposit", {"amount": 100})
+        hold = await self.create_transaction(*args, "hold", {"amount": 30})
+        await self.create_transaction(
+            *args, "debit", {"amount": 20, "hold_transaction_id": hold["id"]}
+        )
+        hold = await self.create_transaction(*args, "hold", {"amount": 10})
+        await self.create_transaction(
+            *args, "release", {"hold_transaction_id": hold["id"]}
+        )
+        await self.create_transaction(*args, "debit", {"amount": 5})
+        await self.create_transaction(
+            *args, "adjust", {"amount": 50, "reset_spent": True}
+        )
+        await self.create_transaction(*args, "hold", {"amount": 15})
+        await self.create_transaction(*args, "debit", {"amount": 5})
+
+        response = await client.post(f"{self.base_url}/admin/reconciliation")
+        assert response.status_code == status.HTTP_200_OK
+        report = response.json()
+        assert report["balances_checked"] >= 1
+        assert self.find_drift(report, wallet_id) is None
+
+        # Simulate a balance update lost after its transaction completed
+        async with db_session() as session_ctx:
+            await session_ctx.session.execute(
+                update(BalanceDBModel)
+                .where(
+                    BalanceDBModel.wallet_id == wallet_id,
+                    BalanceDBModel.credit_type_id == credit_type_id,
+                )
+                .values(available=40, spent=0)
+            )
+
+        response = await client.post(f"{self.base_url}/admin/reconciliation")
+        drift = self.find_drift(response.json(), wallet_id)
+        assert drift == {
+            "wallet_id": wallet_id,
+            "credit_type_id": credit_type_id,
+            "available": 40,
+            "held": 15,
+            "spent": 0,
+            "overall_spent": 30,
+            "expected_available": 30,
+            "expected_held": 15,
+            "expected_spent": 5,
+            "expected_overall_spent": 30,
+            "repaired": False,
+        }
+
+        response = await client.post(
+            f"{self.base_url}/admin/reconciliation", params={"repair": True}
+        )
+        report = response.json()
+        assert self.find_drift(report, wallet_id)["repaired"]
+        assert report["balances_repaired"] == report["balances_drifted"]
+
+        response = await client.get(f"{self.base_url}/wallets/{wallet_id}")
+        balance = response.json()["balances"][0]
+        assert balance["available"] == 30
+        assert balance["held"] == 15
+        assert balance["spent"] == 5
+        assert balance["overall_spent"] == 30
+
+        response = await client.post(f"{self.base_url}/admin/reconciliation")
+        assert response.json()["balances_drifted"] == 0
+
+    async def test_reconcile_adjust_completed_late(self, client: AsyncClient):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        args = (client, wallet_id, credit_type_id)
+        await self.create_transaction(*args, "deposit", {"amount": 100})
+        deposit = await self.create_transaction(*args, "deposit", {"amount": 10})
+        adjust = await self.create_transaction(*args, "adjust", {"amount": 50})
+
+        # The ADJUST was created before the deposit but completed after it, so
+        # it overrides the deposit
+        created_at = datetime.fromisoformat(deposit["created_at"])
+        async with db_session() as session_ctx:
+            await session_ctx.session.execute(
+                update(TransactionDBModel)
+                .where(TransactionDBModel.id == adjust["id"])
+                .values(created_at=created_at - timedelta(seconds=1))
+            )
+
+        response = await client.post(f"{self.base_url}/admin/reconciliation")
+        assert response.status_code == status.HTTP_200_OK
+        assert self.find_drift(response.json(), wallet_id) is None
+
+        response = await client.get(f"{self.base_url}/wallets/{wallet_id}")
+        assert response.json()["balances"][0]["available"] == 50
+
+    async def test_repair_low_balance_since(self, client: AsyncClient):
+        wallet_id, _ = await self.setup_wallet_and_credit_type(client)
+        response = await client.post(
+            f"{self.base_url}/credit-types",
+            json={
+                "name": f"test_reconciliation_low_balance_{uuid4()}",
+                "description": "Low below 50 credits",
+                "low_balance_threshold": 50,
+            },
+        )
+        credit_type_id = response.json()["id"]
+        args = (client, wallet_id, credit_type_id)
+        await self.create_transaction(*args, "deposit", {"amount": 100})
+
+        async def corrupt_and_repair(**values) -> dict:
+            async with db_session() as session_ctx:
+                await session_ctx.session.execute(
+                    update(BalanceDBModel)
+                    .where(
+                        BalanceDBModel.wallet_id == wallet_id,
+                        BalanceDBModel.credit_type_id == credit_type_id,
+                    )
+                    .values(**values)
+                )
+            response = await client.post(
+                f"{self.base_url}/admin/reconciliation", params={"repair": True}
+            )
+            assert self.find_drift(response.json(), wallet_id)["repaired"]
+            response = await client.get(f"{self.base_url}/wallets/{wallet_id}")
+            return response.json()["balances"][0]
+
+        # Repaired back above the threshold, no longer low
+        balance = await corrupt_and_repair(available=10, low_balance_since=func.now())
+        assert balance["available"] == 100
+        assert balance["low_balance_since"] is None
+
+        await self.create_transaction(*args, "debit", {"amount": 60})
+        # Repaired back below the threshold, low again
+        balance = await corrupt_and_repair(available=100, low_balance_since=None)
+        assert balance["available"] == 40
+        assert balance["low_balance_since"] is not None
@@ -0,0 +1,267 @@
+import json
+from uuid import uuid4
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from src.core.settings import settings
+from src.db import transaction_imports as imports_db
+from src.models.wallets import CreateWalletRequest
+from src.services import transaction_imports_service
+
+pytestmark = pytest.mark.anyio
+
+
+class TestTransactionImports:
+    base_url = settings.API_V1_STR
+
+    async def setup_wallet_and_credit_type(self, client: AsyncClient):
+        wallet_request = CreateWalletRequest(
+            name="test_import_wallet", context={"user_id": str(uuid4())}
+        )
+        wallet_response = await client.post(
+            f"{self.base_url}/wallets/", json=wallet_request.model_dump()
+        )
+        credit_type_response = await client.post(
+            f"{self.base_url}/credit-types",
+            json={
+                "name": f"test_import_credit_type_{uuid4()}",
+                "description": "Test credit type for import tests",
+            },
+        )
+        return wallet_response.json()["id"], credit_type_response.json()["id"]
+
+    async def import_transactions(
+        self, client: AsyncClient, body: str, import_format: str
+    ) -> dict:
+        # Background tasks complete before the response is returned by the
+        # test transport, so the import is processed once the call returns
+        response = await client.post(
+            f"{self.base_url}/admin/imports",
+            params={"format": import_format},
+            content=body.encode(),
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        import_id = response.json()["id"]
+        response = await client.get(f"{self.base_url}/admin/imports/{import_id}")
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()
+
+    async def get_balance(
+        self, client: AsyncClient, wallet_id: str, credit_type_id: str
+    ) -> dict:
+        response = await client.get(f"{self.base_url}/wallets/{wallet_id}")
+        return next(
+            balance
+            for balance in response.json()["balances"]
+            if balance["credit_type_id"] == credit_type_id
+        )
+
+    async def test_import_ndjson(self, client: AsyncClient):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        hold_id, released_hold_id = str(uuid4()), str(uuid4())
+        external_id = f"import_{uuid4()}"
+        common = {
+            "wallet_id": wallet_id,
+            "credit_type_id": credit_type_id,
+            "description": "imported",
+        }
+        rows = [
+            {
+                **common,
+                "type": "deposit",
+                "external_id": external_id,
+                "payload": {"amount": 100},
+                "context": {"source": "import"},
+                "created_at": "2024-01-01T00:00:00Z",
+            },
+            {
+                **common,
+                "id": hold_id,
+                "type": "hold",
+                "payload": {"amount": 30},
+                "created_at": "2024-01-02T00:00:00Z",
+            },
+            {
+                **common,
+                "type": "debit",
+                "payload": {"amount": 20, "hold_transaction_id": hold_id},
+                "created_at": "2024-01-03T00:00:00Z",
+            },
+            {
+                **common,
+                "id": released_hold_id,
+                "type": "hold",
+                "payload": {"amount": 10},
+                "created_at": "2024-01-04T00:00:00Z",
+            },
+            {
+                **common,
+                "type": "release",
+                "payload": {"hold_transaction_id": released_hold_id},
+                "created_at": "2024-01-05T00:00:00Z",
+            },
+        ]
+        body = "\n".join(json.dumps(row) for row in rows) + "\n"
+
+        transaction_import = await self.import_transactions(client, body, "ndjson")
+        assert transaction_import["status"] == "completed"
+        assert transaction_import["rows_staged"] == 5
+        assert transaction_import["rows_imported"] == 5
+        assert transaction_import["balances_recomputed"] == 1
+        assert transaction_import["errors"] == []
+
+        balance = await self.get_balance(client, wallet_id, credit_type_id)
+        assert balance["available"] == 80
+        assert balance["held"] == 0
+        assert balance["spent"] == 20
+        assert balance["overall_spent"] == 20
+
+        response = await client.get(f"{self.base_url}/transactions/{hold_id}")
+        assert response.json()["hold_status"] == "used"
+        response = await client.get(f"{self.base_url}/transactions/{released_hold_id}")
+        assert response.json()["hold_status"] == "released"
+        response = await client.get(
+            f"{self.base_url}/transactions/",
+            params={
+                "external_id": external_id,
+                "start_date": "2024-01-01T00:00:00Z",
+            },
+        )
+        transaction = response.json()["data"][0]
+        assert transaction["context"] == {"source": "import"}
+        assert transaction["description"] == "imported"
+
+        # Rows without an id are new transactions, which reuse the external_id
+        transaction_import = await self.import_transactions(client, body, "ndjson")
+        assert transaction_import["status"] == "failed"
+        assert {error["reason"] for error in transaction_import["errors"]} == {
+            "external_id used by another transaction"
+        }
+
+    async def test_import_csv(self, client: AsyncClient):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        transaction_id = str(uuid4())
+        row = f"{transaction_id},DEPOSIT,{wallet_id},{credit_type_id},csv"
+        body = (
+            "\ufeffid,type,wallet_id,credit_type_id,description,payload\n"
+            f'{row},"{{""amount"": 50}}"\n'
+            f'{row},"{{""amount"": 70}}"\n'
+        )
+        transaction_import = await self.import_transactions(client, body, "csv")
+        assert transaction_import["status"] == "failed"
+        assert transaction_import["rows_invalid"] == 2
+        assert transaction_import["errors"] == [
+            {"line": 1, "reason": "duplicate id"},
+            {"line": 2, "reason": "duplicate id"},
+        ]
+
+        body = "\n".join(body.splitlines()[:2]) + "\n"
+        transaction_import = await self.import_transactions(client, body, "csv")
+        assert transaction_import["status"] == "completed"
+        balance = await self.get_balance(client, wallet_id, credit_type_id)
+        assert balance["available"] == 50
+
+        # Rows with the id of an existing transaction replace it
+        body = body.replace('""amount"": 50', '""amount"": 70')
+        transaction_import = await self.import_transactions(client, body, "csv")
+        assert transaction_import["status"] == "completed"
+        balance = await self.get_balance(client, wallet_id, credit_type_id)
+        assert balance["available"] == 70
+
+    async def test_import_invalid_rows(self, client: AsyncClient):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        rows = [
+            {
+                "type": "deposit",
+                "wallet_id": str(uuid4()),
+                "credit_type_id": credit_type_id,
+                "description": "imported",
+                "payload": {"amount": 100},
+            },
+            {
+                "type": "deposit",
+                "wallet_id": wallet_id,
+                "credit_type_id": credit_type_id,
+                "description": "imported",
+                "payload": {"amount": -1},
+            },
+        ]
+        body = "\n".join(json.dumps(row) for row in rows)
+        transaction_import = await self.import_transactions(client, body, "ndjson")
+        assert transaction_import["status"] == "failed"
+        assert transaction_import["rows_imported"] == 0
+        assert transaction_import["errors"] == [
+            {"line": 1, "reason": "unknown wallet"},
+            {"line": 2, "reason": "invalid amount"},
+        ]
+
+        response = await client.get(f"{self.base_url}/wallets/{wallet_id}")
+        assert response.json()["balances"] == []
+
+        response = await client.post(
+            f"{self.base_url}/admin/imports",
+            params={"format": "ndjson"},
+            content=b'{"type": "deposit", "amount": 1}\n',
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"] == "Line 1: unknown fields amount"
+
+    async def test_import_failed_midway(
+        self, client: AsyncClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        rows = [
+            {
+                "type": "deposit",
+                "wallet_id": wallet_id,
+                "credit_type_id": credit_type_id,
+                "description": "imported",
+                "payload": {"amount": 100},
+            }
+        ] * 2
+        body = "\n".join(json.dumps(row) for row in rows)
+
+        upsert = imports_db.upsert_staged_transactions
+        recompute = transaction_imports_service._recompute_staged_balances
+
+        async def fail_second_batch(first_line, **kwargs):
+            if first_line > 1:
+                raise RuntimeError("Batch failed")
+            return await upsert(first_line=first_line, **kwargs)
+
+        async def fail_recompute(*args, **kwargs):
+            raise RuntimeError("Recompute failed")
+
+        monkeypatch.setattr(transaction_imports_service, "IMPORT_BATCH_SIZE", 1)
+        monkeypatch.setattr(imports_db, "upsert_staged_transactions", fail_second_batch)
+        monkeypatch.setattr(
+            transaction_imports_service, "_recompute_staged_balances", fail_recompute
+        )
+        # The first batch is committed, its balance is left pending
+        transaction_import = await self.import_transactions(client, body, "ndjson")
+        assert transaction_import["status"] == "failed"
+        assert transaction_import["rows_imported"] == 1
+        assert transaction_import["balances_pending"] is True
+
+        monkeypatch.setattr(
+            transaction_imports_service, "_recompute_staged_balances", recompute
+        )
+        response = await client.post(
+            f"{self.base_url}/admin/imports/{transaction_import['id']}"
+            "/recompute-balances"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["balances_pending"] is False
+        assert response.json()["balances_recomputed"] == 1
+        balance = await self.get_balance(client, wallet_id, credit_type_id)
+        assert balance["available"] == 100
+
+        # Without a recompute failure, the committed batch is recomputed
+        # right away
+        transaction_import = await self.import_transactions(client, body, "ndjson")
+        assert transaction_import["status"] == "failed"
+        assert transaction_import["balances_pending"] is False
+        balance = await self.get_balance(client, wallet_id, credit_type_id)
+        assert balance["available"] == 200
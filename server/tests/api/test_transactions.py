@@ -1,10 +1,18 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from functools import partial
 from uuid import uuid4
 
+import httpx
 import pytest
 from fastapi import status
 from httpx import AsyncClient
+from redis.exceptions import RedisError
 
 from src.core.settings import settings
+from src.db.expressions import PromotedContextKeys
 from src.models.transactions import (
     AdjustTransactionRequest,
     AdjustTransactionRequestPayload,
@@ -19,6 +27,7 @@ from src.models.transactions import (
     ReleaseTransactionRequestPayload,
 )
 from src.models.wallets import CreateWalletRequest
+from src.services import low_balance_service
 from src.utils.constants import (
     BALANCE_NOT_FOUND_ERROR,
     DUPLICATE_TRANSACTION_ERROR,
@@ -27,6 +36,7 @@ from src.utils.constants import (
     HOLD_TRANSACTION_NOT_HELD_ERROR,
     INSUFFICIENT_BALANCE_ERROR,
 )
+from src.utils.trending_wallets import TrendingWallets
 
 pytestmark = pytest.mark.anyio
 
@@ -148,6 +158,62 @@ class TestTransactions:
         assert balance.get("held") == 0
         assert balance.get("overall_spent") == 50
 
+    async def test_debit_spend_stats(self, client: AsyncClient):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        credit_request = DepositTransactionRequest(
+            credit_type_id=credit_type_id,
+            description="Initial credit",
+            payload=DepositTransactionRequestPayload(amount=1000),
+            issuer="test_user",
+        )
+        await client.post(
+            f"{self.base_url}/wallets/{wallet_id}/deposit",
+            json=credit_request.model_dump(),
+        )
+
+        async def debit(amount: float) -> dict:
+            debit_request = DebitTransactionRequest(
+                credit_type_id=credit_type_id,
+                description="Test debit transaction",
+                payload=DebitTransactionRequestPayload(amount=amount),
+                issuer="test_user",
+            )
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet_id}/debit",
+                json=debit_request.model_dump(),
+            )
+            assert response.status_code == status.HTTP_200_OK
+            wallet_response = await client.get(f"{self.base_url}/wallets/{wallet_id}")
+            return self.find_balance(wallet_response.json()["balances"], credit_type_id)
+
+        window = settings.BURN_RATE_WINDOW_DAYS
+        balance = await debit(10)
+        assert balance["burn_rate"] == pytest.approx(10 / window, rel=1e-3)
+        assert balance["spend_zscore"] is None
+
+        # No spread between the debits yet
+        balance = await debit(20)
+        assert balance["spend_zscore"] is None
+
+        # Mean 11 and variance 9 after the first two debits
+        balance = await debit(50)
+        assert balance["spend_zscore"] == pytest.approx((50 - 11) / 3)
+        assert balance["burn_rate"] == pytest.approx(80 / window, rel=1e-3)
+        depletion_at = datetime.fromisoformat(balance["estimated_depletion_at"])
+        expected = datetime.now(timezone.utc) + timedelta(days=920 * window / 80)
+        assert abs(depletion_at - expected) < timedelta(hours=1)
+
+        response = await client.get(
+            f"{self.base_url}/insights/wallets/depletion",
+            params={"limit": 100},
+            headers={"Cache-Control": "no-cache"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        depletion_dates = [
+            balance["estimated_depletion_at"] for balance in response.json()
+        ]
+        assert depletion_dates == sorted(depletion_dates)
+
     async def test_insufficient_balance_debit(self, client: AsyncClient):
         wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
 
@@ -676,6 +742,283 @@ class TestTransactions:
         assert transaction_response.status_code == status.HTTP_200_OK
         assert transaction_response.json()["id"] == transaction_id
 
+    async def test_insights_redis_failure(
+        self, client: AsyncClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+
+        async def fail(*args, **kwargs):
+            raise RedisError("Redis is down")
+
+        monkeypatch.setattr(TrendingWallets, "record", fail)
+        # The insights are best effort, the transaction still completes
+        response = await client.post(
+            f"{self.base_url}/wallets/{wallet_id}/deposit",
+            json=DepositTransactionRequest(
+                credit_type_id=credit_type_id,
+                description="Redis failure",
+                payload=DepositTransactionRequestPayload(amount=10),
+                issuer="test_user",
+            ).model_dump(),
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["status"] == "completed"
+
+    async def test_insights_record_completed_transactions(
+        self, client: AsyncClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        recorded = []
+
+        async def record(self, wallet_id: str, created_at: datetime):
+            recorded.append(wallet_id)
+
+        monkeypatch.setattr(TrendingWallets, "record", record)
+        response = await client.post(
+            f"{self.base_url}/wallets/{wallet_id}/deposit",
+            json=DepositTransactionRequest(
+                credit_type_id=credit_type_id,
+                description="Recorded deposit",
+                payload=DepositTransactionRequestPayload(amount=20),
+                issuer="test_user",
+            ).model_dump(),
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert recorded == [wallet_id]
+
+        # The failed debit is never counted
+        response = await client.post(
+            f"{self.base_url}/wallets/{wallet_id}/debit",
+            json=DebitTransactionRequest(
+                credit_type_id=credit_type_id,
+                description="Failed debit",
+                payload=DebitTransactionRequestPayload(amount=50),
+                issuer="test_user",
+            ).model_dump(),
+        )
+        assert response.status_code == status.HTTP_402_PAYMENT_REQUIRED
+        assert recorded == [wallet_id]
+
+    async def test_transaction_response_fields(self, client: AsyncClient):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+
+        credit_request = DepositTransactionRequest(
+            credit_type_id=credit_type_id,
+            description="Initial credit",
+            payload=DepositTransactionRequestPayload(amount=100),
+            issuer="test_user",
+        )
+        response = await client.post(
+            f"{self.base_url}/wallets/{wallet_id}/deposit",
+            json=credit_request.model_dump(),
+        )
+        assert response.status_code == status.HTTP_200_OK
+        expected_snapshot = {
+            "available": 100,
+            "held": 0,
+            "spent": 0,
+            "overall_spent": 0,
+        }
+        assert response.json()["description"] == "Initial credit"
+        assert response.json()["payload"] == {"type": "deposit", "amount": 100}
+        assert response.json()["balance_snapshot"] == expected_snapshot
+
+        transaction_response = await client.get(
+            f"{self.base_url}/transactions/{response.json()['id']}"
+        )
+        assert transaction_response.json()["description"] == "Initial credit"
+        assert transaction_response.json()["balance_snapshot"] == expected_snapshot
+
+    async def test_list_transactions_by_context(self, client: AsyncClient):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        org_id = str(uuid4())
+
+        for context in [
+            {"org_id": org_id, "source": "api"},
+            {"org_id": org_id, "source": "import"},
+            {"org_id": str(uuid4()), "source": "api"},
+        ]:
+            deposit_request = DepositTransactionRequest(
+                credit_type_id=credit_type_id,
+                description="Context credit",
+                payload=DepositTransactionRequestPayload(amount=10),
+                issuer="test_user",
+                context=context,
+            )
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet_id}/deposit",
+                json=deposit_request.model_dump(),
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()["context"] == context
+
+        # org_id is a promoted context key, source is not
+        response = await client.get(
+            f"{self.base_url}/transactions/",
+            params={"context": f"[org_id={org_id}]"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["total_count"] == 2
+
+        response = await client.get(
+            f"{self.base_url}/transactions/",
+            params={"context": f"[org_id={org_id},source=api]"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["total_count"] == 1
+        assert response.json()["data"][0]["context"] == {
+            "org_id": org_id,
+            "source": "api",
+        }
+
+    async def test_list_transactions_by_typed_context(
+        self, client: AsyncClient, monkeypatch
+    ):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        org_id = uuid4().int % 10**12
+        for context in [{"org_id": org_id}, {"org_id": str(org_id)}, {"org_id": True}]:
+            deposit_request = DepositTransactionRequest(
+                credit_type_id=credit_type_id,
+                description="Typed context credit",
+                payload=DepositTransactionRequestPayload(amount=10),
+                issuer="test_user",
+                context=context,
+            )
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet_id}/deposit",
+                json=deposit_request.model_dump(),
+            )
+            assert response.status_code == status.HTTP_200_OK
+
+        async def contexts(filters: str) -> list:
+            response = await client.get(
+                f"{self.base_url}/transactions/",
+                params={"wallet_id": wallet_id, "context": filters},
+            )
+            assert response.status_code == status.HTTP_200_OK
+            return sorted(str(t["context"]["org_id"]) for t in response.json()["data"])
+
+        # Filters match the same transactions through the promoted key indexes
+        # and as any other key
+        assert "org_id" in PromotedContextKeys().get("transactions")
+        for promoted in [True, False]:
+            if not promoted:
+                monkeypatch.setattr(PromotedContextKeys(), "_keys", {})
+            assert await contexts(f"[org_id={org_id}]") == [str(org_id)] * 2
+            assert await contexts("[org_id=true]") == ["True"]
+
+    async def test_low_balance_notifications(self, client: AsyncClient, monkeypatch):
+        wallet_id, _ = await self.setup_wallet_and_credit_type(client)
+        response = await client.post(
+            f"{self.base_url}/credit-types",
+            json={
+                "name": "test_low_balance_credit_type",
+                "description": "Notified below 50 credits",
+                "low_balance_threshold": 50,
+            },
+        )
+        credit_type_id = response.json()["id"]
+
+        async def transact(kind, request_type, payload_type, amount):
+            request = request_type(
+                credit_type_id=credit_type_id,
+                description=f"Low balance {kind}",
+                payload=payload_type(amount=amount),
+                issuer="test_user",
+            )
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet_id}/{kind}",
+                json=request.model_dump(),
+            )
+            assert response.status_code == status.HTTP_200_OK
+
+        deposit = (DepositTransactionRequest, DepositTransactionRequestPayload)
+        debit = (DebitTransactionRequest, DebitTransactionRequestPayload)
+        hold = (HoldTransactionRequest, HoldTransactionRequestPayload)
+        await transact("deposit", *deposit, 100)
+        await transact("debit", *debit, 60)  # crosses, 40 left
+        await transact("debit", *debit, 10)  # still below
+        await transact("deposit", *deposit, 100)  # back above, 130
+        await transact("hold", *hold, 100)  # crosses again, 30 left
+
+        # The threshold of the balance overrides the one of the credit type
+        response = await client.put(
+            f"{self.base_url}/wallets/{wallet_id}/balances/{credit_type_id}"
+            "/low-balance-threshold",
+            json={"low_balance_threshold": 10},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["low_balance_since"] is None
+        await transact("debit", *debit, 15)  # 15 left, above 10
+
+        deliveries = []
+
+        def webhook(request: httpx.Request) -> httpx.Response:
+            notifications = json.loads(request.content)["notifications"]
+            deliveries.append([n for n in notifications if n["wallet_id"] == wallet_id])
+            return httpx.Response(500 if len(deliveries) == 1 else 200)
+
+        monkeypatch.setattr(settings, "LOW_BALANCE_WEBHOOK_URL", "http://webhook")
+        monkeypatch.setattr(settings, "LOW_BALANCE_WEBHOOK_RETRY_SECONDS", 0)
+        monkeypatch.setattr(
+            low_balance_service.httpx,
+            "AsyncClient",
+            partial(httpx.AsyncClient, transport=httpx.MockTransport(webhook)),
+        )
+        # The first delivery fails, the notifications are delivered again
+        await low_balance_service.deliver_low_balance_notifications()
+        await low_balance_service.deliver_low_balance_notifications()
+        failed, delivered = deliveries
+        assert [n["available"] for n in delivered] == [40, 30]
+        assert [n["id"] for n in delivered] == [n["id"] for n in failed]
+        assert len({n["id"] for n in delivered}) == 2
+
+        await low_balance_service.deliver_low_balance_notifications()
+        assert all(not batch for batch in deliveries[2:])
+
+    async def test_export_transactions(self, client: AsyncClient):
+        wallet_id, credit_type_id = await self.setup_wallet_and_credit_type(client)
+        transaction_ids = []
+        for amount in [10, 20, 30]:
+            deposit_request = DepositTransactionRequest(
+                credit_type_id=credit_type_id,
+                description="Exported credit",
+                payload=DepositTransactionRequestPayload(amount=amount),
+                issuer="test_user",
+            )
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet_id}/deposit",
+                json=deposit_request.model_dump(),
+            )
+            transaction_ids.append(response.json()["id"])
+
+        response = await client.get(
+            f"{self.base_url}/transactions/export",
+            params={"wallet_id": wallet_id, "order_by": "asc"},
+            headers={"Accept-Encoding": "identity"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "content-encoding" not in response.headers
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == transaction_ids
+        assert [row["payload"]["amount"] for row in rows] == [10, 20, 30]
+        assert rows[-1]["balance_snapshot"]["available"] == 60
+
+        response = await client.get(
+            f"{self.base_url}/transactions/export",
+            params={"wallet_id": wallet_id, "order_by": "asc", "format": "csv"},
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.headers["content-encoding"] == "gzip"
+        # httpx transparently decodes the gzip body
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["id"] for row in rows] == transaction_ids
+        assert [json.loads(row["payload"])["amount"] for row in rows] == [10, 20, 30]
+        assert rows[0]["description"] == "Exported credit"
+
     @pytest.mark.parametrize(
         "transaction_type,request_class,payload_class",
         [
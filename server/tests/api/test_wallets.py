@@ -1,10 +1,27 @@
-from uuid import uuid4
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
 
 import httpx
 import pytest
+from sqlalchemy import update
 
 from src.core.settings import settings
+from src.db.expressions import PromotedContextKeys
+from src.models.transactions import (
+    DebitTransactionRequest,
+    DebitTransactionRequestPayload,
+    DepositTransactionRequest,
+    DepositTransactionRequestPayload,
+    TransactionDBModel,
+)
 from src.models.wallets import CreateWalletRequest, UpdateWalletRequest
+from src.services import balance_checkpoints_service
+from src.utils.balance_events import RESET, BalanceEvents
+from src.utils.ctx_managers import db_session
+from tests.utils import create_credit_type, create_wallet
 
 pytestmark = pytest.mark.anyio
 
@@ -24,7 +41,7 @@ class TestWalletEndpoints:
         data = response.json()
         assert data["name"] == wallet_name
         assert data["context"]["user_id"] == user_id
-        assert "id" in data
+        assert UUID(data["id"]).version == 7
 
     async def test_create_wallet_with_same_external_id(self, client: httpx.AsyncClient):
         user_id = str(uuid4())
@@ -98,6 +115,10 @@ class TestWalletEndpoints:
         response = await client.get(f"{self.base_url}/wallets/{nonexistent_id}")
         assert response.status_code == 404
 
+    async def test_get_wallet_with_malformed_id(self, client: httpx.AsyncClient):
+        response = await client.get(f"{self.base_url}/wallets/not-a-wallet-id")
+        assert response.status_code == 404
+
     async def test_list_wallets_with_multiple_wallets(self, client: httpx.AsyncClient):
         # Create first wallet
         user_id = str(uuid4())
@@ -136,6 +157,73 @@ class TestWalletEndpoints:
         response = response.json()
         assert response["data"][0]["id"] == wallet_id_1
 
+    async def test_list_wallets_by_typed_context(self, client: httpx.AsyncClient):
+        batch = str(uuid4())
+        contexts = {
+            "number": {"tier": 2, "vip": True},
+            "string": {"tier": "2", "vip": "true"},
+            "decimal": {"tier": 2.0, "vip": False},
+        }
+        wallet_ids = {}
+        for name, context in contexts.items():
+            request = CreateWalletRequest(
+                name=f"typed_context_{name}", context={"batch": batch, **context}
+            )
+            response = await client.post(
+                f"{self.base_url}/wallets/", json=request.model_dump()
+            )
+            assert response.status_code == 201
+            wallet_ids[response.json()["id"]] = name
+
+        async def matching(filters: str) -> set:
+            response = await client.get(
+                f"{self.base_url}/wallets/",
+                params={"context": f"[batch={batch},{filters}]"},
+            )
+            assert response.status_code == 200
+            return {wallet_ids[wallet["id"]] for wallet in response.json()["data"]}
+
+        # Values match on their text, whatever their JSON type
+        assert await matching("tier=2") == {"number", "string"}
+        assert await matching("tier=2.0") == {"decimal"}
+        assert await matching("vip=true") == {"number", "string"}
+        assert await matching("vip=false") == {"decimal"}
+        assert await matching("tier=2,vip=true") == {"number", "string"}
+
+    async def test_list_wallets_by_promoted_typed_context(
+        self, client: httpx.AsyncClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        org_id = uuid4().int % 10**12
+        contexts = {
+            "number": {"org_id": org_id},
+            "string": {"org_id": str(org_id)},
+            "decimal": {"org_id": float(org_id)},
+        }
+        wallet_ids = {}
+        for name, context in contexts.items():
+            request = CreateWalletRequest(name=f"promoted_{name}", context=context)
+            response = await client.post(
+                f"{self.base_url}/wallets/", json=request.model_dump()
+            )
+            assert response.status_code == 201
+            wallet_ids[response.json()["id"]] = name
+
+        async def matching(value: str) -> set:
+            response = await client.get(
+                f"{self.base_url}/wallets/", params={"context": f"[org_id={value}]"}
+            )
+            assert response.status_code == 200
+            return {wallet_ids[wallet["id"]] for wallet in response.json()["data"]}
+
+        # Filters match the same wallets through the promoted key indexes and as
+        # any other key
+        assert "org_id" in PromotedContextKeys().get("wallets")
+        for promoted in [True, False]:
+            if not promoted:
+                monkeypatch.setattr(PromotedContextKeys(), "_keys", {})
+            assert await matching(str(org_id)) == {"number", "string"}
+            assert await matching(f"{org_id}.0") == {"decimal"}
+
     async def test_list_wallets_empty_result(self, client: httpx.AsyncClient):
         user_id = str(uuid4())
         query_params = {
@@ -265,3 +353,178 @@ class TestWalletEndpoints:
         response_data = response.json()
         assert len(response_data["data"]) == 2
         assert response_data["data"][0]["name"] == wallet_name_1
+
+    async def test_search_wallets(self, client: httpx.AsyncClient):
+        token = uuid4().hex
+        wallet_names = [f"{token} alpha", f"{token} beta", f"other {uuid4().hex}"]
+        for wallet_name in wallet_names:
+            request = CreateWalletRequest(name=wallet_name, context={})
+            await client.post(f"{self.base_url}/wallets/", json=request.model_dump())
+
+        # Search by a word of the name
+        response = await client.get(
+            f"{self.base_url}/wallets/", params={"search": token}
+        )
+        assert response.status_code == 200
+        response_data = response.json()
+        assert response_data["total_count"] == 2
+        assert {wallet["name"] for wallet in response_data["data"]} == {
+            wallet_names[0],
+            wallet_names[1],
+        }
+
+        # The closest match is ranked first
+        response = await client.get(
+            f"{self.base_url}/wallets/", params={"search": f"{token} beta"}
+        )
+        assert response.status_code == 200
+        assert response.json()["data"][0]["name"] == wallet_names[1]
+
+    async def test_search_wallets_by_external_id(self, client: httpx.AsyncClient):
+        external_id = f"customer-{uuid4().hex}"
+        request = CreateWalletRequest(
+            name="external id search", context={}, external_id=external_id
+        )
+        await client.post(f"{self.base_url}/wallets/", json=request.model_dump())
+
+        response = await client.get(
+            f"{self.base_url}/wallets/", params={"search": external_id}
+        )
+        assert response.status_code == 200
+        response_data = response.json()
+        assert len(response_data["data"]) == 1
+        assert response_data["data"][0]["external_id"] == external_id
+
+    async def test_balance_events(self, client: httpx.AsyncClient):
+        credit_type = await create_credit_type(client, self.base_url)
+        wallet = await create_wallet(client, self.base_url)
+
+        async def deposit():
+            request = DepositTransactionRequest(
+                credit_type_id=credit_type["id"],
+                description="Balance event deposit",
+                payload=DepositTransactionRequestPayload(amount=100),
+                issuer="test_user",
+            )
+            response = await client.post(
+                f"{self.base_url}/wallets/{wallet['id']}/deposit",
+                json=request.model_dump(),
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        first = await deposit()
+        # Resumed from a minute ago, the deposit is replayed
+        a_minute_ago = f"{int(time.time() * 1000) - 60000}-0"
+        events = BalanceEvents().listen(wallet["id"], a_minute_ago)
+        first_id, data = await anext(events)
+        assert json.loads(data)["transaction_id"] == first["id"]
+        assert json.loads(data)["balance"]["available"] == 100
+
+        # Already subscribed, the next deposit is pushed
+        pushed = asyncio.create_task(anext(events))
+        second = await deposit()
+        second_id, data = await asyncio.wait_for(pushed, 5)
+        assert json.loads(data)["transaction_id"] == second["id"]
+        assert json.loads(data)["balance"]["available"] == 200
+        await events.aclose()
+
+        events = BalanceEvents().listen(wallet["id"], first_id)
+        assert (await anext(events))[0] == second_id
+        await events.aclose()
+
+        events = BalanceEvents().listen(wallet["id"], "not-an-id")
+        assert await anext(events) is RESET
+        await events.aclose()
+        await BalanceEvents().close()
+
+        response = await client.get(f"{self.base_url}/wallets/{uuid4()}/events")
+        assert response.status_code == 404
+
+    async def test_balances_as_of(
+        self, client: httpx.AsyncClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        credit_type = await create_credit_type(client, self.base_url)
+        wallet = await create_wallet(client, self.base_url)
+        wallet_url = f"{self.base_url}/wallets/{wallet['id']}"
+
+        async def post(action, request):
+            response = await client.post(
+                f"{wallet_url}/{action}", json=request.model_dump()
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        def deposit(amount):
+            return DepositTransactionRequest(
+                credit_type_id=credit_type["id"],
+                description="As of deposit",
+                payload=DepositTransactionRequestPayload(amount=amount),
+                issuer="test_user",
+            )
+
+        def completed_at(transaction):
+            return datetime.fromisoformat(transaction["completed_at"])
+
+        async def available_as_of(as_of):
+            response = await client.get(wallet_url, params={"as_of": as_of.isoformat()})
+            assert response.status_code == 200
+            return [balance["available"] for balance in response.json()["balances"]]
+
+        first = completed_at(await post("deposit", deposit(100)))
+        monkeypatch.setattr(settings, "BALANCE_CHECKPOINT_INTERVAL_SECONDS", 0)
+        assert await balance_checkpoints_service.checkpoint_balances() >= 1
+        second = completed_at(await post("deposit", deposit(50)))
+        debit = await post(
+            "debit",
+            DebitTransactionRequest(
+                credit_type_id=credit_type["id"],
+                description="As of debit",
+                payload=DebitTransactionRequestPayload(amount=30),
+                issuer="test_user",
+            ),
+        )
+        third = completed_at(debit)
+        # Created before the second deposit completed, the debit still follows it
+        async with db_session() as session_ctx:
+            await session_ctx.session.execute(
+                update(TransactionDBModel)
+                .where(TransactionDBModel.id == debit["id"])
+                .values(created_at=second - timedelta(seconds=1))
+            )
+
+        microsecond = timedelta(microseconds=1)
+        assert await available_as_of(first - microsecond) == []
+        assert await available_as_of(first) == [100]
+        # From the checkpoint, no transaction since
+        assert await available_as_of(second - microsecond) == [100]
+        assert await available_as_of(second) == [150]
+        assert await available_as_of(third) == [120]
+        response = await client.get(wallet_url)
+        assert response.json()["balances"][0]["available"] == 120
+        assert response.json()["balances"][0]["as_of"] is None
+
+        now = datetime.now(timezone.utc)
+        response = await client.get(
+            f"{wallet_url}/balance-history",
+            params={
+                "start_date": (now - timedelta(days=2)).isoformat(),
+                "end_date": now.isoformat(),
+                "granularity": "hour",
+            },
+        )
+        assert response.status_code == 200
+        points = response.json()
+        assert points[-1]["available"] == 120
+        assert points[-1]["spent"] == 30
+        assert all(point["credit_type_id"] == credit_type["id"] for point in points)
+
+        response = await client.get(
+            f"{wallet_url}/balance-history",
+            params={
+                "start_date": (now - timedelta(days=365)).isoformat(),
+                "end_date": now.isoformat(),
+                "granularity": "hour",
+            },
+        )
+        assert response.status_code == 422
@@ -4,6 +4,8 @@ import pytest
 from src.core.app import app
 from src.core.db_config import DBManager
 from src.core.redis_config import RedisManager
+from src.db.expressions import PromotedContextKeys
+from src.utils.ctx_managers import db_session
 
 
 @pytest.fixture(scope="session")
@@ -15,6 +17,8 @@ def anyio_backend():
 async def setup_test_environment():
     await DBManager().init_db_connection()
     await RedisManager().connect()
+    async with db_session(read_only=True) as session_ctx:
+        await PromotedContextKeys().load(session_ctx.session)
 
     yield
 
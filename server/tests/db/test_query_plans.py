@@ -0,0 +1,395 @@
+import json
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from hashlib import md5
+from typing import AsyncGenerator, Dict, List, Set
+from uuid import UUID
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db import balances as balances_db
+from src.db import insights as insights_db
+from src.db import products as products_db
+from src.db import rollups as rollups_db
+from src.db import transactions as transactions_db
+from src.db import wallets as wallets_db
+from src.models.base import OrderBy, PaginationRequest
+from src.models.Insights import TimeGranularity
+from src.models.transactions import HoldStatus, TransactionType
+from src.utils.ctx_managers import db_session
+from src.utils.dependencies import DateTimeRange
+
+pytestmark = pytest.mark.anyio
+
+NUM_WALLETS = 5_000
+NUM_TRANSACTIONS = 100_000
+NOW = datetime.now(timezone.utc)
+
+# Small lookup tables (credit types, product settings) are cheaper to scan than
+# to probe, only the tables that grow with usage must never be scanned
+LARGE_TABLES = {
+    "transactions",
+    "balances",
+    "product_subscriptions",
+    "transaction_rollups",
+}
+
+SYNTHETIC_DATA_SQL = [
+    """
+    INSERT INTO credit_types (id, name, description)
+    SELECT md5('plan-ct-' || i)::uuid, 'plan credit type ' || i, 'query plan tests'
+    FROM generate_series(0, 3) AS i
+    """,
+    f"""
+    INSERT INTO wallets (id, name, context, status, created_at)
+    SELECT md5('plan-wallet-' || i)::uuid, 'plan wallet ' || i,
+           jsonb_build_object(
+               'org_id', 'org-' || (i % 1000), 'team_id', 'team-' || (i % 1000)
+           ),
+           'ACTIVE',
+           now() - (i || ' minutes')::interval
+    FROM generate_series(0, {NUM_WALLETS - 1}) AS i
+    """,
+    """
+    INSERT INTO transaction_labels (value)
+    VALUES ('plan_tests'), ('synthetic transaction')
+    ON CONFLICT DO NOTHING
+    """,
+    f"""
+    WITH plan_labels AS (
+        SELECT id, value FROM transaction_labels
+        WHERE value IN ('plan_tests', 'synthetic transaction')
+    )
+    INSERT INTO transactions (
+        id, type, external_id, wallet_id, credit_type_id, issuer_id,
+        description_id, amount, context, payload, hold_status, status, created_at
+    )
+    SELECT
+        md5('plan-tx-' || i)::uuid,
+        (ARRAY['DEPOSIT', 'DEBIT', 'HOLD', 'RELEASE', 'ADJUST'])[1 + i % 5]
+            ::transactiontype,
+        'plan-ext-' || i,
+        md5('plan-wallet-' || (i % {NUM_WALLETS}))::uuid,
+        md5('plan-ct-' || (i % 4))::uuid,
+        (SELECT id FROM plan_labels WHERE value = 'plan_tests'),
+        (SELECT id FROM plan_labels WHERE value = 'synthetic transaction'),
+        1 + i % 100,
+        json_build_object('org_id', 'org-' || (i % {NUM_WALLETS} % 1000)),
+        json_build_object('amount', 1 + i % 100),
+        CASE WHEN i % 5 = 2 THEN
+            (CASE WHEN i % 100 = 2 THEN 'HELD' ELSE 'USED' END)::holdstatus
+        END,
+        'COMPLETED',
+        now() - ((i * 631) % (365 * 24 * 60) || ' minutes')::interval
+    FROM generate_series(0, {NUM_TRANSACTIONS - 1}) AS i
+    """,
+    f"""
+    INSERT INTO balances (
+        id, wallet_id, credit_type_id, available, held, spent, overall_spent,
+        burn_rate, estimated_depletion_at
+    )
+    SELECT md5('plan-balance-' || w || '-' || c)::uuid,
+           md5('plan-wallet-' || w)::uuid, md5('plan-ct-' || c)::uuid,
+           100, 0, 0, 0, 1 + w % 50,
+           now() + (100.0 / (1 + w % 50) || ' days')::interval
+    FROM generate_series(0, {NUM_WALLETS - 1}) AS w, generate_series(0, 3) AS c
+    """,
+    """
+    INSERT INTO products (id, name, description, status)
+    VALUES (md5('plan-product')::uuid, 'plan product', 'query plan tests', 'ACTIVE')
+    """,
+    f"""
+    INSERT INTO product_subscriptions (
+        id, product_id, wallet_id, status, type, mode, settings_snapshot
+    )
+    SELECT md5('plan-subscription-' || i)::uuid, md5('plan-product')::uuid,
+           md5('plan-wallet-' || (i % {NUM_WALLETS}))::uuid,
+           'COMPLETED', 'ONE_TIME', 'ADD', '{{}}'::jsonb
+    FROM generate_series(0, {NUM_WALLETS * 4 - 1}) AS i
+    """,
+    # Rolled up from scratch, up to a day ago, by synthetic_session
+    "DELETE FROM transaction_rollups",
+    "DELETE FROM rollup_watermarks",
+    "ANALYZE credit_types",
+    "ANALYZE wallets",
+    "ANALYZE transactions",
+    "ANALYZE balances",
+    "ANALYZE products",
+    "ANALYZE product_subscriptions",
+]
+
+
+def synthetic_id(name: str) -> str:
+    """The id the synthetic data set derives from name with md5(name)::uuid"""
+    return str(UUID(md5(name.encode()).hexdigest()))
+
+
+@pytest.fixture(scope="module")
+async def synthetic_session(
+    setup_test_environment,
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    A session holding a large synthetic data set that is rolled back afterwards.
+    """
+    async with db_session(read_only=True) as session_ctx:
+        session = session_ctx.session
+        for statement in SYNTHETIC_DATA_SQL:
+            await session.execute(text(statement))
+        await rollups_db.refresh_transaction_rollups(
+            session, until=NOW - timedelta(days=1), max_span=timedelta(days=10 * 365)
+        )
+        await session.execute(text("ANALYZE transaction_rollups"))
+        yield session
+        await session.rollback()
+
+
+async def get_parent_indexes(session: AsyncSession) -> Dict[str, str]:
+    """Map partition indexes to the index of the partitioned table they belong to"""
+    result = await session.execute(
+        text(
+            """
+            SELECT child.relname, parent.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            WHERE child.relkind = 'i'
+            """
+        )
+    )
+    return dict(result.all())
+
+
+@asynccontextmanager
+async def capture_plans(session: AsyncSession) -> AsyncGenerator[List[dict], None]:
+    """Collect the EXPLAIN plan of every statement executed on the session"""
+    plans: List[dict] = []
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "WITH")):
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            plan = cursor.fetchall()[0][0]
+            plans.append((json.loads(plan) if isinstance(plan, str) else plan)[0])
+
+    connection = (await session.connection()).sync_connection
+    assert connection is not None
+    event.listen(connection, "before_cursor_execute", explain)
+    try:
+        yield plans
+    finally:
+        event.remove(connection, "before_cursor_execute", explain)
+
+
+def walk(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+async def assert_uses_index(
+    session: AsyncSession, plans: List[dict], expected_indexes: Set[str]
+):
+    assert plans, "no statement was executed"
+    parent_indexes = await get_parent_indexes(session)
+
+    used_indexes = set()
+    for plan in plans:
+        for node in walk(plan["Plan"]):
+            if node["Node Type"] == "Seq Scan":
+                table_name = re.sub(r"_part_\d+$", "", node["Relation Name"])
+                assert table_name not in LARGE_TABLES, (
+                    f"sequential scan on {node['Relation Name']}:\n"
+                    f"{json.dumps(plan, indent=2)}"
+                )
+            if "Index Name" in node:
+                index_name = node["Index Name"]
+                used_indexes.add(parent_indexes.get(index_name, index_name))
+
+    assert (
+        used_indexes & expected_indexes
+    ), f"expected one of {expected_indexes}, plans used {used_indexes}"
+
+
+async def test_list_wallet_transactions_in_range(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await transactions_db.list_transactions(
+            session=synthetic_session,
+            wallet_id=synthetic_id("plan-wallet-7"),
+            credit_type_id=None,
+            external_id=None,
+            pagination=PaginationRequest(page=1, page_size=20),
+            context={},
+            date_range=DateTimeRange(start_date=NOW - timedelta(days=30), end_date=NOW),
+            order_by=OrderBy.DESC,
+        )
+    await assert_uses_index(
+        synthetic_session, plans, {"ix_transactions_wallet_id_created_at"}
+    )
+
+
+async def test_get_transaction_by_external_id(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await transactions_db.get_transaction_by_external_id(
+            session=synthetic_session, external_id="plan-ext-42"
+        )
+    await assert_uses_index(
+        synthetic_session, plans, {"transactions_external_id_wallet_id_idx"}
+    )
+
+
+async def test_get_held_hold(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        for _ in range(10):  # past the point where generic plans kick in
+            await transactions_db.get_transaction(
+                session=synthetic_session,
+                transaction_id=synthetic_id("plan-tx-102"),
+                transaction_type=TransactionType.HOLD,
+                credit_type_id=synthetic_id("plan-ct-2"),
+                wallet_id=synthetic_id("plan-wallet-102"),
+                hold_status=HoldStatus.HELD,
+            )
+    await assert_uses_index(synthetic_session, plans, {"ix_transactions_held_id"})
+
+
+async def test_debit_balance(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await balances_db.debit_balance(
+            session=synthetic_session,
+            wallet_id=synthetic_id("plan-wallet-3"),
+            credit_type_id=synthetic_id("plan-ct-1"),
+            amount=1,
+            held_amount=0,
+            spent=1,
+        )
+    await assert_uses_index(
+        synthetic_session, plans, {"balances_wallet_id_credit_type_id_idx"}
+    )
+
+
+async def test_depleting_balances(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await insights_db.get_depleting_balances(session=synthetic_session, limit=10)
+    await assert_uses_index(
+        synthetic_session, plans, {"ix_balances_estimated_depletion_at"}
+    )
+
+
+async def test_get_subscriptions(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await products_db.get_subscriptions(
+            session=synthetic_session,
+            wallet_id=synthetic_id("plan-wallet-3"),
+            pagination_request=PaginationRequest(page=1, page_size=10),
+        )
+    await assert_uses_index(
+        synthetic_session, plans, {"ix_product_subscriptions_wallet_id"}
+    )
+
+
+async def test_credit_usage_aggregation(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await insights_db.get_credit_usage_aggregation(
+            session=synthetic_session,
+            start_date=NOW - timedelta(days=7),
+            end_date=NOW,
+        )
+    await assert_uses_index(synthetic_session, plans, {"transaction_rollups_pkey"})
+    # The hours after the watermark are read from the DEBITs index
+    await assert_uses_index(
+        synthetic_session, plans, {"ix_transactions_debit_created_at"}
+    )
+
+
+async def test_credit_usage_timeseries_aggregation(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await insights_db.get_credit_usage_timeseries_aggregation(
+            session=synthetic_session,
+            start_date=NOW - timedelta(days=7),
+            end_date=NOW,
+            granularity=TimeGranularity.DAY,
+        )
+    await assert_uses_index(synthetic_session, plans, {"transaction_rollups_pkey"})
+    await assert_uses_index(synthetic_session, plans, {"transactions_created_at_idx"})
+
+
+async def test_wallet_activity_aggregation(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await insights_db.get_wallet_activity_aggregation(
+            session=synthetic_session,
+            start_date=NOW - timedelta(days=7),
+            end_date=NOW,
+            granularity=TimeGranularity.DAY,
+        )
+    await assert_uses_index(synthetic_session, plans, {"transaction_rollups_pkey"})
+    await assert_uses_index(synthetic_session, plans, {"transactions_created_at_idx"})
+
+
+async def test_trending_wallets(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await insights_db.get_trending_wallets(
+            session=synthetic_session,
+            start_date=NOW - timedelta(days=7),
+            end_date=NOW,
+            limit=5,
+        )
+    await assert_uses_index(synthetic_session, plans, {"transaction_rollups_pkey"})
+    await assert_uses_index(synthetic_session, plans, {"transactions_created_at_idx"})
+
+
+async def test_list_wallets_by_context(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await wallets_db.get_wallets(
+            session=synthetic_session,
+            pagination_request=PaginationRequest(page=1, page_size=10),
+            context={"team_id": "team-7"},
+        )
+    await assert_uses_index(synthetic_session, plans, {"ix_wallets_context"})
+
+
+async def test_list_wallets_by_promoted_context_key(synthetic_session: AsyncSession):
+    async with capture_plans(synthetic_session) as plans:
+        await wallets_db.get_wallets(
+            session=synthetic_session,
+            pagination_request=PaginationRequest(page=1, page_size=10),
+            context={"org_id": "org-7"},
+        )
+    await assert_uses_index(
+        synthetic_session, plans, {"ix_wallets_ctx_org_id_created_at"}
+    )
+
+
+async def test_list_transactions_by_promoted_context_key(
+    synthetic_session: AsyncSession,
+):
+    async with capture_plans(synthetic_session) as plans:
+        await transactions_db.list_transactions(
+            session=synthetic_session,
+            wallet_id=None,
+            credit_type_id=None,
+            external_id=None,
+            pagination=PaginationRequest(page=1, page_size=20),
+            context={"org_id": "org-7"},
+            date_range=DateTimeRange(start_date=NOW - timedelta(days=30), end_date=NOW),
+            order_by=OrderBy.DESC,
+        )
+    await assert_uses_index(
+        synthetic_session, plans, {"ix_transactions_ctx_org_id_created_at"}
+    )
+
+
+async def test_wallet_activity_by_promoted_context_key(
+    synthetic_session: AsyncSession,
+):
+    async with capture_plans(synthetic_session) as plans:
+        await insights_db.get_wallet_activity_aggregation(
+            session=synthetic_session,
+            start_date=NOW - timedelta(days=7),
+            end_date=NOW,
+            granularity=TimeGranularity.DAY,
+            context={"org_id": "org-7"},
+        )
+    await assert_uses_index(
+        synthetic_session, plans, {"ix_transactions_ctx_org_id_created_at"}
+    )